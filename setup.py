@@ -102,6 +102,7 @@ setup(
                 'sct_merge_images',
                 'sct_process_segmentation',
                 'sct_run_batch',
+                'sct_server',
                 'sct_propseg',
                 'sct_qc',
                 'sct_register_multimodal',
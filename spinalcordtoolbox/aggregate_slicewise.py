@@ -13,8 +13,10 @@ import csv
 import datetime
 import logging
 import wquantiles
+from scipy import sparse
 
-from spinalcordtoolbox.template import get_slices_from_vertebral_levels, get_vertebral_level_from_slice
+from spinalcordtoolbox.atlas import SparseAtlas
+from spinalcordtoolbox.template import get_vertebral_level_per_slice, get_vertebral_level_from_slice
 from spinalcordtoolbox.image import Image
 from spinalcordtoolbox.utils import __version__, parse_num_list_inv
 
@@ -88,21 +90,7 @@ def func_map(data, mask, map_clusters):
     # Check number of labels and map_clusters
     assert mask.shape[-1] == len(map_clusters)
 
-    # Iterate across all labels (excluding the first one) and generate cluster labels. Examples of input/output:
-    #   [[0], [0], [0], [1], [2], [0]] --> [0, 0, 0, 1, 2, 0]
-    #   [[0, 1], [0], [0], [1], [2]] --> [0, 0, 0, 0, 1]
-    #   [[0, 1], [0], [1], [2], [3]] --> [0, 0, 0, 1, 2]
-    possible_clusters = [map_clusters[0]]
-    id_clusters = [0]  # this one corresponds to the first cluster
-    for i_cluster in map_clusters[1:]:  # skip the first
-        found_index = False
-        for possible_cluster in possible_clusters:
-            if i_cluster[0] in possible_cluster:
-                id_clusters.append(possible_clusters.index(possible_cluster))
-                found_index = True
-        if not found_index:
-            possible_clusters.append(i_cluster)
-            id_clusters.append(possible_clusters.index([i_cluster[0]]))
+    id_clusters = get_id_clusters(map_clusters)
 
     # Sum across each clustered labels, then concatenate to generate mask_clusters
     # mask_clusters has dimension: x, y, z, n_clustered_labels, with n_clustered_labels being equal to the number of
@@ -147,6 +135,31 @@ def func_map(data, mask, map_clusters):
     return beta[0], beta
 
 
+def get_id_clusters(map_clusters):
+    """
+    Cluster of each label for MAP estimation (see func_map()).
+
+    :param map_clusters: list of list of int: See func_map()
+    :return: list of int: index of the cluster of each label
+    """
+    # Iterate across all labels (excluding the first one) and generate cluster labels. Examples of input/output:
+    #   [[0], [0], [0], [1], [2], [0]] --> [0, 0, 0, 1, 2, 0]
+    #   [[0, 1], [0], [0], [1], [2]] --> [0, 0, 0, 0, 1]
+    #   [[0, 1], [0], [1], [2], [3]] --> [0, 0, 0, 1, 2]
+    possible_clusters = [map_clusters[0]]
+    id_clusters = [0]  # this one corresponds to the first cluster
+    for i_cluster in map_clusters[1:]:  # skip the first
+        found_index = False
+        for possible_cluster in possible_clusters:
+            if i_cluster[0] in possible_cluster:
+                id_clusters.append(possible_clusters.index(possible_cluster))
+                found_index = True
+        if not found_index:
+            possible_clusters.append(i_cluster)
+            id_clusters.append(possible_clusters.index([i_cluster[0]]))
+    return id_clusters
+
+
 def func_median(data, mask, map_clusters=None):
     """
     Compute weighted median. This is a "non-discrete" implementation of the median, in that it computes the mean between
@@ -237,7 +250,8 @@ def aggregate_per_slice_or_level(metric, mask=None, slices=[], levels=[], distan
     """
     The aggregation will be performed along the last dimension of 'metric' ndarray.
 
-    :param metric: Class Metric(): data to aggregate.
+    :param metric: Class Metric(): data to aggregate, or list of Metric() with the same shape, which are aggregated \
+    together with the same mask (e.g. FA and MD, see _SlicewiseData).
     :param mask: Class Metric(): mask to use for aggregating the data. Optional.
     :param slices: List[int]: Slices to aggregate metric from. If empty, select all slices.
     :param levels: List[int]: Vertebral levels to aggregate metric from. It has priority over "slices".
@@ -248,13 +262,19 @@ def aggregate_per_slice_or_level(metric, mask=None, slices=[], levels=[], distan
     :param tuple group_funcs: Name and function to apply on metric. Example: (('MEAN', func_wa),)). Note, the function
       has special requirements in terms of i/o. See the definition to func_wa and use it as a template.
     :param map_clusters: list of list of int: See func_map()
-    :return: Aggregated metric
+    :return: Aggregated metric (list of aggregated metrics if metric is a list)
     """
+    several_metrics = isinstance(metric, list)
+    metrics = metric if several_metrics else [metric]
+    if len(set(m.data.shape for m in metrics)) > 1:
+        raise ValueError("Shape mismatch between the metrics: {}".format([m.data.shape for m in metrics]))
     if vert_level:
+        im_vert_level = Image(vert_level).change_orientation('RPI')
         # Assumption: vert_level image will only ever be 3D or 4D
-        vert_level_slices = Image(vert_level).change_orientation('RPI').data.shape[2]
+        vert_level_slices = im_vert_level.data.shape[2]
         # Get slices ('z') from metrics regardless of whether they're 1D [z], 3D [x, y, z], and 4D [x, y, z, t]
-        metric_slices = metric.data.shape[2] if len(metric.data.shape) >= 3 else metric.data.shape[0]
+        shape = metrics[0].data.shape
+        metric_slices = shape[2] if len(shape) >= 3 else shape[0]
         if vert_level_slices != metric_slices:
             raise ValueError(f"Shape mismatch between vertfile [{vert_level_slices}] and metric [{metric_slices}]). "
                              f"Please verify that your vertfile has the same number of slices as your input image, "
@@ -269,16 +289,17 @@ def aggregate_per_slice_or_level(metric, mask=None, slices=[], levels=[], distan
             perslice = False
 
     # if slices is empty, select all available slices from the metric
-    ndim = metric.data.ndim
+    ndim = metrics[0].data.ndim
     if not slices:
-        slices = range(metric.data.shape[ndim-1])
+        slices = range(metrics[0].data.shape[ndim-1])
 
     # aggregation based on levels
     vertgroups = None
     if levels:
-        im_vert_level = Image(vert_level).change_orientation('RPI')
+        # Vertebral level of each slice, computed once for all the levels
+        vert_level_per_slice = get_vertebral_level_per_slice(im_vert_level)
         # slicegroups = [(0, 1, 2), (3, 4, 5), (6, 7, 8)]
-        slicegroups = [tuple(get_slices_from_vertebral_levels(im_vert_level, level)) for level in levels]
+        slicegroups = [tuple(np.flatnonzero(vert_level_per_slice == level).tolist()) for level in levels]
         if perlevel:
             # vertgroups = [(2,), (3,), (4,)]
             vertgroups = [tuple([level]) for level in levels]
@@ -301,58 +322,414 @@ def aggregate_per_slice_or_level(metric, mask=None, slices=[], levels=[], distan
         else:
             # slicegroups = [(0, 1, 2, 3, 4, 5, 6, 7, 8)]
             slicegroups = [tuple(slices)]
-    agg_metric = dict((slicegroup, dict()) for slicegroup in slicegroups)
-    # loop across slice group
-    for slicegroup in slicegroups:
-        # add distance from PMJ info
-        if distance_pmj is not None:
-            agg_metric[slicegroup]['DistancePMJ'] = [distance_pmj]
-        else:
-            agg_metric[slicegroup]['DistancePMJ'] = None
-        # add level info
-        if vertgroups is None:
-            agg_metric[slicegroup]['VertLevel'] = None
-        else:
-            agg_metric[slicegroup]['VertLevel'] = vertgroups[slicegroups.index(slicegroup)]
-        # Loop across functions (e.g.: MEAN, STD)
-        for (name, func) in group_funcs:
-            try:
-                data_slicegroup = metric.data[..., slicegroup]  # selection is done in the last dimension
-                if mask is not None:
-                    mask_slicegroup = mask.data[..., slicegroup, :]
-                    agg_metric[slicegroup]['Label'] = mask.label
-                    # For size calculation, only the first index [0] is relevant (See spinalcordtoolbox/issues/3216)
-                    agg_metric[slicegroup]['Size [vox]'] = np.sum(mask_slicegroup[..., 0])
-                else:
-                    mask_slicegroup = np.ones(data_slicegroup.shape)
-                # Ignore nonfinite values
-                i_nonfinite = np.where(np.isfinite(data_slicegroup) == False)
-                data_slicegroup[i_nonfinite] = 0.
-                # TODO: the lines below could probably be done more elegantly
-                if mask_slicegroup.ndim == data_slicegroup.ndim + 1:
-                    arr_tmp_concat = []
-                    for i in range(mask_slicegroup.shape[-1]):
-                        arr_tmp = np.reshape(mask_slicegroup[..., i], data_slicegroup.shape)
-                        arr_tmp[i_nonfinite] = 0.
-                        arr_tmp_concat.append(np.expand_dims(arr_tmp, axis=(mask_slicegroup.ndim-1)))
-                    mask_slicegroup = np.concatenate(arr_tmp_concat, axis=(mask_slicegroup.ndim-1))
-                else:
-                    mask_slicegroup[i_nonfinite] = 0.
-                # Make sure the number of pixels to extract metrics is not null
-                if mask_slicegroup.sum() == 0:
-                    result = None
-                else:
-                    # Run estimation
-                    result, _ = func(data_slicegroup, mask_slicegroup, map_clusters)
+    # Aggregate all the slice groups at once, for the functions that have a grouped implementation
+    try:
+        groupeds = _aggregate_grouped(metrics, mask, slicegroups, group_funcs, map_clusters)
+    except Exception as e:
+        # Errors (e.g. slices out of bounds) are reported for each slice group by the loop below
+        logging.debug("Aggregating slice groups one by one: {}".format(e))
+        groupeds = None
+    agg_metrics = []
+    for metric, grouped in zip(metrics, groupeds if groupeds is not None else [None] * len(metrics)):
+        agg_metric = dict((slicegroup, dict()) for slicegroup in slicegroups)
+        # loop across slice group
+        for i_group, slicegroup in enumerate(slicegroups):
+            # add distance from PMJ info
+            if distance_pmj is not None:
+                agg_metric[slicegroup]['DistancePMJ'] = [distance_pmj]
+            else:
+                agg_metric[slicegroup]['DistancePMJ'] = None
+            # add level info
+            if vertgroups is None:
+                agg_metric[slicegroup]['VertLevel'] = None
+            else:
+                agg_metric[slicegroup]['VertLevel'] = vertgroups[slicegroups.index(slicegroup)]
+            # Loop across functions (e.g.: MEAN, STD)
+            for (name, func) in group_funcs:
+                try:
+                    if grouped is not None and mask is not None:
+                        agg_metric[slicegroup]['Label'] = mask.label
+                        agg_metric[slicegroup]['Size [vox]'] = grouped['Size [vox]'][i_group]
+                    if grouped is not None and name in grouped and grouped[name][i_group] is not _UNDEFINED:
+                        result = grouped[name][i_group]
+                    else:
+                        result = _aggregate_slicegroup(metric, mask, slicegroup, func, map_clusters,
+                                                       agg_metric[slicegroup])
                     # check if nan
-                    if np.isnan(result):
+                    if result is not None and np.isnan(result):
                         result = None
-                # here we create a field with name: FUNC(METRIC_NAME). Example: MEAN(CSA)
-                agg_metric[slicegroup]['{}({})'.format(name, metric.label)] = result
-            except Exception as e:
-                logging.warning(e)
-                agg_metric[slicegroup]['{}({})'.format(name, metric.label)] = str(e)
-    return agg_metric
+                    # here we create a field with name: FUNC(METRIC_NAME). Example: MEAN(CSA)
+                    agg_metric[slicegroup]['{}({})'.format(name, metric.label)] = result
+                except Exception as e:
+                    logging.warning(e)
+                    agg_metric[slicegroup]['{}({})'.format(name, metric.label)] = str(e)
+        agg_metrics.append(agg_metric)
+    return agg_metrics if several_metrics else agg_metrics[0]
+
+
+def _aggregate_slicegroup(metric, mask, slicegroup, func, map_clusters, agg_metric_slicegroup):
+    """
+    Aggregate a metric across a slice group with a function of aggregate_per_slice_or_level().
+
+    :param agg_metric_slicegroup: dict of the slice group, where the label and size of the mask are added
+    :return: result of the function, or None if the mask is empty
+    """
+    data_slicegroup = metric.data[..., slicegroup]  # selection is done in the last dimension
+    if mask is not None:
+        if isinstance(mask.data, SparseAtlas):
+            mask_slicegroup = mask.data.slices(slicegroup).toarray()
+        else:
+            mask_slicegroup = mask.data[..., slicegroup, :]
+        agg_metric_slicegroup['Label'] = mask.label
+        # For size calculation, only the first index [0] is relevant (See spinalcordtoolbox/issues/3216)
+        agg_metric_slicegroup['Size [vox]'] = np.sum(mask_slicegroup[..., 0])
+    else:
+        mask_slicegroup = np.ones(data_slicegroup.shape)
+    # Ignore nonfinite values
+    i_nonfinite = np.where(np.isfinite(data_slicegroup) == False)
+    data_slicegroup[i_nonfinite] = 0.
+    # TODO: the lines below could probably be done more elegantly
+    if mask_slicegroup.ndim == data_slicegroup.ndim + 1:
+        arr_tmp_concat = []
+        for i in range(mask_slicegroup.shape[-1]):
+            arr_tmp = np.reshape(mask_slicegroup[..., i], data_slicegroup.shape)
+            arr_tmp[i_nonfinite] = 0.
+            arr_tmp_concat.append(np.expand_dims(arr_tmp, axis=(mask_slicegroup.ndim-1)))
+        mask_slicegroup = np.concatenate(arr_tmp_concat, axis=(mask_slicegroup.ndim-1))
+    else:
+        mask_slicegroup[i_nonfinite] = 0.
+    # Make sure the number of pixels to extract metrics is not null
+    if mask_slicegroup.sum() == 0:
+        return None
+    # Run estimation
+    result, _ = func(data_slicegroup, mask_slicegroup, map_clusters)
+    return result
+
+
+# Marks the slice groups that a grouped function could not aggregate (see _aggregate_grouped())
+_UNDEFINED = object()
+
+
+def _average_dtype(dtype_data, dtype_weights):
+    """Type of the result of np.average(data, weights=weights)."""
+    if np.issubdtype(dtype_data, np.integer) or np.issubdtype(dtype_data, np.bool_):
+        return np.result_type(dtype_data, dtype_weights, 'f8')
+    return np.result_type(dtype_data, dtype_weights)
+
+
+def _nonzero(array):
+    """
+    Same as np.nonzero(), but with the indices in the order of the memory layout of the array, which is much faster for
+    arrays that are not C-ordered (e.g. Fortran-ordered images).
+    """
+    nonzero = array != 0
+    axes = np.argsort([-abs(stride) for stride in nonzero.strides], kind='stable')
+    nonzero = nonzero.transpose(axes)
+    indices = np.unravel_index(np.flatnonzero(nonzero), nonzero.shape)
+    return tuple(indices[list(axes).index(axis)] for axis in range(array.ndim))
+
+
+class _SlicewiseData:
+    """
+    Metric and mask of the slices of _aggregate_grouped(), with the slices along the last axis of the metric.
+
+    The voxels of the first label of the mask with a non-null weight and a finite value (the only ones contributing to
+    weighted sums) are listed once, while the arrays with the nonfinite values set to zero (as done by
+    _aggregate_slicegroup()) and the normal equations of the labels are only built for the functions that need them.
+
+    When several metrics are aggregated with the same mask, the voxels of the mask and, for the metrics that are not
+    finite in the same voxels, the normal equations and their pseudo-inverses (see pinv()) are shared.
+    """
+    def __init__(self, data, mask=None, shared=None):
+        """
+        :param data: ndarray: metric (not modified)
+        :param mask: ndarray or SparseAtlas: mask, with the labels along the last axis (not modified), or None
+        :param shared: _SlicewiseData of another metric with the same mask, or None
+        """
+        self.n_slices = data.shape[-1]
+        self.data_dtype = data.dtype
+        self._data = data
+        self._mask = mask
+        self._shared = shared
+        self._atlas = None
+        self._dense_data = None
+        self._dense_weights = None
+        self._normal_equations = None
+        self._pinv = {}
+        if mask is None:
+            self.weights_dtype = np.float64
+            self._weights = None
+            voxels = _nonzero(np.isfinite(data))
+            self.slice_index = voxels[-1]
+            self.values = data[voxels].astype(np.float64)
+            self.weights = np.ones(len(self.values))
+        else:
+            self.weights_dtype = mask.dtype
+            if shared is not None:
+                self._weights, self._voxels, self._weights_nonzero = \
+                    shared._weights, shared._voxels, shared._weights_nonzero
+                self.size = shared.size
+            else:
+                self._weights = mask.label(0) if isinstance(mask, SparseAtlas) else mask[..., 0]
+                self._voxels = _nonzero(self._weights)
+                self._weights_nonzero = self._weights[self._voxels]
+                # For size calculation, only the first index [0] is relevant (See spinalcordtoolbox/issues/3216)
+                self.size = np.bincount(self._voxels[-1], self._weights_nonzero.astype(np.float64),
+                                        minlength=self.n_slices)
+            values = data[self._voxels]
+            finite = np.isfinite(values)
+            self.slice_index = self._voxels[-1][finite]
+            self.values = values[finite].astype(np.float64)
+            self.weights = self._weights_nonzero[finite].astype(np.float64)
+
+    def sum_per_slice(self, values):
+        """Sum of values (one per listed voxel) for each slice."""
+        return np.bincount(self.slice_index, values, minlength=self.n_slices)
+
+    @property
+    def dense_data(self):
+        """Metric with the nonfinite values set to zero."""
+        if self._dense_data is None:
+            self._dense_data = np.where(np.isfinite(self._data), self._data, 0).astype(self.data_dtype, copy=False)
+        return self._dense_data
+
+    @property
+    def dense_weights(self):
+        """Weights with the weights of the nonfinite values set to zero."""
+        if self._dense_weights is None:
+            finite = np.isfinite(self._data)
+            if self._weights is None:
+                self._dense_weights = finite.astype(np.float64)
+            else:
+                self._dense_weights = np.where(finite, self._weights, 0).astype(self._weights.dtype, copy=False)
+        return self._dense_weights
+
+    @property
+    def atlas(self):
+        """Mask as a SparseAtlas."""
+        if self._atlas is None:
+            if self._shared is not None:
+                self._atlas = self._shared.atlas
+            else:
+                self._atlas = self._mask if isinstance(self._mask, SparseAtlas) else SparseAtlas.from_array(self._mask)
+        return self._atlas
+
+    @property
+    def normal_equations(self):
+        """Normal equations of the labels of the mask for each slice (see SparseAtlas.normal_equations())."""
+        if self._normal_equations is None:
+            shared = self._shared
+            if shared is not None and np.array_equal(np.isfinite(self._data), np.isfinite(shared._data)):
+                gram, _, sums = shared.normal_equations
+                self._normal_equations = self.atlas.normal_equations(self._data, gram=(gram, sums))
+                self._pinv = shared._pinv
+            else:
+                self._normal_equations = self.atlas.normal_equations(self._data)
+        return self._normal_equations
+
+    def pinv(self, name, matrices):
+        """
+        Pseudo-inverse of matrices built from the normal equations (one per slice group), which is computed once for
+        the metrics sharing the normal equations.
+
+        :param name: str: identifies the matrices (for the same slice groups)
+        :param matrices: ndarray (slice groups, n, n)
+        """
+        if name not in self._pinv:
+            self._pinv[name] = np.linalg.pinv(matrices)
+        return self._pinv[name]
+
+
+def _grouped_wa(slicewise, counts, columns, map_clusters=None, binarize=False):
+    """
+    Weighted average of each slice group.
+
+    :param slicewise: _SlicewiseData: metric and weights
+    :param counts: ndarray (slice groups, slices): number of occurrences of each slice in each slice group
+    :param columns: list of the indices of the slices of each slice group (in the order of the slice group)
+    :param map_clusters: list of list of int: See func_map()
+    :param binarize: binarize the weights (see func_bin())
+    :return: results (one per slice group), and whether the result is defined for each slice group
+    """
+    weights = np.where(slicewise.weights >= 0.5, 1., 0.) if binarize else slicewise.weights
+    sum_weights = counts @ slicewise.sum_per_slice(weights)
+    sum_data = counts @ slicewise.sum_per_slice(weights * slicewise.values)
+    valid = sum_weights != 0
+    values = np.zeros(len(counts))
+    values[valid] = sum_data[valid] / sum_weights[valid]
+    weights_dtype = np.int64 if binarize else slicewise.weights_dtype
+    return values.astype(_average_dtype(slicewise.data_dtype, weights_dtype)), valid
+
+
+def _grouped_std(slicewise, counts, columns, map_clusters=None):
+    """Weighted standard deviation of each slice group, combined from the mean and the sum of squared deviations of
+    each slice (Chan et al., 1979)."""
+    sum_weights = slicewise.sum_per_slice(slicewise.weights)
+    valid_slice = sum_weights != 0
+    mean = np.zeros(slicewise.n_slices)
+    mean[valid_slice] = (slicewise.sum_per_slice(slicewise.weights * slicewise.values)[valid_slice]
+                         / sum_weights[valid_slice])
+    squares = slicewise.sum_per_slice(slicewise.weights * (slicewise.values - mean[slicewise.slice_index]) ** 2)
+    group_weights = counts @ sum_weights
+    valid = group_weights != 0
+    group_mean = np.zeros(len(counts))
+    group_mean[valid] = (counts @ (sum_weights * mean))[valid] / group_weights[valid]
+    group_squares = (counts * (squares + sum_weights * (mean - group_mean[:, np.newaxis]) ** 2)).sum(axis=1)
+    values = np.zeros(len(counts))
+    values[valid] = np.sqrt(group_squares[valid] / group_weights[valid])
+    # Same type as math.sqrt() in func_std()
+    return values.tolist(), valid
+
+
+def _grouped_bin(slicewise, counts, columns, map_clusters=None):
+    """Average of each slice group after binarizing the weights (see func_bin())."""
+    return _grouped_wa(slicewise, counts, columns, binarize=True)
+
+
+def _grouped_sum(slicewise, counts, columns, map_clusters=None):
+    """Sum of the data of each slice group (see func_sum())."""
+    data = slicewise.dense_data
+    sum_slice = data.sum(axis=tuple(range(data.ndim - 1)))
+    return (counts @ sum_slice).astype(np.sum(data[..., :0]).dtype), np.ones(len(counts), dtype=bool)
+
+
+def _grouped_max(slicewise, counts, columns, map_clusters=None):
+    """Maximum of the data of each slice group (see func_max())."""
+    data = slicewise.dense_data
+    max_slice = data.max(axis=tuple(range(data.ndim - 1)))
+    values = np.array([max_slice[group > 0].max() if group.any() else 0 for group in counts], dtype=data.dtype)
+    return values, np.ones(len(counts), dtype=bool)
+
+
+def _grouped_median(slicewise, counts, columns, map_clusters=None):
+    """Weighted median of each slice group (see func_median())."""
+    data = slicewise.dense_data.reshape(-1, slicewise.n_slices)
+    weights = slicewise.dense_weights.reshape(-1, slicewise.n_slices)
+    values = np.zeros(len(counts))
+    valid = np.zeros(len(counts), dtype=bool)
+    for i_group, cols in enumerate(columns):
+        # Same order of the values as func_median() (including the null weights), so that ties are sorted the same way
+        data_group, weights_group = data[:, cols].ravel(), weights[:, cols].ravel()
+        if weights_group.sum() != 0:
+            values[i_group], valid[i_group] = wquantiles.median(data_group, weights_group), True
+    return values, valid
+
+
+def _ml_dtype(dtype_data, dtype_mask):
+    """Type of the result of func_ml()."""
+    dtype_gram = dtype_mask if np.issubdtype(dtype_mask, np.inexact) else np.float64
+    return np.result_type(dtype_gram, dtype_data, dtype_mask)
+
+
+def _normal_equations_per_group(slicewise, counts):
+    """Normal equations of the labels of the mask (see SparseAtlas.normal_equations()) for each slice group."""
+    gram, moments, _ = slicewise.normal_equations
+    # Most slice groups contain few slices (e.g. per slice)
+    counts = sparse.csr_matrix(counts)
+    return (counts @ gram.reshape(len(gram), -1)).reshape((-1,) + gram.shape[1:]), counts @ moments
+
+
+def _solve_normal_equations(pinv_gram, moments):
+    """Least squares estimation (beta = (Xt . X)^(-1) . Xt . y) for each slice group."""
+    return np.einsum('gij,gj->gi', pinv_gram, moments)
+
+
+def _grouped_ml(slicewise, counts, columns, map_clusters=None):
+    """Maximum likelihood estimation for each slice group (see func_ml()), from the normal equations of each slice."""
+    gram, moments = _normal_equations_per_group(slicewise, counts)
+    beta = _solve_normal_equations(slicewise.pinv('ml', gram), moments)
+    return beta[:, 0].astype(_ml_dtype(slicewise.data_dtype, slicewise.weights_dtype)), np.ones(len(counts), dtype=bool)
+
+
+def _grouped_map(slicewise, counts, columns, map_clusters=None):
+    """Maximum a posteriori estimation for each slice group (see func_map()), from the normal equations of each
+    slice."""
+    gram, moments = _normal_equations_per_group(slicewise, counts)
+    # Check number of labels and map_clusters
+    assert gram.shape[-1] == len(map_clusters)
+    # ML estimation for each cluster of labels, whose mask is the sum of the masks of the labels
+    id_clusters = get_id_clusters(map_clusters)
+    clusters = np.array([[id_cluster == i_cluster for i_cluster in list(set(id_clusters))]
+                         for id_cluster in id_clusters], dtype=float)
+    beta_cluster = _solve_normal_equations(slicewise.pinv('map_clusters', clusters.T @ gram @ clusters),
+                                           moments @ clusters)
+    # beta = beta_0 + (Xt . X + 1)^(-1) . Xt . (y - X . beta_0), with Xt . X . beta_0 = gram . beta_0
+    beta_0 = beta_cluster[:, id_clusters]
+    beta = beta_0 + _solve_normal_equations(slicewise.pinv('map', gram + np.eye(gram.shape[-1])),
+                                            moments - np.einsum('gij,gj->gi', gram, beta_0))
+    return beta[:, 0], np.ones(len(counts), dtype=bool)
+
+
+# Grouped implementation of the functions of aggregate_per_slice_or_level()
+_GROUPED_FUNCS = {func_wa: _grouped_wa, func_std: _grouped_std, func_bin: _grouped_bin, func_sum: _grouped_sum,
+                  func_max: _grouped_max, func_median: _grouped_median, func_ml: _grouped_ml, func_map: _grouped_map}
+
+
+def _aggregate_grouped(metrics, mask, slicegroups, group_funcs, map_clusters=None):
+    """
+    Aggregate metrics across all the slice groups at once, for the functions of group_funcs that have a grouped
+    implementation (see _GROUPED_FUNCS).
+
+    From the metric and the first label of the mask (see _SlicewiseData), each function computes slice-wise sums (or
+    maxima, sorted values), which are then combined per slice group with a (slice groups, slices) matrix counting the
+    occurrences of each slice in each group.
+
+    :param metrics: list of Metric(), aggregated with the same mask
+    :return: for each metric, dict {name of the function: list of results per slice group (None if the mask is empty,
+      or _UNDEFINED where the result must be computed by _aggregate_slicegroup(), e.g. to report an error)}, with the
+      size of the mask per slice group in 'Size [vox]'. None if no function has a grouped implementation.
+    """
+    if not any(func in _GROUPED_FUNCS for _, func in group_funcs):
+        return None
+    slices = sorted(set(functools.reduce(operator.concat, [tuple(slicegroup) for slicegroup in slicegroups], ())))
+    index = {z: i for i, z in enumerate(slices)}
+    columns = [[index[z] for z in slicegroup] for slicegroup in slicegroups]
+    counts = np.zeros((len(slicegroups), len(slices)))
+    for i_group, cols in enumerate(columns):
+        np.add.at(counts[i_group], cols, 1)
+    # Select a range of slices without copying the data
+    if slices and slices[0] >= 0 and slices == list(range(slices[0], slices[-1] + 1)):
+        selection = slice(slices[0], slices[-1] + 1)
+    else:
+        selection = slices
+
+    mask_data = None
+    if mask is not None:
+        if isinstance(mask.data, SparseAtlas):
+            mask_data = mask.data.slices(slices)
+        else:
+            mask_data = mask.data[..., selection, :]
+    groupeds, shared = [], None
+    for metric in metrics:
+        data = metric.data[..., selection]
+        if data.shape[-1] != len(slices):
+            raise IndexError("Slices out of bounds: {}".format(slices))
+        grouped = {}
+        if mask is not None:
+            slicewise = _SlicewiseData(data, mask_data, shared=shared)
+            shared = slicewise if shared is None else shared
+            grouped['Size [vox]'] = list((counts @ slicewise.size).astype(np.sum(np.zeros(0, mask_data.dtype)).dtype))
+            if mask_data.shape[-1] == 1:
+                mask_empty = counts @ slicewise.sum_per_slice(slicewise.weights) == 0
+            elif isinstance(mask_data, SparseAtlas):
+                # All the labels (e.g. for func_ml())
+                mask_empty = counts @ slicewise.normal_equations[2].sum(axis=1) == 0
+            else:
+                mask_total = np.where(np.isfinite(data)[..., np.newaxis], mask_data, 0)
+                mask_total = mask_total.sum(axis=tuple(range(data.ndim - 1)) + (data.ndim,))
+                mask_empty = counts @ mask_total == 0
+        else:
+            slicewise = _SlicewiseData(data)
+            mask_empty = counts @ slicewise.sum_per_slice(slicewise.weights) == 0
+
+        for name, func in group_funcs:
+            if func not in _GROUPED_FUNCS:
+                continue
+            values, valid = _GROUPED_FUNCS[func](slicewise, counts, columns, map_clusters)
+            grouped[name] = [None if empty else value if ok else _UNDEFINED
+                             for value, ok, empty in zip(values, valid, mask_empty)]
+        groupeds.append(grouped)
+    return groupeds
 
 
 def check_labels(indiv_labels_ids, selected_labels):
@@ -394,8 +771,9 @@ def extract_metric(data, labels=None, slices=None, levels=None, perslice=True, p
     """
     Extract metric within a data, using mask and a given method.
 
-    :param data: Class Metric(): Data (a.k.a. metric) of n-dimension to extract aggregated value from
-    :param labels: Class Metric(): Labels of (n+1)dim. The last dim encloses the labels.
+    :param data: Class Metric(): Data (a.k.a. metric) of n-dimension to extract aggregated value from, or list of \
+    Metric() (e.g. FA, MD) extracted with the same masks and ML/MAP estimation (see aggregate_per_slice_or_level())
+    :param labels: ndarray or SparseAtlas: Labels of (n+1)dim. The last dim encloses the labels.
     :param slices:
     :param levels:
     :param perslice:
@@ -412,13 +790,15 @@ def extract_metric(data, labels=None, slices=None, levels=None, perslice=True, p
     map_clusters = None
     func_methods = {'ml': ('ML', func_ml), 'map': ('MAP', func_map)}  # TODO: complete dict with other methods
     # If label_struc[id_label].id is a list (i.e. comes from a combined labels), sum all labels
-    if isinstance(label_struc[id_label].id, list):
-        labels_sum = np.sum(labels[..., label_struc[id_label].id], axis=labels.ndim-1)  # (nx, ny, nz, 1)
+    if isinstance(labels, SparseAtlas):
+        labels_sum = labels.select([label_struc[id_label].id])  # (nx, ny, nz, 1)
     else:
-        labels_sum = labels[..., label_struc[id_label].id]
-    # expand dim: labels_sum=(..., 1)
-    ndim = labels_sum.ndim
-    labels_sum = np.expand_dims(labels_sum, axis=ndim)
+        if isinstance(label_struc[id_label].id, list):
+            labels_sum = np.sum(labels[..., label_struc[id_label].id], axis=labels.ndim-1)  # (nx, ny, nz, 1)
+        else:
+            labels_sum = labels[..., label_struc[id_label].id]
+        # expand dim: labels_sum=(..., 1)
+        labels_sum = np.expand_dims(labels_sum, axis=labels_sum.ndim)
 
     # Maximum Likelihood or Maximum a Posteriori
     if method in ['ml', 'map']:
@@ -439,7 +819,10 @@ def extract_metric(data, labels=None, slices=None, levels=None, perslice=True, p
         # Examples of scenario:
         #   labels_sum = [[0], [1:36]]
         #   labels_sum = [[3,4], [0,2,5:36]]
-        labels_sum = np.concatenate([labels_sum, labels[..., id_label_compl]], axis=ndim)
+        if isinstance(labels, SparseAtlas):
+            labels_sum = labels.select([label_struc[id_label].id] + id_label_compl)
+        else:
+            labels_sum = np.concatenate([labels_sum, labels[..., id_label_compl]], axis=labels_sum.ndim - 1)
         mask = Metric(data=labels_sum, label=label_struc[id_label].name)
         group_funcs = (func_methods[method], ('STD', func_std))
     # Weighted average
@@ -0,0 +1,231 @@
+#########################################################################################
+#
+# Atlas of labels (e.g. the white and gray matter tracts of the PAM50 template) stored as a sparse matrix.
+#
+# ---------------------------------------------------------------------------------------
+# Copyright (c) 2020 Polytechnique Montreal <www.neuro.polymtl.ca>
+#
+# About the license: see the file LICENSE.TXT
+#########################################################################################
+
+import logging
+import os
+
+import numpy as np
+from scipy import sparse
+
+from spinalcordtoolbox.image import Image
+from spinalcordtoolbox.utils.fs import tmp_create, rmtree, get_cache_dir, cache_key, cache_fetch, cache_store
+
+logger = logging.getLogger(__name__)
+
+# Name of the sparse atlas in the entries of the persistent cache (see load_atlas())
+CACHE_FILENAME = 'atlas_sparse.npz'
+
+
+class SparseAtlas:
+    """
+    Labels of an atlas stored as a sparse (voxels x labels) matrix, instead of a dense (x, y, z, label) stack: each
+    label of the atlas is non-null in a small fraction of the voxels.
+
+    The voxels (rows of the matrix) are ordered slice by slice, the slices being along the last spatial axis (z), so
+    that the labels of a slice are a block of rows.
+    """
+    def __init__(self, matrix, shape):
+        """
+        :param matrix: scipy.sparse matrix (voxels x labels)
+        :param shape: shape of the atlas as a dense stack: (x, y, z, label)
+        """
+        self.matrix = sparse.csr_matrix(matrix)
+        self.shape = tuple(int(n) for n in shape)
+        if self.matrix.shape != (np.prod(self.shape[:-1], dtype=int), self.shape[-1]):
+            raise ValueError("Shape mismatch between the matrix {} and the atlas {}".format(self.matrix.shape,
+                                                                                            self.shape))
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def dtype(self):
+        return self.matrix.dtype
+
+    @property
+    def nbytes(self):
+        return self.matrix.data.nbytes + self.matrix.indices.nbytes + self.matrix.indptr.nbytes
+
+    @classmethod
+    def from_array(cls, labels):
+        """
+        :param labels: ndarray: dense stack of labels, with the labels along the last axis, e.g. (x, y, z, label)
+        """
+        labels = np.asarray(labels)
+        return cls(_to_rows(labels, axis=labels.ndim - 2).reshape(-1, labels.shape[-1]), labels.shape)
+
+    @classmethod
+    def from_images(cls, fnames):
+        """
+        Load the label images (reoriented to RPI) one at a time, so that the dense stack is never built.
+
+        :param fnames: list of file names: one image per label
+        """
+        rows, columns, values, shape = [], [], [], None
+        for i_label, fname in enumerate(fnames):
+            data = Image(fname).change_orientation('RPI').data
+            if shape is None:
+                shape = data.shape
+            elif data.shape != shape:
+                raise ValueError("Shape mismatch between the labels: {} {} vs. {}".format(fname, data.shape, shape))
+            data = _to_rows(data, axis=data.ndim - 1)
+            row = np.flatnonzero(data)
+            rows.append(row)
+            columns.append(np.full(len(row), i_label))
+            values.append(data[row])
+        matrix = sparse.coo_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(columns))),
+                                   shape=(np.prod(shape, dtype=int), len(fnames)))
+        return cls(matrix, shape + (len(fnames),))
+
+    def select(self, ids):
+        """
+        Atlas of some labels.
+
+        :param ids: list of labels: int (label ID), or list of int (sum of labels)
+        :return: SparseAtlas
+        """
+        selection = sparse.lil_matrix((self.shape[-1], len(ids)), dtype=self.dtype)
+        for i, id_label in enumerate(ids):
+            for id_label_sum in (id_label if isinstance(id_label, list) else [id_label]):
+                selection[id_label_sum, i] += 1
+        return SparseAtlas(self.matrix @ selection.tocsr(), self.shape[:-1] + (len(ids),))
+
+    def slices(self, slices):
+        """
+        Atlas of some slices.
+
+        :param slices: list of int: slices (z)
+        :return: SparseAtlas
+        """
+        slices = list(slices)
+        n_voxels = np.prod(self.shape[:-2], dtype=int)
+        if slices == list(range(self.shape[-2])):
+            return self
+        if slices and slices[0] >= 0 and slices == list(range(slices[0], slices[-1] + 1)):
+            # Range of slices: block of rows
+            matrix = self.matrix[slices[0] * n_voxels:(slices[-1] + 1) * n_voxels]
+        else:
+            matrix = self.matrix[(np.asarray(slices, dtype=int)[:, np.newaxis] * n_voxels + np.arange(n_voxels)).ravel()]
+        return SparseAtlas(matrix, self.shape[:-2] + (len(slices), self.shape[-1]))
+
+    def label(self, ids):
+        """
+        :param ids: int (label ID), or list of int (sum of labels)
+        :return: ndarray: dense label, e.g. (x, y, z)
+        """
+        ids = ids if isinstance(ids, list) else [ids]
+        values = np.asarray(self.matrix[:, ids].sum(axis=1, dtype=self.dtype)).ravel()
+        return _from_rows(values, self.shape[:-1])
+
+    def toarray(self):
+        """
+        :return: ndarray: dense stack of labels, e.g. (x, y, z, label)
+        """
+        return _from_rows(self.matrix.toarray(), self.shape[:-1])
+
+    def normal_equations(self, data, gram=None):
+        """
+        Terms of the normal equations of the least squares estimation of the metric in each label (see func_ml()),
+        for each slice. The voxels where the metric is not finite are ignored.
+
+        :param data: ndarray: metric, e.g. (x, y, z)
+        :param gram: (gram, sums) returned for another metric that is not finite in the same voxels: only the moments \
+        are computed.
+        :return: gram: ndarray (slices, labels, labels): X.T @ X, with X the (voxels x labels) labels of the slice
+        :return: moments: ndarray (slices, labels): X.T @ y, with y the metric of the slice
+        :return: sums: ndarray (slices, labels): sum of each label in the slice
+        """
+        n_slices, n_labels = self.shape[-2], self.shape[-1]
+        y = _to_rows(data, axis=data.ndim - 1)
+        if len(y) != self.matrix.shape[0]:
+            raise ValueError("Shape mismatch between the metric {} and the atlas {}".format(data.shape, self.shape))
+        finite = np.isfinite(y)
+        y = np.where(finite, y, 0).astype(np.float64)
+        matrix = self.matrix
+        values = matrix.data.astype(np.float64)
+        if gram is None:
+            # Remove the entries of the voxels where the metric is not finite (their metric is set to zero already for
+            # the moments)
+            rows = np.flatnonzero(~finite)
+            starts, lengths = matrix.indptr[rows], matrix.indptr[rows + 1] - matrix.indptr[rows]
+            values[np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())] = 0
+        # Each entry is moved to the columns of its slice, so that one product computes the terms of all the slices
+        n_voxels = np.prod(self.shape[:-2], dtype=int)
+        slice_entries = np.repeat(np.arange(n_slices), np.diff(matrix.indptr[::n_voxels]))
+        matrix_slices = sparse.csr_matrix((values, matrix.indices + slice_entries * n_labels, matrix.indptr),
+                                          shape=(matrix.shape[0], n_slices * n_labels))
+        moments = (matrix_slices.T @ y).reshape(n_slices, n_labels)
+        if gram is not None:
+            return gram[0], moments, gram[1]
+        matrix = sparse.csr_matrix((values, matrix.indices, matrix.indptr), shape=matrix.shape)
+        gram = (matrix.T @ matrix_slices).toarray().reshape(n_labels, n_slices, n_labels).transpose(1, 0, 2)
+        sums = np.asarray(matrix_slices.sum(axis=0)).reshape(n_slices, n_labels)
+        return gram, moments, sums
+
+
+def _to_rows(data, axis):
+    """Flatten the spatial axes of an array slice by slice, the slices being along the axis."""
+    data = np.moveaxis(data, axis, 0)
+    return data.reshape((-1,) + data.shape[axis + 1:])
+
+
+def _from_rows(values, shape):
+    """Inverse of _to_rows(): reshape the first axis of the values (flattened slice by slice) as the spatial shape."""
+    values = values.reshape((shape[-1],) + tuple(shape[:-1]) + values.shape[1:])
+    return np.moveaxis(values, 0, len(shape) - 1)
+
+
+def load_atlas(path_label, fnames, fname_label='info_label.txt', cache=True):
+    """
+    Load the labels of an atlas folder (reoriented to RPI) as a SparseAtlas. If the persistent cache is enabled (see
+    SCT_CACHE_DIR), the sparse atlas is stored in the cache, to be loaded directly next time, as long as the label file
+    and the atlas files are not modified.
+
+    :param path_label: atlas folder
+    :param fnames: list of file names (in path_label): one image per label (see metadata.read_label_file())
+    :param fname_label: label file of the atlas (in path_label)
+    :param cache: load and store the atlas in the persistent cache
+    :return: SparseAtlas
+    """
+    paths = [os.path.join(path_label, fname) for fname in fnames]
+    path_cache = get_cache_dir() if cache else None
+    if path_cache is None:
+        return SparseAtlas.from_images(paths)
+
+    # The atlas files are identified by their path, size and modification time rather than by their content, which
+    # would take as long to read as the atlas itself
+    fname_info = os.path.join(path_label, fname_label)
+    key = cache_key(input_files=[fname_info] if os.path.isfile(fname_info) else [],
+                    input_data=[[os.path.abspath(path), os.path.getsize(path), os.path.getmtime(path)]
+                                for path in paths],
+                    input_params={'cache': CACHE_FILENAME})
+    path_tmp = tmp_create(basename="load_atlas")
+    fname_npz = os.path.join(path_tmp, CACHE_FILENAME)
+    try:
+        if cache_fetch(path_cache, key, {CACHE_FILENAME: fname_npz}):
+            try:
+                with np.load(fname_npz, allow_pickle=False) as npz:
+                    matrix = sparse.csr_matrix((npz['data'], npz['indices'], npz['indptr']),
+                                               shape=tuple(npz['matrix_shape']))
+                    return SparseAtlas(matrix, npz['shape'])
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning("Could not read the cached atlas: %s", e)
+
+        atlas = SparseAtlas.from_images(paths)
+        try:
+            np.savez(fname_npz, data=atlas.matrix.data, indices=atlas.matrix.indices, indptr=atlas.matrix.indptr,
+                     matrix_shape=atlas.matrix.shape, shape=atlas.shape)
+            cache_store(path_cache, key, {CACHE_FILENAME: fname_npz})
+        except OSError as e:
+            logger.info("Could not store the sparse atlas in the cache: %s", e)
+        return atlas
+    finally:
+        rmtree(path_tmp, verbose=0)
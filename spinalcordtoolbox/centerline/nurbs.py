@@ -41,7 +41,6 @@ import numpy as np
 import logging
 
 from spinalcordtoolbox.image import Image
-from spinalcordtoolbox.types import Centerline
 
 logger = logging.getLogger(__name__)
 
@@ -50,6 +49,43 @@ class ReconstructionError(RuntimeError):
     pass
 
 
+def _inverse(values):
+    """Inverse of the values, 0 where the values are null (terms of the Cox-de Boor recursion that are left out)."""
+    return np.divide(1.0, values, out=np.zeros_like(values), where=values != 0)
+
+
+def _basis_functions(knots, order, t, derivatives=False):
+    """
+    B-spline basis functions of a knot vector, computed at all the parameters at once with the Cox-de Boor recursion.
+
+    Each basis function is made of polynomial pieces over the knot spans, which are taken as closed intervals: at a
+    knot, the pieces of both adjacent spans are summed.
+
+    :param knots: knot vector (length: number of basis functions + order)
+    :param order: order of the B-spline (degree + 1)
+    :param t: parameters at which the basis functions are evaluated
+    :param derivatives: also return the derivatives of the basis functions
+    :return: basis: ndarray (len(t), len(knots) - order)
+    :return: basis_deriv: ndarray (len(t), len(knots) - order), if derivatives is True
+    """
+    knots = np.asarray(knots, dtype=float)
+    t = np.asarray(t, dtype=float).reshape(-1, 1)
+    basis = ((knots[:-1] <= t) & (t <= knots[1:])).astype(float)
+    basis_previous = np.zeros((len(t), len(knots) - order + 1))
+    for k in range(2, order + 1):
+        basis_previous = basis
+        inv_left = _inverse(knots[k - 1:-1] - knots[:-k])
+        inv_right = _inverse(knots[k:] - knots[1:-k + 1])
+        basis = (t - knots[:-k]) * inv_left * basis_previous[:, :-1] \
+            + (knots[k:] - t) * inv_right * basis_previous[:, 1:]
+    if not derivatives:
+        return basis
+    # Like the original polynomial implementation, the derivative is scaled by the order (instead of the degree)
+    if order == 1:
+        return basis, np.zeros_like(basis)
+    return basis, order * (inv_left * basis_previous[:, :-1] - inv_right * basis_previous[:, 1:])
+
+
 class NURBS:
     def __init__(self, degre=3, precision=1000, liste=None, sens=False, nbControl=None, verbose=1, tolerance=0.01,
                  maxControlPoints=50, all_slices=True, twodim=False, weights=True):
@@ -88,10 +124,10 @@ class NURBS:
                     self.courbe3D_deriv.append([[P_x_d[i], P_y_d[i], P_z_d[i]] for i in len(P_x_d)])
         else:
             # La liste est sous la forme d'une liste de points
-            P_x = [x[0] for x in liste]
-            P_y = [x[1] for x in liste]
+            data = np.array(liste, dtype=float)
+            P_x, P_y = data[:, 0], data[:, 1]
             if not twodim:
-                P_z = [x[2] for x in liste]
+                P_z = data[:, 2]
                 self.P_z = P_z
 
             if nbControl is None:
@@ -107,20 +143,10 @@ class NURBS:
                                           + '. Either change degree to a lower value, or add points to the curve.')
 
                 # compute weights based on curve density
-                w = [1.0] * len(P_x)
+                w = np.ones(len(P_x))
                 if weights:
-                    if not twodim:
-                        for i in range(1, len(P_x) - 1):
-                            dist_before = np.sqrt(
-                                (P_x[i - 1] - P_x[i]) ** 2 + (P_y[i - 1] - P_y[i]) ** 2 + (P_z[i - 1] - P_z[i]) ** 2)
-                            dist_after = np.sqrt(
-                                (P_x[i] - P_x[i + 1]) ** 2 + (P_y[i] - P_y[i + 1]) ** 2 + (P_z[i] - P_z[i + 1]) ** 2)
-                            w[i] = (dist_before + dist_after) / 2.0
-                    else:
-                        for i in range(1, len(P_x) - 1):
-                            dist_before = np.sqrt((P_x[i - 1] - P_x[i]) ** 2 + (P_y[i - 1] - P_y[i]) ** 2)
-                            dist_after = np.sqrt((P_x[i] - P_x[i + 1]) ** 2 + (P_y[i] - P_y[i + 1]) ** 2)
-                            w[i] = (dist_before + dist_after) / 2.0
+                    dist = np.sqrt(np.sum(np.diff(data, axis=0) ** 2, axis=1))
+                    w[1:-1] = (dist[:-1] + dist[1:]) / 2.0
                     w[0], w[-1] = w[1], w[-2]
 
                 list_param_that_worked = []
@@ -149,25 +175,7 @@ class NURBS:
                                                                                   self.precision / 3)
 
                         # compute error between the input data and the nurbs
-                        error_curve = 0.0
-                        if not twodim:
-                            for i in range(0, len(P_x)):
-                                min_dist = 10000.0
-                                for k in range(0, len(self.courbe3D[0])):
-                                    dist = (self.courbe3D[0][k] - P_x[i]) ** 2 + (self.courbe3D[1][k] - P_y[i]) ** 2 + (
-                                                self.courbe3D[2][k] - P_z[i]) ** 2
-                                    if dist < min_dist:
-                                        min_dist = dist
-                                error_curve += min_dist
-                        else:
-                            for i in range(0, len(P_x)):
-                                min_dist = 10000.0
-                                for k in range(0, len(self.courbe2D[0])):
-                                    dist = (self.courbe2D[0][k] - P_x[i]) ** 2 + (self.courbe2D[1][k] - P_y[i]) ** 2
-                                    if dist < min_dist:
-                                        min_dist = dist
-                                error_curve += min_dist
-                        error_curve /= float(len(P_x))
+                        error_curve = self.approximation_error(data, self.courbe2D if twodim else self.courbe3D)
 
                         if verbose >= 1:
                             logger.info('Error on approximation = ' + str(np.round(error_curve, 2)) + ' mm')
@@ -245,477 +253,121 @@ class NURBS:
     def getCourbe2D_deriv(self):
         return self.courbe2D_deriv
 
-    # Multiplie deux polynomes
-    def multipolynome(self, polyA, polyB):
-        result = []
-        for r in polyB:
-            temp = polyA * r[0]
-            result.append([temp, r[-1]])
-        return result
-
-    def N(self, i, k, x):
-        global Nik_temp
-        if k == 1:
-            tab = [[np.poly1d(1), i + 1]]
-        else:
-            tab = []
-            den_g = x[i + k - 1] - x[i]
-            den_d = x[i + k] - x[i + 1]
-            if den_g != 0:
-                if Nik_temp[i][k - 1] == -1:
-                    Nik_temp[i][k - 1] = self.N(i, k - 1, x)
-                tab_b = self.multipolynome(np.poly1d([1 / den_g, -x[i] / den_g]), Nik_temp[i][k - 1])
-                tab.extend(tab_b)
-            if den_d != 0:
-                if Nik_temp[i + 1][k - 1] == -1:
-                    Nik_temp[i + 1][k - 1] = self.N(i + 1, k - 1, x)
-                tab_d = self.multipolynome(np.poly1d([-1 / den_d, x[i + k] / den_d]), Nik_temp[i + 1][k - 1])
-                tab.extend(tab_d)
-
-        return tab
-
-    def Np(self, i, k, x):
-        global Nik_temp_deriv, Nik_temp
-        if k == 1:
-            tab = [[np.poly1d(0), i + 1]]
-        else:
-            tab = []
-            den_g = x[i + k - 1] - x[i]
-            den_d = x[i + k] - x[i + 1]
-            if den_g != 0:
-                if Nik_temp_deriv[i][-1] == -1:
-                    Nik_temp_deriv[i][-1] = self.N(i, k - 1, x)
-                tab_b = self.multipolynome(np.poly1d([k / den_g]), Nik_temp_deriv[i][-1])
-                tab.extend(tab_b)
-            if den_d != 0:
-                if Nik_temp_deriv[i + 1][-1] == -1:
-                    Nik_temp_deriv[i + 1][-1] = self.N(i + 1, k - 1, x)
-                tab_d = self.multipolynome(np.poly1d([-k / den_d]), Nik_temp_deriv[i + 1][-1])
-                tab.extend(tab_d)
-
-        return tab
-
-    def evaluateN(self, Ni, t, x):
-        result = 0
-        for Ni_temp in Ni:
-            if x[Ni_temp[-1] - 1] <= t <= x[Ni_temp[-1]]:
-                result += Ni_temp[0](t)
-        return result
-
-    def calculX3D(self, P, k):
-        n = len(P) - 1
-        c = []
-        sumC = 0
-        for i in range(n):
-            dist = np.sqrt((P[i + 1][0] - P[i][0]) ** 2 + (P[i + 1][1] - P[i][1]) ** 2 + (P[i + 1][2] - P[i][2]) ** 2)
-            c.append(dist)
-            sumC += dist
-
-        x = [0] * k
-        sumCI = 0
-        for i in range(n - k + 1):
-            sumCI += c[i + 1]
-            x.append((n - k + 2) / sumC * ((i + 1) * c[i + 1] / (n - k + 2) + sumCI))
+    def approximation_error(self, data, courbe):
+        """
+        Mean, over the data points, of the squared distance to the nearest point of the curve (at most 10000).
 
-        x.extend([n - k + 2] * k)
+        :param data: ndarray (points, dimensions)
+        :param courbe: list of coordinates of the curve, e.g. [P_x, P_y, P_z]
+        :return: float
+        """
+        courbe = np.column_stack(courbe)
+        min_dist = np.empty(len(data))
+        # Distances to all the points of the curve, for a block of data points at a time
+        step = max(1, 250000 // len(courbe))
+        for i in range(0, len(data), step):
+            dist = np.sum((courbe[np.newaxis] - data[i:i + step, np.newaxis]) ** 2, axis=2)
+            min_dist[i:i + step] = np.fmin(np.fmin.reduce(dist, axis=1), 10000.0)
+        return np.cumsum(min_dist)[-1] / float(len(data))
 
-        return x
+    def calculX3D(self, P, k):
+        return self.calculX(P, k)
 
     def calculX2D(self, P, k):
-        n = len(P) - 1
-        c = []
-        sumC = 0
-        for i in range(n):
-            dist = np.sqrt((P[i + 1][0] - P[i][0]) ** 2 + (P[i + 1][1] - P[i][1]) ** 2)
-            c.append(dist)
-            sumC += dist
-
-        x = [0] * k
-        sumCI = 0
-        for i in range(n - k + 1):
-            sumCI += c[i + 1]
-            x.append((n - k + 2) / sumC * ((i + 1) * c[i + 1] / (n - k + 2) + sumCI))
+        return self.calculX(P, k)
 
-        x.extend([n - k + 2] * k)
-
-        return x
+    def calculX(self, P, k):
+        P = np.asarray(P, dtype=float)
+        n = len(P) - 1
+        c = np.sqrt(np.sum(np.diff(P, axis=0) ** 2, axis=1))
+        sumC = np.cumsum(c)[-1]
+        i = np.arange(1, n - k + 2)
+        x = (n - k + 2) / sumC * (i * c[i] / (n - k + 2) + np.cumsum(c[i]))
+        return np.concatenate([np.zeros(k), x, np.full(k, float(n - k + 2))])
 
     def construct3D(self, P, k, prec):  # P point de controles
-        global Nik_temp, Nik_temp_deriv
-        n = len(P)  # Nombre de points de controle - 1
-
-        # Calcul des xi
         x = self.calculX3D(P, k)
-
-        # Calcul des coefficients N(i,k)
-        Nik_temp = [[-1 for j in range(k)] for i in range(n)]
-        for i in range(n):
-            Nik_temp[i][-1] = self.N(i, k, x)
-        Nik = []
-        for i in range(n):
-            Nik.append(Nik_temp[i][-1])
-
-        # Calcul des Nik,p'
-        Nik_temp_deriv = [[-1] for i in range(n)]
-        for i in range(n):
-            Nik_temp_deriv[i][-1] = self.Np(i, k, x)
-        Nikp = []
-        for i in range(n):
-            Nikp.append(Nik_temp_deriv[i][-1])
-
-        # Calcul de la courbe
         param = np.linspace(x[0], x[-1], int(round(prec)))
-        P_x, P_y, P_z = [], [], []  # coord fitees
-        P_x_d, P_y_d, P_z_d = [], [], []  # derivees
-        for i in range(len(param)):
-            sum_num_x, sum_num_y, sum_num_z, sum_den = 0, 0, 0, 0
-            sum_num_x_der, sum_num_y_der, sum_num_z_der, sum_den_der = 0, 0, 0, 0
-
-            for l in range(n - k + 1):  # utilisation que des points non nuls
-                if x[l + k - 1] <= param[i] < x[l + k]:
-                    debut = l
-            fin = debut + k - 1
-
-            for j, point in enumerate(P[debut:fin + 1]):
-                j = j + debut
-                N_temp = self.evaluateN(Nik[j], param[i], x)
-                N_temp_deriv = self.evaluateN(Nikp[j], param[i], x)
-                sum_num_x += N_temp * point[0]
-                sum_num_y += N_temp * point[1]
-                sum_num_z += N_temp * point[2]
-                sum_den += N_temp
-                sum_num_x_der += N_temp_deriv * point[0]
-                sum_num_y_der += N_temp_deriv * point[1]
-                sum_num_z_der += N_temp_deriv * point[2]
-                sum_den_der += N_temp_deriv
-
-            P_x.append(sum_num_x / sum_den)  # sum_den = 1 !
-            P_y.append(sum_num_y / sum_den)
-            P_z.append(sum_num_z / sum_den)
-            P_x_d.append(sum_num_x_der)
-            P_y_d.append(sum_num_y_der)
-            P_z_d.append(sum_num_z_der)
-
-            if sum_den <= 0.05:
-                raise ReconstructionError()
-
-        P_x = [P_x[i] for i in np.argsort(P_z)]
-        P_y = [P_y[i] for i in np.argsort(P_z)]
-        P_x_d = [P_x_d[i] for i in np.argsort(P_z)]
-        P_y_d = [P_y_d[i] for i in np.argsort(P_z)]
-        P_z_d = [P_z_d[i] for i in np.argsort(P_z)]
-        P_z = np.sort(P_z)
-
-        # on veut que les coordonnees fittees aient le meme z que les coordonnes de depart. on se ramene donc a des entiers et on moyenne en x et y  .
-        P_x = np.array(P_x)
-        P_y = np.array(P_y)
-        P_x_d = np.array(P_x_d)
-        P_y_d = np.array(P_y_d)
-        P_z_d = np.array(P_z_d)
-
-        if self.all_slices:
-            P_z = np.array([int(np.round(P_z[i])) for i in range(0, len(P_z))])
-
-            # not perfect but works (if "enough" points), in order to deal with missing z slices
-            for i in range(min(P_z), max(P_z) + 1, 1):
-                if i not in P_z:
-                    P_z_temp = np.insert(P_z, np.where(P_z == i - 1)[-1][-1] + 1, i)
-                    P_x_temp = np.insert(P_x, np.where(P_z == i - 1)[-1][-1] + 1, (
-                                P_x[np.where(P_z == i - 1)[-1][-1]] + P_x[np.where(P_z == i - 1)[-1][-1] + 1]) / 2)
-                    P_y_temp = np.insert(P_y, np.where(P_z == i - 1)[-1][-1] + 1, (
-                                P_y[np.where(P_z == i - 1)[-1][-1]] + P_y[np.where(P_z == i - 1)[-1][-1] + 1]) / 2)
-                    P_x_d_temp = np.insert(P_x_d, np.where(P_z == i - 1)[-1][-1] + 1, (
-                                P_x_d[np.where(P_z == i - 1)[-1][-1]] + P_x_d[np.where(P_z == i - 1)[-1][-1] + 1]) / 2)
-                    P_y_d_temp = np.insert(P_y_d, np.where(P_z == i - 1)[-1][-1] + 1, (
-                                P_y_d[np.where(P_z == i - 1)[-1][-1]] + P_y_d[np.where(P_z == i - 1)[-1][-1] + 1]) / 2)
-                    P_z_d_temp = np.insert(P_z_d, np.where(P_z == i - 1)[-1][-1] + 1, (
-                                P_z_d[np.where(P_z == i - 1)[-1][-1]] + P_z_d[np.where(P_z == i - 1)[-1][-1] + 1]) / 2)
-                    P_x, P_y, P_z, P_x_d, P_y_d, P_z_d = P_x_temp, P_y_temp, P_z_temp, P_x_d_temp, P_y_d_temp, P_z_d_temp
-
-            coord_mean = np.array(
-                [[np.mean(P_x[P_z == i]), np.mean(P_y[P_z == i]), i] for i in range(min(P_z), max(P_z) + 1, 1)])
-
-            P_x = coord_mean[:, :][:, 0]
-            P_y = coord_mean[:, :][:, 1]
-
-            coord_mean_d = np.array(
-                [[np.mean(P_x_d[P_z == i]), np.mean(P_y_d[P_z == i]), np.mean(P_z_d[P_z == i])] for i in
-                 range(min(P_z), max(P_z) + 1, 1)])
-
-            P_z = coord_mean[:, :][:, 2]
-
-            P_x_d = coord_mean_d[:, :][:, 0]
-            P_y_d = coord_mean_d[:, :][:, 1]
-            P_z_d = coord_mean_d[:, :][:, 2]
-
-        return [P_x, P_y, P_z], [P_x_d, P_y_d, P_z_d]
+        return self.average_over_slices(*self.compute_curve_from_parametrization(P, k, x, param))
 
     def construct2D(self, P, k, prec):  # P point de controles
-        global Nik_temp, Nik_temp_deriv
-        n = len(P)  # Nombre de points de controle - 1
-
-        # Calcul des xi
         x = self.calculX2D(P, k)
+        param = np.linspace(x[0], x[-1], int(round(prec)))
+        return self.average_over_slices(*self.compute_curve_from_parametrization(P, k, x, param))
 
-        # Calcul des coefficients N(i,k)
-        Nik_temp = [[-1 for j in range(k)] for i in range(n)]
-        for i in range(n):
-            Nik_temp[i][-1] = self.N(i, k, x)
-        Nik = []
-        for i in range(n):
-            Nik.append(Nik_temp[i][-1])
-
-        # Calcul des Nik,p'
-        Nik_temp_deriv = [[-1] for i in range(n)]
-        for i in range(n):
-            Nik_temp_deriv[i][-1] = self.Np(i, k, x)
-        Nikp = []
-        for i in range(n):
-            Nikp.append(Nik_temp_deriv[i][-1])
+    def average_over_slices(self, courbe, courbe_deriv):
+        """
+        Sort the points of the curve along the last axis (z in 3D, y in 2D) and, if all_slices, average the points and
+        derivatives of each (integer) slice, so that the fitted curve has the same slices as the input data.
 
-        # Calcul de la courbe
-        param = np.linspace(x[0], x[-1], prec)
-        P_x, P_y = [], []  # coord fitees
-        P_x_d, P_y_d = [], []  # derivees
-        for i in range(len(param)):
-            sum_num_x, sum_num_y, sum_den = 0, 0, 0
-            sum_num_x_der, sum_num_y_der, sum_den_der = 0, 0, 0
-
-            for l in range(n - k + 1):  # utilisation que des points non nuls
-                if x[l + k - 1] <= param[i] < x[l + k]:
-                    debut = l
-            fin = debut + k - 1
-
-            for j, point in enumerate(P[debut:fin + 1]):
-                j = j + debut
-                N_temp = self.evaluateN(Nik[j], param[i], x)
-                N_temp_deriv = self.evaluateN(Nikp[j], param[i], x)
-                sum_num_x += N_temp * point[0]
-                sum_num_y += N_temp * point[1]
-                sum_den += N_temp
-                sum_num_x_der += N_temp_deriv * point[0]
-                sum_num_y_der += N_temp_deriv * point[1]
-                sum_den_der += N_temp_deriv
-
-            P_x.append(sum_num_x / sum_den)  # sum_den = 1 !
-            P_y.append(sum_num_y / sum_den)
-            P_x_d.append(sum_num_x_der)
-            P_y_d.append(sum_num_y_der)
-
-            if sum_den <= 0.05:
-                raise ReconstructionError()
-
-        P_x = [P_x[i] for i in np.argsort(P_y)]
-        P_x_d = [P_x_d[i] for i in np.argsort(P_y)]
-        P_y_d = [P_y_d[i] for i in np.argsort(P_y)]
-        P_y = np.sort(P_y)
+        :param courbe: ndarray (points, dimensions)
+        :param courbe_deriv: ndarray (points, dimensions)
+        :return: list of coordinates, list of derivatives
+        """
+        order = np.argsort(courbe[:, -1])
+        courbe, courbe_deriv = courbe[order], courbe_deriv[order]
+        if not self.all_slices:
+            return list(courbe.T), list(courbe_deriv.T)
 
         # on veut que les coordonnees fittees aient le meme z que les coordonnes de depart. on se ramene donc a des entiers et on moyenne en x et y  .
-        P_x = np.array(P_x)
-        P_y = np.array(P_y)
-        P_x_d = np.array(P_x_d)
-        P_y_d = np.array(P_y_d)
-
-        if self.all_slices:
-            P_y = np.array([int(np.round(P_y[i])) for i in range(0, len(P_y))])
-
-            # not perfect but works (if "enough" points), in order to deal with missing z slices
-            for i in range(min(P_y), max(P_y) + 1, 1):
-                if i not in P_y:
-                    P_y_temp = np.insert(P_y, np.where(P_y == i - 1)[-1][-1] + 1, i)
-                    P_x_temp = np.insert(P_x, np.where(P_y == i - 1)[-1][-1] + 1, (
-                                P_x[np.where(P_y == i - 1)[-1][-1]] + P_x[np.where(P_y == i - 1)[-1][-1] + 1]) / 2)
-                    P_x_d_temp = np.insert(P_x_d, np.where(P_y == i - 1)[-1][-1] + 1, (
-                                P_x_d[np.where(P_y == i - 1)[-1][-1]] + P_x_d[np.where(P_y == i - 1)[-1][-1] + 1]) / 2)
-                    P_y_d_temp = np.insert(P_y_d, np.where(P_y == i - 1)[-1][-1] + 1, (
-                                P_y_d[np.where(P_y == i - 1)[-1][-1]] + P_y_d[np.where(P_y == i - 1)[-1][-1] + 1]) / 2)
-                    P_x, P_y, P_x_d, P_y_d = P_x_temp, P_y_temp, P_x_d_temp, P_y_d_temp
-
-            coord_mean = np.array([[np.mean(P_x[P_y == i]), i] for i in range(min(P_y), max(P_y) + 1, 1)])
-
-            P_x = coord_mean[:, :][:, 0]
-
-            coord_mean_d = np.array(
-                [[np.mean(P_x_d[P_y == i]), np.mean(P_y_d[P_y == i])] for i in range(min(P_y), max(P_y) + 1, 1)])
-
-            P_y = coord_mean[:, :][:, 1]
-
-            P_x_d = coord_mean_d[:, :][:, 0]
-            P_y_d = coord_mean_d[:, :][:, 1]
-
-        return [P_x, P_y], [P_x_d, P_y_d]
-
-    def Tk(self, k, Q, Nik, ubar, u):
-        return Q[k] - self.evaluateN(Nik[-1], ubar, u) * Q[-1] - self.evaluateN(Nik[0], ubar, u) * Q[0]
+        slices = np.round(courbe[:, -1]).astype(int)
+        values = np.column_stack([courbe[:, :-1], courbe_deriv])
+        # not perfect but works (if "enough" points), in order to deal with missing z slices
+        for i in np.setdiff1d(np.arange(slices.min(), slices.max() + 1), slices):
+            index = np.searchsorted(slices, i - 1, side='right')
+            slices = np.insert(slices, index, i)
+            values = np.insert(values, index, (values[index - 1] + values[index]) / 2, axis=0)
+
+        first = slices.min()
+        counts = np.bincount(slices - first)
+        mean = np.array([np.bincount(slices - first, weights=value) for value in values.T]) / counts
+        dim = courbe.shape[1]
+        return list(mean[:dim - 1]) + [np.arange(first, slices.max() + 1, dtype=float)], list(mean[dim - 1:])
 
     def isXinY(self, y, x):
-        result = True
-        for i in range(0, len(y) - 1):
-            if y[i] - y[i + 1] != 0.0:
-                result_temp = False
-                for j in range(0, len(x)):
-                    if y[i] - y[i + 1] != 0.0 and y[i] <= x[j] <= y[i + 1]:
-                        result_temp = True
-                        break
-                result = result and result_temp
-        return result
+        # Is there at least one value of x in each non-empty interval [y[i], y[i + 1]]
+        y, x = np.asarray(y), np.sort(x)
+        nonempty = y[:-1] != y[1:]
+        nb_x = np.searchsorted(x, y[1:][nonempty], side='right') - np.searchsorted(x, y[:-1][nonempty], side='left')
+        return bool(np.all(nb_x > 0))
 
     def reconstructGlobalApproximation(self, P_x, P_y, P_z, p, n, w):
         # p = degre de la NURBS
         # n = nombre de points de controle desires
         # w is the weigth on each point P
-        global Nik_temp
-        m = len(P_x)
-
-        # Calcul des chords
-        di = 0.0
-        for k in range(m - 1):
-            di += np.sqrt((P_x[k + 1] - P_x[k]) ** 2 + (P_y[k + 1] - P_y[k]) ** 2 + (P_z[k + 1] - P_z[k]) ** 2)
-        ubar = [0]
-        for k in range(m - 1):
-            # ubar.append((k+1)/float(m))  # uniform method
-            # ubar.append(ubar[-1]+abs((P_x[k+1]-P_x[k])**2 + (P_y[k+1]-P_y[k])**2 + (P_z[k+1]-P_z[k])**2)/di)  # chord length method
-            ubar.append(ubar[-1] + np.sqrt((P_x[k + 1] - P_x[k]) ** 2 + (P_y[k + 1] - P_y[k]) ** 2 + (
-                        P_z[k + 1] - P_z[k]) ** 2) / di)  # centripetal method
-
-        # the knot vector should reflect the distribution of ubar
-        d = (m + 1) / (n - p + 1)
-        u_nonuniform = [0.0] * p
-        for j in range(n - p):
-            i = int((j + 1) * d)
-            alpha = (j + 1) * d - i
-            u_nonuniform.append((1 - alpha) * ubar[i - 1] + alpha * ubar[i])
-        u_nonuniform.extend([1.0] * p)
-
-        # the knot vector can also is uniformly distributed
-        u_uniform = [0.0] * p
-        for j in range(n - p):
-            u_uniform.append((float(j) + 1) / float(n - p))
-        u_uniform.extend([1.0] * p)
-
-        # The only condition for NURBS to work here is that there is at least one point P_.. in each knot space.
-        # The uniform knot vector does not ensure this condition while the nonuniform knot vector ensure it but lack of uniformity in case of variable density of points.
-        # We need a compromise between the two methods: the knot vector must be as uniform as possible, with at least one point between each pair of knots.
-        # New algo:
-        # knotVector = uniformKnotVector
-        # while isKnotSpaceEmpty:
-        #     knotVector += gamma * (nonuniformKnotVector - nonuniformKnotVector)
-        #     # where gamma is a ratio [0,1] multiplier of an integer: 1/gamma = int
-        u_uniform = np.array(u_uniform)
-        u_nonuniform = np.array(u_nonuniform)
-        u = np.array(u_uniform, copy=True)
-        gamma = 1.0 / 10.0
-        n_iter = 0
-        while not self.isXinY(y=u, x=ubar) and n_iter <= 10000:
-            u += gamma * (u_nonuniform - u_uniform)
-            n_iter += 1
-
-        Nik_temp = [[-1 for j in range(p)] for i in range(n)]  # noqa
-        for i in range(n):
-            Nik_temp[i][-1] = self.N(i, p, u)
-        Nik = []
-        for i in range(n):
-            Nik.append(Nik_temp[i][-1])
-
-        R = []
-        for k in range(m - 1):
-            Rtemp = []
-            den = 0
-            for Ni in Nik:
-                den += self.evaluateN(Ni, ubar[k], u)
-            for i in range(n - 1):
-                Rtemp.append(self.evaluateN(Nik[i], ubar[k], u) / den)
-            R.append(Rtemp)
-        R = np.matrix(R)
-
-        # create W diagonal matrix
-        W = np.diag(w[0:-1])
-
-        # calcul des denominateurs par ubar
-        denU = []
-        for k in range(m - 1):
-            temp = 0
-            for Ni in Nik:
-                temp += self.evaluateN(Ni, ubar[k], u)
-            denU.append(temp)
-        Tx = []
-        for i in range(n - 1):
-            somme = 0
-            for k in range(m - 1):
-                somme += w[k] * self.evaluateN(Nik[i], ubar[k], u) * self.Tk(k, P_x, Nik, ubar[k], u) / denU[k]
-            Tx.append(somme)
-        Tx = np.matrix(Tx)
-
-        Ty = []
-        for i in range(n - 1):
-            somme = 0
-            for k in range(m - 1):
-                somme += w[k] * self.evaluateN(Nik[i], ubar[k], u) * self.Tk(k, P_y, Nik, ubar[k], u) / denU[k]
-            Ty.append(somme)
-        Ty = np.matrix(Ty)
-
-        Tz = []
-        for i in range(n - 1):
-            somme = 0
-            for k in range(m - 1):
-                somme += w[k] * self.evaluateN(Nik[i], ubar[k], u) * self.Tk(k, P_z, Nik, ubar[k], u) / denU[k]
-            Tz.append(somme)
-        Tz = np.matrix(Tz)
-
-        P_xb = np.linalg.pinv(R.T * W * R) * Tx.T
-        P_yb = np.linalg.pinv(R.T * W * R) * Ty.T
-        P_zb = np.linalg.pinv(R.T * W * R) * Tz.T
-
-        # Modification of first and last control points
-        P_xb[0], P_yb[0], P_zb[0] = P_x[0], P_y[0], P_z[0]
-        P_xb[-1], P_yb[-1], P_zb[-1] = P_x[-1], P_y[-1], P_z[-1]
-
-        # At this point, we need to check if the control points are in a correct range or if there were instability.
-        # Typically, control points should be far from the data points. One way to do so is to ensure that the
-        from numpy import std
-        std_factor = 10.0
-        std_Px, std_Py, std_Pz, std_x, std_y, std_z = std(P_xb), std(P_yb), std(P_zb), std(np.array(P_x)), std(
-            np.array(P_y)), std(np.array(P_z))
-        if std_x >= 0.1 and std_y >= 0.1 and std_z >= 0.1 and (
-                std_Px > std_factor * std_x or std_Py > std_factor * std_y or std_Pz > std_factor * std_z):
-            raise ReconstructionError()
-
-        P = [[P_xb[i, 0], P_yb[i, 0], P_zb[i, 0]] for i in range(len(P_xb))]
-
-        return P
+        return self.global_approximation(np.column_stack([P_x, P_y, P_z]), p, n, w, np.linalg.pinv)
 
     def reconstructGlobalApproximation2D(self, P_x, P_y, p, n, w):
-        # p = degre de la NURBS
-        # n = nombre de points de controle desires
-        # w is the weigth on each point P
-        global Nik_temp
-        m = len(P_x)
+        return self.global_approximation(np.column_stack([P_x, P_y]), p, n, w, np.linalg.inv)
+
+    def global_approximation(self, Q, p, n, w, inverse):
+        """
+        Control points of the NURBS that approximates the data points in the weighted least squares sense, the first
+        and last control points being the first and last data points.
+
+        :param Q: ndarray (points, dimensions): data points
+        :param p: order of the NURBS (degree + 1)
+        :param n: number of control points (the last one is dropped)
+        :param w: weight of each data point
+        :param inverse: inverse of the normal matrix, e.g. np.linalg.pinv
+        :return: list of n - 1 control points
+        """
+        m = len(Q)
 
         # Calcul des chords
-        di = 0.0
-        for k in range(m - 1):
-            di += np.sqrt((P_x[k + 1] - P_x[k]) ** 2 + (P_y[k + 1] - P_y[k]) ** 2)
-        ubar = [0]
-        for k in range(m - 1):
-            # ubar.append((k+1)/float(m))  # uniform method
-            # ubar.append(ubar[-1]+abs((P_x[k+1]-P_x[k])**2 + (P_y[k+1]-P_y[k])**2 + (P_z[k+1]-P_z[k])**2)/di)  # chord length method
-            ubar.append(
-                ubar[-1] + np.sqrt((P_x[k + 1] - P_x[k]) ** 2 + (P_y[k + 1] - P_y[k]) ** 2) / di)  # centripetal method
+        dist = np.sqrt(np.sum(np.diff(Q, axis=0) ** 2, axis=1))
+        di = np.cumsum(dist)[-1]
+        ubar = np.concatenate([[0.0], np.cumsum(dist / di)])  # centripetal method
 
         # the knot vector should reflect the distribution of ubar
         d = (m + 1) / (n - p + 1)
-        u_nonuniform = [0.0] * p
-        for j in range(n - p):
-            i = int((j + 1) * d)
-            alpha = (j + 1) * d - i
-            u_nonuniform.append((1 - alpha) * ubar[i - 1] + alpha * ubar[i])
-        u_nonuniform.extend([1.0] * p)
+        jd = np.arange(1, n - p + 1) * d
+        i = jd.astype(int)
+        alpha = jd - i
+        u_nonuniform = np.concatenate([np.zeros(p), (1 - alpha) * ubar[i - 1] + alpha * ubar[i], np.ones(p)])
 
         # the knot vector can also is uniformly distributed
-        u_uniform = [0.0] * p
-        for j in range(n - p):
-            u_uniform.append((float(j) + 1) / float(n - p))
-        u_uniform.extend([1.0] * p)
+        u_uniform = np.concatenate([np.zeros(p), np.arange(1, n - p + 1) / float(n - p), np.ones(p)])
 
         # The only condition for NURBS to work here is that there is at least one point P_.. in each knot space.
         # The uniform knot vector does not ensure this condition while the nonuniform knot vector ensure it but lack of uniformity in case of variable density of points.
@@ -725,8 +377,6 @@ class NURBS:
         # while isKnotSpaceEmpty:
         #     knotVector += gamma * (nonuniformKnotVector - nonuniformKnotVector)
         #     # where gamma is a ratio [0,1] multiplier of an integer: 1/gamma = int
-        u_uniform = np.array(u_uniform)
-        u_nonuniform = np.array(u_nonuniform)
         u = np.array(u_uniform, copy=True)
         gamma = 1.0 / 10.0
         n_iter = 0
@@ -734,71 +384,26 @@ class NURBS:
             u += gamma * (u_nonuniform - u_uniform)
             n_iter += 1
 
-        Nik_temp = [[-1 for j in range(p)] for i in range(n)]  # noqa
-        for i in range(n):
-            Nik_temp[i][-1] = self.N(i, p, u)
-        Nik = []
-        for i in range(n):
-            Nik.append(Nik_temp[i][-1])
-
-        R = []
-        for k in range(m - 1):
-            Rtemp = []
-            den = 0
-            for Ni in Nik:
-                den += self.evaluateN(Ni, ubar[k], u)
-            for i in range(n - 1):
-                Rtemp.append(self.evaluateN(Nik[i], ubar[k], u) / den)
-            R.append(Rtemp)
-        R = np.matrix(R)
-
-        # create W diagonal matrix
-        W = np.diag(w[0:-1])
-
-        # calcul des denominateurs par ubar
-        denU = []
-        for k in range(m - 1):
-            temp = 0
-            for Ni in Nik:
-                temp += self.evaluateN(Ni, ubar[k], u)
-            denU.append(temp)
-        Tx = []
-        for i in range(n - 1):
-            somme = 0
-            for k in range(m - 1):
-                somme += w[k] * self.evaluateN(Nik[i], ubar[k], u) * self.Tk(k, P_x, Nik, ubar[k], u) / denU[k]
-            Tx.append(somme)
-        Tx = np.matrix(Tx)
-
-        Ty = []
-        for i in range(n - 1):
-            somme = 0
-            for k in range(m - 1):
-                somme += w[k] * self.evaluateN(Nik[i], ubar[k], u) * self.Tk(k, P_y, Nik, ubar[k], u) / denU[k]
-            Ty.append(somme)
-        Ty = np.matrix(Ty)
-
-        P_xb = (R.T * W * R).I * Tx.T
-        P_yb = (R.T * W * R).I * Ty.T
+        # Each row of the basis has at most p non-null values: the normal matrix is banded, but small (n x n)
+        Nik = _basis_functions(u, p, ubar[:m - 1])
+        R = Nik[:, :n - 1] / Nik.sum(axis=1)[:, np.newaxis]
+        w = np.asarray(w[0:-1], dtype=float)[:, np.newaxis]
+        Tk = Q[:m - 1] - np.outer(Nik[:, -1], Q[-1]) - np.outer(Nik[:, 0], Q[0])
+        P = inverse(R.T @ (w * R)) @ (R.T @ (w * Tk))
 
         # Modification of first and last control points
-        P_xb[0], P_yb[0] = P_x[0], P_y[0]
-        P_xb[-1], P_yb[-1] = P_x[-1], P_y[-1]
+        P[0], P[-1] = Q[0], Q[-1]
 
         # At this point, we need to check if the control points are in a correct range or if there were instability.
         # Typically, control points should be far from the data points. One way to do so is to ensure that the
-        from numpy import std
         std_factor = 10.0
-        std_Px, std_Py, std_x, std_y = std(P_xb), std(P_yb), std(np.array(P_x)), std(np.array(P_y))
-        if std_x >= 0.1 and std_y >= 0.1 and (std_Px > std_factor * std_x or std_Py > std_factor * std_y):
+        std_P, std_Q = np.std(P, axis=0), np.std(Q, axis=0)
+        if np.all(std_Q >= 0.1) and np.any(std_P > std_factor * std_Q):
             raise ReconstructionError()
 
-        P = [[P_xb[i, 0], P_yb[i, 0]] for i in range(len(P_xb))]
-
-        return P
+        return P.tolist()
 
     def reconstructGlobalInterpolation(self, P_x, P_y, P_z, p):  # now in 3D
-        global Nik_temp
         n = 13
         l = len(P_x)
         newPx = P_x[::int(np.round(l / (n - 1)))]
@@ -810,187 +415,51 @@ class NURBS:
         n = len(newPx)
 
         # Calcul du vecteur de noeuds
-        di = 0
-        for k in range(n - 1):
-            di += np.sqrt(
-                (newPx[k + 1] - newPx[k]) ** 2 + (newPy[k + 1] - newPy[k]) ** 2 + (newPz[k + 1] - newPz[k]) ** 2)
-        u = [0] * p
-        ubar = [0]
-        for k in range(n - 1):
-            ubar.append(ubar[-1] + np.sqrt(
-                (newPx[k + 1] - newPx[k]) ** 2 + (newPy[k + 1] - newPy[k]) ** 2 + (newPz[k + 1] - newPz[k]) ** 2) / di)
-        for j in range(n - p):
-            sumU = 0
-            for i in range(p):
-                sumU = sumU + ubar[j + i]
-            u.append(sumU / p)
-        u.extend([1] * p)
-
-        # Construction des fonctions basiques
-        Nik_temp = [[-1 for j in range(p)] for i in range(n)]
-        for i in range(n):
-            Nik_temp[i][-1] = self.N(i, p, u)
-        Nik = []
-        for i in range(n):
-            Nik.append(Nik_temp[i][-1])
-
-        # Construction des matrices
-        M = []
-        for i in range(n):
-            ligneM = []
-            for j in range(n):
-                ligneM.append(self.evaluateN(Nik[j], ubar[i], u))
-            M.append(ligneM)
-        M = np.matrix(M)
-
-        # Matrice des points interpoles
-        Qx = np.matrix(newPx).T
-        Qy = np.matrix(newPy).T
-        Qz = np.matrix(newPz).T
+        Q = np.column_stack([newPx, newPy, newPz])
+        dist = np.sqrt(np.sum(np.diff(Q, axis=0) ** 2, axis=1))
+        ubar = np.concatenate([[0.0], np.cumsum(dist / np.cumsum(dist)[-1])])
+        u = np.concatenate([np.zeros(p), [np.sum(ubar[j:j + p]) / p for j in range(n - p)], np.ones(p)])
 
         # Calcul des points de controle
-        P_xb = M.I * Qx
-        P_yb = M.I * Qy
-        P_zb = M.I * Qz
-
-        return [[P_xb[i, 0], P_yb[i, 0], P_zb[i, 0]] for i in range(len(P_xb))]
-
-    def compute_curve_from_parametrization(self, P, k, x, Nik, Nikp, param):
-        n = len(P)  # Nombre de points de controle - 1
-        P_x, P_y, P_z = [], [], []  # coord fitees
-        P_x_d, P_y_d, P_z_d = [], [], []  # derivees
-        for i in range(len(param)):
-            sum_num_x, sum_num_y, sum_num_z, sum_den = 0, 0, 0, 0
-            sum_num_x_der, sum_num_y_der, sum_num_z_der, sum_den_der = 0, 0, 0, 0
-
-            for l in range(n - k + 1):  # utilisation que des points non nuls
-                if x[l + k - 1] <= param[i] < x[l + k]:
-                    debut = l  # TODO: can yield UnboundLocalError: local variable 'debut' referenced before assignment
-            fin = debut + k - 1
-
-            for j, point in enumerate(P[debut:fin + 1]):
-                j = j + debut
-                N_temp = self.evaluateN(Nik[j], param[i], x)
-                N_temp_deriv = self.evaluateN(Nikp[j], param[i], x)
-                sum_num_x += N_temp * point[0]
-                sum_num_y += N_temp * point[1]
-                sum_num_z += N_temp * point[2]
-                sum_den += N_temp
-                sum_num_x_der += N_temp_deriv * point[0]
-                sum_num_y_der += N_temp_deriv * point[1]
-                sum_num_z_der += N_temp_deriv * point[2]
-                sum_den_der += N_temp_deriv
-
-            P_x.append(sum_num_x / sum_den)  # sum_den = 1 !
-            P_y.append(sum_num_y / sum_den)
-            P_z.append(sum_num_z / sum_den)
-            P_x_d.append(sum_num_x_der)
-            P_y_d.append(sum_num_y_der)
-            P_z_d.append(sum_num_z_der)
-
-            if sum_den <= 0.05:
-                raise ReconstructionError()
-
-        P_x = [P_x[i] for i in np.argsort(P_z)]
-        P_y = [P_y[i] for i in np.argsort(P_z)]
-        P_x_d = [P_x_d[i] for i in np.argsort(P_z)]
-        P_y_d = [P_y_d[i] for i in np.argsort(P_z)]
-        P_z_d = [P_z_d[i] for i in np.argsort(P_z)]
-        P_z = np.sort(P_z)
+        M = _basis_functions(u, p, ubar)
+        return (np.linalg.inv(M) @ Q).tolist()
 
-        # on veut que les coordonnees fittees aient le meme z que les coordonnes de depart. on se ramene donc a des entiers et on moyenne en x et y  .
-        P_x = np.array(P_x)
-        P_y = np.array(P_y)
-        P_x_d = np.array(P_x_d)
-        P_y_d = np.array(P_y_d)
-        P_z_d = np.array(P_z_d)
-        return P_x, P_y, P_z, P_x_d, P_y_d, P_z_d
+    def compute_curve_from_parametrization(self, P, k, x, param):
+        """
+        Points and derivatives of the curve at the given parameters.
 
-    def construct3D_uniform(self, P, k, prec):  # P point de controles
-        global Nik_temp, Nik_temp_deriv
-        n = len(P)  # Nombre de points de controle - 1
+        :param P: control points
+        :param k: order of the NURBS (degree + 1)
+        :param x: knot vector
+        :param param: parameters of the points
+        :return: ndarray (points, dimensions), ndarray (points, dimensions)
+        """
+        P = np.asarray(P, dtype=float)
+        Nik, Nikp = _basis_functions(x, k, param, derivatives=True)
+        sum_den = Nik.sum(axis=1)
+        if np.any(sum_den <= 0.05):
+            raise ReconstructionError()
+        return (Nik @ P) / sum_den[:, np.newaxis], Nikp @ P
 
-        # Calcul des xi
+    def construct3D_uniform(self, P, k, prec):  # P point de controles
         x = self.calculX3D(P, k)
 
-        # Calcul des coefficients N(i,k)
-        Nik_temp = [[-1 for j in range(k)] for i in range(n)]
-        for i in range(n):
-            Nik_temp[i][-1] = self.N(i, k, x)
-        Nik = []
-        for i in range(n):
-            Nik.append(Nik_temp[i][-1])
-
-        # Calcul des Nik,p'
-        Nik_temp_deriv = [[-1] for i in range(n)]
-        for i in range(n):
-            Nik_temp_deriv[i][-1] = self.Np(i, k, x)
-        Nikp = []
-        for i in range(n):
-            Nikp.append(Nik_temp_deriv[i][-1])
-
         # Calcul de la courbe
         # reparametrization of the curve
         param = np.linspace(x[0], x[-1], prec)
-        P_x, P_y, P_z, P_x_d, P_y_d, P_z_d = self.compute_curve_from_parametrization(P, k, x, Nik, Nikp, param)
-        centerline = Centerline(P_x, P_y, P_z, P_x_d, P_y_d, P_z_d)
-        distances_between_points = centerline.progressive_length[1:]
+        courbe, _ = self.compute_curve_from_parametrization(P, k, x, param)
+        distances_between_points = np.sqrt(np.sum(np.diff(courbe, axis=0) ** 2, axis=1))
         range_points = np.linspace(0.0, 1.0, prec)
-        dist_curved = np.zeros(prec)
-        for i in range(1, prec):
-            dist_curved[i] = dist_curved[i - 1] + distances_between_points[i - 1] / centerline.length
+        length = np.cumsum(distances_between_points)[-1]
+        dist_curved = np.concatenate([[0.0], np.cumsum(distances_between_points / length)])
         param = x[0] + (x[-1] - x[0]) * np.interp(range_points, dist_curved, range_points)
-        P_x, P_y, P_z, P_x_d, P_y_d, P_z_d = self.compute_curve_from_parametrization(P, k, x, Nik, Nikp, param)
+        [P_x, P_y, P_z], [P_x_d, P_y_d, P_z_d] = self.average_over_slices(
+            *self.compute_curve_from_parametrization(P, k, x, param))
 
         if self.all_slices:
-            P_z = np.array([int(np.round(P_z[i])) for i in range(0, len(P_z))])
-
-            # not perfect but works (if "enough" points), in order to deal with missing z slices
-            for i in range(min(P_z), max(P_z) + 1, 1):
-                if i not in P_z:
-                    P_z_temp = np.insert(P_z, np.where(P_z == i - 1)[-1][-1] + 1, i)
-                    P_x_temp = np.insert(P_x, np.where(P_z == i - 1)[-1][-1] + 1,
-                                         (P_x[np.where(P_z == i - 1)[-1][-1]] + P_x[
-                                             np.where(P_z == i - 1)[-1][-1] + 1]) / 2)
-                    P_y_temp = np.insert(P_y, np.where(P_z == i - 1)[-1][-1] + 1,
-                                         (P_y[np.where(P_z == i - 1)[-1][-1]] + P_y[
-                                             np.where(P_z == i - 1)[-1][-1] + 1]) / 2)
-                    P_x_d_temp = np.insert(P_x_d, np.where(P_z == i - 1)[-1][-1] + 1, (
-                            P_x_d[np.where(P_z == i - 1)[-1][-1]] + P_x_d[np.where(P_z == i - 1)[-1][-1] + 1]) / 2)
-                    P_y_d_temp = np.insert(P_y_d, np.where(P_z == i - 1)[-1][-1] + 1, (
-                            P_y_d[np.where(P_z == i - 1)[-1][-1]] + P_y_d[np.where(P_z == i - 1)[-1][-1] + 1]) / 2)
-                    P_z_d_temp = np.insert(P_z_d, np.where(P_z == i - 1)[-1][-1] + 1, (
-                            P_z_d[np.where(P_z == i - 1)[-1][-1]] + P_z_d[np.where(P_z == i - 1)[-1][-1] + 1]) / 2)
-                    P_x, P_y, P_z, P_x_d, P_y_d, P_z_d = P_x_temp, P_y_temp, P_z_temp, P_x_d_temp, P_y_d_temp, P_z_d_temp
-
-            coord_mean = np.array(
-                [[np.mean(P_x[P_z == i]), np.mean(P_y[P_z == i]), i] for i in range(min(P_z), max(P_z) + 1, 1)])
-
-            P_x = coord_mean[:, :][:, 0]
-            P_y = coord_mean[:, :][:, 1]
-
-            coord_mean_d = np.array(
-                [[np.mean(P_x_d[P_z == i]), np.mean(P_y_d[P_z == i]), np.mean(P_z_d[P_z == i])] for i in
-                 range(min(P_z), max(P_z) + 1, 1)])
-
-            P_z = coord_mean[:, :][:, 2]
-
-            P_x_d = coord_mean_d[:, :][:, 0]
-            P_y_d = coord_mean_d[:, :][:, 1]
-            P_z_d = coord_mean_d[:, :][:, 2]
-
             # check if slice should be in the result, based on self.P_z
-            indexes_to_remove = []
-            for i, ind_z in enumerate(P_z):
-                if ind_z not in self.P_z:
-                    indexes_to_remove.append(i)
-
-            P_x = np.delete(P_x, indexes_to_remove)
-            P_y = np.delete(P_y, indexes_to_remove)
-            P_z = np.delete(P_z, indexes_to_remove)
-            P_x_d = np.delete(P_x_d, indexes_to_remove)
-            P_y_d = np.delete(P_y_d, indexes_to_remove)
-            P_z_d = np.delete(P_z_d, indexes_to_remove)
+            keep = np.isin(P_z, self.P_z)
+            P_x, P_y, P_z, P_x_d, P_y_d, P_z_d = [a[keep] for a in [P_x, P_y, P_z, P_x_d, P_y_d, P_z_d]]
 
         return [P_x, P_y, P_z], [P_x_d, P_y_d, P_z_d]
 
@@ -29,6 +29,15 @@ def main():
     cmd = [sys.executable, script] + sys.argv[1:]
 
     mpi_flags = os.environ.get("SCT_MPI_MODE", None)
+
+    # Run the command in the command server (see sct_server) if there is one, to skip the startup of a new interpreter
+    path_socket = os.environ.get("SCT_SERVER", None)
+    if path_socket and mpi_flags is None and command != "sct_server":
+        from spinalcordtoolbox.compat.server import forward
+        status = forward(path_socket, script, sys.argv[1:], env)
+        if status is not None:
+            sys.exit(status)
+
     if mpi_flags is not None:
         if mpi_flags == "yes":  # compat
             mpi_flags = "-n 1"
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# Command server: run the scripts in processes forked from a long-lived server, which has already imported the
+# heavy modules (numpy, scipy, nibabel...), instead of starting a new interpreter for each command.
+#
+# The launcher forwards the commands to the server listening on the Unix socket set by the environment variable
+# SCT_SERVER. The client sends its standard streams (file descriptors), so that the output of the command goes
+# directly to the terminal or pipes of the client, and waits for the exit status of the command.
+
+import sys
+import os
+import array
+import json
+import socket
+import struct
+import signal
+import runpy
+import logging
+import importlib
+import traceback
+
+logger = logging.getLogger(__name__)
+
+# Modules imported by the server, and thus shared by all the commands (modules that start threads at import, such as
+# tensorflow, must not be imported before forking)
+PRELOAD = [
+    'numpy',
+    'scipy.ndimage',
+    'scipy.interpolate',
+    'nibabel',
+    'matplotlib.pyplot',
+    'spinalcordtoolbox.image',
+    'spinalcordtoolbox.utils',
+    'spinalcordtoolbox.math',
+    'spinalcordtoolbox.labels',
+    'spinalcordtoolbox.resampling',
+    'spinalcordtoolbox.centerline.core',
+    'spinalcordtoolbox.registration.register',
+    'spinalcordtoolbox.straightening',
+    'spinalcordtoolbox.process_seg',
+    'spinalcordtoolbox.aggregate_slicewise',
+    'spinalcordtoolbox.reports.qc',
+]
+
+_HEADER = struct.Struct('!i')
+
+
+def get_default_socket():
+    """Default path of the socket of the server, for the current user."""
+    import tempfile
+    return os.path.join(tempfile.gettempdir(), 'sct_server_{}.sock'.format(os.getuid()))
+
+
+def _recv_exactly(conn, size):
+    data = b''
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed")
+        data += chunk
+    return data
+
+
+def _recv_int(conn):
+    return _HEADER.unpack(_recv_exactly(conn, _HEADER.size))[0]
+
+
+def forward(path_socket, script, args, env, cwd=None):
+    """
+    Run a script in the server, with the standard streams of the current process.
+
+    :param path_socket: path of the socket of the server
+    :param script: path of the script to run
+    :param args: list of arguments of the script
+    :param env: environment of the command
+    :param cwd: working directory of the command (default: current directory)
+    :return: exit status of the command, or None if the server could not be reached
+    """
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(path_socket)
+    except OSError:
+        conn.close()
+        return None
+
+    with conn:
+        request = json.dumps({'script': script, 'args': list(args), 'env': dict(env),
+                              'cwd': cwd or os.getcwd()}).encode('utf-8')
+        fds = array.array('i', [sys.stdin.fileno(), sys.stdout.fileno(), sys.stderr.fileno()])
+        sys.stdout.flush()
+        sys.stderr.flush()
+        conn.sendmsg([_HEADER.pack(len(request))], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, fds)])
+        conn.sendall(request)
+
+        try:
+            pid = _recv_int(conn)
+        except ConnectionError:
+            return 1
+        while True:
+            try:
+                return _recv_int(conn)
+            except KeyboardInterrupt:
+                # Interrupt the command, and wait for its exit status
+                os.kill(pid, signal.SIGINT)
+            except ConnectionError:
+                return 1
+
+
+def _run_request(conn):
+    """Run the command requested on a connection, in the current (forked) process. Return its exit status."""
+    fds = array.array('i')
+    msg, ancdata, _, _ = conn.recvmsg(_HEADER.size, socket.CMSG_LEN(3 * fds.itemsize))
+    if not msg:
+        raise ConnectionError("Connection closed")
+    for level, kind, data in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(data[:len(data) - (len(data) % fds.itemsize)])
+    if len(fds) != 3:
+        raise ValueError("Expected the 3 standard streams of the client")
+    request = json.loads(_recv_exactly(conn, _HEADER.unpack(msg + _recv_exactly(conn, _HEADER.size - len(msg)))[0]))
+
+    # Use the standard streams, environment and working directory of the client
+    for fd_std, fd in enumerate(fds):
+        if fd != fd_std:
+            os.dup2(fd, fd_std)
+            os.close(fd)
+    sys.stdin = os.fdopen(0, 'r', closefd=False)
+    sys.stdout = os.fdopen(1, 'w', buffering=1, closefd=False)
+    sys.stderr = os.fdopen(2, 'w', buffering=1, closefd=False)
+    # Logging handlers of the server would write to its own streams objects
+    for handler in list(logging.root.handlers):
+        logging.root.removeHandler(handler)
+    os.environ.clear()
+    os.environ.update(request['env'])
+    os.chdir(request['cwd'])
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    conn.sendall(_HEADER.pack(os.getpid()))
+
+    # Run the script as `python script args` would
+    sys.argv = [request['script']] + request['args']
+    try:
+        runpy.run_path(request['script'], run_name='__main__')
+        status = 0
+    except SystemExit as e:
+        if e.code is None:
+            status = 0
+        elif isinstance(e.code, int):
+            status = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            status = 1
+    except BaseException:
+        traceback.print_exc()
+        status = 1
+    sys.stdout.flush()
+    sys.stderr.flush()
+    return status
+
+
+def _handle(conn):
+    """Handle a connection in a forked process, which never returns."""
+    status = 1
+    try:
+        status = _run_request(conn)
+        conn.sendall(_HEADER.pack(status))
+    except ConnectionError:
+        pass
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        os._exit(status)
+
+
+def serve(path_socket, preload=PRELOAD):
+    """
+    Serve the commands sent to a Unix socket, until interrupted (SIGINT or SIGTERM). Each command runs in a process
+    forked from the server.
+
+    :param path_socket: path of the socket
+    :param preload: modules to import before serving
+    """
+    for module in preload:
+        importlib.import_module(module)
+
+    if os.path.exists(path_socket):
+        # Remove the socket of a server that was not stopped properly, unless it is still running
+        if _is_running(path_socket):
+            raise RuntimeError("A server is already running on {}".format(path_socket))
+        os.remove(path_socket)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path_socket)
+    os.chmod(path_socket, 0o600)
+    server.listen(64)
+    server.settimeout(1)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    logger.info("Serving commands on {} (pid {}). Use: export SCT_SERVER={}".format(path_socket, os.getpid(),
+                                                                                    path_socket))
+    try:
+        while True:
+            # Reap the completed commands
+            try:
+                while os.waitpid(-1, os.WNOHANG)[0]:
+                    pass
+            except ChildProcessError:
+                pass
+
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                continue
+            sys.stdout.flush()
+            sys.stderr.flush()
+            if os.fork() == 0:
+                server.close()
+                conn.settimeout(None)
+                _handle(conn)
+            conn.close()
+    except KeyboardInterrupt:
+        logger.info("Server stopped")
+    finally:
+        server.close()
+        os.remove(path_socket)
+
+
+def _is_running(path_socket):
+    """Whether a server is listening on the socket."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        try:
+            conn.connect(path_socket)
+        except OSError:
+            return False
+    return True
@@ -0,0 +1,109 @@
+# coding: utf-8
+"""
+Inference with ivadomed models, with each model loaded once when several images are segmented in the same process.
+"""
+
+import contextlib
+import logging
+import os
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+# Models loaded while cached_models() is active: {(path, mtime, arguments): model}
+_cache = {}
+# Locks of the models being loaded, so that a model is loaded once without blocking the loading of the other ones
+_loading = {}
+# State of the (nested) cached_models() contexts: number of active contexts, folders of their models, and the
+# attributes of the patched module to restore
+_state = {'depth': 0, 'folders': [], 'restore': None}
+# Protects _cache, _loading and _state
+_lock = threading.Lock()
+
+
+class _ModuleProxy(object):
+    """Module with some of its attributes replaced, the other ones being the attributes of the module"""
+
+    def __init__(self, module, **attributes):
+        self._module = module
+        self.__dict__.update(attributes)
+
+    def __getattr__(self, name):
+        return getattr(self._module, name)
+
+
+def _is_model_file(path):
+    """True if path is a file inside the folder of one of the models of the active cached_models() contexts"""
+    if not isinstance(path, (str, os.PathLike)):
+        return False
+    path = os.path.abspath(path)
+    with _lock:
+        folders = [folder for folders in _state['folders'] for folder in folders]
+    return any(path.startswith(os.path.join(folder, '')) for folder in folders) and os.path.isfile(path)
+
+
+def _cached(load):
+    """Memoize a function loading a model from a file (path as first argument), for the files of the models only."""
+    def load_cached(path, *args, **kwargs):
+        if not _is_model_file(path):
+            return load(path, *args, **kwargs)
+        key = (os.path.abspath(path), os.path.getmtime(path), repr(args), repr(sorted(kwargs.items())))
+        with _lock:
+            if key in _cache:
+                return _cache[key]
+            key_lock = _loading.setdefault(key, threading.Lock())
+        with key_lock:
+            with _lock:
+                if key in _cache:
+                    return _cache[key]
+            logger.debug("Loading model: %s", path)
+            model = load(path, *args, **kwargs)
+            with _lock:
+                _cache[key] = model
+                _loading.pop(key, None)
+        return model
+    return load_cached
+
+
+@contextlib.contextmanager
+def cached_models(path_models, module=None):
+    """
+    Context manager in which the models loaded by ivadomed.inference.segment_volume() are kept in memory and reused by
+    the next calls, which can be made from several threads. The models are released when leaving the context.
+
+    segment_volume() loads the model file on each call (torch.load() for .pt models) and creates an ONNX Runtime session
+    for each batch of slices (.onnx models): inside this context, the model (or session) previously created for the
+    same file is returned instead. Only the torch and onnxruntime modules seen by ivadomed.inference are replaced (the
+    torch and onnxruntime modules themselves are left untouched), and only the files inside the folders of the models
+    are cached: the other arguments are passed to the original functions.
+
+    :param path_models: list of the folders of the models
+    :param module: module whose `torch` and `onnxruntime` are replaced. Default: ivadomed.inference
+    """
+    if module is None:
+        from ivadomed import inference as module
+    folders = [os.path.abspath(path_model) for path_model in path_models]
+    with _lock:
+        _state['depth'] += 1
+        _state['folders'].append(folders)
+        if _state['depth'] == 1:
+            # First (outermost) context: the loaders seen by the module are replaced
+            originals = {'torch': module.torch, 'onnxruntime': module.onnxruntime}
+            module.torch = _ModuleProxy(originals['torch'], load=_cached(originals['torch'].load))
+            module.onnxruntime = _ModuleProxy(
+                originals['onnxruntime'], InferenceSession=_cached(originals['onnxruntime'].InferenceSession))
+            _state['restore'] = module, originals
+    try:
+        yield
+    finally:
+        with _lock:
+            _state['depth'] -= 1
+            _state['folders'].remove(folders)
+            if _state['depth'] == 0:
+                module, originals = _state['restore']
+                for name, original in originals.items():
+                    setattr(module, name, original)
+                _state['restore'] = None
+                _cache.clear()
+                _loading.clear()
@@ -12,6 +12,7 @@ import json
 import os
 import sys
 import io
+from collections import OrderedDict
 
 import nibabel as nib
 import numpy as np
@@ -39,6 +40,16 @@ warnings.simplefilter(action='ignore', category=FutureWarning)
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 SMALL_INPUT_SIZE = 200
 BATCH_SIZE = 4
+# Number of axial slices predicted at once by segment_volume() (with TTA, each slice is predicted 9 times in the same
+# batch), which bounds the memory used by the predictions of tall volumes
+SLICES_PER_BATCH = 32
+# Number of test-time augmentation (TTA) passes with a random intensity offset (in addition to the original slices)
+TTA_SAMPLES = 8
+# Maximum number of models kept in memory by get_model()
+MODEL_CACHE_SIZE = 4
+
+# Models with their weights loaded, by (model name, network input size), from the least to the most recently used
+_model_cache = OrderedDict()
 
 
 def check_backend():
@@ -198,8 +209,77 @@ def threshold_predictions(predictions, thr=0.999):
     return thresholded_preds
 
 
+def get_model(model_name, input_size):
+    """Get a model with its weights loaded, from the process-level cache.
+
+    Creating the Keras model and loading its weights takes most of the
+    time of segment_volume() for typical volumes, so models are kept
+    in memory and reused by the next calls (e.g. when segmenting many
+    subjects in the same Python process). The least recently used model
+    is evicted when more than MODEL_CACHE_SIZE models are cached.
+
+    :param model_name: the name of the model (see model.MODELS).
+    :param input_size: the network input size (H, W).
+    :return: the Keras model.
+    """
+    key = (model_name, tuple(int(size) for size in input_size))
+    if key in _model_cache:
+        _model_cache.move_to_end(key)
+        return _model_cache[key]
+
+    gmseg_model_challenge = DataResource('deepseg_gm_models')
+    model_path, metadata_path = model.MODELS[model_name]
+
+    metadata_abs_path = gmseg_model_challenge.get_file_path(metadata_path)
+    with open(metadata_abs_path) as fp:
+        metadata = json.load(fp)
+
+    deepgmseg_model = model.create_model(metadata['filters'], key[1])
+
+    model_abs_path = gmseg_model_challenge.get_file_path(model_path)
+    deepgmseg_model.load_weights(model_abs_path)
+
+    _model_cache[key] = deepgmseg_model
+    while len(_model_cache) > MODEL_CACHE_SIZE:
+        _model_cache.popitem(last=False)
+    return deepgmseg_model
+
+
+def clear_model_cache(model_name=None):
+    """Evict models from the cache of get_model().
+
+    :param model_name: evict only the models with this name (all the
+                       models if None).
+    """
+    for key in list(_model_cache):
+        if model_name is None or key[0] == model_name:
+            del _model_cache[key]
+
+
+def predict_slices(deepgmseg_model, axial_slices, tta_offsets=()):
+    """Predict a batch of axial slices, with the test-time augmentation
+    passes fused into a single call to the model.
+
+    :param deepgmseg_model: the Keras model.
+    :param axial_slices: the normalized slices (N, H, W, 1).
+    :param tta_offsets: intensity offsets of the TTA passes (no TTA if
+                        empty).
+    :return: predictions (N, H, W, 1), averaged over the TTA passes and
+             the original slices.
+    """
+    # Augmented slices first and original slices last, as the previous
+    # one-pass-per-offset implementation
+    batch = np.concatenate([axial_slices + offset for offset in tta_offsets] + [axial_slices])
+    preds = deepgmseg_model.predict(batch, batch_size=BATCH_SIZE,
+                                    verbose=True)
+    if len(tta_offsets) > 0:
+        preds = np.mean(preds.reshape((len(tta_offsets) + 1,) + axial_slices.shape), axis=0)
+    return preds
+
+
 def segment_volume(ninput_volume, model_name,
-                   threshold=0.999, use_tta=False):
+                   threshold=0.999, use_tta=False,
+                   slices_per_batch=SLICES_PER_BATCH):
     """Segment a nifti volume.
 
     :param ninput_volume: the input volume.
@@ -207,15 +287,10 @@ def segment_volume(ninput_volume, model_name,
     :param threshold: threshold to be applied in predictions.
     :param use_tta: whether TTA (test-time augmentation)
                     should be used or not.
+    :param slices_per_batch: number of slices predicted at once (all
+                             the slices if None).
     :return: segmented slices.
     """
-    gmseg_model_challenge = DataResource('deepseg_gm_models')
-    model_path, metadata_path = model.MODELS[model_name]
-
-    metadata_abs_path = gmseg_model_challenge.get_file_path(metadata_path)
-    with open(metadata_abs_path) as fp:
-        metadata = json.load(fp)
-
     volume_size = np.array(ninput_volume.shape[0:2])
     small_input = (volume_size <= SMALL_INPUT_SIZE).any()
 
@@ -226,11 +301,7 @@ def segment_volume(ninput_volume, model_name,
         # larger sizer, crop at 200x200
         net_input_size = (SMALL_INPUT_SIZE, SMALL_INPUT_SIZE)
 
-    deepgmseg_model = model.create_model(metadata['filters'],
-                                         net_input_size)
-
-    model_abs_path = gmseg_model_challenge.get_file_path(model_path)
-    deepgmseg_model.load_weights(model_abs_path)
+    deepgmseg_model = get_model(model_name, net_input_size)
 
     volume_data = ninput_volume.get_data()
     axial_slices = []
@@ -252,37 +323,24 @@ def segment_volume(ninput_volume, model_name,
     normalization = VolumeStandardizationTransform()
     axial_slices = normalization(axial_slices)
 
-    if use_tta:
-        pred_sampled = []
-        for i in range(8):
-            sampled_value = np.random.uniform(high=2.0)
-            sampled_axial_slices = axial_slices + sampled_value
-            preds = deepgmseg_model.predict(sampled_axial_slices,
-                                            batch_size=BATCH_SIZE,
-                                            verbose=True)
-            pred_sampled.append(preds)
-
-        preds = deepgmseg_model.predict(axial_slices, batch_size=BATCH_SIZE,
-                                        verbose=True)
-        pred_sampled.append(preds)
-        pred_sampled = np.asarray(pred_sampled)
-        pred_sampled = np.mean(pred_sampled, axis=0)
-        preds = threshold_predictions(pred_sampled, threshold)
-    else:
-        preds = deepgmseg_model.predict(axial_slices, batch_size=BATCH_SIZE,
-                                        verbose=True)
-        preds = threshold_predictions(preds, threshold)
+    # The same offsets are used for all the batches of slices
+    tta_offsets = [np.random.uniform(high=2.0) for _ in range(TTA_SAMPLES)] if use_tta else []
 
-    pred_slices = []
+    n_slices = axial_slices.shape[0]
+    pred_slices = np.zeros((n_slices,) + volume_data.shape[:2], dtype=np.uint8)
+    slices_per_batch = slices_per_batch or max(n_slices, 1)
 
-    # Un-cropping
-    for slice_num in range(preds.shape[0]):
-        pred_slice = preds[slice_num][..., 0]
-        if not small_input:
-            pred_slice = crops[slice_num].pad(pred_slice)
-        pred_slices.append(pred_slice)
+    for start in range(0, n_slices, slices_per_batch):
+        preds = predict_slices(deepgmseg_model, axial_slices[start:start + slices_per_batch], tta_offsets)
+        preds = threshold_predictions(preds, threshold)
+
+        # Un-cropping
+        for slice_num in range(preds.shape[0]):
+            pred_slice = preds[slice_num][..., 0]
+            if not small_input:
+                pred_slice = crops[start + slice_num].pad(pred_slice)
+            pred_slices[start + slice_num] = pred_slice
 
-    pred_slices = np.asarray(pred_slices, dtype=np.uint8)
     pred_slices = np.transpose(pred_slices, (1, 2, 0))
 
     return pred_slices
@@ -22,6 +22,7 @@ from spinalcordtoolbox.deepseg_sc.cnn_models_3d import load_trained_model
 
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 BATCH_SIZE = 4
+BATCH_SLICES = 16  # Maximum number of slices whose blocks are predicted at once by heatmap()
 # Thresholds to apply to binarize segmentations from the output of the 2D CNN. These thresholds were obtained by
 # minimizing the standard deviation of cross-sectional area across contrasts. For more details, see:
 # https://github.com/sct-pipeline/deepseg-threshold
@@ -188,15 +189,38 @@ def crop_image_around_centerline(im_in, ctr_in, crop_size):
 
 def scan_slice(z_slice, model, mean_train, std_train, coord_lst, patch_shape, z_out_dim):
     """Scan the entire axial slice to detect the centerline."""
+    # predict all the non-overlapping blocks of a cross-sectional slice at once
+    block_preds = _predict_blocks(model, [z_slice[coord[0]:coord[2], coord[1]:coord[3]] for coord in coord_lst],
+                                  mean_train, std_train)
+    z_slice_out, x_CoM, y_CoM, sum_lst = _assemble_scan(block_preds, coord_lst, patch_shape, z_out_dim)
+
+    # Put first the coord of the patch were the centerline is likely located so that the search could be faster for the
+    # next axial slices
+    coord_lst.insert(0, coord_lst.pop(sum_lst.index(max(sum_lst))))
+
+    return z_slice_out, x_CoM, y_CoM, coord_lst
+
+
+def _scan_slices(data_im, z_lst, model, mean_train, std_train, coord_lst, patch_shape, z_out_dim):
+    """Scan several entire axial slices to detect the centerline, with a single prediction for all their blocks.
+
+    :return: list of (z_slice_out, x_CoM, y_CoM), one per slice of z_lst
+    """
+    block_preds = _predict_blocks(model, [data_im[coord[0]:coord[2], coord[1]:coord[3], zz]
+                                          for zz in z_lst for coord in coord_lst], mean_train, std_train)
+    scans = []
+    for i in range(len(z_lst)):
+        z_slice_out, x_CoM, y_CoM, _ = _assemble_scan(block_preds[i * len(coord_lst):(i + 1) * len(coord_lst)],
+                                                      coord_lst, patch_shape, z_out_dim)
+        scans.append((z_slice_out, x_CoM, y_CoM))
+    return scans
+
+
+def _assemble_scan(block_preds, coord_lst, patch_shape, z_out_dim):
+    """Assemble the predictions of the blocks of a slice and compute the center of mass of the largest object."""
     z_slice_out = np.zeros(z_out_dim)
     sum_lst = []
-    # loop across all the non-overlapping blocks of a cross-sectional slice
-    for idx, coord in enumerate(coord_lst):
-        block = z_slice[coord[0]:coord[2], coord[1]:coord[3]]
-        block_nn = np.expand_dims(np.expand_dims(block, 0), -1)
-        block_nn_norm = _normalize_data(block_nn, mean_train, std_train)
-        block_pred = model.predict(block_nn_norm, batch_size=BATCH_SIZE)
-
+    for coord, block_pred in zip(coord_lst, block_preds):
         if coord[2] > z_out_dim[0]:
             x_end = patch_shape[0] - (coord[2] - z_out_dim[0])
         else:
@@ -206,12 +230,8 @@ def scan_slice(z_slice, model, mean_train, std_train, coord_lst, patch_shape, z_
         else:
             y_end = patch_shape[1]
 
-        z_slice_out[coord[0]:coord[2], coord[1]:coord[3]] = block_pred[0, :x_end, :y_end, 0]
-        sum_lst.append(np.sum(block_pred[0, :x_end, :y_end, 0]))
-
-    # Put first the coord of the patch were the centerline is likely located so that the search could be faster for the
-    # next axial slices
-    coord_lst.insert(0, coord_lst.pop(sum_lst.index(max(sum_lst))))
+        z_slice_out[coord[0]:coord[2], coord[1]:coord[3]] = block_pred[:x_end, :y_end]
+        sum_lst.append(np.sum(block_pred[:x_end, :y_end]))
 
     # computation of the new center of mass
     if np.max(z_slice_out) > 0.5:
@@ -223,11 +243,30 @@ def scan_slice(z_slice, model, mean_train, std_train, coord_lst, patch_shape, z_
     else:
         x_CoM, y_CoM = None, None
 
-    return z_slice_out, x_CoM, y_CoM, coord_lst
+    return z_slice_out, x_CoM, y_CoM, sum_lst
+
+
+def _predict_blocks(model, blocks, mean_train, std_train):
+    """Predict a list of 2D blocks of the same shape with a single call to the model.
+
+    :return: ndarray (n_blocks, x, y) of predictions
+    """
+    blocks_nn = _normalize_data(np.expand_dims(np.array(blocks, dtype=np.float32), -1), mean_train, std_train)
+    return model.predict(blocks_nn, batch_size=max(BATCH_SIZE, len(blocks)))[..., 0]
 
 
 def heatmap(im, model, patch_shape, mean_train, std_train, brain_bool=True):
-    """Compute the heatmap with CNN_1 representing the SC localization."""
+    """Compute the heatmap with CNN_1 representing the SC localization.
+
+    To reduce the number of calls to the model, predictions are computed for batches of up to BATCH_SLICES slices:
+      - when the SC has to be searched in the entire cross-sectional slice, all the blocks of the next slices are
+        predicted at once;
+      - when the SC is tracked from slice to slice, the block centered around the center of mass (CoM) of the previous
+        slice is predicted for the next slices at the same position, and reused as long as the CoM-centered block does
+        not move.
+    The slice-to-slice CoM tracking is then done on these predictions, which gives the same heatmap as one prediction
+    per block. The number of slices of a batch is doubled each time a batch is entirely used, and reset otherwise.
+    """
     data_im = im.data.astype(np.float32)
     im_out = change_type(im, "uint8")
     del im
@@ -253,20 +292,39 @@ def heatmap(im, model, patch_shape, mean_train, std_train, brain_bool=True):
     data_im = np.pad(data_im, ((0, x_pad), (0, 0), (0, 0)), 'constant')
     # scale intensities between 0 and 255
     data_im = scale_intensity(data_im)
+    nz = data_im.shape[2]
+
+    # predictions of the batches: {kind: {zz: (prediction, position of the tracked block or None)}}
+    batch_pred = {'track': {}, 'scan': {}}
+    batch_end = {'track': 0, 'scan': 0}
+    batch_len = {'track': 1, 'scan': 1}
+
+    def predict_batch(kind, zz, position=None):
+        """Predict the tracked block at position (kind='track') or all the blocks (kind='scan') from slice zz."""
+        batch_len[kind] = min(2 * batch_len[kind], BATCH_SLICES) if zz == batch_end[kind] else 1
+        z_lst = list(range(zz, min(zz + batch_len[kind], nz)))
+        batch_end[kind] = z_lst[-1] + 1
+        if kind == 'track':
+            x_0, x_1, y_0, y_1 = position
+            preds = _predict_blocks(model, [data_im[x_0:x_1, y_0:y_1, z] for z in z_lst], mean_train, std_train)
+        else:
+            preds = _scan_slices(data_im, z_lst, model, mean_train, std_train, coord_lst, patch_shape,
+                                 data.shape[:2])
+        for z, pred in zip(z_lst, preds):
+            batch_pred[kind][z] = (pred, position)
 
     x_CoM, y_CoM = None, None
     z_sc_notDetected_cmpt = 0
-    for zz in range(data_im.shape[2]):
+    for zz in range(nz):
         # if SC was detected at zz-1, we will start doing the detection on the block centered around the previously
         # computed center of mass (CoM)
         if x_CoM is not None:
             z_sc_notDetected_cmpt = 0  # SC detected, cmpt set to zero
             x_0, x_1 = _find_crop_start_end(x_CoM, patch_shape[0], data_im.shape[0])
             y_0, y_1 = _find_crop_start_end(y_CoM, patch_shape[1], data_im.shape[1])
-            block = data_im[x_0:x_1, y_0:y_1, zz]
-            block_nn = np.expand_dims(np.expand_dims(block, 0), -1)
-            block_nn_norm = _normalize_data(block_nn, mean_train, std_train)
-            block_pred = model.predict(block_nn_norm, batch_size=BATCH_SIZE)
+            if batch_pred['track'].get(zz, (None, None))[1] != (x_0, x_1, y_0, y_1):
+                predict_batch('track', zz, (x_0, x_1, y_0, y_1))
+            block_pred = batch_pred['track'][zz][0]
 
             # coordinates manipulation due to the above padding and cropping
             if x_1 > data.shape[0]:
@@ -282,7 +340,7 @@ def heatmap(im, model, patch_shape, mean_train, std_train, brain_bool=True):
             else:
                 y_end = patch_shape[1]
 
-            data[x_0:x_1, y_0:y_1, zz] = block_pred[0, :x_end, :y_end, 0]
+            data[x_0:x_1, y_0:y_1, zz] = block_pred[:x_end, :y_end]
 
             # computation of the new center of mass
             if np.max(data[:, :, zz]) > 0.5:
@@ -295,9 +353,9 @@ def heatmap(im, model, patch_shape, mean_train, std_train, brain_bool=True):
         # if the SC was not detected at zz-1 or on the patch centered around CoM in slice zz, the entire cross-sectional
         # slice is scanned
         if x_CoM is None:
-            z_slice, x_CoM, y_CoM, coord_lst = scan_slice(data_im[:, :, zz], model,
-                                                          mean_train, std_train,
-                                                          coord_lst, patch_shape, data.shape[:2])
+            if zz not in batch_pred['scan']:
+                predict_batch('scan', zz)
+            z_slice, x_CoM, y_CoM = batch_pred['scan'][zz][0]
             data[:, :, zz] = z_slice
 
             z_sc_notDetected_cmpt += 1
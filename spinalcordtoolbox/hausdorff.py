@@ -0,0 +1,140 @@
+#########################################################################################
+#
+# Skeletonization and distances between binary images (Hausdorff's distance, surface distances).
+#
+# ---------------------------------------------------------------------------------------
+# Copyright (c) 2020 Polytechnique Montreal <www.neuro.polymtl.ca>
+#
+# About the license: see the file LICENSE.TXT
+#########################################################################################
+
+import logging
+
+import numpy as np
+from scipy import ndimage
+from scipy.spatial import cKDTree
+
+logger = logging.getLogger(__name__)
+
+
+def zhang_suen(data):
+    """
+    Thinning with the Zhang-Suen algorithm (1984), computed on all the pixels (and slices) at once.
+
+    Same as the implementation of https://github.com/linbojin/Skeletonization-by-Zhang-Suen-Thinning-Algorithm
+    (previously used by sct_compute_hausdorff_distance), including its handling of the borders: the pixels of the
+    rows/columns 1 and len(image) - 1 are never removed, and the neighbours of the pixels of the first row/column are
+    taken on the opposite side of the image.
+
+    :param data: binary 2D array, or 3D array of 2D slices along the first axis
+    :return: thinned array (same shape and type as data)
+    """
+    image = (np.asarray(data) > 0).astype(np.uint8)
+    image_2d = image.ndim == 2
+    if image_2d:
+        image = image[np.newaxis]
+    n_rows, n_cols = image.shape[1:]
+
+    # Pixels which can be removed
+    removable = np.ones(image.shape[1:], dtype=bool)
+    for index in [1, n_rows - 1]:
+        removable[index, :] = False
+        if index < n_cols:
+            removable[:, index] = False
+
+    def neighbours(im):
+        """8-neighbours P2, ..., P9 of each pixel, in a clockwise order starting from the pixel above."""
+        up, down = np.roll(im, 1, axis=1), np.roll(im, -1, axis=1)
+        return [up, np.roll(up, -1, axis=2), np.roll(im, -1, axis=2), np.roll(down, -1, axis=2),
+                down, np.roll(down, 1, axis=2), np.roll(im, 1, axis=2), np.roll(up, 1, axis=2)]
+
+    def step(im, first):
+        P2, P3, P4, P5, P6, P7, P8, P9 = n = neighbours(im)
+        count = sum(n)
+        # Number of 0 -> 1 transitions in the sequence P2, P3, ..., P9, P2
+        transitions = sum((n1 == 0) & (n2 == 1) for n1, n2 in zip(n, n[1:] + n[:1]))
+        if first:
+            conditions_34 = (P2 * P4 * P6 == 0) & (P4 * P6 * P8 == 0)
+        else:
+            conditions_34 = (P2 * P4 * P8 == 0) & (P2 * P6 * P8 == 0)
+        return (im == 1) & removable & (2 <= count) & (count <= 6) & (transitions == 1) & conditions_34
+
+    while True:
+        changing1 = step(image, first=True)
+        image[changing1] = 0
+        changing2 = step(image, first=False)
+        image[changing2] = 0
+        if not changing1.any() and not changing2.any():
+            break
+
+    if image_2d:
+        image = image[0]
+    return image.astype(np.asarray(data).dtype)
+
+
+def relative_distances(data1, data2):
+    """
+    Distance (in pixels) from each non-zero pixel of data1 to the nearest non-zero pixel of data2, in the same slice.
+
+    :param data1: binary 2D array, or 3D array of 2D slices along the first axis
+    :param data2: array of the same shape as data1
+    :return: array of the shape of data1, with the distances on the non-zero pixels of data1 (zero elsewhere, and on
+      the slices where data1 or data2 is empty)
+    """
+    data1, data2 = np.asarray(data1) > 0, np.asarray(data2) > 0
+    distances = np.zeros(data1.shape)
+    if data1.ndim == 2:
+        data1, data2 = data1[np.newaxis], data2[np.newaxis]
+
+    # Only the slices where both images have pixels are compared
+    valid = data1.any(axis=(1, 2)) & data2.any(axis=(1, 2))
+    if not valid.all():
+        logger.warning("An image is empty (%s slice(s))", np.count_nonzero(~valid))
+    coords1 = np.argwhere(data1 & valid[:, np.newaxis, np.newaxis])
+    coords2 = np.argwhere(data2 & valid[:, np.newaxis, np.newaxis])
+    if len(coords1) == 0:
+        return distances
+
+    # Query all the slices with one KD-tree: the slices are spaced further apart than the largest distance within a
+    # slice, so that the nearest neighbour of a pixel is always in the same slice
+    scale = np.array([sum(data1.shape[1:]), 1, 1])
+    dist, _ = cKDTree(coords2 * scale).query(coords1 * scale)
+    distances.reshape(data1.shape)[tuple(coords1.T)] = dist
+    return distances
+
+
+def get_surface(data):
+    """Voxels of a binary 3D array that are on its surface (i.e. that have a background voxel among their
+    6-neighbours, or are on the border of the array)."""
+    data = np.asarray(data) > 0
+    return data & ~ndimage.binary_erosion(data, border_value=0)
+
+
+def surface_distances(im1, im2):
+    """
+    3D distances between the surfaces of two binary images (in the same space).
+
+    :param im1: Image
+    :param im2: Image
+    :return: dict with the Hausdorff's distance ('hausdorff'), the 95th percentile Hausdorff's distance ('hd95') and
+      the average symmetric surface distance ('assd'), in mm (NaN if an image is empty). hd95 and assd are defined as
+      in MedPy: hd95 = max(95th percentile of the distances from surface 1 to 2, and from 2 to 1),
+      assd = mean(mean distance from surface 1 to 2, mean distance from surface 2 to 1).
+    """
+    if im1.data.shape != im2.data.shape:
+        raise ValueError("The images must have the same shape: {} != {}".format(im1.data.shape, im2.data.shape))
+    pixdim = np.asarray(im1.dim[4:4 + im1.data.ndim])
+
+    points1 = np.argwhere(get_surface(im1.data)) * pixdim
+    points2 = np.argwhere(get_surface(im2.data)) * pixdim
+    if len(points1) == 0 or len(points2) == 0:
+        logger.warning("An image is empty: the surface distances are not defined")
+        return {'hausdorff': np.nan, 'hd95': np.nan, 'assd': np.nan}
+
+    dist12, _ = cKDTree(points2).query(points1)
+    dist21, _ = cKDTree(points1).query(points2)
+    return {
+        'hausdorff': max(dist12.max(), dist21.max()),
+        'hd95': max(np.percentile(dist12, 95), np.percentile(dist21, 95)),
+        'assd': (dist12.mean() + dist21.mean()) / 2,
+    }
@@ -18,6 +18,7 @@ import warnings
 import logging
 import shutil
 import math
+import mmap
 from typing import Sequence
 
 import nibabel as nib
@@ -66,6 +67,8 @@ class Slicer(object):
 
     - The original image data is directly available without copy,
       which is a nice feature, not a bug! Use .copy() if you need copies...
+    - If the image is lazy and its data was not loaded yet, only the
+      requested slice is read from the file (see `Image.dataobj`).
 
     Example:
 
@@ -90,35 +93,19 @@ class Slicer(object):
         if not orientation in all_refspace_strings():
             raise ValueError("Invalid orientation spec")
 
-        # Get a different view on data, as if we were doing a reorientation
+        # Get a different view on data, as if we were doing a reorientation: the slices are taken along the original
+        # axis that ends up last, with the axes inversions (flip) and manipulations (transpose) of the reorientation
 
         perm, inversion = _get_permutations(im.orientation, orientation)
-
-        # axes inversion (flip)
-        data = im.data[::inversion[0], ::inversion[1], ::inversion[2]]
-
-        # axes manipulations (transpose)
-        if perm == [1, 0, 2]:
-            data = np.swapaxes(data, 0, 1)
-        elif perm == [2, 1, 0]:
-            data = np.swapaxes(data, 0, 2)
-        elif perm == [0, 2, 1]:
-            data = np.swapaxes(data, 1, 2)
-        elif perm == [2, 0, 1]:
-            data = np.swapaxes(data, 0, 2)  # transform [2, 0, 1] to [1, 0, 2]
-            data = np.swapaxes(data, 0, 1)  # transform [1, 0, 2] to [0, 1, 2]
-        elif perm == [1, 2, 0]:
-            data = np.swapaxes(data, 0, 2)  # transform [1, 2, 0] to [0, 2, 1]
-            data = np.swapaxes(data, 1, 2)  # transform [0, 2, 1] to [0, 1, 2]
-        elif perm == [0, 1, 2]:
-            # do nothing
-            pass
-        else:
+        if sorted(perm) != [0, 1, 2]:
             raise NotImplementedError()
+        axes = list(np.argsort(perm))
 
-        self._data = data
+        self._dataobj = im.dataobj
+        self._axes = axes
+        self._inversion = inversion
         self._orientation = orientation
-        self._nb_slices = data.shape[2]
+        self._nb_slices = im.dataobj.shape[axes[2]]
 
     def __len__(self):
         return self._nb_slices
@@ -135,7 +122,14 @@ class Slicer(object):
         if idx >= self._nb_slices:
             raise IndexError("I just have {} slices!".format(self._nb_slices))
 
-        return self._data[:, :, idx]
+        axis_slice = self._axes[2]
+        if self._inversion[axis_slice] == -1:
+            idx = self._nb_slices - 1 - idx
+        index = tuple(idx if axis == axis_slice else slice(None, None, self._inversion[axis]) for axis in range(3))
+        data = self._dataobj[index]
+        if self._axes[0] > self._axes[1]:
+            data = np.swapaxes(data, 0, 1)
+        return data
 
 
 class SlicerOneAxis(object):
@@ -146,6 +140,9 @@ class SlicerOneAxis(object):
     its specification.
 
     Can help getting ranges and slice indices.
+
+    As for `Slicer`, only the requested slice is read from the file if the
+    image is lazy and its data was not loaded yet.
     """
 
     def __init__(self, im, axis="IS"):
@@ -193,7 +190,7 @@ class SlicerOneAxis(object):
         if self.direction == -1:
             idx = self.nb_slices - 1 - idx
 
-        return self.im.data[self._slice(idx)]
+        return self.im.dataobj[self._slice(idx)]
 
 
 class SlicerMany(object):
@@ -224,6 +221,15 @@ class SlicerMany(object):
         return [x[idx] for x in self.slicers]
 
 
+def _is_memory_mapped(data):
+    """Return True if the array is a view onto a memory-mapped file."""
+    while data is not None:
+        if isinstance(data, (np.memmap, mmap.mmap)):
+            return True
+        data = getattr(data, 'base', None)
+    return False
+
+
 def check_affines_match(im):
     hdr = im.hdr
     hdr2 = hdr.copy()
@@ -252,7 +258,7 @@ class Image(object):
     """
 
     def __init__(self, param=None, hdr=None, orientation=None, absolutepath=None, dim=None, verbose=1,
-                 check_sform=False):
+                 check_sform=False, lazy=False):
         """
         :param param: string indicating a path to a image file or an `Image` object.
         :param hdr: a nibabel header object to use as the header for the image (overwritten if `param` is provided)
@@ -262,11 +268,15 @@ class Image(object):
         :param verbose: integer how verbose to be 0 is silent 1 is chatty.
         :param check_sform: whether or not to check whether the sform matches the qform. If this is set to `True`,
           `Image` will fail raise an error if they don't match.
+        :param lazy: if `param` is a path, only read the header, and read the data from the file when it is first\
+          accessed. Uncompressed NIfTI files are memory-mapped (copy-on-write), and `Slicer`/`SlicerOneAxis` only\
+          read the slices they return. Useful to get the header or a few slices of large (e.g. 4D) images.
         """
 
         # initialization of all parameters
         self.im_file = None
-        self.data = None
+        self._data = None
+        self._dataobj = None
         self._path = None
         self.ext = ""
 
@@ -282,7 +292,7 @@ class Image(object):
 
         # load an image from file
         if isinstance(param, str) or (sys.hexversion < 0x03000000 and isinstance(param, unicode)):
-            self.loadFromPath(param, verbose)
+            self.loadFromPath(param, verbose, lazy=lazy)
         # copy constructor
         elif isinstance(param, type(self)):
             self.copy(param)
@@ -312,6 +322,29 @@ class Image(object):
             raise ValueError("Image sform does not match qform")
 
 
+    @property
+    def data(self):
+        """Image data, read from the file when first accessed if the image is lazy."""
+        if self._data is None and self._dataobj is not None:
+            self._data = np.asanyarray(self._dataobj)
+            self._dataobj = None
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+        self._dataobj = None
+
+    @property
+    def dataobj(self):
+        """
+        Array-like image data: the data if it is loaded, otherwise the nibabel array proxy of the file, which reads
+        only the requested part of the data when it is indexed (e.g. `im.dataobj[..., 0]`).
+        """
+        if self._data is None and self._dataobj is not None:
+            return self._dataobj
+        return self.data
+
     @property
     def dim(self):
         return get_dimension(self)
@@ -394,22 +427,26 @@ class Image(object):
         self.hdr.set_qform(self.hdr.get_sform())
         self.hdr._structarr['qform_code'] = self.hdr._structarr['sform_code']
 
-    def loadFromPath(self, path, verbose):
+    def loadFromPath(self, path, verbose, lazy=False):
         """
         This function load an image from an absolute path using nibabel library
 
         :param path: path of the file from which the image will be loaded
+        :param lazy: if True, the data is only read from the file when first accessed
         :return:
         """
 
         self.im_file = nib.load(path)
-        self.data = self.im_file.get_data()
+        if lazy:
+            self._data, self._dataobj = None, self.im_file.dataobj
+        else:
+            self.data = np.asanyarray(self.im_file.dataobj)
         self.hdr = self.im_file.header
         self.absolutepath = path
         if path != self.absolutepath:
-            logger.debug("Loaded %s (%s) orientation %s shape %s", path, self.absolutepath, self.orientation, self.data.shape)
+            logger.debug("Loaded %s (%s) orientation %s shape %s", path, self.absolutepath, self.orientation, self.dataobj.shape)
         else:
-            logger.debug("Loaded %s orientation %s shape %s", path, self.orientation, self.data.shape)
+            logger.debug("Loaded %s orientation %s shape %s", path, self.orientation, self.dataobj.shape)
 
     def change_shape(self, shape):
         """
@@ -497,9 +534,11 @@ class Image(object):
             if (dtype is not None) and (dtype not in ['minimize', 'minimize_int']):
                 hdr.set_data_dtype(dtype)
 
-        # nb. that copy() is important because if it were a memory map, save()
-        # would corrupt it
-        img = nib.nifti1.Nifti1Image(data.copy(), None, hdr)
+        # nb. copying a memory map is important because save() would corrupt it when overwriting the mapped file.
+        # Other arrays are written as is.
+        if _is_memory_mapped(data):
+            data = data.copy()
+        img = nib.nifti1.Nifti1Image(data, None, hdr)
         if os.path.isfile(path):
             if verbose:
                 logger.warning('File ' + path + ' already exists. Will overwrite it.')
@@ -1319,12 +1358,15 @@ def convert(img: Image, squeeze_data=True, dtype=None):
     return img
 
 
-def split_img_data(src_img: Image, dim, squeeze_data=True):
+def split_img_data(src_img: Image, dim, squeeze_data=True, copy=True):
     """
     Split data
 
     :param src_img: input image.
     :param dim: dimension: 0, 1, 2, 3.
+    :param squeeze_data: if True, remove the split dimension if it is the last one.
+    :param copy: if False, the data of the output images are views of the input data, and the input image is not \
+      copied for each output image.
     :return: list of split images
     """
 
@@ -1350,11 +1392,13 @@ def split_img_data(src_img: Image, dim, squeeze_data=True):
     # Write each file
     im_out_list = []
     for idx_img, dat in enumerate(data_split):
-        im_out = empty_like(src_img)
         if do_reshape:
-            im_out.data = dat.reshape(tuple([x for (idx_shape, x) in enumerate(data.shape) if idx_shape != dim]))
+            dat = dat.reshape(tuple([x for (idx_shape, x) in enumerate(data.shape) if idx_shape != dim]))
+        if copy:
+            im_out = empty_like(src_img)
+            im_out.data = dat.copy()
         else:
-            im_out.data = dat
+            im_out = Image(dat, hdr=src_img.hdr.copy())
         im_out.absolutepath = add_suffix(src_img.absolutepath, "_{}{}".format(dim_list[dim].upper(), str(idx_img).zfill(4)))
         im_out_list.append(im_out)
 
@@ -1377,7 +1421,7 @@ def concat_warp2d(fname_list, fname_warp3d, fname_dest):
     warp3d = np.zeros([nx, ny, nz, 1, 3])
 
     for iz, fname in enumerate(fname_list):
-        warp2d = nib.load(fname).get_data()
+        warp2d = np.asanyarray(nib.load(fname).dataobj)
         warp3d[:, :, iz, 0, 0] = warp2d[:, :, 0, 0, 0]
         warp3d[:, :, iz, 0, 1] = warp2d[:, :, 0, 0, 1]
         del warp2d
@@ -1435,7 +1479,7 @@ def check_dim(fname, dim_lst=[3]):
     :param fname:
     :return: True or False
     """
-    dim = Image(fname).hdr['dim'][:4]
+    dim = Image(fname, lazy=True).hdr['dim'][:4]
 
     if not dim[0] in dim_lst:
         raise ValueError(f"File {fname} has {dim[0]} dimensions! Accepted dimensions are: {dim_lst}.")
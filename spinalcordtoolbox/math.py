@@ -151,6 +151,58 @@ def mutual_information(x, y, nbins=32, normalized=False):
     return mi
 
 
+def _histogram_bins(x, nbins):
+    """
+    Bin of each value in the histogram of each row of x, with nbins equal bins between the min and max of the row (as
+    in np.histogram2d()).
+
+    :param x: numpy.array (n, size)
+    :param nbins: number of bins
+    :return: numpy.array of int (n, size)
+    """
+    x = np.asarray(x)
+    lower, upper = x.min(axis=-1).astype(float), x.max(axis=-1).astype(float)
+    constant = lower == upper
+    lower, upper = np.where(constant, lower - 0.5, lower), np.where(constant, upper + 0.5, upper)
+    edges = np.linspace(lower, upper, nbins + 1, axis=-1)
+    lower, upper = lower[..., np.newaxis], upper[..., np.newaxis]
+    # Approximate bins, then corrected with the edges (rounding errors shift the bin by one at most). The last bin
+    # includes the max.
+    bins = np.clip(((x - lower) * (nbins / (upper - lower))).astype(int), 0, nbins - 1)
+    bins -= x < np.take_along_axis(edges, bins, axis=-1)
+    bins += (x >= np.take_along_axis(edges, bins + 1, axis=-1)) & (bins < nbins - 1)
+    return bins
+
+
+def mutual_information_batch(x, y, nbins=32):
+    """
+    Compute the mutual information between each row of x and y, with the contingency matrices of all the rows computed
+    at once: same as [mutual_information(x_i, y, nbins) for x_i in x].
+
+    :param x: 2D numpy.array (n, size): flatten data from n images
+    :param y: 1D numpy.array (size): flatten data from an image
+    :param nbins: number of bins to compute the contingency matrices
+    :return: numpy.array (n): non negative values of mutual information
+    """
+    x = np.atleast_2d(x)
+    if nbins == 1:
+        return np.zeros(len(x))
+    # Contingency matrix of each row: the bins of y are the same for all the rows
+    bins = _histogram_bins(x, nbins) * nbins + _histogram_bins(y, nbins)
+    bins += np.arange(len(x))[:, np.newaxis] * nbins ** 2
+    c_xy = np.bincount(bins.ravel(), minlength=len(x) * nbins ** 2).reshape(len(x), nbins, nbins)
+    # Same terms as mutual_info_score(), for the non-zero values of the contingency matrices
+    nonzero = c_xy > 0
+    c_sum = c_xy.sum(axis=(1, 2))[:, np.newaxis, np.newaxis]
+    pi, pj = c_xy.sum(axis=2), c_xy.sum(axis=1)
+    outer = np.where(nonzero, pi[:, :, np.newaxis] * pj[:, np.newaxis, :], 1)
+    log_outer = -np.log(outer) + np.log(c_sum) + np.log(c_sum)
+    c_nm = c_xy / c_sum
+    mi = c_nm * (np.log(np.where(nonzero, c_xy, 1)) - np.log(c_sum)) + c_nm * log_outer
+    mi = np.where(nonzero & (np.abs(mi) >= np.finfo(mi.dtype).eps), mi, 0.0)
+    return np.clip(mi.sum(axis=(1, 2)), 0.0, None)
+
+
 def correlation(x, y, type='pearson'):
     """
     Compute pearson or spearman correlation coeff
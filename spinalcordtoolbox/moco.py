@@ -20,18 +20,20 @@ import time
 import functools
 import operator
 import csv
+import multiprocessing
 
 import numpy as np
 import scipy.interpolate
 
-from spinalcordtoolbox.image import Image, add_suffix, generate_output_file, convert, apply_mask_if_soft
+from spinalcordtoolbox.image import (Image, add_suffix, generate_output_file, convert, apply_mask_if_soft,
+                                     split_img_data)
 from spinalcordtoolbox.utils.shell import display_viewer_syntax, get_interpolation
 from spinalcordtoolbox.utils.sys import sct_progress_bar, run_proc, printv
 from spinalcordtoolbox.utils.fs import tmp_create, extract_fname, rmtree, copy
 
 # FIXME don't import from scripts in API
 from spinalcordtoolbox.scripts import sct_dmri_separate_b0_and_dwi
-from spinalcordtoolbox.scripts.sct_image import split_data, concat_data, multicomponent_split
+from spinalcordtoolbox.scripts.sct_image import concat_data, multicomponent_split
 from spinalcordtoolbox.scripts import sct_apply_transfo
 
 
@@ -80,6 +82,7 @@ class ParamMoco:
         self.iterAvg = 1  # iteratively average target image for more robust moco
         self.is_sagittal = False  # if True, then split along Z (right-left) and register each 2D slice (vs. 3D volume)
         self.output_motion_param = True  # if True, the motion parameters are outputted
+        self.jobs = 1  # number of registrations run in parallel
 
     # update constructor with user's parameters
     def update(self, param_user):
@@ -138,8 +141,7 @@ def moco_wrapper(param):
     file_moco_params_csv = 'moco_params.tsv'
     file_moco_params_x = 'moco_params_x.nii.gz'
     file_moco_params_y = 'moco_params_y.nii.gz'
-    ext_data = '.nii.gz'  # workaround "too many open files" by slurping the data
-    # TODO: check if .nii can be used
+    ext_data = '.nii'  # uncompressed, as temporary files are only read by the registration
     mat_final = 'mat_final/'
     # ext_mat = 'Warp.nii.gz'  # warping field
 
@@ -227,21 +229,14 @@ def moco_wrapper(param):
     # Prepare data (mean/groups...)
     # ==================================================================================================================
 
-    # Split into T dimension
-    printv('\nSplit along T dimension...', param.verbose)
-    im_data_split_list = split_data(im_data, 3)
-    for im in im_data_split_list:
-        x_dirname, x_basename, x_ext = extract_fname(im.absolutepath)
-        im.absolutepath = os.path.join(x_dirname, x_basename + ".nii.gz")
-        im.save()
+    # Volumes are taken directly from the 4D data array: only the averaged data and the volumes used as registration
+    # targets are written to disk
+    data = im_data.data
 
     if param.is_diffusion:
         # Merge and average b=0 images
         printv('\nMerge and average b=0 data...', param.verbose)
-        im_b0_list = []
-        for it in range(nb_b0):
-            im_b0_list.append(im_data_split_list[index_b0[it]])
-        im_b0 = concat_data(im_b0_list, 3).save(file_b0, verbose=0)
+        im_b0 = Image(data[..., index_b0], hdr=im_data.hdr.copy()).save(file_b0, verbose=0)
         # Average across time
         im_b0.mean(dim=3).save(add_suffix(file_b0, '_mean'))
 
@@ -267,34 +262,21 @@ def moco_wrapper(param):
         group_indexes.append(index_moco[len(index_moco) - nb_remaining:len(index_moco)])
 
     _, file_dwi_basename, file_dwi_ext = extract_fname(file_datasub)
-    # Group data
-    list_file_group = []
+    # Average data within groups, directly into the preallocated array of merged groups
+    data_groups = None
     for iGroup in sct_progress_bar(range(nb_groups), unit='iter', unit_scale=False, desc="Merge within groups", ascii=False,
                                    ncols=80):
-        # get index
-        index_moco_i = group_indexes[iGroup]
-        n_moco_i = len(index_moco_i)
-        # concatenate images across time, within this group
-        file_dwi_merge_i = os.path.join(file_dwi_basename + '_' + str(iGroup) + ext_data)
-        im_dwi_list = []
-        for it in range(n_moco_i):
-            im_dwi_list.append(im_data_split_list[index_moco_i[it]])
-        im_dwi_out = concat_data(im_dwi_list, 3).save(file_dwi_merge_i, verbose=0)
-        # Average across time
-        list_file_group.append(os.path.join(file_dwi_basename + '_' + str(iGroup) + '_mean' + ext_data))
-        im_dwi_out.mean(dim=3).save(list_file_group[-1])
+        data_group_mean = np.mean(data[..., group_indexes[iGroup]], 3)
+        if data_groups is None:
+            data_groups = np.empty(data_group_mean.shape + (nb_groups,), dtype=data_group_mean.dtype)
+        data_groups[..., iGroup] = data_group_mean
 
     # Merge across groups
     printv('\nMerge across groups...', param.verbose)
-    # file_dwi_groups_means_merge = 'dwi_averaged_groups'
-    fname_dw_list = []
-    for iGroup in range(nb_groups):
-        fname_dw_list.append(list_file_group[iGroup])
-    im_dw_list = [Image(fname) for fname in fname_dw_list]
-    concat_data(im_dw_list, 3).save(file_datasubgroup, verbose=0)
-
-    # Cleanup
-    del im, im_data_split_list
+    Image(data_groups, hdr=im_data.hdr.copy()).save(file_datasubgroup, verbose=0)
+    # The first group is the registration target
+    file_group_target = os.path.join(file_dwi_basename + '_0_mean' + ext_data)
+    Image(data_groups[..., 0], hdr=im_data.hdr.copy()).save(file_group_target, verbose=0)
 
     # ==================================================================================================================
     # Estimate moco
@@ -313,13 +295,13 @@ def moco_wrapper(param):
         if index_moco[0] != 0:
             # If first DWI is not the first volume (most common), then there is a least one b=0 image before. In that
             # case select it as the target image for registration of all b=0
-            param_moco.file_target = os.path.join(file_data_dirname,
-                                                  file_data_basename + '_T' + str(index_b0[index_moco[0] - 1]).zfill(
-                                                      4) + ext_data)
+            it_target = index_b0[index_moco[0] - 1]
         else:
             # If first DWI is the first volume, then the target b=0 is the first b=0 from the index_b0.
-            param_moco.file_target = os.path.join(file_data_dirname,
-                                                  file_data_basename + '_T' + str(index_b0[0]).zfill(4) + ext_data)
+            it_target = index_b0[0]
+        param_moco.file_target = os.path.join(file_data_dirname,
+                                              file_data_basename + '_T' + str(it_target).zfill(4) + ext_data)
+        Image(data[..., it_target], hdr=im_data.hdr.copy()).save(param_moco.file_target, verbose=0)
         # Run moco
         param_moco.path_out = ''
         param_moco.todo = 'estimate_and_apply'
@@ -331,7 +313,7 @@ def moco_wrapper(param):
     printv('  Estimating motion across groups...', param.verbose)
     printv('-------------------------------------------------------------------------------', param.verbose)
     param_moco.file_data = file_datasubgroup
-    param_moco.file_target = list_file_group[0]  # target is the first volume (closest to the first b=0 if DWI scan)
+    param_moco.file_target = file_group_target  # target is the first volume (closest to the first b=0 if DWI scan)
     param_moco.path_out = ''
     param_moco.todo = 'estimate_and_apply'
     param_moco.mat_moco = 'mat_groups'
@@ -368,7 +350,7 @@ def moco_wrapper(param):
     printv('  Apply moco', param.verbose)
     printv('-------------------------------------------------------------------------------', param.verbose)
     param_moco.file_data = file_data
-    param_moco.file_target = list_file_group[0]  # reference for reslicing into proper coordinate system
+    param_moco.file_target = file_group_target  # reference for reslicing into proper coordinate system
     param_moco.path_out = ''  # TODO not used in moco()
     param_moco.mat_moco = mat_final
     param_moco.todo = 'apply'
@@ -529,21 +511,17 @@ def moco(param):
     # If scan is sagittal, split src and target along Z (slice)
     if param.is_sagittal:
         dim_sag = 2  # TODO: find it
-        # z-split data (time series)
-        im_z_list = split_data(im_data, dim=dim_sag, squeeze_data=False)
-        file_data_splitZ = []
-        for im_z in im_z_list:
-            im_z.save(verbose=0)
-            file_data_splitZ.append(im_z.absolutepath)
+        # z-split data (time series). Z-split volumes are kept in memory: only their T-split is written to disk
+        im_data_splitZ = split_img_data(im_data, dim=dim_sag, squeeze_data=False, copy=False)
         # z-split target
-        im_targetz_list = split_data(Image(file_target), dim=dim_sag, squeeze_data=False)
+        im_targetz_list = split_img_data(Image(file_target), dim=dim_sag, squeeze_data=False, copy=False)
         file_target_splitZ = []
         for im_targetz in im_targetz_list:
             im_targetz.save(verbose=0)
             file_target_splitZ.append(im_targetz.absolutepath)
         # z-split mask (if exists)
         if not param.fname_mask == '':
-            im_maskz_list = split_data(Image(file_mask), dim=dim_sag, squeeze_data=False)
+            im_maskz_list = split_img_data(Image(file_mask), dim=dim_sag, squeeze_data=False, copy=False)
             file_mask_splitZ = []
             for im_maskz in im_maskz_list:
                 im_maskz.save(verbose=0)
@@ -553,7 +531,7 @@ def moco(param):
 
     # axial orientation
     else:
-        file_data_splitZ = [file_data]  # TODO: make it absolute like above
+        im_data_splitZ = [im_data]
         file_target_splitZ = [file_target]  # TODO: make it absolute like above
         # initialize file list for output matrices
         file_mat = np.empty((1, nt), dtype=object)
@@ -566,58 +544,80 @@ def moco(param):
 
     # Loop across file list, where each file is either a 2D volume (if sagittal) or a 3D volume (otherwise)
     # file_mat = tuple([[[] for i in range(nt)] for i in range(nz)])
-
-    file_data_splitZ_moco = []
-    printv('\nRegister. Loop across Z (note: there is only one Z if orientation is axial)')
-    for file in file_data_splitZ:
-        iz = file_data_splitZ.index(file)
+    nz_split = len(im_data_splitZ)
+    index = np.arange(nt)
+    file_data_splitZ_splitT = []
+    file_data_splitZ_splitT_moco = []
+    input_masks = []
+    for iz, im_z in enumerate(im_data_splitZ):
         # Split data along T dimension
         # printv('\nSplit data along T dimension.', verbose)
-        im_z = Image(file)
-        list_im_zt = split_data(im_z, dim=3)
-        file_data_splitZ_splitT = []
+        list_im_zt = split_img_data(im_z, dim=3, copy=False)
+        file_data_splitT = []
         for im_zt in list_im_zt:
             im_zt.save(verbose=0)
-            file_data_splitZ_splitT.append(im_zt.absolutepath)
-        # file_data_splitT = file_data + '_T'
+            file_data_splitT.append(im_zt.absolutepath)
 
-        # Motion correction: initialization
-        index = np.arange(nt)
-        file_data_splitT_num = []
-        file_data_splitZ_splitT_moco = []
-        failed_transfo = [0 for i in range(nt)]
-
-        # Motion correction: Loop across T
-        for indice_index in sct_progress_bar(range(nt), unit='iter', unit_scale=False,
-                                             desc="Z=" + str(iz) + "/" + str(len(file_data_splitZ) - 1), ascii=False, ncols=80):
-
-            # create indices and display stuff
+        # Motion correction: initialize file names and masks
+        file_data_splitT_moco = []
+        input_masks_z = [None for i in range(nt)]
+        for indice_index in range(nt):
             it = index[indice_index]
             file_mat[iz][it] = os.path.join(folder_mat, "mat.Z") + str(iz).zfill(4) + 'T' + str(it).zfill(4)
-            file_data_splitZ_splitT_moco.append(add_suffix(file_data_splitZ_splitT[it], '_moco'))
+            file_data_splitT_moco.append(add_suffix(file_data_splitT[it], '_moco'))
             # deal with masking (except in the 'apply' case, where masking is irrelevant)
-            input_mask = None
             if not param.fname_mask == '' and not param.todo == 'apply':
-                file_data_splitZ_splitT[it], input_mask = apply_mask_if_soft(file_data_splitZ_splitT[it],
-                                                                             im_maskz_list[iz])
-
-            # run 3D registration
-            failed_transfo[it] = register(param, file_data_splitZ_splitT[it], file_target_splitZ[iz], file_mat[iz][it],
-                                          file_data_splitZ_splitT_moco[it], im_mask=input_mask)
-
-            # average registered volume with target image
-            # N.B. use weighted averaging: (target * nb_it + moco) / (nb_it + 1)
-            if param.iterAvg and indice_index < 10 and failed_transfo[it] == 0 and not param.todo == 'apply':
-                im_targetz = Image(file_target_splitZ[iz])
-                data_targetz = im_targetz.data
-                data_mocoz = Image(file_data_splitZ_splitT_moco[it]).data
-                data_targetz = (data_targetz * (indice_index + 1) + data_mocoz) / (indice_index + 2)
-                im_targetz.data = data_targetz
-                im_targetz.save(verbose=0)
+                file_data_splitT[it], input_masks_z[it] = apply_mask_if_soft(file_data_splitT[it], im_maskz_list[iz])
+        file_data_splitZ_splitT.append(file_data_splitT)
+        file_data_splitZ_splitT_moco.append(file_data_splitT_moco)
+        input_masks.append(input_masks_z)
+
+    # With iterative averaging, the target of a slice is updated after each of its first 10 registrations, so these
+    # registrations are run one after the other (but the slices are independent, so the series of the different slices
+    # run in parallel). The following ones use a fixed target and are all run in parallel.
+    n_avg = 10 if param.iterAvg and not param.todo == 'apply' else 0
+    if param.jobs == 1:
+        nt_sequential = nt
+    else:
+        nt_sequential = min(n_avg, nt)
+
+    # Motion correction: Loop across Z and T
+    printv('\nRegister. Loop across Z (note: there is only one Z if orientation is axial)')
+    failed_transfo = np.zeros((nz_split, nt), dtype=int)
+    pbar = sct_progress_bar(total=nz_split * nt, unit='iter', unit_scale=False, desc="Register", ascii=False,
+                            ncols=80)
+    # The same worker processes are used for all the slices
+    pool = multiprocessing.Pool(param.jobs) if param.jobs > 1 else None
+    try:
+        imap = pool.imap if pool is not None else map
+        if nt_sequential > 0:
+            list_args = [(param, file_data_splitZ_splitT[iz][:nt_sequential], file_target_splitZ[iz],
+                          list(file_mat[iz][:nt_sequential]), file_data_splitZ_splitT_moco[iz][:nt_sequential],
+                          input_masks[iz][:nt_sequential], n_avg) for iz in range(nz_split)]
+            for iz, failed in enumerate(imap(_register_series_worker, list_args)):
+                failed_transfo[iz, :nt_sequential] = failed
+                pbar.update(nt_sequential)
+        list_zt = [(iz, it) for iz in range(nz_split) for it in index[nt_sequential:]]
+        list_args = [(param, file_data_splitZ_splitT[iz][it], file_target_splitZ[iz], file_mat[iz][it],
+                      file_data_splitZ_splitT_moco[iz][it], input_masks[iz][it]) for iz, it in list_zt]
+        for (iz, it), failed in zip(list_zt, imap(_register_worker, list_args)):
+            failed_transfo[iz, it] = failed
+            pbar.update(1)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    pbar.close()
+
+    # Registered volumes are merged along Z and T directly into this preallocated array
+    data_moco = None
+    for iz in range(nz_split):
+        file_data_splitT = file_data_splitZ_splitT[iz]
+        file_data_splitT_moco = file_data_splitZ_splitT_moco[iz]
 
         # Replace failed transformation with the closest good one
-        fT = [i for i, j in enumerate(failed_transfo) if j == 1]
-        gT = [i for i, j in enumerate(failed_transfo) if j == 0]
+        fT = [i for i, j in enumerate(failed_transfo[iz]) if j == 1]
+        gT = [i for i, j in enumerate(failed_transfo[iz]) if j == 0]
         for it in range(len(fT)):
             abs_dist = [np.abs(gT[i] - fT[it]) for i in range(len(gT))]
             if not abs_dist == []:
@@ -626,32 +626,34 @@ def moco(param):
                 # copy transformation
                 copy(file_mat[iz][gT[index_good]] + 'Warp.nii.gz', file_mat[iz][fT[it]] + 'Warp.nii.gz')
                 # apply transformation
-                sct_apply_transfo.main(argv=['-i', file_data_splitZ_splitT[fT[it]],
+                sct_apply_transfo.main(argv=['-i', file_data_splitT[fT[it]],
                                              '-d', file_target,
                                              '-w', file_mat[iz][fT[it]] + 'Warp.nii.gz',
-                                             '-o', file_data_splitZ_splitT_moco[fT[it]],
+                                             '-o', file_data_splitT_moco[fT[it]],
                                              '-x', param.interp])
             else:
                 # exit program if no transformation exists.
                 printv('\nERROR in ' + os.path.basename(__file__) + ': No good transformation exist. Exit program.\n', verbose, 'error')
                 sys.exit(2)
 
-        # Merge data along T
-        file_data_splitZ_moco.append(add_suffix(file, suffix))
+        # Merge data along T (and along Z if sagittal)
         if todo != 'estimate':
-            im_data_splitZ_splitT_moco = [Image(fname) for fname in file_data_splitZ_splitT_moco]
-            im_out = concat_data(im_data_splitZ_splitT_moco, 3)
-            im_out.absolutepath = file_data_splitZ_moco[iz]
-            im_out.save(verbose=0)
-
-    # If sagittal, merge along Z
-    if param.is_sagittal:
-        # TODO: im_out.dim is incorrect: Z value is one
-        im_data_splitZ_moco = [Image(fname) for fname in file_data_splitZ_moco]
-        im_out = concat_data(im_data_splitZ_moco, 2)
-        dirname, basename, ext = extract_fname(file_data)
-        path_out = os.path.join(dirname, basename + suffix + ext)
-        im_out.absolutepath = path_out
+            for it in range(nt):
+                im_moco = Image(file_data_splitT_moco[it])
+                data = im_moco.data
+                if data.ndim < 3:
+                    data = np.expand_dims(data, 2)
+                if data_moco is None:
+                    # The header of the output image is the one of the first registered volume
+                    im_out = im_moco
+                    nz_moco = data.shape[2]
+                    data_moco = np.empty(data.shape[:2] + (nz_moco * nz_split, nt), dtype=data.dtype)
+                data_moco[:, :, iz * nz_moco:(iz + 1) * nz_moco, it] = data
+
+    if todo != 'estimate':
+        # TODO: im_out.dim is incorrect
+        im_out.data = data_moco
+        im_out.absolutepath = add_suffix(file_data, suffix)
         im_out.save(verbose=0)
 
     return file_mat, im_out
@@ -780,6 +782,47 @@ def register(param, file_src, file_dest, file_mat, file_out, im_mask=None):
     return failed_transfo
 
 
+def register_series(param, list_file_src, file_dest, list_file_mat, list_file_out, list_im_mask, n_avg=10):
+    """
+    Register volumes one after the other to the same target. With iterative averaging, the target is updated with each
+    of the first registered volumes: (target * nb_it + moco) / (nb_it + 1).
+
+    :param param:
+    :param list_file_src: list of the volumes to register (see register())
+    :param file_dest: target, which is updated
+    :param list_file_mat: list of the output transformations
+    :param list_file_out: list of the registered volumes
+    :param list_im_mask: list of the masks (or None)
+    :param n_avg: number of registered volumes averaged with the target
+    :return: list of the failure status of each registration
+    """
+    list_failed = []
+    for i, (file_src, file_mat, file_out, im_mask) in enumerate(zip(list_file_src, list_file_mat, list_file_out,
+                                                                     list_im_mask)):
+        # run 3D registration
+        failed = register(param, file_src, file_dest, file_mat, file_out, im_mask=im_mask)
+        # average registered volume with target image
+        # N.B. use weighted averaging: (target * nb_it + moco) / (nb_it + 1)
+        if i < n_avg and failed == 0:
+            im_target = Image(file_dest)
+            im_target.data = (im_target.data * (i + 1) + Image(file_out).data) / (i + 2)
+            im_target.save(verbose=0)
+        list_failed.append(failed)
+    return list_failed
+
+
+def _register_series_worker(args):
+    """Call register_series() with a tuple of arguments, to be used with multiprocessing.Pool.imap()."""
+    return register_series(*args)
+
+
+def _register_worker(args):
+    """Call register() with a tuple of arguments (param, file_src, file_dest, file_mat, file_out, im_mask), to be used
+    with multiprocessing.Pool.imap()."""
+    param, file_src, file_dest, file_mat, file_out, im_mask = args
+    return register(param, file_src, file_dest, file_mat, file_out, im_mask=im_mask)
+
+
 def spline(folder_mat, nt, nz, verbose, index_b0=[], graph=0):
 
     printv('\n\n\n------------------------------------------------------------------------------', verbose)
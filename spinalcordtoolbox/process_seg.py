@@ -2,9 +2,13 @@
 # -*- coding: utf-8
 # Functions processing segmentation data
 
+import os
 import math
 import platform
+import functools
+import multiprocessing
 import numpy as np
+from scipy import ndimage, spatial
 from skimage import measure, transform
 import logging
 import nibabel
@@ -13,14 +17,36 @@ from spinalcordtoolbox.image import Image
 from spinalcordtoolbox.aggregate_slicewise import Metric
 from spinalcordtoolbox.centerline.core import ParamCenterline, get_centerline
 from spinalcordtoolbox.resampling import resample_nib
-from spinalcordtoolbox.utils import sct_progress_bar
+from spinalcordtoolbox.utils import sct_progress_bar, tmp_create, rmtree
 
 # NB: We use a threshold to check if an array is empty, instead of checking if it's exactly 0. This is because
 # resampling can change 0 -> ~0 (e.g. 1e-16). See: https://github.com/spinalcordtoolbox/spinalcordtoolbox/issues/3402
 NEAR_ZERO_THRESHOLD = 1e-6
 
+# List of properties to output (in the right order)
+PROPERTY_LIST = ['area',
+                 'angle_AP',
+                 'angle_RL',
+                 'diameter_AP',
+                 'diameter_RL',
+                 'eccentricity',
+                 'orientation',
+                 'solidity',
+                 'length'
+                 ]
 
-def compute_shape(segmentation, angle_correction=True, param_centerline=None, verbose=1):
+# Number of slices processed at once by the 'batch' engine of compute_shape()
+BATCH_CHUNK_SIZE = 64
+# Tolerance between the 'batch' and 'loop' engines of compute_shape(), for slices that do not touch the border of the
+# image: relative tolerance for area, diameters, eccentricity and solidity, absolute tolerance (in deg) for orientation.
+# The difference comes from the cropping around the cord before upsampling: the 'loop' engine crops each slice to its
+# own bounding box, while the 'batch' engine uses the same crop size for all slices of a chunk, which slightly changes
+# the boundary conditions of the upsampling.
+BATCH_ENGINE_RTOL = 0.01
+BATCH_ENGINE_ORIENTATION_ATOL = 0.1
+
+
+def compute_shape(segmentation, angle_correction=True, param_centerline=None, verbose=1, engine='batch', jobs=1):
     """
     Compute morphometric measures of the spinal cord in the transverse (axial) plane from the segmentation.
     The segmentation could be binary or weighted for partial volume [0,1].
@@ -29,20 +55,18 @@ def compute_shape(segmentation, angle_correction=True, param_centerline=None, ve
     :param angle_correction:
     :param param_centerline: see centerline.core.ParamCenterline()
     :param verbose:
+    :param engine: {'batch', 'loop'}: 'batch' processes all slices at once as array operations (see
+      _properties2d_batch()), 'loop' processes the slices one by one (see _properties2d()). Both engines agree within
+      BATCH_ENGINE_RTOL and BATCH_ENGINE_ORIENTATION_ATOL.
+    :param jobs: Number of processes used to compute the shape of chunks of slices in parallel. Only used with
+      engine='batch'.
     :return metrics: Dict of class Metric(). If a metric cannot be calculated, its value will be nan.
     :return fit_results: class centerline.core.FitResults()
     """
-    # List of properties to output (in the right order)
-    property_list = ['area',
-                     'angle_AP',
-                     'angle_RL',
-                     'diameter_AP',
-                     'diameter_RL',
-                     'eccentricity',
-                     'orientation',
-                     'solidity',
-                     'length'
-                     ]
+    if engine not in ['batch', 'loop']:
+        raise ValueError(f"Invalid engine '{engine}'. Valid choices are: 'batch', 'loop'.")
+    if jobs > 1 and engine != 'batch':
+        raise ValueError("Parallel processing (jobs > 1) is only available with engine='batch'.")
 
     im_seg = Image(segmentation).change_orientation('RPI')
     # Getting image dimensions. x, y and z respectively correspond to RL, PA and IS.
@@ -58,9 +82,10 @@ def compute_shape(segmentation, angle_correction=True, param_centerline=None, ve
     data_seg = im_segr.data
     X, Y, Z = (data_seg > NEAR_ZERO_THRESHOLD).nonzero()
     min_z_index, max_z_index = min(Z), max(Z)
+    z_range = np.arange(min_z_index, max_z_index + 1)
 
     # Initialize dictionary of property_list, with 1d array of nan (default value if no property for a given slice).
-    shape_properties = {key: np.full_like(np.empty(nz), np.nan, dtype=np.double) for key in property_list}
+    shape_properties = {key: np.full_like(np.empty(nz), np.nan, dtype=np.double) for key in PROPERTY_LIST}
 
     fit_results = None
 
@@ -68,29 +93,66 @@ def compute_shape(segmentation, angle_correction=True, param_centerline=None, ve
         # compute the spinal cord centerline based on the spinal cord segmentation
         # here, param_centerline.minmax needs to be False because we need to retrieve the total number of input slices
         _, arr_ctl, arr_ctl_der, fit_results = get_centerline(im_segr, param=param_centerline, verbose=verbose)
+        angle_AP_rad, angle_RL_rad = _angles_from_centerline(arr_ctl_der, [px, py, pz])
+    else:
+        angle_AP_rad, angle_RL_rad = np.zeros(len(z_range)), np.zeros(len(z_range))
+
+    if engine == 'batch':
+        _compute_shape_batch(data_seg, z_range, angle_AP_rad, angle_RL_rad, [px, py, pz], angle_correction,
+                             shape_properties, jobs=jobs)
+    else:
+        _compute_shape_loop(data_seg, z_range, angle_AP_rad, angle_RL_rad, [px, py, pz], angle_correction,
+                            shape_properties)
+
+    metrics = {}
+    for key, value in shape_properties.items():
+        # Making sure all entries added to metrics have results
+        if not value == []:
+            metrics[key] = Metric(data=np.array(value), label=key)
+
+    return metrics, fit_results
 
+
+def _angles_from_centerline(arr_ctl_der, dim):
+    """
+    Compute the angles between the centerline and the normal vector to the axial slices.
+
+    :param arr_ctl_der: 3xn array: derivatives of the centerline along z, as output by get_centerline()
+    :param dim: [px, py, pz]: Physical dimension of the image (in mm).
+    :return: angle_AP_rad, angle_RL_rad: 1d arrays of angles (in rad) about the AP and RL axis
+    """
+    # Extract tangent vectors to the centerline (i.e. its derivative). No need to normalize them by their L2 norm, as
+    # atan2 only depends on the ratio between components.
+    tangent_x = np.asarray(arr_ctl_der[0]) * dim[0]
+    tangent_y = np.asarray(arr_ctl_der[1]) * dim[1]
+    tangent_z = np.full_like(tangent_x, dim[2], dtype=np.float64)
+    # Angle between [tangent_x, tangent_z] and [0, 1], i.e. atan2(det([v0, v1]), dot(v0, v1))
+    angle_AP_rad = np.arctan2(tangent_x, tangent_z)
+    angle_RL_rad = np.arctan2(tangent_y, tangent_z)
+    return angle_AP_rad, angle_RL_rad
+
+
+def _compute_shape_loop(data_seg, z_range, angle_AP_rad, angle_RL_rad, dim, angle_correction, shape_properties):
+    """
+    Reference engine for compute_shape(): process each slice in z_range one after the other.
+
+    :param data_seg: 3D array of the segmentation, resampled to isotropic resolution in the axial plane.
+    :param z_range: 1d array of slice indices to process.
+    :param angle_AP_rad: 1d array (same length as z_range) of angles about the AP axis
+    :param angle_RL_rad: 1d array (same length as z_range) of angles about the RL axis
+    :param dim: [px, py, pz]: Physical dimension of the image (in mm).
+    :param angle_correction: Bool: whether to correct the slices for the angle of the centerline.
+    :param shape_properties: Dict of 1d arrays (one value per slice) which is filled in place.
+    """
+    px, py, pz = dim
     # Loop across z and compute shape analysis
-    for iz in sct_progress_bar(range(min_z_index, max_z_index + 1), unit='iter', unit_scale=False, desc="Compute shape analysis",
-                               ascii=True, ncols=80):
+    for i, iz in enumerate(sct_progress_bar(z_range, unit='iter', unit_scale=False, desc="Compute shape analysis",
+                                            ascii=True, ncols=80)):
         # Extract 2D patch
-        current_patch = im_segr.data[:, :, iz]
+        current_patch = data_seg[:, :, iz]
         if angle_correction:
-            # Extract tangent vector to the centerline (i.e. its derivative)
-            tangent_vect = np.array([arr_ctl_der[0][iz - min_z_index] * px,
-                                     arr_ctl_der[1][iz - min_z_index] * py,
-                                     pz])
-            # Normalize vector by its L2 norm
-            tangent_vect = tangent_vect / np.linalg.norm(tangent_vect)
-            # Compute the angle about AP axis between the centerline and the normal vector to the slice
-            v0 = [tangent_vect[0], tangent_vect[2]]
-            v1 = [0, 1]
-            angle_AP_rad = np.math.atan2(np.linalg.det([v0, v1]), np.dot(v0, v1))
-            # Compute the angle about RL axis between the centerline and the normal vector to the slice
-            v0 = [tangent_vect[1], tangent_vect[2]]
-            v1 = [0, 1]
-            angle_RL_rad = np.math.atan2(np.linalg.det([v0, v1]), np.dot(v0, v1))
             # Apply affine transformation to account for the angle between the centerline and the normal to the patch
-            tform = transform.AffineTransform(scale=(np.cos(angle_RL_rad), np.cos(angle_AP_rad)))
+            tform = transform.AffineTransform(scale=(np.cos(angle_RL_rad[i]), np.cos(angle_AP_rad[i])))
             # Convert to float64, to avoid problems in image indexation causing issues when applying transform.warp
             current_patch = current_patch.astype(np.float64)
             # TODO: make sure pattern does not go extend outside of image border
@@ -101,39 +163,144 @@ def compute_shape(segmentation, angle_correction=True, param_centerline=None, ve
                                                   )
         else:
             current_patch_scaled = current_patch
-            angle_AP_rad, angle_RL_rad = 0.0, 0.0
         # compute shape properties on 2D patch
         shape_property = _properties2d(current_patch_scaled, [px, py])
         if shape_property is not None:
             # Add custom fields
-            shape_property['angle_AP'] = angle_AP_rad * 180.0 / math.pi
-            shape_property['angle_RL'] = angle_RL_rad * 180.0 / math.pi
-            shape_property['length'] = pz / (np.cos(angle_AP_rad) * np.cos(angle_RL_rad))
+            shape_property['angle_AP'] = angle_AP_rad[i] * 180.0 / math.pi
+            shape_property['angle_RL'] = angle_RL_rad[i] * 180.0 / math.pi
+            shape_property['length'] = pz / (np.cos(angle_AP_rad[i]) * np.cos(angle_RL_rad[i]))
             # Loop across properties and assign values for function output
-            for property_name in property_list:
+            for property_name in PROPERTY_LIST:
                 shape_properties[property_name][iz] = shape_property[property_name]
         else:
             logging.warning('\nNo properties for slice: {}'.format(iz))
 
-        """ DEBUG
-        from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
-        from matplotlib.figure import Figure
-        fig = Figure()
-        FigureCanvas(fig)
-        ax = fig.add_subplot(111)
-        ax.imshow(current_patch_scaled)
-        ax.grid()
-        ax.set_xlabel('y')
-        ax.set_ylabel('x')
-        fig.savefig('tmp_fig.png')
-        """
-    metrics = {}
-    for key, value in shape_properties.items():
-        # Making sure all entries added to metrics have results
-        if not value == []:
-            metrics[key] = Metric(data=np.array(value), label=key)
 
-    return metrics, fit_results
+def _compute_shape_batch(data_seg, z_range, angle_AP_rad, angle_RL_rad, dim, angle_correction, shape_properties,
+                         chunk_size=BATCH_CHUNK_SIZE, jobs=1):
+    """
+    Vectorized engine for compute_shape(): process the slices in z_range as a stack, chunk by chunk. See
+    _compute_shape_loop() for a description of the parameters.
+
+    :param chunk_size: Number of slices processed at once. Peak memory (per job) is proportional to this value.
+    :param jobs: Number of processes used to process the chunks in parallel.
+    """
+    if jobs > 1:
+        # Make sure that all processes have at least one chunk to work on
+        chunk_size = max(1, min(chunk_size, math.ceil(len(z_range) / jobs)))
+    chunks = [(z_range[i:i + chunk_size], angle_AP_rad[i:i + chunk_size], angle_RL_rad[i:i + chunk_size])
+              for i in range(0, len(z_range), chunk_size)]
+    progress_bar = sct_progress_bar(total=len(chunks), unit='chunk', unit_scale=False, desc="Compute shape analysis",
+                                    ascii=True, ncols=80)
+
+    def merge(z_chunk, properties):
+        is_empty = np.isnan(properties['area'])
+        for iz in z_chunk[is_empty]:
+            logging.warning('\nNo properties for slice: {}'.format(iz))
+        for property_name in PROPERTY_LIST:
+            shape_properties[property_name][z_chunk[~is_empty]] = properties[property_name][~is_empty]
+        progress_bar.update(1)
+
+    if jobs > 1:
+        # Share the segmentation with the worker processes through a memory-mapped file rather than pickling it for
+        # each chunk: the workers only read the slices of their own chunk, and the OS page cache is shared between
+        # processes.
+        path_tmp = tmp_create(basename="compute-shape")
+        fname_data = os.path.join(path_tmp, 'data_seg.npy')
+        np.save(fname_data, data_seg)
+        try:
+            with multiprocessing.Pool(jobs) as pool:
+                worker = functools.partial(_compute_shape_chunk_worker, fname_data=fname_data, dim=dim,
+                                           angle_correction=angle_correction)
+                for (z_chunk, _, _), properties in zip(chunks, pool.imap(worker, chunks)):
+                    merge(z_chunk, properties)
+        finally:
+            rmtree(path_tmp, verbose=0)
+    else:
+        for z_chunk, angle_AP_chunk, angle_RL_chunk in chunks:
+            merge(z_chunk, _compute_shape_chunk(data_seg, z_chunk, angle_AP_chunk, angle_RL_chunk, dim,
+                                                angle_correction))
+    progress_bar.close()
+
+
+def _compute_shape_chunk_worker(chunk, fname_data, dim, angle_correction):
+    """
+    Job function for processing a chunk of slices in a worker process (see _compute_shape_batch()).
+
+    :param chunk: tuple (z_chunk, angle_AP_rad, angle_RL_rad)
+    :param fname_data: .npy file of the segmentation, which is memory-mapped (read-only).
+    """
+    data_seg = np.load(fname_data, mmap_mode='r')
+    return _compute_shape_chunk(data_seg, *chunk, dim, angle_correction)
+
+
+def _compute_shape_chunk(data_seg, z_chunk, angle_AP_rad, angle_RL_rad, dim, angle_correction):
+    """
+    Compute shape properties for a chunk of slices.
+
+    :param data_seg: 3D array of the segmentation, resampled to isotropic resolution in the axial plane.
+    :param z_chunk: 1d array of slice indices to process.
+    :param angle_AP_rad: 1d array (same length as z_chunk) of angles about the AP axis
+    :param angle_RL_rad: 1d array (same length as z_chunk) of angles about the RL axis
+    :param dim: [px, py, pz]: Physical dimension of the image (in mm).
+    :param angle_correction: Bool: whether to correct the slices for the angle of the centerline.
+    :return: Dict of 1d arrays (same length as z_chunk), with keys PROPERTY_LIST.
+    """
+    px, py, pz = dim
+    # Extract stack of 2D patches, with slices along the first axis
+    patches = np.moveaxis(data_seg[:, :, z_chunk], 2, 0).astype(np.float64)
+    if angle_correction:
+        # Account for the angle between the centerline and the normal to the patch (same as transform.warp() with
+        # an AffineTransform of scale (cos(angle_RL), cos(angle_AP)))
+        patches = _scale_patches(patches, np.cos(angle_AP_rad), np.cos(angle_RL_rad))
+    properties = _properties2d_batch(patches, [px, py])
+    properties['angle_AP'] = angle_AP_rad * 180.0 / math.pi
+    properties['angle_RL'] = angle_RL_rad * 180.0 / math.pi
+    properties['length'] = pz / (np.cos(angle_AP_rad) * np.cos(angle_RL_rad))
+    return properties
+
+
+def _scale_patches(patches, scale_x, scale_y):
+    """
+    Scale each 2D patch of a stack about the origin, using bilinear interpolation. Values sampled outside the patch
+    are set to 0, like transform.warp(mode='constant').
+
+    :param patches: 3D array (n, nx, ny): stack of 2D patches.
+    :param scale_x: 1d array (n): scaling factor along the first axis of each patch.
+    :param scale_y: 1d array (n): scaling factor along the second axis of each patch.
+    :return: 3D array (n, nx, ny): stack of scaled patches.
+    """
+    n, nx, ny = patches.shape
+    patches = _interp_axis(patches, np.arange(nx) / np.asarray(scale_x)[:, None], axis=1)
+    patches = _interp_axis(patches, np.arange(ny) / np.asarray(scale_y)[:, None], axis=2)
+    return patches
+
+
+def _interp_axis(patches, coords, axis):
+    """
+    Linearly interpolate a stack of 2D patches along one axis, with a different set of coordinates for each patch.
+    Values sampled outside the patch are set to 0.
+
+    :param patches: 3D array (n, nx, ny): stack of 2D patches.
+    :param coords: 2D array (n, m): coordinates (in voxel) to sample along `axis` for each patch.
+    :param axis: 1 or 2: axis of the patches to interpolate along.
+    :return: 3D array: stack of interpolated patches, with size m along `axis`.
+    """
+    n = patches.shape[axis]
+    # Pad with one zero on each side, so that out-of-bound samples can be clipped to the padding
+    pad_width = [(0, 0)] * 3
+    pad_width[axis] = (1, 1)
+    patches_padded = np.pad(patches, pad_width)
+    index_low = np.floor(coords)
+    weight_high = coords - index_low
+    index_low = np.clip(index_low.astype(int) + 1, 0, n + 1)
+    index_high = np.clip(index_low + 1, 0, n + 1)
+    # Broadcast indices and weights along the other axis of the patches
+    shape = (coords.shape[0], coords.shape[1], 1) if axis == 1 else (coords.shape[0], 1, coords.shape[1])
+    index_low, index_high, weight_high = [a.reshape(shape) for a in (index_low, index_high, weight_high)]
+    return (np.take_along_axis(patches_padded, index_low, axis=axis) * (1 - weight_high) +
+            np.take_along_axis(patches_padded, index_high, axis=axis) * weight_high)
 
 
 def _properties2d(image, dim):
@@ -203,6 +370,209 @@ def _properties2d(image, dim):
     return properties
 
 
+def _properties2d_batch(images, dim):
+    """
+    Compute shape property of each 2D image of a stack, like _properties2d() does for a single image, but with array
+    operations across all images at once. Each image is cropped around its own bounding box before upsampling, and
+    ellipse parameters are computed from the second-order central moments of the upsampled binary masks (as
+    measure.regionprops does).
+
+    :param images: 3D array (n, nx, ny): stack of 2D images in float (weighted for partial volume) that have a single
+      object.
+    :param dim: [px, py]: Physical dimension of the image (in mm). X,Y respectively correspond to AP,RL.
+    :return: Dict of 1d arrays (n). Properties of empty images are set to nan.
+    """
+    pad = 3  # padding used for cropping
+    n, nx, ny = images.shape
+    properties = {key: np.full(n, np.nan) for key in ['area', 'diameter_AP', 'diameter_RL', 'eccentricity',
+                                                       'orientation', 'solidity']}
+    # Check which slices are empty
+    is_valid = ~np.all(images < NEAR_ZERO_THRESHOLD, axis=(1, 2))
+    if not is_valid.any():
+        return properties
+    images = images[is_valid]
+    # Normalize between 0 and 1
+    image_min = images.min(axis=(1, 2), keepdims=True)
+    image_max = images.max(axis=(1, 2), keepdims=True)
+    images_norm = ((images - image_min) / (image_max - image_min)).astype(np.float64)
+    # Get bounding box of the object of each slice
+    images_bin = images_norm > 0.5
+    bbox_x = _bounding_box(images_bin.any(axis=2))
+    bbox_y = _bounding_box(images_bin.any(axis=1))
+    # Size of the crop window of each slice: its bounding box (+ padding). The properties of a slice only depend on
+    # the slice itself (not on the other slices of the stack), so the slices with the same window size are processed
+    # together.
+    widths = np.stack([np.minimum(index_max - index_min + 2 * pad, size)
+                       for (index_min, index_max), size in [(bbox_x, nx), (bbox_y, ny)]], axis=1)
+    index_valid = np.flatnonzero(is_valid)
+    for width in np.unique(widths, axis=0):
+        group = np.flatnonzero((widths == width).all(axis=1))
+        images_crop = _crop_patches(images_norm[group], (bbox_x[0][group], bbox_x[1][group]),
+                                    (bbox_y[0][group], bbox_y[1][group]), pad)
+        for key, value in _properties2d_cropped(images_crop, dim).items():
+            properties[key][index_valid[group]] = value
+
+    return properties
+
+
+def _properties2d_cropped(images_crop, dim):
+    """
+    Compute the shape properties of a stack of normalized images, cropped to windows of identical size (see
+    _properties2d_batch()).
+
+    :param images_crop: 3D array (n, wx, wy): stack of cropped images, normalized between 0 and 1.
+    :param dim: [px, py]: Physical dimension of the image (in mm).
+    :return: Dict of 1d arrays (n).
+    """
+    upscale = 5  # upscale factor for resampling the input image (for better precision)
+    # Oversample images to reach sufficient precision when computing shape metrics on the binary masks
+    images_crop_r = _pyramid_expand_batch(images_crop, upscale)
+    # Binarize images using threshold at 0.5
+    images_crop_r_bin = images_crop_r > 0.5
+    # Compute area with weighted segmentation and adjust area with physical pixel size
+    area = np.sum(images_crop_r, axis=(1, 2)) * dim[0] * dim[1] / upscale ** 2
+    # Compute ellipse parameters from the moments of the binary masks
+    major_axis_length, minor_axis_length, eccentricity, orientation_rad = _ellipse_from_moments(images_crop_r_bin)
+    # Compute ellipse orientation, modulo pi, in deg, and between [0, 90]
+    orientation = np.vectorize(fix_orientation, otypes=[np.float64])(orientation_rad)
+    # Find RL and AP diameter based on major/minor axes and cord orientation
+    is_RL_major = orientation < 45.0
+    diameter_AP = np.where(is_RL_major, minor_axis_length, major_axis_length) * dim[0] / upscale
+    diameter_RL = np.where(is_RL_major, major_axis_length, minor_axis_length) * dim[1] / upscale
+    # Deal with https://github.com/spinalcordtoolbox/spinalcordtoolbox/issues/2307
+    if any(x in platform.platform() for x in ['Darwin-15', 'Darwin-16']):
+        solidity = np.full(len(images_crop), np.nan)
+    else:
+        solidity = np.count_nonzero(images_crop_r_bin, axis=(1, 2)) / _convex_area(images_crop_r_bin)
+    return {'area': area, 'diameter_AP': diameter_AP, 'diameter_RL': diameter_RL, 'eccentricity': eccentricity,
+            'orientation': orientation, 'solidity': solidity}
+
+
+def _bounding_box(mask):
+    """
+    :param mask: 2D boolean array (n, m): projection of each binary image along one axis.
+    :return: min, max: 1d arrays (n) of the first and last+1 indices where mask is True (like regionprops().bbox)
+    """
+    index_min = np.argmax(mask, axis=1)
+    index_max = mask.shape[1] - np.argmax(mask[:, ::-1], axis=1)
+    return index_min, index_max
+
+
+def _crop_patches(images, bbox_x, bbox_y, pad):
+    """
+    Crop a stack of 2D images to windows of identical size (the size of the largest bounding box + padding), each
+    window containing the bounding box (+ padding) of its image. Windows are shifted to stay inside the image rather
+    than going past its border.
+
+    :param images: 3D array (n, nx, ny)
+    :param bbox_x: (min, max) 1d arrays (n) of bounding box indices along the first axis of the images.
+    :param bbox_y: (min, max) 1d arrays (n) of bounding box indices along the second axis of the images.
+    :param pad: Padding around the bounding boxes.
+    :return: 3D array (n, wx, wy): stack of cropped images.
+    """
+    n, nx, ny = images.shape
+    indices = []
+    for (index_min, index_max), size in [(bbox_x, nx), (bbox_y, ny)]:
+        width = min(np.max(index_max - index_min) + 2 * pad, size)
+        start = np.clip(index_min - pad, 0, size - width)
+        indices.append(start[:, None] + np.arange(width))
+    return images[np.arange(n)[:, None, None], indices[0][:, :, None], indices[1][:, None, :]]
+
+
+def _pyramid_expand_batch(images, upscale):
+    """
+    Upsample and smooth each 2D image of a stack, like transform.pyramid_expand(image, upscale=upscale, sigma=None,
+    order=1). Both operations are linear and separable, so they are applied as one matrix product along each axis.
+
+    :param images: 3D array (n, nx, ny): stack of 2D images.
+    :param upscale: Upscale factor.
+    :return: 3D array (n, nx * upscale, ny * upscale)
+    """
+    # Same default sigma as transform.pyramid_expand()
+    sigma = 2 * upscale / 6.0
+    matrices = []
+    for size in images.shape[1:]:
+        # Apply the same operations as transform.pyramid_expand() on the identity matrix, to get the matrix of the
+        # operator along this axis
+        matrix = ndimage.zoom(np.eye(size), (upscale, 1), order=1, mode='mirror', grid_mode=True)
+        matrix = ndimage.gaussian_filter1d(matrix, sigma, axis=0, mode='reflect')
+        matrices.append(matrix)
+    return matrices[0] @ images @ matrices[1].T
+
+
+def _convex_area(images_bin):
+    """
+    Compute the area (in pixels) of the convex hull of each binary image of a stack, with the same definition as
+    morphology.convex_hull_image(): the hull goes through the middle of the pixel edges, and pixels whose center
+    is inside or on the hull are counted.
+
+    :param images_bin: 3D boolean array (n, nx, ny): stack of non-empty binary images.
+    :return: 1d array (n)
+    """
+    n, nx, ny = images_bin.shape
+    # The first and last pixels of each row are the only pixels that can be on the convex hull
+    has_pixel = images_bin.any(axis=2)
+    first = np.argmax(images_bin, axis=2)
+    last = ny - 1 - np.argmax(images_bin[:, :, ::-1], axis=2)
+    offsets = np.array([[-0.5, 0], [0.5, 0], [0, -0.5], [0, 0.5]])
+    rows = np.arange(nx, dtype=np.float64)
+    area = np.zeros(n)
+    for i in range(n):
+        row = np.nonzero(has_pixel[i])[0]
+        coords = np.concatenate([np.stack([row, first[i, row]], axis=1), np.stack([row, last[i, row]], axis=1)])
+        coords = (coords[:, None, :] + offsets).reshape(-1, 2)
+        vertices = coords[spatial.ConvexHull(coords).vertices]
+        # Intersect each row with all edges of the hull: as the hull is convex, the pixels inside are between the
+        # leftmost and rightmost intersections
+        start, end = vertices, np.roll(vertices, -1, axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = (rows[:, None] - start[:, 0]) / (end[:, 0] - start[:, 0])
+        is_crossing = (t >= -1e-10) & (t <= 1 + 1e-10)
+        col = start[:, 1] + t * (end[:, 1] - start[:, 1])
+        # Horizontal edges are intersected at both of their vertices
+        is_horizontal = (start[:, 0] == end[:, 0]) & (rows[:, None] == start[:, 0])
+        col_min = np.where(is_horizontal, np.minimum(start[:, 1], end[:, 1]), np.where(is_crossing, col, np.inf))
+        col_max = np.where(is_horizontal, np.maximum(start[:, 1], end[:, 1]), np.where(is_crossing, col, -np.inf))
+        count = np.floor(col_max.max(axis=1) + 1e-10) - np.ceil(col_min.min(axis=1) - 1e-10) + 1
+        area[i] = np.sum(np.clip(count, 0, None))
+    return area
+
+
+def _ellipse_from_moments(images_bin):
+    """
+    Fit an ellipse to each binary image of a stack, using the eigenvalues of the inertia tensor (same definitions as
+    measure.regionprops).
+
+    :param images_bin: 3D boolean array (n, nx, ny): stack of non-empty binary images.
+    :return: major_axis_length, minor_axis_length, eccentricity, orientation (in rad): 1d arrays (n)
+    """
+    images_bin = images_bin.astype(np.float64)
+    x = np.arange(images_bin.shape[1], dtype=np.float64)
+    y = np.arange(images_bin.shape[2], dtype=np.float64)
+    proj_x = images_bin.sum(axis=2)
+    proj_y = images_bin.sum(axis=1)
+    m00 = proj_x.sum(axis=1)
+    # Centroids and normalized second-order central moments
+    cx = proj_x @ x / m00
+    cy = proj_y @ y / m00
+    mu20 = proj_x @ x ** 2 / m00 - cx ** 2
+    mu02 = proj_y @ y ** 2 / m00 - cy ** 2
+    mu11 = np.einsum('nij,i,j->n', images_bin, x, y) / m00 - cx * cy
+    # Inertia tensor [[a, b], [b, c]] and its eigenvalues l1 >= l2
+    a, b, c = mu02, -mu11, mu20
+    delta = np.sqrt(((a - c) / 2) ** 2 + b ** 2)
+    l1 = np.clip((a + c) / 2 + delta, 0, None)
+    l2 = np.clip((a + c) / 2 - delta, 0, None)
+    major_axis_length = 4 * np.sqrt(l1)
+    minor_axis_length = 4 * np.sqrt(l2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        eccentricity = np.where(l1 == 0, 0, np.sqrt(1 - l2 / l1))
+    orientation = np.where(a - c == 0,
+                           np.where(b < 0, -math.pi / 4, math.pi / 4),
+                           0.5 * np.arctan2(-2 * b, c - a))
+    return major_axis_length, minor_axis_length, eccentricity, orientation
+
+
 def fix_orientation(orientation):
     """Re-map orientation from skimage.regionprops from [-pi/2,pi/2] to [0,90] and rotate by 90deg because image axis
     are inverted"""
@@ -201,7 +201,7 @@ def register_step_ants_registration(src, dest, step, masking, ants_registration_
     # N.B. no need to pad if iter = 0
     if not step.iter == '0':
         dest_pad = image.add_suffix(dest, '_pad')
-        run_proc(['sct_image', '-i', dest, '-o', dest_pad, '-pad', '0,0,' + str(padding)])
+        image.pad_image(image.Image(dest), pad_z_i=int(padding), pad_z_f=int(padding)).save(dest_pad)
         dest = dest_pad
 
     # apply Laplacian filter
@@ -472,7 +472,7 @@ def register2d_centermassrot(fname_src, fname_dest, paramreg=None, fname_warp='w
 
     # Get image dimensions and retrieve nz
     logger.info(f"\nGet image dimensions of destination image...")
-    nx, ny, nz, nt, px, py, pz, pt = image.Image(fname_dest[0]).dim
+    nx, ny, nz, nt, px, py, pz, pt = image.Image(fname_dest[0], lazy=True).dim
 
     logger.info(f"  matrix size: {str(nx)} x {str(ny)} x {str(nz)}")
     logger.info(f"  voxel size: {str(px)}mm x {str(py)}mm x {str(nz)}mm")
@@ -727,7 +727,7 @@ def register2d_columnwise(fname_src, fname_dest, fname_warp='warp_forward.nii.gz
 
     # Get image dimensions and retrieve nz
     logger.info(f"\nGet image dimensions of destination image...")
-    nx, ny, nz, nt, px, py, pz, pt = image.Image(fname_dest).dim
+    nx, ny, nz, nt, px, py, pz, pt = image.Image(fname_dest, lazy=True).dim
 
     logger.info(f"  matrix size: {str(nx)} x {str(ny)} x {str(nz)}")
     logger.info(f"  voxel size: {str(px)}mm x {str(py)}mm x {str(nz)}mm")
@@ -1001,7 +1001,7 @@ def register2d(fname_src, fname_dest, fname_mask='', fname_warp='warp_forward.ni
 
     # Get image dimensions and retrieve nz
     logger.info(f"\nGet image dimensions of destination image...")
-    nx, ny, nz, nt, px, py, pz, pt = image.Image(fname_dest).dim
+    nx, ny, nz, nt, px, py, pz, pt = image.Image(fname_dest, lazy=True).dim
 
     logger.info(f"  matrix size: {str(nx)} x {str(ny)} x {str(nz)}")
     logger.info(f"  voxel size: {str(px)}mm x {str(py)}mm x {str(nz)}mm")
@@ -1163,7 +1163,7 @@ def generate_warping_field(fname_dest, warp_x, warp_y, fname_warp='warping_field
     logger.info(f"\nGenerate warping field...")
 
     # Get image dimensions
-    nx, ny, nz, nt, px, py, pz, pt = image.Image(fname_dest).dim
+    nx, ny, nz, nt, px, py, pz, pt = image.Image(fname_dest, lazy=True).dim
 
     # initialize
     data_warp = np.zeros((nx, ny, nz, 1, 3))
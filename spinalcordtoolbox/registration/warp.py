@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+#########################################################################################
+# Apply a chain of ANTs/ITK transformations (affine matrices and displacement fields) to an image with NumPy/SciPy,
+# as an alternative to isct_antsApplyTransforms.
+#
+# The transformations are composed into a single sampling grid (the position in the source image of each voxel of the
+# destination image), which is then used to resample all the volumes of the source image.
+#
+# Conventions (same as ITK):
+# - Physical coordinates are in LPS (NIfTI/nibabel coordinates are in RAS).
+# - Transformations map points of the destination (fixed) space to the source (moving) space.
+# - Displacement fields are encoded in 5D NIfTI files (x, y, z, 1, vector) with vector intent, their vectors being
+#   expressed in LPS.
+#
+# ---------------------------------------------------------------------------------------
+# Copyright (c) 2020 NeuroPoly, Polytechnique Montreal <www.neuro.polymtl.ca>
+#
+# License: see the LICENSE.TXT
+#########################################################################################
+
+import logging
+import os
+
+import numpy as np
+from scipy import ndimage
+from scipy.io import loadmat
+
+from spinalcordtoolbox.image import Image
+
+logger = logging.getLogger(__name__)
+
+# Interpolation order of scipy.ndimage.map_coordinates for each interpolation method of sct_apply_transfo
+INTERP_ORDER = {'nn': 0, 'linear': 1, 'spline': 3}
+
+# Number of destination slices (along the last axis) for which the sampling grid is computed at once, to bound the
+# size of the temporary arrays
+SLICES_PER_CHUNK = 16
+
+RAS2LPS = np.diag([-1., -1., 1., 1.])
+
+
+def read_affine(fname, inverse=False):
+    """
+    Read an ITK affine transformation, as written by ANTs (binary .mat file) or by SCT (text file).
+
+    :param fname: path of the transformation file (.mat or .txt)
+    :param inverse: invert the transformation
+    :return: 4x4 matrix mapping LPS coordinates of the fixed space to LPS coordinates of the moving space
+    """
+    if fname.endswith('.mat'):
+        matfile = loadmat(fname)
+        names = [name for name in matfile if name.startswith(('AffineTransform_', 'MatrixOffsetTransformBase_'))]
+        if len(names) != 1 or 'fixed' not in matfile:
+            raise ValueError("Unsupported transformation file: {}".format(fname))
+        parameters = matfile[names[0]].ravel()
+        center = matfile['fixed'].ravel()
+    else:
+        with open(fname) as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line and not line.startswith('#'))
+        if not fields.get('Transform', '').strip().startswith(('AffineTransform_', 'MatrixOffsetTransformBase_')):
+            raise ValueError("Unsupported transformation file: {}".format(fname))
+        parameters = np.array(fields['Parameters'].split(), dtype=float)
+        center = np.array(fields.get('FixedParameters', '').split(), dtype=float)
+
+    ndim = len(center)
+    if ndim not in [2, 3] or len(parameters) != ndim * (ndim + 1):
+        raise ValueError("Unsupported transformation file: {}".format(fname))
+    matrix = parameters[:ndim * ndim].reshape(ndim, ndim)
+    translation = parameters[ndim * ndim:]
+    # ITK: T(x) = M (x - c) + c + t
+    affine = np.eye(4)
+    affine[:ndim, :ndim] = matrix
+    affine[:ndim, 3] = translation + center - matrix @ center
+    if inverse:
+        affine = np.linalg.inv(affine)
+    return affine
+
+
+def _vox2lps(im):
+    return RAS2LPS @ im.hdr.get_best_affine()
+
+
+def _inside(coords, shape):
+    """Whether continuous voxel coordinates (3, n) are inside the image buffer, as in ITK (half a voxel margin)."""
+    inside = np.ones(coords.shape[1], dtype=bool)
+    for axis, size in enumerate(shape):
+        inside &= (coords[axis] >= -0.5) & (coords[axis] <= size - 0.5)
+    return inside
+
+
+class DisplacementField:
+    """Displacement field, with linear interpolation and zero displacement outside the field (as in ITK)."""
+    def __init__(self, fname):
+        im = Image(fname)
+        if im.header.get_intent()[0] != 'vector':
+            raise ValueError("Displacement field in {} is invalid: should be encoded in a 5D file with vector intent "
+                             "code".format(fname))
+        data = np.asarray(im.data, dtype=np.float64)
+        # (x, y, z, 1, vector) for 3D fields, (x, y, 1, 1, vector) or (x, y, 1, vector) for 2D fields
+        self.vectors = data.reshape(data.shape[:3] + (data.shape[-1],)) if data.ndim == 5 else \
+            data.reshape(data.shape[:2] + (1, data.shape[-1]))
+        self.lps2vox = np.linalg.inv(_vox2lps(im))
+
+    def __call__(self, points):
+        """
+        :param points: (n, 3) array of LPS coordinates
+        :return: displaced points
+        """
+        coords = self.lps2vox[:3, :3] @ points.T + self.lps2vox[:3, 3:]
+        inside = _inside(coords, self.vectors.shape[:3])
+        displaced = points.copy()
+        for axis in range(self.vectors.shape[3]):
+            displaced[inside, axis] += ndimage.map_coordinates(self.vectors[..., axis], coords[:, inside], order=1,
+                                                               mode='nearest')
+        return displaced
+
+
+def read_transforms(list_warp, list_warpinv=()):
+    """
+    Read a chain of transformations.
+
+    :param list_warp: paths of the transformations, in the order of sct_apply_transfo -w (i.e. the order in which
+      they would be applied to the source image)
+    :param list_warpinv: paths of list_warp whose (affine) transformation must be inverted
+    :return: list of callables mapping (n, 3) LPS points of the destination space towards the source space, in the
+      order in which they must be applied to the points
+    """
+    transforms = []
+    for fname in list_warp:
+        if fname.endswith(('.nii', '.nii.gz')):
+            if fname in list_warpinv:
+                raise ValueError("Displacement fields cannot be inverted: {}".format(fname))
+            transforms.append(DisplacementField(fname))
+        else:
+            affine = read_affine(fname, inverse=fname in list_warpinv)
+            transforms.append(lambda points, affine=affine: points @ affine[:3, :3].T + affine[:3, 3])
+    # The source image is transformed by the first transformation first, so the points of the destination space go
+    # through the chain backwards
+    return transforms[::-1]
+
+
+def get_sampling_grid(im_src, im_dest, list_warp, list_warpinv=(), cache=None):
+    """
+    Compose a chain of transformations into the position, in the source image, of each voxel of the destination image.
+
+    :param im_src: source Image
+    :param im_dest: destination Image
+    :param list_warp: see read_transforms()
+    :param list_warpinv: see read_transforms()
+    :param cache: dict owned by the caller, in which the grid is kept to be reused by the next calls with the same \
+      cache, if the files of the transformations and destination image have not changed and the source image is in \
+      the same space (e.g. for all the labels of the template in sct_warp_template). Only the last grid is kept.
+    :return: float32 array (3, nx, ny, nz) of voxel coordinates in the source image
+    """
+    def file_key(fname):
+        return os.path.abspath(fname), os.path.getmtime(fname)
+
+    key = None
+    if cache is not None and im_dest.absolutepath is not None and os.path.isfile(im_dest.absolutepath):
+        key = (file_key(im_dest.absolutepath), tuple(file_key(fname) for fname in list_warp),
+               tuple(sorted(os.path.abspath(fname) for fname in list_warpinv)),
+               im_src.hdr.get_best_affine().tobytes(), im_src.data.shape[:3])
+        if key in cache:
+            logger.debug("Reusing the sampling grid of the previous call")
+            return cache[key]
+
+    transforms = read_transforms(list_warp, list_warpinv)
+    shape = tuple(im_dest.data.shape[:3]) + (1,) * (3 - len(im_dest.data.shape[:3]))
+    vox2lps = _vox2lps(im_dest)
+    lps2vox_src = np.linalg.inv(_vox2lps(im_src))
+    grid = np.empty((3,) + shape, dtype=np.float32)
+    for z in range(0, shape[2], SLICES_PER_CHUNK):
+        nz = min(SLICES_PER_CHUNK, shape[2] - z)
+        indices = np.indices(shape[:2] + (nz,)).reshape(3, -1).astype(np.float64)
+        indices[2] += z
+        points = (vox2lps[:3, :3] @ indices + vox2lps[:3, 3:]).T
+        for transform in transforms:
+            points = transform(points)
+        coords = lps2vox_src[:3, :3] @ points.T + lps2vox_src[:3, 3:]
+        grid[:, :, :, z:z + nz] = coords.reshape((3,) + shape[:2] + (nz,))
+
+    if key is not None:
+        cache.clear()
+        cache[key] = grid
+    return grid
+
+
+def resample_volumes(data, grid, interp='spline'):
+    """
+    Resample the volumes of an array on a sampling grid, with zeros outside the array.
+
+    :param data: 3D or 4D array (the volumes are along the 4th axis)
+    :param grid: output of get_sampling_grid()
+    :param interp: 'nn', 'linear' or 'spline'
+    :return: float32 array of the shape of the grid, plus the 4th axis of data
+    """
+    order = INTERP_ORDER[interp]
+    volumes = data.reshape(data.shape[:3] + (-1,)) if data.ndim > 3 else data[..., np.newaxis]
+    coords = grid.reshape(3, -1)
+    inside = _inside(coords, volumes.shape[:3])
+    coords = coords[:, inside]
+    out = np.zeros((inside.size, volumes.shape[3]), dtype=np.float32)
+    for t in range(volumes.shape[3]):
+        volume = np.asarray(volumes[..., t], dtype=np.float64)
+        # Same boundary conditions as ITK: clamp to the edge for nn/linear, mirror for B-splines
+        out[inside, t] = ndimage.map_coordinates(volume, coords, order=order,
+                                                 mode='mirror' if order > 1 else 'nearest')
+    return out.reshape(grid.shape[1:] + ((volumes.shape[3],) if data.ndim > 3 else ()))
+
+
+def apply_transforms(im_src, im_dest, list_warp, list_warpinv=(), interp='spline', cache=None):
+    """
+    Apply a chain of transformations to an image and resample it in the space of a destination image, like
+    isct_antsApplyTransforms. 4D images are resampled volume by volume on the same sampling grid.
+
+    :param im_src: source Image (3D or 4D)
+    :param im_dest: destination Image
+    :param list_warp: see read_transforms()
+    :param list_warpinv: see read_transforms()
+    :param interp: 'nn', 'linear' or 'spline'
+    :param cache: see get_sampling_grid()
+    :return: Image in the space of im_dest (with the 4th dimension of im_src)
+    """
+    grid = get_sampling_grid(im_src, im_dest, list_warp, list_warpinv, cache=cache)
+    data = resample_volumes(im_src.data, grid, interp=interp)
+    hdr = im_dest.hdr.copy()
+    if data.ndim > 3:
+        pixdim = hdr['pixdim']
+        pixdim[4] = im_src.hdr['pixdim'][4]
+        hdr['pixdim'] = pixdim
+    hdr.set_data_dtype(np.float32)
+    return Image(data, hdr=hdr)
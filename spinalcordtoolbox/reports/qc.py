@@ -18,15 +18,18 @@ import skimage.io
 import skimage.exposure
 from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
 from matplotlib.figure import Figure
-from matplotlib.animation import FuncAnimation, PillowWriter
 import matplotlib.colors as color
 
 from spinalcordtoolbox.image import Image
 import spinalcordtoolbox.reports.slice as qcslice
+from spinalcordtoolbox.reports import raster
 from spinalcordtoolbox.utils import sct_dir_local_path, list2cmdline, __version__, copy, extract_fname
 
 logger = logging.getLogger(__name__)
 
+# Index of the QC entries (one JSON object per line), in the '_json' folder of the QC report
+QC_INDEX_FILENAME = 'qc_index.jsonl'
+
 
 class QcImage(object):
     """
@@ -63,6 +66,12 @@ class QcImage(object):
                      "#a22abd", "#d58240", "#ac2aff"]
     _seg_colormap = ["#4d0000", "#ff0000"]
     _ctl_colormap = ["#ff000099", '#ffff00']
+    _gray_colormap = ["#000000", "#ffffff"]
+    # Orientation labels of the axial mosaics: (text, x, y)
+    _orientation_labels = [('A', 12, 6), ('P', 12, 28), ('L', 0, 18), ('R', 24, 18)]
+    # Palette of the gif frames: gray levels, then yellow for the orientation labels
+    _gif_levels = 255
+    _gif_palette = raster.gray_palette(_gif_levels, [(255, 255, 0)])
 
     def __init__(self, qc_report, interpolation, action_list, process, stretch_contrast=True,
                  stretch_contrast_method='contrast_stretching', angle_line=None, fps=None):
@@ -240,7 +249,7 @@ class QcImage(object):
                   cmap=color.ListedColormap(self._color_bin_red),
                   norm=color.Normalize(vmin=0, vmax=1),
                   interpolation=self.interpolation,
-                  alpha=10,
+                  alpha=1,
                   aspect=float(self.aspect_mask))
         ax.get_xaxis().set_visible(False)
         ax.get_yaxis().set_visible(False)
@@ -277,6 +286,40 @@ class QcImage(object):
         ax.get_xaxis().set_visible(False)
         ax.get_yaxis().set_visible(False)
 
+    def _listed_seg_rgba(self, mask):
+        """Rasterized listed_seg()"""
+        cmap = color.LinearSegmentedColormap.from_list("", self._seg_colormap)
+        return raster.apply_colormap(np.ma.masked_equal(mask, 0), raster.colormap_lut(cmap), vmin=0.5, vmax=1)
+
+    def _template_rgba(self, mask):
+        """Rasterized template()"""
+        values = np.where(mask < 0.5, 0, mask)
+        cmap = color.LinearSegmentedColormap.from_list('cmap_atlas', [color.colorConverter.to_rgba('white', alpha=0.0),
+                                                                      color.colorConverter.to_rgba('blue', alpha=0.7),
+                                                                      color.colorConverter.to_rgba('cyan', alpha=0.8)])
+        return raster.apply_colormap(values, raster.colormap_lut(cmap))
+
+    def _no_seg_seg_rgba(self, mask):
+        """Rasterized no_seg_seg(), without the orientation labels"""
+        cmap = color.LinearSegmentedColormap.from_list("", self._gray_colormap)
+        return raster.apply_colormap(mask, raster.colormap_lut(cmap))
+
+    def _smooth_centerline_rgba(self, mask):
+        """Rasterized smooth_centerline()"""
+        mask = mask / mask.max()
+        mask[mask < 0.05] = 0
+        cmap = color.LinearSegmentedColormap.from_list("", self._ctl_colormap)
+        return raster.apply_colormap(np.ma.masked_equal(mask, 0), raster.colormap_lut(cmap), vmin=0, vmax=1)
+
+    # Actions which only map the mask to colors, drawn without matplotlib. The other actions draw annotations (text,
+    # markers, lines) and are rendered with matplotlib.
+    _raster_actions = {
+        'listed_seg': _listed_seg_rgba,
+        'template': _template_rgba,
+        'no_seg_seg': _no_seg_seg_rgba,
+        'smooth_centerline': _smooth_centerline_rgba,
+    }
+
     # def colorbar(self):
     #     fig = plt.figure(figsize=(9, 1.5))
     #     ax = fig.add_axes([0.05, 0.80, 0.9, 0.15])
@@ -337,29 +380,54 @@ class QcImage(object):
         # if sagittal orientation restrict height
         elif slice_orientation == 'Sagittal':
             size_fig = [5 * img.shape[1] / img.shape[0], 5]
+        dpi = self.qc_report.qc_params.dpi
+
+        # The images are drawn without matplotlib, unless they need one of its interpolations
+        rasterize = self.interpolation in ['none', 'nearest']
 
-        fig = Figure()
-        fig.set_size_inches(size_fig[0], size_fig[1], forward=True)
-        FigureCanvas(fig)
-        ax = fig.add_axes((0, 0, 1, 1))
-        ax.imshow(img, cmap='gray', interpolation=self.interpolation, aspect=float(self.aspect_img))
-        self._add_orientation_label(ax)
-        ax.get_xaxis().set_visible(False)
-        ax.get_yaxis().set_visible(False)
         logger.info(self.qc_report.qc_params.abs_bkg_img_path())
-        self._save(fig, self.qc_report.qc_params.abs_bkg_img_path(), dpi=self.qc_report.qc_params.dpi)
+        if rasterize:
+            canvas = raster.Canvas((size_fig[0] * dpi, size_fig[1] * dpi), img.shape, float(self.aspect_img))
+            cmap = color.LinearSegmentedColormap.from_list("", self._gray_colormap)
+            image = raster.to_image(canvas.draw(raster.apply_colormap(img, raster.colormap_lut(cmap))))
+            self._draw_orientation_label(image, canvas, 'yellow')
+            image.save(self.qc_report.qc_params.abs_bkg_img_path(), format='png')
+        else:
+            fig = Figure()
+            fig.set_size_inches(size_fig[0], size_fig[1], forward=True)
+            FigureCanvas(fig)
+            ax = fig.add_axes((0, 0, 1, 1))
+            ax.imshow(img, cmap='gray', interpolation=self.interpolation, aspect=float(self.aspect_img))
+            self._add_orientation_label(ax)
+            ax.get_xaxis().set_visible(False)
+            ax.get_yaxis().set_visible(False)
+            self._save(fig, self.qc_report.qc_params.abs_bkg_img_path(), dpi=dpi)
 
-        fig = Figure()
-        fig.set_size_inches(size_fig[0], size_fig[1], forward=True)
-        FigureCanvas(fig)
         for i, action in enumerate(self.action_list):
-            logger.debug('Action List %s', action.__name__)
             if self._stretch_contrast and action.__name__ in ("no_seg_seg",):
                 print("Mask type %s" % mask[i].dtype)
                 mask[i] = self._func_stretch_contrast(mask[i])
-            ax = fig.add_axes((0, 0, 1, 1), label=str(i))
-            action(self, mask[i], ax)
-        self._save(fig, self.qc_report.qc_params.abs_overlay_img_path(), dpi=self.qc_report.qc_params.dpi)
+
+        # The annotations of the overlays (text, markers, lines) are drawn with matplotlib
+        if rasterize and all(action.__name__ in self._raster_actions for action in self.action_list):
+            rgba = np.zeros(mask[0].shape[:2] + (4,), dtype=np.uint8)
+            for i, action in enumerate(self.action_list):
+                logger.debug('Action List %s', action.__name__)
+                rgba = raster.alpha_blend(rgba, self._raster_actions[action.__name__](self, mask[i]))
+            canvas = raster.Canvas((size_fig[0] * dpi, size_fig[1] * dpi), rgba.shape, float(self.aspect_mask))
+            image = raster.to_image(canvas.draw(rgba))
+            if any(action.__name__ == 'no_seg_seg' for action in self.action_list):
+                self._draw_orientation_label(image, canvas, 'yellow')
+            image.save(self.qc_report.qc_params.abs_overlay_img_path(), format='png')
+        else:
+            fig = Figure()
+            fig.set_size_inches(size_fig[0], size_fig[1], forward=True)
+            FigureCanvas(fig)
+            for i, action in enumerate(self.action_list):
+                logger.debug('Action List %s', action.__name__)
+                ax = fig.add_axes((0, 0, 1, 1), label=str(i))
+                action(self, mask[i], ax)
+            self._save(fig, self.qc_report.qc_params.abs_overlay_img_path(), dpi=dpi)
 
         self.qc_report.update_description_file(img.shape)
 
@@ -372,16 +440,13 @@ class QcImage(object):
         :return:
         """
 
-        size_fig = [5, 10 * images_after_moco[0].shape[0] / images_after_moco[0].shape[1] + 0.5]
         if self._stretch_contrast:
             for i in range(len(images_after_moco)):
                 images_after_moco[i] = self._func_stretch_contrast(images_after_moco[i])
                 images_before_moco[i] = self._func_stretch_contrast(images_before_moco[i])
 
-        self._generate_and_save_gif(images_before_moco, images_after_moco, size_fig)
-        self._generate_and_save_gif(images_before_moco, images_after_moco, size_fig, is_mask=True)
-
-        w, h = (self.qc_report.qc_params.dpi * size_fig[0], self.qc_report.qc_params.dpi * size_fig[1])
+        self._generate_and_save_gif(images_before_moco, images_after_moco)
+        w, h = self._generate_and_save_gif(images_before_moco, images_after_moco, is_mask=True)
         self.qc_report.update_description_file((w, h))
 
     def _func_stretch_contrast(self, img):
@@ -430,20 +495,33 @@ class QcImage(object):
         """
         if self.qc_report.qc_params.orientation == 'Axial':
             # If mosaic of axial slices, display orientation labels
-            ax.text(12, 6, 'A', color='yellow', size=4)
-            ax.text(12, 28, 'P', color='yellow', size=4)
-            ax.text(0, 18, 'L', color='yellow', size=4)
-            ax.text(24, 18, 'R', color='yellow', size=4)
+            for text, x, y in self._orientation_labels:
+                ax.text(x, y, text, color='yellow', size=4)
+
+    def _draw_orientation_label(self, image, canvas, fill, offset=0):
+        """
+        Draw the orientation labels on a rasterized image, like _add_orientation_label()
+
+        :param image: PIL.Image.Image
+        :param canvas: spinalcordtoolbox.reports.raster.Canvas: Canvas in which the mosaic is drawn
+        :param fill: Color of the labels
+        :param offset: int: Vertical position of the canvas in the image
+        :return:
+        """
+        if self.qc_report.qc_params.orientation == 'Axial':
+            for text, x, y in self._orientation_labels:
+                x, y = canvas.to_canvas(x, y)
+                # font size of 4 points
+                raster.draw_text(image, (x, y + offset), text, 4 * self.qc_report.qc_params.dpi / 72, fill)
 
-    def _generate_and_save_gif(self, top_images, bottom_images, size_fig, is_mask=False):
+    def _generate_and_save_gif(self, top_images, bottom_images, is_mask=False):
         """
-        Create figure with two images for sct_fmri_moco and sct_dmri_moco and save gif
+        Create frames with two images for sct_fmri_moco and sct_dmri_moco and save gif
 
         :param top_images: list of images of mosaic before motion correction
         :param bottom_images: list of images of mosaic after motion correction
-        :param size_fig: size of figure in inches
         :param is_mask: display grid on top of mosaic
-        :return:
+        :return: (width, height) of the gif
         """
 
         if is_mask:
@@ -451,42 +529,47 @@ class QcImage(object):
         else:
             aspect = self.aspect_img
 
-        fig = Figure()
-        FigureCanvas(fig)
-        fig.set_size_inches(size_fig[0], size_fig[1], forward=True)
-        fig.subplots_adjust(left=0, top=0.9, bottom=0.1)
-
-        ax1 = fig.add_subplot(211)
-        null_image = np.zeros(np.shape(top_images[0]))
-        img1 = ax1.imshow(null_image, cmap='gray', aspect=float(aspect))
-        ax1.set_title('Before motion correction', fontsize=8, loc='left', pad=2)
-        ax1.get_xaxis().set_visible(False)
-        ax1.get_yaxis().set_visible(False)
-        self._add_orientation_label(ax1)
-        if is_mask:
-            QcImage.grid(self, top_images[0], ax1)
-
-        ax2 = fig.add_subplot(212)
-        img2 = ax2.imshow(null_image, cmap='gray', aspect=float(aspect))
-        ax2.set_title('After motion correction', fontsize=8, loc='left', pad=2)
-        ax2.get_xaxis().set_visible(False)
-        ax2.get_yaxis().set_visible(False)
-        self._add_orientation_label(ax2)
+        # Layout of a figure 5 inches wide, with the title of each mosaic above it, and the volume number at the bottom
+        dpi = self.qc_report.qc_params.dpi
+        title_size, volume_size = 8 * dpi / 72, 6 * dpi / 72
+        h, w = top_images[0].shape
+        canvas = raster.Canvas((5 * dpi, 5 * dpi * h * aspect / w), (h, w), float(aspect))
+        margin, footer = int(round(1.5 * title_size)), int(round(2 * volume_size))
+        width, height = canvas.size[0], 2 * (margin + canvas.size[1]) + footer
+        tops = [margin, 2 * margin + canvas.size[1]]
+        white, yellow = self._gif_levels - 1, self._gif_levels
+
+        # Titles, drawn once for all the frames
+        background = raster.to_image(np.full((height, width), white, dtype=np.uint8), self._gif_palette)
+        for top, title in zip(tops, ['Before motion correction', 'After motion correction']):
+            raster.draw_text(background, (0, top - title_size / 4), title, title_size, 0)
+        background = np.asarray(background)
+
+        # Orientation labels and grid over the mosaics, drawn once for all the frames
+        annotations = raster.to_image(np.zeros((height, width), dtype=np.uint8), self._gif_palette)
+        for top in tops:
+            self._draw_orientation_label(annotations, canvas, yellow, offset=top)
+        annotations = np.array(annotations)
         if is_mask:
-            QcImage.grid(self, bottom_images[0], ax2)
-
-        ann = ax2.annotate('', xy=(0, .025), xycoords='figure fraction', horizontalalignment='left',
-                           verticalalignment='bottom', fontsize=6)
-
-        def update_figure(i):
-            img1.set_data(top_images[i])
-            img1.set_clim(vmin=np.amin(top_images[i]), vmax=np.amax(top_images[i]))
-            img2.set_data(bottom_images[i])
-            img2.set_clim(vmin=np.amin(bottom_images[i]), vmax=np.amax(bottom_images[i]))
-            ann.set_text(f'Volume: {i + 1}/{len(top_images)}')
-
-        # FuncAnimation creates an animation by repeatedly calling the function update_figure for each frame
-        ani = FuncAnimation(fig, update_figure, frames=len(top_images))
+            linewidth = max(int(round(0.5 * dpi / 72)), 1)
+            for top in tops:
+                for x0, y0 in self._centermass:
+                    x, y = (int(round(c - linewidth / 2)) for c in canvas.to_canvas(x0, y0))
+                    annotations[top:top + canvas.size[1], max(x, 0):x + linewidth] = white
+                    annotations[top + max(y, 0):top + y + linewidth, :] = white
+        is_annotated = annotations > 0
+
+        frames = []
+        for i in range(len(top_images)):
+            frame = background.copy()
+            for top, images in zip(tops, [top_images, bottom_images]):
+                index, _ = raster.colormap_index(images[i], self._gif_levels)
+                frame[top:top + canvas.size[1]] = canvas.draw(index.astype(np.uint8), background=white)
+            frame[is_annotated] = annotations[is_annotated]
+            frame = raster.to_image(frame, self._gif_palette)
+            raster.draw_text(frame, (0, height - volume_size / 2), f'Volume: {i + 1}/{len(top_images)}',
+                             volume_size, 0)
+            frames.append(frame)
 
         if is_mask:
             gif_out_path = self.qc_report.qc_params.abs_overlay_img_path()
@@ -495,9 +578,9 @@ class QcImage(object):
 
         if self._fps is None:
             self._fps = 3
-        writer = PillowWriter(self._fps)
         logger.info('Saving gif %s', gif_out_path)
-        ani.save(gif_out_path, writer=writer, dpi=self.qc_report.qc_params.dpi)
+        raster.save_gif(frames, gif_out_path, self._fps)
+        return width, height
 
     def _save(self, fig, img_path, format='png', bbox_inches='tight', pad_inches=0.00, dpi=300):
         """
@@ -559,7 +642,7 @@ class Params(object):
         self.dpi = dpi
         self.root_folder = dest_folder
         self.mod_date = datetime.datetime.strftime(datetime.datetime.now(), '%Y_%m_%d_%H%M%S.%f')
-        self.qc_results = os.path.join(dest_folder, '_json/qc_' + self.mod_date + '.json')
+        self.qc_results = os.path.join(dest_folder, '_json', QC_INDEX_FILENAME)
         if command in ['sct_fmri_moco', 'sct_dmri_moco']:
             ext = "gif"
         else:
@@ -631,46 +714,65 @@ class QcReport(object):
             'moddate': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             'qc': ""
         }
-        logger.debug('Description file: %s', self.qc_params.qc_results)
-        # results = []
+        logger.debug('QC index: %s', self.qc_params.qc_results)
         # Create path to store json files
         path_json, _ = os.path.split(self.qc_params.qc_results)
         if not os.path.exists(path_json):
             os.makedirs(path_json, exist_ok=True)
 
-        # lock the output directory
-        # because this code may be run in parallel
-        path_json_fd = os.open(path_json, os.O_RDONLY)
-        fcntl.flock(path_json_fd, fcntl.LOCK_EX)
-
+        # Append the entry to the index in a single write, so that the processes adding entries to the same QC report
+        # at the same time don't need to lock it
+        index_fd = os.open(self.qc_params.qc_results, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
         try:
-            # Create json file
-            with open(self.qc_params.qc_results, 'w+') as qc_file:
-                json.dump(output, qc_file, indent=1)
-            self._update_html_assets(get_json_data_from_path(path_json))
+            os.write(index_fd, (json.dumps(output) + '\n').encode('utf-8'))
         finally:
-            # fcntl.flock(path_json_fd, fcntl.LOCK_UN) # technically, redundant, since close() triggers this too.
-            os.close(path_json_fd)
-
-    def _update_html_assets(self, json_data):
-        """Update the html file and assets"""
-        assets_path = os.path.join(os.path.dirname(__file__), 'assets')
-        dest_path = self.qc_params.root_folder
-
-        with io.open(os.path.join(assets_path, 'index.html'), encoding="utf-8") as template_index:
-            template = Template(template_index.read())
-            output = template.substitute(sct_json_data=json.dumps(json_data))
-            io.open(os.path.join(dest_path, 'index.html'), 'w', encoding="utf-8").write(output)
-
-        for path in ['css', 'js', 'imgs', 'fonts']:
-            src_path = os.path.join(assets_path, '_assets', path)
-            dest_full_path = os.path.join(dest_path, '_assets', path)
-            if not os.path.exists(dest_full_path):
-                os.makedirs(dest_full_path, exist_ok=True)
-            for file_ in os.listdir(src_path):
-                if not os.path.isfile(os.path.join(dest_full_path, file_)):
-                    copy(os.path.join(src_path, file_),
-                             dest_full_path)
+            os.close(index_fd)
+
+        # When many entries are added (e.g. by the jobs of sct_run_batch), index.html is rendered once at the end
+        if os.environ.get('SCT_QC_DEFER_INDEX', '0') != '1':
+            update_index_html(self.qc_params.root_folder)
+
+
+def update_index_html(path_qc):
+    """
+    Render the index.html of a QC report from all its entries, and copy the assets of the report.
+
+    :param path_qc: str: root folder of the QC report
+    """
+    path_json = os.path.join(path_qc, '_json')
+    os.makedirs(path_json, exist_ok=True)
+    # lock the output directory, because this code may be run in parallel: the last rendering includes all the entries
+    path_json_fd = os.open(path_json, os.O_RDONLY)
+    fcntl.flock(path_json_fd, fcntl.LOCK_EX)
+    try:
+        _update_html_assets(path_qc, get_json_data_from_path(path_json))
+    finally:
+        # fcntl.flock(path_json_fd, fcntl.LOCK_UN) # technically, redundant, since close() triggers this too.
+        os.close(path_json_fd)
+
+
+def _update_html_assets(dest_path, json_data):
+    """Update the html file and assets"""
+    assets_path = os.path.join(os.path.dirname(__file__), 'assets')
+
+    with io.open(os.path.join(assets_path, 'index.html'), encoding="utf-8") as template_index:
+        template = Template(template_index.read())
+        output = template.substitute(sct_json_data=json.dumps(json_data))
+    # Replace the previous index.html at once, so that it is never seen partially written
+    fname_index_tmp = os.path.join(dest_path, 'index.html.{}.tmp'.format(os.getpid()))
+    with io.open(fname_index_tmp, 'w', encoding="utf-8") as index:
+        index.write(output)
+    os.replace(fname_index_tmp, os.path.join(dest_path, 'index.html'))
+
+    for path in ['css', 'js', 'imgs', 'fonts']:
+        src_path = os.path.join(assets_path, '_assets', path)
+        dest_full_path = os.path.join(dest_path, '_assets', path)
+        if not os.path.exists(dest_full_path):
+            os.makedirs(dest_full_path, exist_ok=True)
+        for file_ in os.listdir(src_path):
+            if not os.path.isfile(os.path.join(dest_full_path, file_)):
+                copy(os.path.join(src_path, file_),
+                         dest_full_path)
 
 
 def add_entry(src, process, args, path_qc, plane, path_img=None, path_img_overlay=None,
@@ -880,10 +982,20 @@ def generate_qc(fname_in1, fname_in2=None, fname_seg=None, angle_line=None, args
 
 
 def get_json_data_from_path(path_json):
-    """Read all json files present in the given path, and output an aggregated json structure"""
+    """Read the QC index and the json files present in the given path, and output an aggregated json structure"""
     results = []
+    # One json file per entry, written by the previous versions of SCT
     for file_json in glob.iglob(os.path.join(path_json, '*.json')):
         logger.debug('Opening: ' + file_json)
         with open(file_json, 'r+') as fjson:
             results.append(json.load(fjson))
+    fname_index = os.path.join(path_json, QC_INDEX_FILENAME)
+    if os.path.isfile(fname_index):
+        with io.open(fname_index, encoding="utf-8") as index:
+            for line in index:
+                if line.strip():
+                    try:
+                        results.append(json.loads(line))
+                    except ValueError:
+                        logger.warning('Skipping an invalid entry of %s: %s', fname_index, line.strip())
     return results
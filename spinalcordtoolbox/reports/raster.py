@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#########################################################################################
+#
+# Rasterization of the QC images without matplotlib figures: colormaps are applied with lookup tables, layers are
+# alpha blended with NumPy, and the PNG/GIF files are written with Pillow.
+#
+# ---------------------------------------------------------------------------------------
+# Copyright (c) 2020 Polytechnique Montreal <www.neuro.polymtl.ca>
+#
+# About the license: see the file LICENSE.TXT
+#########################################################################################
+
+import functools
+
+import numpy as np
+from PIL import Image as PILImage, ImageDraw, ImageFont
+
+
+def colormap_lut(cmap, n=256):
+    """
+    Lookup table of a colormap.
+
+    :param cmap: matplotlib.colors.Colormap
+    :param n: int: Number of colors
+    :return: (n, 4) uint8 array of RGBA colors
+    """
+    return cmap(np.linspace(0, 1, n), bytes=True)
+
+
+def colormap_index(data, n, vmin=None, vmax=None):
+    """
+    Index of the color of each value in a lookup table of n colors, as matplotlib's Normalize(vmin, vmax) and
+    Colormap compute it. The values under vmin and over vmax get the first and the last color.
+
+    :param data: 2D array or masked array
+    :param n: int: Number of colors
+    :param vmin: float: Value mapped to the first color. Default: minimum of the data
+    :param vmax: float: Value mapped to the last color. Default: maximum of the data
+    :return: int array of indices, bool array of the masked and non-finite values
+    """
+    data = np.ma.masked_invalid(data)
+    mask = np.ma.getmaskarray(data)
+    values = data.filled(0).astype(np.float64)
+    if vmin is None:
+        vmin = values[~mask].min() if not mask.all() else 0
+    if vmax is None:
+        vmax = values[~mask].max() if not mask.all() else 0
+    if vmax == vmin:
+        return np.zeros(values.shape, dtype=int), mask
+    return np.clip((values - vmin) / (vmax - vmin) * n, 0, n - 1).astype(int), mask
+
+
+def apply_colormap(data, lut, vmin=None, vmax=None):
+    """
+    Map the values of an image to RGBA colors, as matplotlib's imshow() does. Masked and non-finite values are
+    transparent.
+
+    :param data: 2D array or masked array
+    :param lut: (n, 4) uint8 array: see colormap_lut()
+    :param vmin: float: See colormap_index()
+    :param vmax: float: See colormap_index()
+    :return: (h, w, 4) uint8 array
+    """
+    index, mask = colormap_index(data, len(lut), vmin, vmax)
+    rgba = lut[index]
+    rgba[mask] = 0
+    return rgba
+
+
+def gray_palette(levels, colors=()):
+    """
+    Palette of 'P' images: `levels` gray levels from black to white, followed by the given colors.
+
+    :param levels: int: Number of gray levels
+    :param colors: list of (r, g, b) colors
+    :return: list of the (r, g, b) values of the palette
+    """
+    grays = np.repeat(np.rint(np.linspace(0, 255, levels))[:, np.newaxis], 3, axis=1)
+    return np.concatenate([grays, np.reshape(colors, (-1, 3))]).astype(np.uint8).ravel().tolist()
+
+
+def alpha_blend(bottom, top):
+    """
+    Draw an RGBA image over another one ("over" compositing).
+
+    :param bottom: (h, w, 4) uint8 array
+    :param top: (h, w, 4) uint8 array
+    :return: (h, w, 4) uint8 array
+    """
+    alpha_top = top[..., 3:] / 255
+    alpha_bottom = bottom[..., 3:] / 255 * (1 - alpha_top)
+    alpha = alpha_top + alpha_bottom
+    rgb = (top[..., :3] * alpha_top + bottom[..., :3] * alpha_bottom) / np.where(alpha > 0, alpha, 1)
+    return np.rint(np.concatenate([rgb, alpha * 255], axis=-1)).astype(np.uint8)
+
+
+class Canvas(object):
+    """
+    Output image of a given size, in which images are drawn with a given aspect ratio, scaled to fit and centered
+    (like imshow() in the axes of a whole matplotlib figure), with a nearest-neighbour interpolation.
+    """
+
+    def __init__(self, size, shape, aspect=1.0):
+        """
+        :param size: (width, height): Size of the output image in pixels
+        :param shape: (h, w): Shape of the images drawn in the canvas
+        :param aspect: float: Ratio of the height and the width of the pixels of the images
+        """
+        self.size = int(size[0]), int(size[1])
+        h, w = shape[:2]
+        self.scale_x = min(self.size[0] / w, self.size[1] / (h * aspect))
+        self.scale_y = self.scale_x * aspect
+        self.shape = int(round(h * self.scale_y)), int(round(w * self.scale_x))
+        self.offset = (self.size[0] - self.shape[1]) // 2, (self.size[1] - self.shape[0]) // 2
+        # Pixel of the images displayed at each row and column of the drawn image
+        self._rows = np.minimum((np.arange(self.shape[0]) + 0.5) / self.scale_y, h - 1).astype(int)
+        self._cols = np.minimum((np.arange(self.shape[1]) + 0.5) / self.scale_x, w - 1).astype(int)
+
+    def to_canvas(self, x, y):
+        """Canvas coordinates of the center of the pixel (x, y) of the images"""
+        return self.offset[0] + (x + 0.5) * self.scale_x, self.offset[1] + (y + 0.5) * self.scale_y
+
+    def draw(self, array, background=0):
+        """
+        :param array: (h, w, ...) array: Image
+        :param background: Value of the canvas outside of the drawn image
+        :return: (height, width, ...) array
+        """
+        canvas = np.full((self.size[1], self.size[0]) + array.shape[2:], background, dtype=array.dtype)
+        x, y = self.offset
+        canvas[y:y + self.shape[0], x:x + self.shape[1]] = array.take(self._rows, axis=0).take(self._cols, axis=1)
+        return canvas
+
+
+@functools.lru_cache()
+def font(size):
+    """Default font of Pillow, scaled to `size` pixels when Pillow supports it"""
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow < 10.1: fixed-size bitmap font
+        return ImageFont.load_default()
+
+
+def draw_text(image, xy, text, size, fill):
+    """
+    Draw text on an image, with (x, y) the left end of its baseline, as matplotlib's text() does.
+
+    :param image: PIL.Image.Image
+    :param xy: (x, y) position in pixels
+    :param text: str
+    :param size: float: Font size in pixels
+    :param fill: Color of the text (palette index for 'P' images)
+    """
+    draw = ImageDraw.Draw(image)
+    text_font = font(max(int(round(size)), 1))
+    bottom = draw.textbbox((0, 0), text, font=text_font)[3]
+    draw.text((xy[0], xy[1] - bottom), text, font=text_font, fill=fill)
+
+
+def to_image(array, palette=None):
+    """
+    :param array: (h, w, 4) uint8 array of RGBA colors, or (h, w) uint8 array of indices in the palette
+    :param palette: list: Palette of the image, see gray_palette()
+    :return: PIL.Image.Image: 'RGBA' or 'P' image
+    """
+    image = PILImage.fromarray(np.ascontiguousarray(array))
+    if palette is not None:
+        image.putpalette(palette)
+    return image
+
+
+def save_gif(frames, fname, fps):
+    """
+    Save an animated gif looping over the frames.
+
+    :param frames: list of PIL.Image.Image
+    :param fname: str: Output file name
+    :param fps: float: Number of frames per second
+    """
+    # The frames already have a palette: it doesn't need to be optimized
+    frames[0].save(fname, format='gif', save_all=True, append_images=frames[1:], duration=int(round(1000 / fps)),
+                   loop=0, optimize=False)
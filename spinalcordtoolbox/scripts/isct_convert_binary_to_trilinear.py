@@ -109,7 +109,7 @@ def main():
 
     # Get dimensions of data
     printv('\nGet dimensions of data...', verbose)
-    nx, ny, nz, nt, px, py, pz, pt = Image('data.nii').dim
+    nx, ny, nz, nt, px, py, pz, pt = Image('data.nii', lazy=True).dim
     printv('.. ' + str(nx) + ' x ' + str(ny) + ' x ' + str(nz), verbose)
 
     # upsample data
@@ -457,7 +457,7 @@ class AnalyzeLeion:
 
     def orient2rpi(self):
         # save input image orientation
-        self.orientation = Image(self.fname_mask).orientation
+        self.orientation = Image(self.fname_mask, lazy=True).orientation
 
         if not self.orientation == 'RPI':
             printv('\nOrient input image(s) to RPI orientation...', self.verbose, 'normal')
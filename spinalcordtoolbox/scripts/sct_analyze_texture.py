@@ -11,13 +11,14 @@
 import os
 import sys
 import itertools
+import multiprocessing
 
 import numpy as np
-from skimage.feature import greycomatrix, greycoprops
 
 from spinalcordtoolbox.image import Image, add_suffix, zeros_like, concat_data
+from spinalcordtoolbox.texture import glcm_features
 from spinalcordtoolbox.utils.shell import SCTArgumentParser, Metavar, ActionCreateFolder
-from spinalcordtoolbox.utils.sys import init_sct, printv, sct_progress_bar, set_loglevel
+from spinalcordtoolbox.utils.sys import init_sct, printv, set_loglevel
 from spinalcordtoolbox.utils.fs import tmp_create, extract_fname, copy, rmtree
 
 
@@ -95,6 +96,15 @@ def get_parser():
         type=int,
         choices=(0, 1),
         default=int(Param().rm_tmp))
+    optional.add_argument(
+        "-jobs",
+        metavar=Metavar.int,
+        type=int,
+        default=Param().jobs,
+        help="Number of processes used to compute the texture of the slices in parallel. Either an integer greater "
+             "than or equal to one specifying the number of cores, 0 or a negative integer specifying number of cores "
+             "minus that number. For example '-jobs -1' will run with all the available cores minus one. Set "
+             "'-jobs 0' to use all available cores.")
     optional.add_argument(
         '-v',
         metavar=Metavar.int,
@@ -132,7 +142,7 @@ class ExtractGLCM:
         self.dct_im_seg = {'im': None, 'seg': None}
 
         # to re-orient the data at the end if needed
-        self.orientation_im = Image(self.param.fname_im).orientation
+        self.orientation_im = Image(self.param.fname_im, lazy=True).orientation
 
         self.fname_metric_lst = {}
 
@@ -235,44 +245,18 @@ class ExtractGLCM:
         if self.orientation_im != self.orientation_extraction:
             im_tmp.change_orientation(self.orientation_extraction)
 
-        dct_metric = {}
-        for m in self.metric_lst:
-            im_2save = zeros_like(im_tmp, dtype='float64')
-            dct_metric[m] = im_2save
-            # dct_metric[m] = Image(self.fname_metric_lst[m])
-
-        with sct_progress_bar() as pbar:
-            for im_z, seg_z, zz in zip(self.dct_im_seg['im'], self.dct_im_seg['seg'], range(len(self.dct_im_seg['im']))):
-                for xx in range(im_z.shape[0]):
-                    for yy in range(im_z.shape[1]):
-                        if not seg_z[xx, yy]:
-                            continue
-                        if xx < offset or yy < offset:
-                            continue
-                        if xx > (im_z.shape[0] - offset - 1) or yy > (im_z.shape[1] - offset - 1):
-                            continue  # to check if the whole glcm_window is in the axial_slice
-                        if False in np.unique(seg_z[xx - offset: xx + offset + 1, yy - offset: yy + offset + 1]):
-                            continue  # to check if the whole glcm_window is in the mask of the axial_slice
-
-                        glcm_window = im_z[xx - offset: xx + offset + 1, yy - offset: yy + offset + 1]
-                        glcm_window = glcm_window.astype(np.uint8)
-
-                        dct_glcm = {}
-                        for a in self.param_glcm.angle.split(','):  # compute the GLCM for self.param_glcm.distance and for each self.param_glcm.angle
-                            dct_glcm[a] = greycomatrix(glcm_window,
-                                                       [self.param_glcm.distance], [np.radians(int(a))],
-                                                       symmetric=self.param_glcm.symmetric,
-                                                       normed=self.param_glcm.normed)
-
-                        for m in self.metric_lst:  # compute the GLCM property (m.split('_')[0]) of the voxel xx,yy,zz
-                            dct_metric[m].data[xx, yy, zz] = greycoprops(dct_glcm[m.split('_')[2]], m.split('_')[0])[0][0]
-
-                        pbar.set_postfix(pos="{}/{}".format(zz, len(self.dct_im_seg["im"])))
-                        pbar.update(1)
+        # compute the GLCM properties of the window centered on each voxel of the axial slices (the window must be
+        # entirely inside the mask), for all the voxels at once
+        features = list(dict.fromkeys(m.split('_')[0] for m in self.metric_lst))
+        angles = [int(a) for a in self.param_glcm.angle.split(',')]
+        dct_texture = glcm_features(np.stack(self.dct_im_seg['im'], axis=2), np.stack(self.dct_im_seg['seg'], axis=2),
+                                    offset, angles, features, jobs=self.param.jobs)
 
         for m in self.metric_lst:
+            im_2save = zeros_like(im_tmp, dtype='float64')
+            im_2save.data = dct_texture[m.split('_')[0], int(m.split('_')[2])]
             fname_out = add_suffix("".join(extract_fname(self.param.fname_im)[1:]), '_' + m)
-            dct_metric[m].save(fname_out)
+            im_2save.save(fname_out)
             self.fname_metric_lst[m] = fname_out
 
     def reorient_data(self):
@@ -291,6 +275,7 @@ class Param:
         self.verbose = 1
         self.dim = 'ax'
         self.rm_tmp = True
+        self.jobs = 1
 
 
 class ParamGLCM(object):
@@ -340,6 +325,10 @@ def main(argv=None):
         param.dim = arguments.dim
     if arguments.r is not None:
         param.rm_tmp = bool(arguments.r)
+    if arguments.jobs > 0:
+        param.jobs = arguments.jobs
+    else:
+        param.jobs = max(1, multiprocessing.cpu_count() + arguments.jobs)
 
     # create the GLCM constructor
     glcm = ExtractGLCM(param=param, param_glcm=param_glcm)
@@ -22,6 +22,7 @@ from spinalcordtoolbox.image import Image, generate_output_file
 from spinalcordtoolbox.cropping import ImageCropper
 from spinalcordtoolbox.math import dilate
 from spinalcordtoolbox.labels import cubic_to_point
+from spinalcordtoolbox.registration import warp
 from spinalcordtoolbox.utils.shell import SCTArgumentParser, Metavar, get_interpolation, display_viewer_syntax
 from spinalcordtoolbox.utils.sys import init_sct, run_proc, printv, set_loglevel
 from spinalcordtoolbox.utils.fs import tmp_create, rmtree, extract_fname, copy
@@ -102,6 +103,15 @@ def get_parser():
         type=int,
         default=1,
         choices=(0, 1))
+    optional.add_argument(
+        "-backend",
+        help="""Implementation used to apply the transformations. 'ants': isct_antsApplyTransforms, run on each 3D
+        volume. 'numpy': composes the transformations into a single sampling grid, which is computed once and used to
+        resample all the volumes of the input image (faster for 4D images). Supports affine transformations and warping
+        fields.""",
+        required=False,
+        default='ants',
+        choices=('ants', 'numpy'))
     optional.add_argument(
         '-v',
         metavar=Metavar.int,
@@ -116,7 +126,7 @@ def get_parser():
 
 class Transform:
     def __init__(self, input_filename, fname_dest, list_warp, list_warpinv=[], output_filename='', verbose=0, crop=0,
-                 interp='spline', remove_temp_files=1, debug=0):
+                 interp='spline', remove_temp_files=1, debug=0, backend='ants', grid_cache=None):
         self.input_filename = input_filename
         self.list_warp = list_warp
         self.list_warpinv = list_warpinv
@@ -127,6 +137,9 @@ class Transform:
         self.verbose = verbose
         self.remove_temp_files = remove_temp_files
         self.debug = debug
+        self.backend = backend
+        # Sampling grid of the numpy backend, reused by the Transforms sharing this dict (see warp.get_sampling_grid())
+        self.grid_cache = grid_cache
 
     def apply(self):
         # Initialization
@@ -162,7 +175,7 @@ class Transform:
                 fname_warp_list_invert += [[path_warp]]
             path_warp = list_warp[idx_warp]
             if path_warp.endswith((".nii", ".nii.gz")) \
-                    and Image(list_warp[idx_warp]).header.get_intent()[0] != 'vector':
+                    and Image(list_warp[idx_warp], lazy=True).header.get_intent()[0] != 'vector':
                 raise ValueError("Displacement field in {} is invalid: should be encoded"
                                  " in a 5D file with vector intent code"
                                  " (see https://nifti.nimh.nih.gov/pub/dist/src/niftilib/nifti1.h"
@@ -216,12 +229,26 @@ class Transform:
                 fname_src = fname_dilated_labels
 
             printv("\nApply transformation and resample to destination space...", verbose)
-            run_proc(['isct_antsApplyTransforms',
-                      '-d', dim,
-                      '-i', fname_src,
-                      '-o', fname_out,
-                      '-t'
-                      ] + fname_warp_list_invert + ['-r', fname_dest] + interp, is_sct_binary=True)
+            if self.backend == 'numpy':
+                warp.apply_transforms(Image(fname_src), Image(fname_dest), list_warp, self.list_warpinv,
+                                      interp=self.interp, cache=self.grid_cache).save(fname_out)
+            else:
+                run_proc(['isct_antsApplyTransforms',
+                          '-d', dim,
+                          '-i', fname_src,
+                          '-o', fname_out,
+                          '-t'
+                          ] + fname_warp_list_invert + ['-r', fname_dest] + interp, is_sct_binary=True)
+
+        # if 4d with the numpy backend, resample all the volumes on the same sampling grid
+        elif self.backend == 'numpy':
+            if islabel:
+                raise NotImplementedError
+
+            dim = '4'
+            printv('\nApply transformation to all 3D volumes...', verbose)
+            warp.apply_transforms(img_src, Image(fname_dest), list_warp, self.list_warpinv,
+                                  interp=self.interp, cache=self.grid_cache).save(fname_out)
 
         # if 4d, loop across the T dimension
         else:
@@ -355,6 +382,7 @@ def main(argv=None):
     transform.output_filename = arguments.o
     transform.interp = arguments.x
     transform.remove_temp_files = arguments.r
+    transform.backend = arguments.backend
     transform.verbose = verbose
 
     transform.apply()
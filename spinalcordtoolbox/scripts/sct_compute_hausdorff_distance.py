@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 #
-# Thinning with the Zhang-Suen algorithm (1984) --> code taken from  https://github.com/linbojin/Skeletonization-by-Zhang-Suen-Thinning-Algorithm
-# Computation of the distances between two skeleton
+# Thinning with the Zhang-Suen algorithm (1984) --> adapted from  https://github.com/linbojin/Skeletonization-by-Zhang-Suen-Thinning-Algorithm
+# Computation of the distances between two skeleton, and between the surfaces of two segmentations
 # ---------------------------------------------------------------------------------------
 # Copyright (c) 2013 Polytechnique Montreal <www.neuro.polymtl.ca>
 # Authors: Sara Dupont
@@ -16,8 +16,10 @@ import os
 import numpy as np
 
 from spinalcordtoolbox.image import Image, add_suffix, empty_like, change_orientation
+from spinalcordtoolbox.resampling import resample_file
+from spinalcordtoolbox.hausdorff import zhang_suen, relative_distances, surface_distances
 from spinalcordtoolbox.utils.shell import SCTArgumentParser, Metavar
-from spinalcordtoolbox.utils.sys import init_sct, run_proc, printv, set_loglevel
+from spinalcordtoolbox.utils.sys import init_sct, printv, set_loglevel
 from spinalcordtoolbox.utils.fs import tmp_create, copy, extract_fname
 from spinalcordtoolbox.math import binarize
 
@@ -44,122 +46,43 @@ class Thinning:
         self.image.data = bin_data(self.image.data)
         self.dim_im = len(self.image.data.shape)
 
-        if self.dim_im == 2:
-            self.thinned_image = empty_like(self.image)
-            self.thinned_image.data = self.zhang_suen(self.image.data)
-            self.thinned_image.absolutepath = add_suffix(self.image.absolutepath, "_thinned")
-
-        elif self.dim_im == 3:
-            if not self.image.orientation == 'IRP':
-                printv('-- changing orientation ...')
-                self.image.change_orientation('IRP')
-
-            thinned_data = np.asarray([self.zhang_suen(im_slice) for im_slice in self.image.data])
-
-            self.thinned_image = empty_like(self.image)
-            self.thinned_image.data = thinned_data
-            self.thinned_image.absolutepath = add_suffix(self.image.absolutepath, "_thinned")
-
-    # ------------------------------------------------------------------------------------------------------------------
-    def get_neighbours(self, x, y, image):
-        """
-        Return 8-neighbours of image point P1(x,y), in a clockwise order
-        code from https://github.com/linbojin/Skeletonization-by-Zhang-Suen-Thinning-Algorithm
-        :param x:
-        :param y:
-        :param image:
-        :return:
-        """
-        # now = time.time()
-        x_1, y_1, x1, y1 = x - 1, y - 1, x + 1, y + 1
-        neighbours = [image[x_1][y], image[x_1][y1], image[x][y1], image[x1][y1],     # P2,P3,P4,P5
-                      image[x1][y], image[x1][y_1], image[x][y_1], image[x_1][y_1]]    # P6,P7,P8,P9
-        # t = time.time() - now
-        # printv('t neighbours: ', t)
-        return neighbours
+        if self.dim_im == 3 and not self.image.orientation == 'IRP':
+            printv('-- changing orientation ...')
+            self.image.change_orientation('IRP')
 
-    # ------------------------------------------------------------------------------------------------------------------
-    def transitions(self, neighbours):
-        """
-        No. of 0,1 patterns (transitions from 0 to 1) in the ordered sequence
-        code from https://github.com/linbojin/Skeletonization-by-Zhang-Suen-Thinning-Algorithm
-        :param neighbours:
-        :return:
-        """
-        # now = time.time()
-        n = neighbours + neighbours[0:1]      # P2, P3, ... , P8, P9, P2
-        s = np.sum((n1, n2) == (0, 1) for n1, n2 in zip(n, n[1:]))  # (P2,P3), (P3,P4), ... , (P8,P9), (P9,P2)
-        # t = time.time() - now
-        # printv('t transitions sum: ', t)
-        return s
+        # In 3D, each axial slice is thinned
+        self.thinned_image = empty_like(self.image)
+        self.thinned_image.data = self.zhang_suen(self.image.data)
+        self.thinned_image.absolutepath = add_suffix(self.image.absolutepath, "_thinned")
 
     # ------------------------------------------------------------------------------------------------------------------
     def zhang_suen(self, image):
         """
-        the Zhang-Suen Thinning Algorithm
-        code from https://github.com/linbojin/Skeletonization-by-Zhang-Suen-Thinning-Algorithm
-        :param image:
+        the Zhang-Suen Thinning Algorithm (see spinalcordtoolbox.hausdorff.zhang_suen)
+        :param image: 2D image, or 3D stack of 2D slices along the first axis
         :return:
         """
-        # now = time.time()
-        image_thinned = image.copy()  # deepcopy to protect the original image
-        changing1 = changing2 = 1  # the points to be removed (set as 0)
-        while changing1 or changing2:  # iterates until no further changes occur in the image
-            # Step 1
-            changing1 = []
-            max = len(image_thinned) - 1
-            pass_list = [1, max]
-            # rows, columns = image_thinned.shape  # x for rows, y for columns
-
-            # for x in range(1, rows - 1):         # No. of  rows
-            # for y in range(1, columns - 1):  # No. of columns
-            for x, y in non_zero_coord(image_thinned):
-                if x not in pass_list and y not in pass_list:
-                    # if image_thinned[x][y] == 1:  # Condition 0: Point P1 in the object regions
-                    P2, P3, P4, P5, P6, P7, P8, P9 = n = self.get_neighbours(x, y, image_thinned)
-                    if (2 <= sum(n) <= 6 and    # Condition 1: 2<= N(P1) <= 6
-                        P2 * P4 * P6 == 0 and    # Condition 3
-                        P4 * P6 * P8 == 0 and   # Condition 4
-                            self.transitions(n) == 1):    # Condition 2: S(P1)=1
-                        changing1.append((x, y))
-            for x, y in changing1:
-                image_thinned[x][y] = 0
-            # Step 2
-            changing2 = []
-
-            # for x in range(1, rows - 1):
-            # for y in range(1, columns - 1):
-            for x, y in non_zero_coord(image_thinned):
-                if x not in pass_list and y not in pass_list:
-                    # if image_thinned[x][y] == 1:  # Condition 0
-                    P2, P3, P4, P5, P6, P7, P8, P9 = n = self.get_neighbours(x, y, image_thinned)
-                    if (2 <= sum(n) <= 6 and       # Condition 1
-                        P2 * P4 * P8 == 0 and       # Condition 3
-                        P2 * P6 * P8 == 0 and  # Condition 4
-                            self.transitions(n) == 1):    # Condition 2
-                        changing2.append((x, y))
-            for x, y in changing2:
-                image_thinned[x][y] = 0
-        # t = time.time() - now
-        # printv('t thinning: ', t)
-        return image_thinned
+        return zhang_suen(image)
 
 
 # ----------------------------------------------------------------------------------------------------------------------
 # HAUSDORFF'S DISTANCE -------------------------------------------------------------------------------------------------
 class HausdorffDistance:
-    def __init__(self, data1, data2, v=1):
+    def __init__(self, data1, data2, v=1, min_distances=None):
         """
         the hausdorff distance between two sets is the maximum of the distances from a point in any of the sets to the nearest point in the other set
+        :param min_distances: relative distances (min_distances_1, min_distances_2), if they were already computed
         :return:
         """
-        # now = time.time()
-        printv('Computing 2D Hausdorff\'s distance ... ', v, 'normal')
-        self.data1 = bin_data(data1)
-        self.data2 = bin_data(data2)
-
-        self.min_distances_1 = self.relative_hausdorff_dist(self.data1, self.data2, v)
-        self.min_distances_2 = self.relative_hausdorff_dist(self.data2, self.data1, v)
+        if min_distances is None:
+            printv('Computing 2D Hausdorff\'s distance ... ', v, 'normal')
+            self.data1 = bin_data(data1)
+            self.data2 = bin_data(data2)
+            min_distances = (self.relative_hausdorff_dist(self.data1, self.data2, v),
+                             self.relative_hausdorff_dist(self.data2, self.data1, v))
+        else:
+            self.data1, self.data2 = data1, data2
+        self.min_distances_1, self.min_distances_2 = min_distances
 
         # relatives hausdorff's distances in pixel
         self.h1 = np.max(self.min_distances_1)
@@ -167,31 +90,30 @@ class HausdorffDistance:
 
         # Hausdorff's distance in pixel
         self.H = max(self.h1, self.h2)
-        # t = time.time() - now
-        # printv('Hausdorff dist time :', t)
 
     # ------------------------------------------------------------------------------------------------------------------
     def relative_hausdorff_dist(self, dat1, dat2, v=1):
-        h = np.zeros(dat1.shape)
-        nz_coord_1 = non_zero_coord(dat1)
-        nz_coord_2 = non_zero_coord(dat2)
-        if len(nz_coord_1) != 0 and len(nz_coord_2) != 0:
-            for x1, y1 in nz_coord_1:
-                # for x1 in range(dat1.shape[0]):
-                # for y1 in range(dat1.shape[1]):
-                # if dat1[x1, y1] == 1:
-                d_p1_dat2 = []
-                p1 = np.asarray([x1, y1])
-                for x2, y2 in nz_coord_2:
-                    # for x2 in range(dat2.shape[0]):
-                    # for y2 in range(dat2.shape[1]):
-                    # if dat2[x2, y2] == 1:
-                    p2 = np.asarray([x2, y2])
-                    d_p1_dat2.append(np.linalg.norm(p1 - p2))  # Euclidean distance between p1 and p2
-                h[x1, y1] = min(d_p1_dat2)
-        else:
-            printv('Warning: an image is empty', v, 'warning')
-        return h
+        """
+        Distance from each non-zero pixel of dat1 to the nearest non-zero pixel of dat2 (slice by slice if dat1 and
+        dat2 are 3D stacks of 2D slices along the first axis)
+        """
+        return relative_distances(dat1, dat2)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @classmethod
+    def per_slice(cls, data1, data2, v=1):
+        """
+        Hausdorff's distances between each pair of slices of two 3D stacks of 2D slices (along the first axis),
+        computed for all the slices at once
+        :return: list of HausdorffDistance
+        """
+        printv('Computing 2D Hausdorff\'s distances ... ', v, 'normal')
+        data1 = bin_data(data1)
+        data2 = bin_data(data2)
+        min_distances_1 = relative_distances(data1, data2)
+        min_distances_2 = relative_distances(data2, data1)
+        return [cls(slice1, slice2, v, min_distances=(dist1, dist2))
+                for slice1, slice2, dist1, dist2 in zip(data1, data2, min_distances_1, min_distances_2)]
 
 
 # ----------------------------------------------------------------------------------------------------------------------
@@ -207,6 +129,7 @@ class ComputeDistances:
         self.param = param
         self.dist1_distribution = None
         self.dist2_distribution = None
+        self.surface_distances = None
 
         if self.dim_im == 3:
             self.orientation1 = self.im1.orientation
@@ -220,6 +143,9 @@ class ComputeDistances:
                     self.im2.change_orientation('IRP')
                     self.im2.save(path=add_suffix(self.im2.absolutepath, "_irp"), mutable=True)
 
+        # 3D distances between the surfaces of the (non-thinned) images, which are only meaningful with several slices
+        if self.dim_im == 3 and self.im2 is not None and self.im1.data.shape[0] > 1:
+            self.surface_distances = surface_distances(self.im1, self.im2)
 
         if self.param.thinning:
             self.thinning1 = Thinning(self.im1, self.param.verbose)
@@ -264,6 +190,12 @@ class ComputeDistances:
                 else:
                     self.res += 'Slice ' + str(i) + ': ' + str(d.H * self.dim_pix) + '  -  ' + str(med1 * self.dim_pix) + '  -  ' + str(med2 * self.dim_pix) + ' \n'
 
+            if self.surface_distances is not None:
+                self.res += '\n3D distances between the surfaces of the two images (all in mm)\n' \
+                            'Hausdorff\'s distance: ' + str(self.surface_distances['hausdorff']) + '\n' \
+                            '95th percentile Hausdorff\'s distance (HD95): ' + str(self.surface_distances['hd95']) + '\n' \
+                            'Average symmetric surface distance (ASSD): ' + str(self.surface_distances['assd']) + '\n'
+
         printv('-----------------------------------------------------------------------------\n' +
                    self.res, self.param.verbose, 'normal')
 
@@ -300,9 +232,8 @@ class ComputeDistances:
         else:
             dat1 = bin_data(self.im1.data)
 
-        self.distances = []
-        for i, dat_slice in enumerate(dat1[:-1]):
-            self.distances.append(HausdorffDistance(bin_data(dat_slice), bin_data(dat1[i + 1]), self.param.verbose))
+        # distances between each slice and the next one
+        self.distances = HausdorffDistance.per_slice(dat1[:-1], dat1[1:], self.param.verbose)
 
     # ------------------------------------------------------------------------------------------------------------------
     def compute_dist_2im_3d(self):
@@ -319,9 +250,7 @@ class ComputeDistances:
             dat1 = bin_data(self.im1.data)
             dat2 = bin_data(self.im2.data)
 
-        self.distances = []
-        for slice1, slice2 in zip(dat1, dat2):
-            self.distances.append(HausdorffDistance(slice1, slice2, self.param.verbose))
+        self.distances = HausdorffDistance.per_slice(dat1, dat2, self.param.verbose)
 
     # ------------------------------------------------------------------------------------------------------------------
     def show_results(self):
@@ -380,6 +309,8 @@ def resample_image(fname, suffix='_resampled.nii.gz', binary=False, npx=0.3, npy
     :return: file name after resampling (or original fname if it was already in the correct resolution)
     """
     im_in = Image(fname)
+    # 2D images are changed to 3D images with one slice by change_orientation() and resample_file()
+    is_2d = im_in.data.ndim == 2
     orientation = im_in.orientation
     if orientation != 'RPI':
         im_in.change_orientation('RPI')
@@ -393,17 +324,12 @@ def resample_image(fname, suffix='_resampled.nii.gz', binary=False, npx=0.3, npy
         if binary:
             interpolation = 'nn'
 
-        if nz == 1:
-            # when data is 2d: we convert it to a 3d image in order to avoid conversion problem with 2d data
-            # TODO: check if this above problem is still present (now that we are using nibabel instead of nipy)
-            run_proc(['sct_image', '-i', ','.join([fname, fname]), '-concat', 'z', '-o', fname])
-
-        run_proc(['sct_resample', '-i', fname, '-mm', str(npx) + 'x' + str(npy) + 'x' + str(pz), '-o', name_resample, '-x', interpolation])
+        if im_in.data.ndim == 2:
+            # when data is 2d: we convert it to a 3d image (with one slice), which can be resampled
+            im_in.data = im_in.data[:, :, np.newaxis]
+            im_in.save(fname)
 
-        if nz == 1:  # when input data was 2d: re-convert data 3d-->2d
-            run_proc(['sct_image', '-i', name_resample, '-split', 'z'])
-            im_split = Image(name_resample.split('.nii.gz')[0] + '_Z0000.nii.gz')
-            im_split.save(name_resample)
+        resample_file(fname, name_resample, str(npx) + 'x' + str(npy) + 'x' + str(pz), 'mm', interpolation, verbose=0)
 
         if binary:
             img = Image(name_resample)
@@ -416,11 +342,20 @@ def resample_image(fname, suffix='_resampled.nii.gz', binary=False, npx=0.3, npy
             name_resample = add_suffix(img.absolutepath, "_{}".format(orientation.lower()))
             img.save(path=name_resample, mutable=True)
 
+        if is_2d:  # when input data was 2d: re-convert data 3d-->2d
+            img = Image(name_resample)
+            img.data = img.data[:, :, 0]
+            img.save()
+
         return name_resample
     else:
         if orientation != 'RPI':
             fname = add_suffix(fname, "_RPI")
             im_in = change_orientation(im_in, orientation).save(fname)
+            if is_2d:  # when input data was 2d: re-convert data 3d-->2d
+                img = Image(fname)
+                img.data = img.data[:, :, 0]
+                img.save()
 
         printv('Image resolution already ' + str(npx) + 'x' + str(npy) + 'xpz')
         return fname
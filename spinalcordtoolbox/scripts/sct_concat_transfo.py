@@ -64,7 +64,7 @@ def main(argv=None):
             fname_warp_list_invert += [[path_warp]]
         path_warp = fname_warp_list[idx_warp]
         if path_warp.endswith((".nii", ".nii.gz")) \
-                and Image(fname_warp_list[idx_warp]).header.get_intent()[0] != 'vector':
+                and Image(fname_warp_list[idx_warp], lazy=True).header.get_intent()[0] != 'vector':
             raise ValueError("Displacement field in {} is invalid: should be encoded"
                              " in a 5D file with vector intent code"
                              " (see https://nifti.nimh.nih.gov/pub/dist/src/niftilib/nifti1.h"
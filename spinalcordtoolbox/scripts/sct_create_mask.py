@@ -174,7 +174,7 @@ def create_mask(param):
     path_tmp = tmp_create(basename="create_mask")
 
     printv('\nOrientation:', param.verbose)
-    orientation_input = Image(param.fname_data).orientation
+    orientation_input = Image(param.fname_data, lazy=True).orientation
     printv('  ' + orientation_input, param.verbose)
 
     # copy input data to tmp folder and re-orient to RPI
@@ -254,7 +254,7 @@ def create_mask(param):
     im_out = concat_data(im_list, dim=2).save('mask_RPI.nii.gz')
 
     im_out.change_orientation(orientation_input)
-    im_out.header = Image(param.fname_data).header
+    im_out.header = Image(param.fname_data, lazy=True).header
     im_out.save(param.fname_out)
 
     # come back
@@ -14,6 +14,7 @@ ivadomed package.
 import os
 import sys
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 from ivadomed import inference as imed_inference
 import nibabel as nib
@@ -22,12 +23,17 @@ import spinalcordtoolbox as sct
 from spinalcordtoolbox import image
 import spinalcordtoolbox.deepseg as deepseg
 import spinalcordtoolbox.deepseg.models
+from spinalcordtoolbox.deepseg.inference import cached_models
 
 from spinalcordtoolbox.utils.shell import SCTArgumentParser, Metavar, display_viewer_syntax
 from spinalcordtoolbox.utils.sys import init_sct, printv, set_loglevel
 
 logger = logging.getLogger(__name__)
 
+# Number of subjects of -i-list segmented at the same time, so that the loading and preprocessing of the images of a
+# subject overlaps with the inference on the previous one
+SUBJECTS_IN_FLIGHT = 2
+
 
 def get_parser():
     parser = SCTArgumentParser(
@@ -40,6 +46,13 @@ def get_parser():
         nargs="+",
         help="Image to segment. Can be multiple images (separated with space).",
         metavar=Metavar.file)
+    input_output.add_argument(
+        "-i-list",
+        help="Text file listing several subjects to segment with the same task, one subject per line. Each line "
+             "contains the image(s) of a subject, separated with spaces, in the same order as -c (lines starting with "
+             "'#' are ignored). The models are loaded only once for all the subjects. Outputs are named as the first "
+             "image of each subject with the suffix of the model (-o cannot be used).",
+        metavar=Metavar.file)
     input_output.add_argument(
         "-c",
         nargs="+",
@@ -128,6 +141,83 @@ def get_parser():
     return parser
 
 
+def read_subject_list(fname):
+    """
+    Read the file given to -i-list.
+
+    :param fname: path of the text file, with the images of a subject on each line
+    :return: list of lists of image paths, one per subject
+    """
+    subjects = []
+    with open(fname) as f:
+        for line in f:
+            if line.strip() and not line.lstrip().startswith('#'):
+                subjects.append(line.split())
+    return subjects
+
+
+def segment_subject(name_models, path_models, input_filenames, arguments, fname_out=None):
+    """
+    Segment the images of a subject with a pipeline of models: the output of each model is used as the prior of the
+    next one.
+
+    :param name_models: names of the models (or paths of custom models)
+    :param path_models: paths of the folders of the models
+    :param input_filenames: images of the subject, in the order of the contrasts of arguments.c
+    :param arguments: parsed arguments of sct_deepseg (contrasts and postprocessing options)
+    :param fname_out: output file name (see -o). If None, the suffix of the model is added to the first image.
+    :return: list of the output segmentations of the last model
+    """
+    fname_prior = None
+    output_filenames = None
+    for name_model, path_model in zip(name_models, path_models):
+        # Order input images
+        if arguments.c is not None:
+            fnames_model = []
+            for required_contrast in deepseg.models.MODELS[name_model]['contrasts']:
+                for provided_contrast, input_filename in zip(arguments.c, input_filenames):
+                    if required_contrast == provided_contrast:
+                        fnames_model.append(input_filename)
+        else:
+            fnames_model = input_filenames
+
+        # Call segment_nifti
+        options = {**vars(arguments), "fname_prior": fname_prior}
+        nii_lst, target_lst = imed_inference.segment_volume(path_model, fnames_model, options=options)
+
+        # Delete intermediate outputs
+        if fname_prior and os.path.isfile(fname_prior) and arguments.r:
+            logger.info("Remove temporary files...")
+            os.remove(fname_prior)
+
+        output_filenames = []
+        # Save output seg
+        for nii_seg, target in zip(nii_lst, target_lst):
+            if fname_out is not None:
+                # To support if the user adds the extension or not
+                extension = ".nii.gz" if ".nii.gz" in fname_out else ".nii" if ".nii" in fname_out else ""
+                if extension == "":
+                    fname_seg = fname_out + target if len(target_lst) > 1 else fname_out
+                else:
+                    fname_seg = fname_out.replace(extension, target + extension) if len(target_lst) > 1 \
+                        else fname_out
+            else:
+                fname_seg = ''.join([sct.image.splitext(fnames_model[0])[0], target + '.nii.gz'])
+
+            # If output folder does not exist, create it
+            path_out = os.path.dirname(fname_seg)
+            if not (path_out == '' or os.path.exists(path_out)):
+                os.makedirs(path_out, exist_ok=True)
+
+            nib.save(nii_seg, fname_seg)
+            output_filenames.append(fname_seg)
+
+        # Use the result of the current model as additional input of the next model
+        fname_prior = fname_seg
+
+    return output_filenames
+
+
 def main(argv=None):
     parser = get_parser()
     arguments = parser.parse_args(argv)
@@ -136,8 +226,8 @@ def main(argv=None):
 
     if (arguments.list_tasks is False
             and arguments.install_task is None
-            and (arguments.i is None or arguments.task is None)):
-        parser.error("You must specify either '-list-tasks', '-install-task', or both '-i' + '-task'.")
+            and ((arguments.i is None and arguments.i_list is None) or arguments.task is None)):
+        parser.error("You must specify either '-list-tasks', '-install-task', or both '-i' (or '-i-list') + '-task'.")
 
     # Deal with task
     if arguments.list_tasks:
@@ -149,9 +239,20 @@ def main(argv=None):
         exit(0)
 
     # Deal with input/output
-    for file in arguments.i:
-        if not os.path.isfile(file):
-            parser.error("This file does not exist: {}".format(file))
+    if arguments.i_list is not None:
+        if arguments.i is not None or arguments.o is not None:
+            parser.error("'-i-list' cannot be used with '-i' or '-o'.")
+        if not os.path.isfile(arguments.i_list):
+            parser.error("This file does not exist: {}".format(arguments.i_list))
+        subjects = read_subject_list(arguments.i_list)
+        if not subjects:
+            parser.error("No images found in: {}".format(arguments.i_list))
+    else:
+        subjects = [arguments.i]
+    for input_filenames in subjects:
+        for file in input_filenames:
+            if not os.path.isfile(file):
+                parser.error("This file does not exist: {}".format(file))
 
     # Verify if the task is part of the "official" tasks, or if it is pointing to paths containing custom models
     if len(arguments.task) == 1 and arguments.task[0] in deepseg.models.TASKS:
@@ -161,23 +262,23 @@ def main(argv=None):
         # Get pipeline model names
         name_models = deepseg.models.TASKS[arguments.task[0]]['models']
     else:
-        n_contrasts = len(arguments.i)
+        n_contrasts = len(subjects[0])
+        required_contrasts = []
         name_models = arguments.task
 
-    if len(arguments.i) != n_contrasts:
-        parser.error(
-            "{} input files found. Please provide all required input files for the task {}, i.e. contrasts: {}."
-            .format(len(arguments.i), arguments.task, ', '.join(required_contrasts)))
+    for input_filenames in subjects:
+        if len(input_filenames) != n_contrasts:
+            parser.error(
+                "{} input files found. Please provide all required input files for the task {}, i.e. contrasts: {}."
+                .format(len(input_filenames), arguments.task, ', '.join(required_contrasts)))
 
     # Check modality order
-    if len(arguments.i) > 1 and arguments.c is None:
+    if n_contrasts > 1 and arguments.c is None:
         parser.error(
             "Please specify the order in which you put the contrasts in the input images (-i) with flag -c, e.g., "
             "-c t1 t2")
 
-    # Run pipeline by iterating through the models
-    fname_prior = None
-    output_filenames = None
+    path_models = []
     for name_model in name_models:
         # Check if this is an official model
         if name_model in list(deepseg.models.MODELS.keys()):
@@ -191,53 +292,32 @@ def main(argv=None):
             path_model = os.path.abspath(name_model)
             if not deepseg.models.is_valid(path_model):
                 parser.error("The input model is invalid: {}".format(path_model))
-
-        # Order input images
-        if arguments.c is not None:
-            input_filenames = []
-            for required_contrast in deepseg.models.MODELS[name_model]['contrasts']:
-                for provided_contrast, input_filename in zip(arguments.c, arguments.i):
-                    if required_contrast == provided_contrast:
-                        input_filenames.append(input_filename)
-        else:
-            input_filenames = arguments.i
-
-        # Call segment_nifti
-        options = {**vars(arguments), "fname_prior": fname_prior}
-        nii_lst, target_lst = imed_inference.segment_volume(path_model, input_filenames, options=options)
-
-        # Delete intermediate outputs
-        if fname_prior and os.path.isfile(fname_prior) and arguments.r:
-            logger.info("Remove temporary files...")
-            os.remove(fname_prior)
-
-        output_filenames = []
-        # Save output seg
-        for nii_seg, target in zip(nii_lst, target_lst):
-            if 'o' in options and options['o'] is not None:
-                # To support if the user adds the extension or not
-                extension = ".nii.gz" if ".nii.gz" in options['o'] else ".nii" if ".nii" in options['o'] else ""
-                if extension == "":
-                    fname_seg = options['o'] + target if len(target_lst) > 1 else options['o']
+        path_models.append(path_model)
+
+    # Run pipeline by iterating through the models, with each model loaded once for all the subjects
+    with cached_models(path_models):
+        if arguments.i_list is None:
+            output_filenames = segment_subject(name_models, path_models, arguments.i, arguments, arguments.o)
+            for output_filename in output_filenames:
+                display_viewer_syntax([arguments.i[0], output_filename], colormaps=['gray', 'red'],
+                                      opacities=['', '0.7'])
+            return
+
+        with ThreadPoolExecutor(max_workers=SUBJECTS_IN_FLIGHT) as executor:
+            futures = [executor.submit(segment_subject, name_models, path_models, input_filenames, arguments)
+                       for input_filenames in subjects]
+            failed = []
+            for input_filenames, future in zip(subjects, futures):
+                try:
+                    output_filenames = future.result()
+                except Exception:
+                    logger.exception("Segmentation failed for: {}".format(' '.join(input_filenames)))
+                    failed.append(input_filenames[0])
                 else:
-                    fname_seg = options['o'].replace(extension, target + extension) if len(target_lst) > 1 \
-                        else options['o']
-            else:
-                fname_seg = ''.join([sct.image.splitext(input_filenames[0])[0], target + '.nii.gz'])
-
-            # If output folder does not exist, create it
-            path_out = os.path.dirname(fname_seg)
-            if not (path_out == '' or os.path.exists(path_out)):
-                os.makedirs(path_out)
-
-            nib.save(nii_seg, fname_seg)
-            output_filenames.append(fname_seg)
-
-        # Use the result of the current model as additional input of the next model
-        fname_prior = fname_seg
+                    printv("{} -> {}".format(input_filenames[0], ', '.join(output_filenames)), verbose, 'info')
 
-    for output_filename in output_filenames:
-        display_viewer_syntax([arguments.i[0], output_filename], colormaps=['gray', 'red'], opacities=['', '0.7'])
+    if failed:
+        raise RuntimeError("Segmentation failed for {} subject(s): {}".format(len(failed), ', '.join(failed)))
 
 
 if __name__ == "__main__":
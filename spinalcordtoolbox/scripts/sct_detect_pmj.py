@@ -128,7 +128,7 @@ class DetectPMJ:
 
         self.tmp_dir = tmp_create()  # path to tmp directory
 
-        self.orientation_im = Image(self.fname_im).orientation  # to re-orient the data at the end
+        self.orientation_im = Image(self.fname_im, lazy=True).orientation  # to re-orient the data at the end
 
         self.slice2D_im = extract_fname(self.fname_im)[1] + '_midSag.nii'  # file used to do the detection, with only one slice
         self.dection_map_pmj = extract_fname(self.fname_im)[1] + '_map_pmj'  # file resulting from the detection
@@ -127,7 +127,7 @@ def main(argv=None):
     for i_item in range(len(arguments.order)):
         if arguments.order[i_item] == 'b0':
             # count number of b=0
-            n_b0 = Image(arguments.i[i_item]).dim[3]
+            n_b0 = Image(arguments.i[i_item], lazy=True).dim[3]
             bval = np.array([0.0] * n_b0)
             bvec = np.array([[0.0, 0.0, 0.0]] * n_b0)
         elif arguments.order[i_item] == 'dwi':
@@ -28,6 +28,7 @@
 
 import sys
 import os
+import multiprocessing
 
 from spinalcordtoolbox.moco import ParamMoco, moco_wrapper
 from spinalcordtoolbox.utils.sys import init_sct, set_loglevel
@@ -48,6 +49,9 @@ def get_parser():
                     "method, type: isct_antsSliceRegularizedRegistration\n"
                     "  - masking (-m)\n"
                     "  - iterative averaging of target volume\n"
+                    "\n"
+                    "Temporary files (one uncompressed NIfTI file per volume) are written to the system temporary "
+                    "folder, which can be set to a node-local scratch folder with the environment variable TMPDIR.\n"
     )
 
     mandatory = parser.add_argument_group("\nMANDATORY ARGUMENTS")
@@ -130,6 +134,17 @@ def get_parser():
         default=param_default.remove_temp_files,
         help="Remove temporary files. 0 = no, 1 = yes"
     )
+    optional.add_argument(
+        '-jobs',
+        metavar=Metavar.int,
+        type=int,
+        default=1,
+        help="Number of registrations run in parallel. Either an integer greater than or equal to one specifying the "
+             "number of cores, 0 or a negative integer specifying number of cores minus that number. For example "
+             "'-jobs -1' will run with all the available cores minus one. Set '-jobs 0' to use all available cores. "
+             "Note: with iterative averaging of the target (default), the first 10 volumes are always registered "
+             "sequentially."
+    )
     optional.add_argument(
         '-v',
         metavar=Metavar.int,
@@ -192,6 +207,10 @@ def main(argv=None):
     param.interp = arguments.x
     param.path_out = arguments.ofolder
     param.remove_temp_files = arguments.r
+    if arguments.jobs < 1:
+        param.jobs = max(1, multiprocessing.cpu_count() + arguments.jobs)
+    else:
+        param.jobs = arguments.jobs
     if arguments.param is not None:
         param.update(arguments.param)
 
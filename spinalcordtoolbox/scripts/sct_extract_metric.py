@@ -21,9 +21,8 @@ import sys
 import os
 import argparse
 
-import numpy as np
-
 from spinalcordtoolbox.metadata import read_label_file
+from spinalcordtoolbox.atlas import SparseAtlas, load_atlas
 from spinalcordtoolbox.aggregate_slicewise import check_labels, extract_metric, save_as_csv, Metric, LabelStruc
 from spinalcordtoolbox.image import Image
 from spinalcordtoolbox.utils.shell import SCTArgumentParser, Metavar, list_type, parse_num_list, display_open
@@ -82,14 +81,22 @@ def get_parser():
             f"To compute average MTR in a region defined by a single label file (could be binary or 0-1 "
             f"weighted mask) between slices 1 and 4:\n"
             f"sct_extract_metric -i mtr.nii.gz -f "
-            f"my_mask.nii.gz -z 1:4 -method wa")
+            f"my_mask.nii.gz -z 1:4 -method wa\n"
+            f"\n"
+            f"To compute FA, MD, AD and RD within all labels in one run (the results are written to the same file, "
+            f"one row per metric and label):\n"
+            f"sct_extract_metric -i dti_FA.nii.gz dti_MD.nii.gz dti_AD.nii.gz dti_RD.nii.gz -method map")
     )
     mandatory = parser.add_argument_group("\nMANDATORY ARGUMENTS")
     mandatory.add_argument(
         '-i',
         metavar=Metavar.file,
+        nargs='+',
         required=True,
-        help="Image file to extract metrics from. Example: FA.nii.gz"
+        help="Image file to extract metrics from. Example: FA.nii.gz\n"
+             "Several files (e.g. FA.nii.gz MD.nii.gz), or a 4D file with one metric per volume, are processed in "
+             "one run: the labels and vertebral levels are loaded once, the masks and the ML/MAP estimation matrices "
+             "are computed once for all the metrics, and the results are written to the same output file."
     )
 
     optional = parser.add_argument_group("\nOPTIONAL ARGUMENTS")
@@ -277,7 +284,7 @@ def main(argv=None):
     param_default = Param()
 
     overwrite = 0  # TODO: Not used. Why?
-    fname_data = get_absolute_path(arguments.i)
+    fnames_data = [get_absolute_path(fname) for fname in arguments.i]
     path_label = arguments.f
     method = arguments.method
     fname_output = arguments.o
@@ -349,30 +356,34 @@ def main(argv=None):
 
     # check syntax of labels asked by user
     labels_id_user = check_labels(indiv_labels_ids + combined_labels_ids, parse_num_list(labels_user))
-    nb_labels = len(indiv_labels_files)
 
     # Load data and systematically reorient to RPI because we need the 3rd dimension to be z
     printv('\nLoad metric image...', verbose)
-    input_im = Image(fname_data).change_orientation("RPI")
-
-    data = Metric(data=input_im.data, label='')
-    # Load labels
-    labels_tmp = np.empty([nb_labels], dtype=object)
-    for i_label in range(nb_labels):
-        im_label = Image(os.path.join(path_label, indiv_labels_files[i_label])).change_orientation("RPI")
-        labels_tmp[i_label] = np.expand_dims(im_label.data, 3)  # TODO: generalize to 2D input label
-    labels = np.concatenate(labels_tmp[:], 3)  # labels: (x,y,z,label)
-    # Load vertebral levels
+    # List of (file name listed in the csv file, metric): the volumes of a 4D file are listed as "file.nii.gz[volume]"
+    metrics = []
+    for fname_data in fnames_data:
+        input_im = Image(fname_data).change_orientation("RPI")
+        if input_im.data.ndim == 4:
+            metrics += [('{}[{}]'.format(fname_data, i_vol), Metric(data=input_im.data[..., i_vol], label=''))
+                        for i_vol in range(input_im.data.shape[3])]
+        else:
+            metrics.append((fname_data, Metric(data=input_im.data, label='')))
+    # Load labels as a sparse atlas: (x,y,z,label). The atlas of a folder is kept in the persistent cache, if enabled.
+    if path_label:
+        labels = load_atlas(path_label, indiv_labels_files, param_default.file_info_label)
+    else:
+        labels = SparseAtlas.from_images(indiv_labels_files)  # TODO: generalize to 2D input label
+    # Load vertebral levels (once for all the labels)
     if not levels:
-        fname_vertebral_labeling = None
-
-    # Get dimensions of data and labels
-    nx, ny, nz = data.data.shape
-    nx_atlas, ny_atlas, nz_atlas, nt_atlas = labels.shape
+        vert_level = None
+    else:
+        vert_level = Image(fname_vertebral_labeling).change_orientation('RPI')
 
     # Check dimensions consistency between atlas and data
-    if (nx, ny, nz) != (nx_atlas, ny_atlas, nz_atlas):
-        printv('\nERROR: Metric data and labels DO NOT HAVE SAME DIMENSIONS.', 1, type='error')
+    nx_atlas, ny_atlas, nz_atlas, nt_atlas = labels.shape
+    for fname_data, data in metrics:
+        if data.data.shape != (nx_atlas, ny_atlas, nz_atlas):
+            printv('\nERROR: Metric data and labels DO NOT HAVE SAME DIMENSIONS: ' + fname_data, 1, type='error')
 
     # Combine individual labels for estimation
     if combine_labels:
@@ -381,14 +392,20 @@ def main(argv=None):
                                      map_cluster=None)
         labels_id_user = [99]
 
+    # All the metrics are extracted at once for each label: agg_metrics[i_label][i_metric]
+    agg_metrics = []
     for id_label in labels_id_user:
         printv('Estimation for label: ' + label_struc[id_label].name, verbose)
-        agg_metric = extract_metric(data, labels=labels, slices=slices, levels=levels, perslice=perslice,
-                                    perlevel=perlevel, vert_level=fname_vertebral_labeling, method=method,
-                                    label_struc=label_struc, id_label=id_label, indiv_labels_ids=indiv_labels_ids)
-
-        save_as_csv(agg_metric, fname_output, fname_in=fname_data, append=append_csv)
-        append_csv = True  # when looping across labels, need to append results in the same file
+        agg_metrics.append(extract_metric([data for _, data in metrics], labels=labels, slices=slices, levels=levels,
+                                          perslice=perslice, perlevel=perlevel, vert_level=vert_level, method=method,
+                                          label_struc=label_struc, id_label=id_label,
+                                          indiv_labels_ids=indiv_labels_ids))
+
+    # Same rows as one run per metric
+    for i_metric, (fname_data, _) in enumerate(metrics):
+        for agg_metrics_label in agg_metrics:
+            save_as_csv(agg_metrics_label[i_metric], fname_output, fname_in=fname_data, append=append_csv)
+            append_csv = True  # when looping across labels, need to append results in the same file
     display_open(fname_output)
 
 
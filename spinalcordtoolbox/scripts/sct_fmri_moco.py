@@ -13,6 +13,7 @@
 
 import sys
 import os
+import multiprocessing
 
 from spinalcordtoolbox.moco import ParamMoco, moco_wrapper
 from spinalcordtoolbox.utils.sys import init_sct, set_loglevel
@@ -41,6 +42,9 @@ def get_parser():
                     "files), as required for FSL analysis.\n"
                     "  - a TSV file with the slice-wise average of the motion correction for XY (one file), that "
                     "can be used for Quality Control.\n"
+                    "\n"
+                    "Temporary files (one uncompressed NIfTI file per volume) are written to the system temporary "
+                    "folder, which can be set to a node-local scratch folder with the environment variable TMPDIR.\n"
     )
 
     mandatory = parser.add_argument_group("\nMANDATORY ARGUMENTS")
@@ -107,6 +111,17 @@ def get_parser():
         default=1,
         help="Remove temporary files. O = no, 1 = yes"
     )
+    optional.add_argument(
+        '-jobs',
+        metavar=Metavar.int,
+        type=int,
+        default=1,
+        help="Number of registrations run in parallel. Either an integer greater than or equal to one specifying the "
+             "number of cores, 0 or a negative integer specifying number of cores minus that number. For example "
+             "'-jobs -1' will run with all the available cores minus one. Set '-jobs 0' to use all available cores. "
+             "Note: with iterative averaging of the target (default), the first 10 volumes are always registered "
+             "sequentially."
+    )
     optional.add_argument(
         '-v',
         metavar=Metavar.int,
@@ -164,6 +179,10 @@ def main(argv=None):
     param.path_out = arguments.ofolder
     param.remove_temp_files = arguments.r
     param.interp = arguments.x
+    if arguments.jobs < 1:
+        param.jobs = max(1, multiprocessing.cpu_count() + arguments.jobs)
+    else:
+        param.jobs = arguments.jobs
     if arguments.g is not None:
         param.group_size = arguments.g
     if arguments.m is not None:
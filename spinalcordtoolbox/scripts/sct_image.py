@@ -202,7 +202,7 @@ def main(argv=None):
 
     fname_in = arguments.i
 
-    im_in_list = [Image(fname) for fname in fname_in]
+    im_in_list = [Image(fname, lazy=True) for fname in fname_in]
     if len(im_in_list) > 1 and arguments.concat is None and arguments.omc is None:
         parser.error("Multi-image input is only supported for the '-concat' and '-omc' arguments.")
 
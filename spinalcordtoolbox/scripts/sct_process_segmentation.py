@@ -19,6 +19,7 @@
 import sys
 import os
 import logging
+import multiprocessing
 import pandas as pd
 import argparse
 import numpy as np
@@ -228,6 +229,16 @@ def get_parser():
              "Given the risks and lack of consensus surrounding CSA normalization, we recommend thoroughly reviewing "
              "the literature on this topic before applying this feature to your data.\n"
     )
+    optional.add_argument(
+        '-jobs',
+        metavar=Metavar.int,
+        type=int,
+        default=1,
+        help="Number of processes used to compute the morphometric measures of chunks of slices in parallel. Either "
+             "an integer greater than or equal to one specifying the number of cores, 0 or a negative integer "
+             "specifying number of cores minus that number. For example '-jobs -1' will run with all the available "
+             "cores minus one. Set '-jobs 0' to use all available cores."
+    )
     optional.add_argument(
         '-qc',
         metavar=Metavar.folder,
@@ -396,6 +407,10 @@ def main(argv=None):
     else:
         distance_pmj = None
     extent_mask = arguments.pmj_extent
+    if arguments.jobs < 1:
+        jobs = max(1, multiprocessing.cpu_count() + arguments.jobs)
+    else:
+        jobs = arguments.jobs
     path_qc = arguments.qc
     qc_dataset = arguments.qc_dataset
     qc_subject = arguments.qc_subject
@@ -413,7 +428,8 @@ def main(argv=None):
     metrics, fit_results = compute_shape(fname_segmentation,
                                          angle_correction=angle_correction,
                                          param_centerline=param_centerline,
-                                         verbose=verbose)
+                                         verbose=verbose,
+                                         jobs=jobs)
     if fname_pmj is not None:
         im_ctl, mask, slices, centerline = get_slices_for_pmj_distance(fname_segmentation, fname_pmj,
                                                                        distance_pmj, extent_mask,
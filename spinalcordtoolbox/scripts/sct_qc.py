@@ -19,19 +19,20 @@ def get_parser():
         epilog='Examples:\n'
                'sct_qc -i t2.nii.gz -s t2_seg.nii.gz -p sct_deepseg_sc\n'
                'sct_qc -i t2.nii.gz -s t2_seg_labeled.nii.gz -p sct_label_vertebrae\n'
-               'sct_qc -i t2.nii.gz -s t2_seg.nii.gz -p sct_deepseg_sc -qc-dataset mydata -qc-subject sub-45'
+               'sct_qc -i t2.nii.gz -s t2_seg.nii.gz -p sct_deepseg_sc -qc-dataset mydata -qc-subject sub-45\n'
+               'sct_qc -render-index -qc ./qc'
     )
     parser.add_argument('-i',
                         metavar='IMAGE',
-                        help='Input image #1 (mandatory)',
-                        required=True)
+                        help='Input image #1 (mandatory, unless -render-index is used)',
+                        required=False)
     parser.add_argument('-p',
                         help='SCT function associated with the QC report to generate',
                         choices=('sct_propseg', 'sct_deepseg_sc', 'sct_deepseg_gm', 'sct_register_multimodal',
                                  'sct_register_to_template', 'sct_warp_template', 'sct_label_vertebrae',
                                  'sct_detect_pmj', 'sct_label_utils', 'sct_get_centerline', 'sct_fmri_moco',
                                  'sct_dmri_moco'),
-                        required=True)
+                        required=False)
     parser.add_argument('-s',
                         metavar='SEG',
                         help='Input segmentation or label',
@@ -56,6 +57,11 @@ def get_parser():
                         help='If provided, this string will be mentioned in the QC report as the subject the process '
                              'was run on',
                         required=False)
+    parser.add_argument('-render-index',
+                        action='store_true',
+                        help='Only render the index.html of the QC report given by -qc from the QC entries already '
+                             'added to it (e.g. by scripts run with the environment variable SCT_QC_DEFER_INDEX=1, '
+                             'which add the QC entries without rendering the report).')
     parser.add_argument('-fps',
                         metavar='float',
                         type=float,
@@ -79,6 +85,13 @@ def main(argv=None):
     verbose = arguments.v
     set_loglevel(verbose=verbose)
 
+    if arguments.render_index:
+        from spinalcordtoolbox.reports.qc import update_index_html
+        update_index_html(arguments.qc)
+        return
+    if arguments.i is None or arguments.p is None:
+        parser.error("The arguments -i and -p are required, unless -render-index is used.")
+
     from spinalcordtoolbox.reports.qc import generate_qc
     # Build args list (for display)
     args_disp = '-i ' + arguments.i
@@ -17,6 +17,7 @@
 import sys
 import os
 import time
+import multiprocessing
 
 import numpy as np
 
@@ -118,7 +119,10 @@ def get_parser():
             "options on a case-by-case basis depending on your data.\n"
             "\n"
             "More information about label creation can be found at "
-            "https://spinalcordtoolbox.com/user_section/tutorials/registration-to-template/vertebral-labeling.html"
+            "https://spinalcordtoolbox.com/user_section/tutorials/registration-to-template/vertebral-labeling.html\n"
+            "\n"
+            "The straightening warping fields can be reused across runs on the same segmentation by setting the "
+            "environment variable SCT_CACHE_DIR (see sct_straighten_spinalcord)."
         )
     )
 
@@ -273,6 +277,16 @@ def get_parser():
         metavar=Metavar.file,
         help="File name of ground-truth template cord segmentation (binary nifti)."
     )
+    optional.add_argument(
+        '-jobs',
+        metavar=Metavar.int,
+        type=int,
+        default=1,
+        help="Number of threads used to compute the straightening warping fields in parallel. Either an integer "
+             "greater than or equal to one specifying the number of cores, 0 or a negative integer specifying number "
+             "of cores minus that number. For example '-jobs -1' will run with all the available cores minus one. Set "
+             "'-jobs 0' to use all available cores."
+    )
     optional.add_argument(
         '-r',
         metavar=Metavar.int,
@@ -330,6 +344,10 @@ def main(argv=None):
     contrast_template = arguments.c
     ref = arguments.ref
     param.remove_temp_files = arguments.r
+    if arguments.jobs < 1:
+        jobs = max(1, multiprocessing.cpu_count() + arguments.jobs)
+    else:
+        jobs = arguments.jobs
     param.verbose = verbose  # TODO: not clean, unify verbose or param.verbose in code, but not both
     param_centerline = ParamCenterline(
         algo_fitting=arguments.centerline_algo,
@@ -555,6 +573,7 @@ def main(argv=None):
             sc_straight.qc = '0'
             sc_straight.remove_temp_files = param.remove_temp_files
             sc_straight.verbose = verbose
+            sc_straight.jobs = jobs
 
             if level_alignment:
                 sc_straight.centerline_reference_filename = ftmp_template_seg
@@ -568,7 +587,7 @@ def main(argv=None):
         # N.B. DO NOT UPDATE VARIABLE ftmp_seg BECAUSE TEMPORARY USED LATER
         # re-define warping field using non-cropped space (to avoid issue #367)
 
-        dimensionality = len(Image(ftmp_data).hdr.get_data_shape())
+        dimensionality = len(Image(ftmp_data, lazy=True).hdr.get_data_shape())
         cmd = ['isct_ComposeMultiTransform', f"{dimensionality}", 'warp_straight2curve.nii.gz', '-R', ftmp_data, 'warp_straight2curve.nii.gz']
         status, output = run_proc(cmd, verbose=verbose, is_sct_binary=True)
         if status != 0:
@@ -610,7 +629,7 @@ def main(argv=None):
             # Concatenate transformations: curve --> straight --> affine
             printv('\nConcatenate transformations: curve --> straight --> affine...', verbose)
 
-            dimensionality = len(Image("template.nii").hdr.get_data_shape())
+            dimensionality = len(Image("template.nii", lazy=True).hdr.get_data_shape())
             cmd = ['isct_ComposeMultiTransform', f"{dimensionality}", 'warp_curve2straightAffine.nii.gz', '-R', 'template.nii', 'straight2templateAffine.txt', 'warp_curve2straight.nii.gz']
             status, output = run_proc(cmd, verbose=verbose, is_sct_binary=True)
             if status != 0:
@@ -668,15 +687,14 @@ def main(argv=None):
         msct_image.spatial_crop(Image(ftmp_seg_), dict(((2, (zmin_template, zmax_template)),))).save(ftmp_seg)
 
         # sub-sample in z-direction
-        # TODO: refactor to use python module instead of doing i/o
         printv('\nSub-sample in z-direction (for faster processing)...', verbose)
-        run_proc(['sct_resample', '-i', ftmp_template, '-o', add_suffix(ftmp_template, '_sub'), '-f', '1x1x' + zsubsample], verbose)
+        resample_file(ftmp_template, add_suffix(ftmp_template, '_sub'), '1x1x' + zsubsample, 'factor', 'linear', 0)
         ftmp_template = add_suffix(ftmp_template, '_sub')
-        run_proc(['sct_resample', '-i', ftmp_template_seg, '-o', add_suffix(ftmp_template_seg, '_sub'), '-f', '1x1x' + zsubsample], verbose)
+        resample_file(ftmp_template_seg, add_suffix(ftmp_template_seg, '_sub'), '1x1x' + zsubsample, 'factor', 'linear', 0)
         ftmp_template_seg = add_suffix(ftmp_template_seg, '_sub')
-        run_proc(['sct_resample', '-i', ftmp_data, '-o', add_suffix(ftmp_data, '_sub'), '-f', '1x1x' + zsubsample], verbose)
+        resample_file(ftmp_data, add_suffix(ftmp_data, '_sub'), '1x1x' + zsubsample, 'factor', 'linear', 0)
         ftmp_data = add_suffix(ftmp_data, '_sub')
-        run_proc(['sct_resample', '-i', ftmp_seg, '-o', add_suffix(ftmp_seg, '_sub'), '-f', '1x1x' + zsubsample], verbose)
+        resample_file(ftmp_seg, add_suffix(ftmp_seg, '_sub'), '1x1x' + zsubsample, 'factor', 'linear', 0)
         ftmp_seg = add_suffix(ftmp_seg, '_sub')
 
         # Registration straight spinal cord to template
@@ -693,7 +711,7 @@ def main(argv=None):
         # Concatenate transformations: anat --> template
         printv('\nConcatenate transformations: anat --> template...', verbose)
 
-        dimensionality = len(Image("template.nii").hdr.get_data_shape())
+        dimensionality = len(Image("template.nii", lazy=True).hdr.get_data_shape())
         cmd = ['isct_ComposeMultiTransform', f"{dimensionality}", 'warp_anat2template.nii.gz', '-R', 'template.nii', warp_forward, 'warp_curve2straightAffine.nii.gz']
         status, output = run_proc(cmd, verbose=verbose, is_sct_binary=True)
         if status != 0:
@@ -704,14 +722,14 @@ def main(argv=None):
         # TODO: make sure the commented code below is consistent with the new implementation
         # warp_inverse.reverse()
         if level_alignment:
-            dimensionality = len(Image("data.nii").hdr.get_data_shape())
+            dimensionality = len(Image("data.nii", lazy=True).hdr.get_data_shape())
             cmd = ['isct_ComposeMultiTransform', f"{dimensionality}", 'warp_template2anat.nii.gz', '-R', 'data.nii', 'warp_straight2curve.nii.gz', warp_inverse]
             status, output = run_proc(cmd, verbose=verbose, is_sct_binary=True)
             if status != 0:
                 raise RuntimeError(f"Subprocess call {cmd} returned non-zero: {output}")
 
         else:
-            dimensionality = len(Image("data.nii").hdr.get_data_shape())
+            dimensionality = len(Image("data.nii", lazy=True).hdr.get_data_shape())
             cmd = ['isct_ComposeMultiTransform', f"{dimensionality}", 'warp_template2anat.nii.gz', '-R', 'data.nii', 'warp_straight2curve.nii.gz', '-i', 'straight2templateAffine.txt', warp_inverse]
             status, output = run_proc(cmd, verbose=verbose, is_sct_binary=True)
             if status != 0:
@@ -886,8 +904,8 @@ def resample_labels(fname_labels, fname_dest, fname_output):
     IMPORTANT: this function assumes that the origin and FOV of the two images are the SAME.
     """
     # get dimensions of input and destination files
-    nx, ny, nz, _, _, _, _, _ = Image(fname_labels).dim
-    nxd, nyd, nzd, _, _, _, _, _ = Image(fname_dest).dim
+    nx, ny, nz, _, _, _, _, _ = Image(fname_labels, lazy=True).dim
+    nxd, nyd, nzd, _, _, _, _, _ = Image(fname_dest, lazy=True).dim
     sampling_factor = [float(nx) / nxd, float(ny) / nyd, float(nz) / nzd]
 
     og_labels = Image(fname_labels).getNonZeroCoordinates()
@@ -1102,7 +1120,7 @@ def register_wrapper(fname_src, fname_dest, param, paramregmulti, fname_src_seg=
 
     # if a warping field needs to be inverted, remove it from warp_forward
     warp_forward = [f for f in warp_forward if f not in warp_forward_winv]
-    dimensionality = len(Image("dest.nii").hdr.get_data_shape())
+    dimensionality = len(Image("dest.nii", lazy=True).hdr.get_data_shape())
     cmd = ['isct_ComposeMultiTransform', f"{dimensionality}", 'warp_src2dest.nii.gz', '-R', 'dest.nii']
 
     if warp_forward_winv:
@@ -1118,7 +1136,7 @@ def register_wrapper(fname_src, fname_dest, param, paramregmulti, fname_src_seg=
     # if an inverse warping field needs to be inverted, remove it from warp_inverse_winv
     warp_inverse = [f for f in warp_inverse if f not in warp_inverse_winv]
     cmd = ['isct_ComposeMultiTransform', f"{dimensionality}", 'warp_dest2src.nii.gz', '-R', 'src.nii']
-    dimensionality = len(Image("dest.nii").hdr.get_data_shape())
+    dimensionality = len(Image("dest.nii", lazy=True).hdr.get_data_shape())
 
     if warp_inverse_winv:
         cmd.append('-i')
@@ -20,9 +20,9 @@ import multiprocessing
 import subprocess
 import platform
 import re
+import signal
 import time
 import datetime
-import functools
 import json
 import tempfile
 import warnings
@@ -79,7 +79,9 @@ def get_parser():
                         'that number. For example \'-jobs -1\' will run with all the available cores minus one job in '
                         'parallel. Set \'-jobs 0\' to use all available cores.\n'
                         'This argument enables process-based parallelism, while \'-itk-threads\' enables thread-based '
-                        'parallelism. You may need to tweak both to find a balance that works best for your system.',
+                        'parallelism. You may need to tweak both to find a balance that works best for your system.\n'
+                        'Subjects are processed from the most to the least costly, as estimated from the duration of '
+                        'their previous run (read from the previous \'-batch-log\') or from the size of their images.',
                         metavar=Metavar.int)
     parser.add_argument('-itk-threads', type=int, default=1,
                         help='Sets the environment variable "ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS".\n'
@@ -87,7 +89,16 @@ def get_parser():
                         'provide a performance boost for high-performance (multi-core) computing environments. '
                         'However, increasing the number of threads may also result in a large increase in memory.\n'
                         'This argument enables thread-based parallelism, while \'-jobs\' enables process-based '
-                        'parallelism. You may need to tweak both to find a balance that works best for your system.',
+                        'parallelism. You may need to tweak both to find a balance that works best for your system.\n'
+                        'Set \'-itk-threads 0\' to share the cores among the jobs: each job that starts gets its share '
+                        'of the cores not used by the running jobs, so that jobs x threads stays at the number of cores '
+                        '(e.g. the last subjects get more threads when fewer subjects than jobs are left).',
+                        metavar=Metavar.int)
+    parser.add_argument('-max-memory', type=int, default=0,
+                        help='Memory budget (in MB) of the batch. A subject is only started if the memory used by the '
+                        'running jobs plus its estimated memory (peak memory of its previous run, otherwise the '
+                        'largest peak memory measured so far) fits in the budget. Set \'-max-memory 0\' to use the '
+                        'memory available when the batch starts.',
                         metavar=Metavar.int)
     parser.add_argument('-path-data', help='Setting for environment variable: PATH_DATA\n'
                         'Path containing subject directories in a consistent format')
@@ -171,6 +182,23 @@ def run_single(subj_dir, script, script_args, path_segmanual, path_data, path_da
     :param continue_on_error:
     :return:
     """
+    job = start_single(subj_dir, script, script_args, path_segmanual, path_data, path_data_processed, path_results,
+                       path_log, path_qc, itk_threads)
+    if job.process is not None:
+        try:
+            job.process.wait()
+        except BaseException:
+            terminate_single(job)
+            raise
+    return finish_single(job, continue_on_error)
+
+
+def start_single(subj_dir, script, script_args, path_segmanual, path_data, path_data_processed, path_results, path_log,
+                 path_qc, itk_threads):
+    """
+    Start the processing of a subject, without waiting for it to complete.
+    :return: job (process is None if the script could not be started, in which case error is set)
+    """
 
     # Strip the `.sh` extension from the script for building error logs
     # TODO: we should probably strip all extensions
@@ -200,28 +228,62 @@ def run_single(subj_dir, script, script_args, path_segmanual, path_data, path_da
         'PATH_LOG': path_log,
         'PATH_QC': path_qc,
         'ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS': str(itk_threads),
-        'SCT_PROGRESS_BAR': 'off'
+        'SCT_PROGRESS_BAR': 'off',
+        # The QC entries of the subjects are only appended to the QC index, and index.html is rendered once at the end
+        'SCT_QC_DEFER_INDEX': '1'
     })
 
-    # Ship the job out, merging stdout/stderr and piping to log file
+    job = SimpleNamespace(subj_dir=subj_dir, subject=subject, log_file=log_file, err_file=err_file,
+                          itk_threads=itk_threads, start=time.time(), process=None, error=None, peak_memory=0)
+    # Ship the job out, merging stdout/stderr and piping to log file. The script runs in its own session (and process
+    # group), so that the programs it starts can be terminated with it (see terminate_single())
     try:
-        res = subprocess.run([script_full, subj_dir] + script_args.split(' '),
-                             env=envir,
-                             stdout=open(log_file, 'w'),
-                             stderr=subprocess.STDOUT)
-
-        assert res.returncode == 0, 'Processing of subject {} failed'.format(subject)
+        with open(log_file, 'w') as stdout:
+            job.process = subprocess.Popen([script_full, subj_dir] + script_args.split(' '),
+                                           env=envir,
+                                           stdout=stdout,
+                                           stderr=subprocess.STDOUT,
+                                           start_new_session=True)
     except Exception as e:
-        process_completed = 'res' in locals()
-        res = res if process_completed else SimpleNamespace(returncode=-1)
-        process_suceeded = res.returncode == 0
+        job.error = e
+    return job
+
+
+def terminate_single(job):
+    """
+    Terminate a running job: its script and the programs started by the script (the process group of the script).
+    :param job: job returned by start_single()
+    """
+    if job.process is None or job.process.poll() is not None:
+        return
+    if hasattr(os, 'killpg'):
+        try:
+            os.killpg(job.process.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    else:
+        job.process.terminate()
 
-        if not process_suceeded and os.path.exists(log_file):
+
+def finish_single(job, continue_on_error=False):
+    """
+    Check the result of a completed job, and rename its log file if it failed.
+    :param job: job returned by start_single()
+    :param continue_on_error:
+    :return: result (with attribute returncode)
+    """
+    res = SimpleNamespace(returncode=-1 if job.process is None else job.process.returncode)
+    try:
+        if job.error is not None:
+            raise job.error
+        assert res.returncode == 0, 'Processing of subject {} failed'.format(job.subject)
+    except Exception as e:
+        if os.path.exists(job.log_file):
             # If the process didn't complete or succeed rename the log file to indicate
             # the error
-            os.rename(log_file, err_file)
+            os.rename(job.log_file, job.err_file)
 
-        if process_suceeded or continue_on_error:
+        if continue_on_error:
             return res
         else:
             raise e
@@ -229,6 +291,118 @@ def run_single(subj_dir, script, script_args, path_segmanual, path_data, path_da
     return res
 
 
+def read_batch_log(fname):
+    """
+    Read the duration and peak memory of the subjects processed by a previous run, from its batch log.
+    :param fname: batch log of the previous run
+    :return: dict {subj_dir: (duration in s, peak memory in MB)}
+    """
+    runs = {}
+    if os.path.isfile(fname):
+        with open(fname, 'r') as f:
+            for line in f:
+                match = re.match(r'Finished at \S+: (.+?) \(duration: ([\d.]+) s, peak memory: ([\d.]+) MB', line)
+                if match:
+                    runs[match.group(1)] = float(match.group(2)), float(match.group(3))
+    return runs
+
+
+def get_subject_size(path_subject):
+    """Total size (in bytes) of the NIfTI images of a subject directory."""
+    size = 0
+    for cwd, dirs, files in os.walk(path_subject):
+        for file in files:
+            if file.endswith(('.nii', '.nii.gz')):
+                size += os.path.getsize(os.path.join(cwd, file))
+    return size
+
+
+def estimate_costs(subject_dirs, path_data, previous_runs):
+    """
+    Estimate the processing cost of each subject, in seconds if possible: the duration of the previous run of the
+    subject, or else the size of its images multiplied by the median duration per byte of the subjects of the previous
+    run. Without previous run, the cost is the size of the images.
+    :param subject_dirs: list of subject directories, relative to path_data
+    :param path_data:
+    :param previous_runs: output of read_batch_log()
+    :return: dict {subj_dir: cost}
+    """
+    sizes = {subj_dir: get_subject_size(os.path.join(path_data, subj_dir)) for subj_dir in subject_dirs}
+    rates = sorted(previous_runs[subj_dir][0] / sizes[subj_dir]
+                   for subj_dir in subject_dirs if subj_dir in previous_runs and sizes[subj_dir] > 0)
+    rate = rates[len(rates) // 2] if rates else 1
+    return {subj_dir: previous_runs[subj_dir][0] if subj_dir in previous_runs else sizes[subj_dir] * rate
+            for subj_dir in subject_dirs}
+
+
+def get_memory(process):
+    """Memory (in MB) currently used by a process and its children."""
+    try:
+        process = psutil.Process(process.pid)
+        return sum(p.memory_info().rss for p in [process] + process.children(recursive=True)) / 1024 / 1024
+    except psutil.Error:
+        return 0
+
+
+def run_batch(subject_dirs, costs, jobs, itk_threads=1, max_memory=None, memory_estimates=None,
+              continue_on_error=False, poll_interval=0.1, **kwargs):
+    """
+    Process subjects in parallel, starting the most costly ones first: each time a job completes, the most costly
+    remaining subject is started, so that short subjects fill the gaps at the end of the batch instead of long subjects
+    running alone.
+
+    :param subject_dirs: list of subject directories
+    :param costs: dict {subj_dir: estimated cost}, see estimate_costs()
+    :param jobs: maximum number of jobs running in parallel
+    :param itk_threads: number of ITK threads per job. If 0, the cores not used by the running jobs are shared among\
+      the jobs that are started, so that the total number of threads stays at the number of cores.
+    :param max_memory: memory budget in MB. A job is only started if the memory used by the running jobs plus its\
+      estimated memory fits in the budget (at least one job is always running).
+    :param memory_estimates: dict {subj_dir: estimated peak memory in MB}. For the other subjects, the largest peak\
+      memory measured so far is used.
+    :param continue_on_error:
+    :param poll_interval: time (in s) between two checks of the running jobs
+    :param kwargs: arguments of start_single()
+    :return: list of results (in the order of subject_dirs), dict {subj_dir: (duration in s, peak memory in MB)}
+    """
+    memory_estimates = memory_estimates or {}
+    n_cores = multiprocessing.cpu_count()
+    pending = sorted(subject_dirs, key=lambda subj_dir: costs[subj_dir], reverse=True)
+    running = []
+    results, runs = {}, {}
+    try:
+        while pending or running:
+            # Start as many jobs as the free slots, cores and memory budget allow
+            while pending and len(running) < jobs:
+                subj_dir = pending[0]
+                memory_estimate = memory_estimates.get(subj_dir, max([job.peak_memory for job in running] +
+                                                                     [peak for _, peak in runs.values()] + [0]))
+                memory_used = sum(get_memory(job.process) for job in running if job.process is not None)
+                if running and max_memory and memory_used + memory_estimate > max_memory:
+                    break
+                if itk_threads == 0:
+                    free_cores = n_cores - sum(job.itk_threads for job in running)
+                    threads = max(1, free_cores // min(jobs - len(running), len(pending)))
+                else:
+                    threads = itk_threads
+                running.append(start_single(pending.pop(0), itk_threads=threads, **kwargs))
+
+            time.sleep(poll_interval)
+            for job in list(running):
+                if job.process is not None:
+                    job.peak_memory = max(job.peak_memory, get_memory(job.process))
+                if job.process is None or job.process.poll() is not None:
+                    running.remove(job)
+                    runs[job.subj_dir] = time.time() - job.start, job.peak_memory
+                    print('Finished at {}: {} (duration: {:.1f} s, peak memory: {:.0f} MB, ITK threads: {})'.format(
+                        time.strftime('%Hh%Mm%Ss'), job.subj_dir, *runs[job.subj_dir], job.itk_threads), flush=True)
+                    results[job.subj_dir] = finish_single(job, continue_on_error)
+    finally:
+        for job in running:
+            terminate_single(job)
+    return [results[subj_dir] for subj_dir in subject_dirs], runs
+
+
 def main(argv=None):
     parser = get_parser()
     arguments = parser.parse_args(argv)
@@ -315,6 +489,9 @@ def main(argv=None):
     if not os.path.exists(script):
         raise FileNotFoundError('Couldn\'t find the script script at {}'.format(script))
 
+    # Read the durations and peak memories of the previous run before overwriting its log
+    previous_runs = read_batch_log(os.path.join(path_log, arguments.batch_log))
+
     # Setup overall log
     batch_log = open(os.path.join(path_log, arguments.batch_log), 'w')
 
@@ -344,7 +521,8 @@ def main(argv=None):
     print('OS: ' + os_running + ' (' + platform.platform() + ')')
 
     # Display number of CPU cores
-    print('CPU cores: Available: {} | Threads used by ITK Programs: {}'.format(multiprocessing.cpu_count(), arguments.itk_threads))
+    print('CPU cores: Available: {} | Threads used by ITK Programs: {}'.format(
+        multiprocessing.cpu_count(), arguments.itk_threads if arguments.itk_threads > 0 else 'auto'))
 
     # Display RAM available
     print("RAM: Total {} MB | Available {} MB | Used {} MB".format(
@@ -429,6 +607,14 @@ def main(argv=None):
     else:
         jobs = arguments.jobs
 
+    if arguments.max_memory > 0:
+        max_memory = arguments.max_memory
+    else:
+        max_memory = psutil.virtual_memory().available / 1024 / 1024
+
+    # Order the subjects by estimated cost
+    costs = estimate_costs(subject_dirs, path_data, previous_runs)
+
     print("RUNNING")
     print("-------")
     print("Processing {} subjects in parallel. (Worker processes used: {}).".format(len(subject_dirs), jobs))
@@ -438,25 +624,25 @@ def main(argv=None):
 
     # Trap errors to send an email if a script fails.
     try:
-        with multiprocessing.Pool(jobs) as p:
-            run_single_dir = functools.partial(run_single,
-                                               script=script,
-                                               script_args=arguments.script_args,
-                                               path_segmanual=path_segmanual,
-                                               path_data=path_data,
-                                               path_data_processed=path_data_processed,
-                                               path_results=path_results,
-                                               path_log=path_log,
-                                               path_qc=path_qc,
-                                               itk_threads=arguments.itk_threads,
-                                               continue_on_error=arguments.continue_on_error)
-            results = list(p.imap(run_single_dir, subject_dirs))
+        results, _ = run_batch(subject_dirs, costs, jobs,
+                               itk_threads=arguments.itk_threads,
+                               max_memory=max_memory,
+                               memory_estimates={subj_dir: memory for subj_dir, (_, memory) in previous_runs.items()},
+                               continue_on_error=arguments.continue_on_error,
+                               script=script,
+                               script_args=arguments.script_args,
+                               path_segmanual=path_segmanual,
+                               path_data=path_data,
+                               path_data_processed=path_data_processed,
+                               path_results=path_results,
+                               path_log=path_log,
+                               path_qc=path_qc)
     except Exception as e:
         if do_email:
             message = ('Oh no there has been the following error in your pipeline:\n\n'
                        '{}'.format(e))
             try:
-                # I consider the multiprocessing error more significant than a potential email error, this
+                # I consider the processing error more significant than a potential email error, this
                 # ensures that the multiprocessing error is signalled.
                 send_notification('sct_run_batch errored', message)
             except Exception:
@@ -468,6 +654,11 @@ def main(argv=None):
 
     end = datetime.datetime.now()
 
+    # Render the QC report from the entries added by all the subjects
+    if os.path.isdir(os.path.join(path_qc, '_json')):
+        from spinalcordtoolbox.reports.qc import update_index_html
+        update_index_html(path_qc)
+
     # Check for failed subjects
     fails = [sd for (sd, ret) in zip(subject_dirs, results) if ret.returncode != 0]
 
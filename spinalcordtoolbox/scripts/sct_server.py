@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+#########################################################################################
+#
+# Command server, which runs SCT commands without starting a new Python interpreter for each of them.
+#
+# ---------------------------------------------------------------------------------------
+# Copyright (c) 2020 Polytechnique Montreal <www.neuro.polymtl.ca>
+#
+# About the license: see the file LICENSE.TXT
+#########################################################################################
+
+import sys
+
+from spinalcordtoolbox.compat.server import serve, get_default_socket, PRELOAD
+from spinalcordtoolbox.utils.shell import SCTArgumentParser, Metavar
+from spinalcordtoolbox.utils.sys import init_sct, set_loglevel
+
+
+def get_parser():
+    parser = SCTArgumentParser(
+        description='Start a command server, which keeps the Python modules used by SCT imported and runs SCT '
+                    'commands in processes forked from it, to avoid paying the startup of a new Python interpreter '
+                    '(import of numpy, scipy, nibabel...) for each command. The server runs until it is '
+                    'interrupted (Ctrl+C or SIGTERM). To forward the commands of a shell (e.g. of a batch script) to '
+                    'the server, set the environment variable SCT_SERVER to the socket of the server, e.g.:\n'
+                    '  sct_server &\n'
+                    '  export SCT_SERVER={}\n'
+                    'Commands are run as usual (in a new interpreter) if the server is not running.'
+                    ''.format(get_default_socket())
+    )
+    parser.add_argument('-socket', metavar=Metavar.file, default=get_default_socket(),
+                        help='Path of the Unix socket of the server.')
+    parser.add_argument('-preload', metavar=Metavar.str, nargs='+', default=[],
+                        help='Additional modules to import in the server, e.g. "-preload '
+                             'spinalcordtoolbox.scripts.sct_register_to_template". Modules imported by default: '
+                             '{}. Note that modules that start threads at import should not be preloaded (e.g. '
+                             'tensorflow), as the commands are run in forked processes.'.format(', '.join(PRELOAD)))
+    parser.add_argument('-v', metavar=Metavar.int, type=int, choices=[0, 1, 2], default=1,
+                        # Values [0, 1, 2] map to logging levels [WARNING, INFO, DEBUG], but are also used as "if verbose == #" in API
+                        help="Verbosity. 0: Display only errors/warnings, 1: Errors/warnings + info messages, 2: Debug mode")
+    parser.add_argument('-h', "--help", action="help", help="show this help message and exit")
+    return parser
+
+
+def main(argv=None):
+    parser = get_parser()
+    arguments = parser.parse_args(argv)
+    verbose = arguments.v
+    set_loglevel(verbose=verbose)
+
+    serve(arguments.socket, preload=PRELOAD + arguments.preload)
+
+
+if __name__ == "__main__":
+    init_sct()
+    main(sys.argv[1:])
@@ -148,7 +148,7 @@ def main(argv=None):
     printv('  Verbose ........................... ' + str(verbose))
 
     # Check that input is 3D:
-    nx, ny, nz, nt, px, py, pz, pt = Image(fname_anat).dim
+    nx, ny, nz, nt, px, py, pz, pt = Image(fname_anat, lazy=True).dim
     dim = 4  # by default, will be adjusted later
     if nt == 1:
         dim = 3
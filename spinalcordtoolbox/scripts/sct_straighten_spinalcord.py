@@ -14,11 +14,12 @@
 
 import sys
 import os
+import multiprocessing
 
 from spinalcordtoolbox.straightening import SpinalCordStraightener
 from spinalcordtoolbox.centerline.core import ParamCenterline
 from spinalcordtoolbox.reports.qc import generate_qc
-from spinalcordtoolbox.utils.shell import SCTArgumentParser, Metavar, ActionCreateFolder, display_viewer_syntax
+from spinalcordtoolbox.utils.shell import SCTArgumentParser, Metavar, ActionCreateFolder, display_viewer_syntax, list_type
 from spinalcordtoolbox.utils.sys import init_sct, printv, set_loglevel
 
 
@@ -28,7 +29,11 @@ def get_parser():
                     "segmentation), and returns the an image of a straightened spinal cord. Reference: "
                     "De Leener B, Mangeat G, Dupont S, Martin AR, Callot V, Stikov N, Fehlings MG, "
                     "Cohen-Adad J. Topologically-preserving straightening of spinal cord MRI. J Magn "
-                    "Reson Imaging. 2017 Oct;46(4):1209-1219"
+                    "Reson Imaging. 2017 Oct;46(4):1209-1219\n"
+                    "\n"
+                    "To reuse the warping fields across runs on the same centerline, set the environment variable "
+                    "SCT_CACHE_DIR to a cache folder. The size of this folder is bounded by the environment variable "
+                    "SCT_CACHE_SIZE (in MB, default: 4096): the least recently used warping fields are removed first."
     )
     mandatory = parser.add_argument_group("MANDATORY ARGUMENTS")
     mandatory.add_argument(
@@ -142,7 +147,9 @@ def get_parser():
              "  - precision: Float [1, inf) Precision factor of straightening, related to the number of slices. Increasing this parameter increases the precision along with increased computational time. Not taken into account with Hanning fitting method. Default=2\n"
              "  - threshold_distance: Float [0, inf) Threshold at which voxels are not considered into displacement. Increase this threshold if the image is blackout around the spinal cord too much. Default=10\n"
              "  - accuracy_results: {0, 1} Disable/Enable computation of accuracy results after straightening. Default=0\n"
-             "  - template_orientation: {0, 1} Disable/Enable orientation of the straight image to be the same as the template. Default=0",
+             "  - template_orientation: {0, 1} Disable/Enable orientation of the straight image to be the same as the template. Default=0\n"
+             "  - chunk_size: Int [1, inf) Number of voxels of the warping fields computed at once. Decrease this parameter to reduce memory usage. Default=262144",
+        type=list_type(',', str),
         required=False)
 
     optional.add_argument(
@@ -150,6 +157,16 @@ def get_parser():
         help="Final interpolation. Default: spline.",
         choices=("nn", "linear", "spline"),
         default="spline")
+    optional.add_argument(
+        '-jobs',
+        metavar=Metavar.int,
+        type=int,
+        default=1,
+        help="Number of threads used to compute the warping fields by chunks of slices in parallel. Either an integer "
+             "greater than or equal to one specifying the number of cores, 0 or a negative integer specifying number "
+             "of cores minus that number. For example '-jobs -1' will run with all the available cores minus one. Set "
+             "'-jobs 0' to use all available cores."
+    )
     optional.add_argument(
         '-qc',
         metavar=Metavar.str,
@@ -242,6 +259,11 @@ def main(argv=None):
     if arguments.xy_size:
         sc_straight.xy_size = arguments.xy_size
 
+    if arguments.jobs < 1:
+        sc_straight.jobs = max(1, multiprocessing.cpu_count() + arguments.jobs)
+    else:
+        sc_straight.jobs = arguments.jobs
+
     sc_straight.param_centerline = ParamCenterline(
         algo_fitting=arguments.centerline_algo,
         smooth=arguments.centerline_smooth)
@@ -258,6 +280,8 @@ def main(argv=None):
                 sc_straight.accuracy_results = int(param_split[1])
             if param_split[0] == 'template_orientation':
                 sc_straight.template_orientation = int(param_split[1])
+            if param_split[0] == 'chunk_size':
+                sc_straight.chunk_size = int(param_split[1])
 
     fname_straight = sc_straight.straighten()
 
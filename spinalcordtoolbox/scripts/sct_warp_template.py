@@ -43,7 +43,8 @@ class Param:
 
 class WarpTemplate:
     def __init__(self, fname_src, fname_transfo, warp_atlas, warp_spinal_levels, folder_out, path_template,
-                 folder_template, folder_atlas, folder_spinal_levels, file_info_label, list_labels_nn, verbose):
+                 folder_template, folder_atlas, folder_spinal_levels, file_info_label, list_labels_nn, verbose,
+                 backend='ants'):
 
         # Initialization
         self.fname_src = fname_src
@@ -58,6 +59,7 @@ class WarpTemplate:
         self.file_info_label = file_info_label
         self.list_labels_nn = list_labels_nn
         self.verbose = verbose
+        self.backend = backend
 
         # printv(arguments)
         printv('\nCheck parameters:')
@@ -71,25 +73,33 @@ class WarpTemplate:
         if not os.path.exists(self.folder_out):
             os.makedirs(self.folder_out)
 
+        # Sampling grid of the numpy backend, computed for the first file and reused for all the other ones. It is
+        # only kept while the template is warped.
+        grid_cache = {}
+
         # Warp template objects
         printv('\nWARP TEMPLATE:', self.verbose)
         warp_label(self.path_template, self.folder_template, self.file_info_label, self.fname_src,
-                   self.fname_transfo, self.folder_out, self.list_labels_nn, self.verbose)
+                   self.fname_transfo, self.folder_out, self.list_labels_nn, self.verbose,
+                   backend=self.backend, grid_cache=grid_cache)
 
         # Warp atlas
         if self.warp_atlas == 1:
             printv('\nWARP ATLAS OF WHITE MATTER TRACTS:', self.verbose)
             warp_label(self.path_template, self.folder_atlas, self.file_info_label, self.fname_src,
-                       self.fname_transfo, self.folder_out, self.list_labels_nn, self.verbose)
+                       self.fname_transfo, self.folder_out, self.list_labels_nn, self.verbose,
+                       backend=self.backend, grid_cache=grid_cache)
 
         # Warp spinal levels
         if self.warp_spinal_levels == 1:
             printv('\nWARP SPINAL LEVELS:', self.verbose)
             warp_label(self.path_template, self.folder_spinal_levels, self.file_info_label, self.fname_src,
-                       self.fname_transfo, self.folder_out, self.list_labels_nn, self.verbose)
+                       self.fname_transfo, self.folder_out, self.list_labels_nn, self.verbose,
+                       backend=self.backend, grid_cache=grid_cache)
 
 
-def warp_label(path_label, folder_label, file_label, fname_src, fname_transfo, path_out, list_labels_nn, verbose):
+def warp_label(path_label, folder_label, file_label, fname_src, fname_transfo, path_out, list_labels_nn, verbose,
+               backend='ants', grid_cache=None):
     """
     Warp label files according to info_label.txt file
     :param path_label:
@@ -100,6 +110,9 @@ def warp_label(path_label, folder_label, file_label, fname_src, fname_transfo, p
     :param path_out:
     :param list_labels_nn:
     :param verbose:
+    :param backend: backend of sct_apply_transfo ('ants' or 'numpy')
+    :param grid_cache: dict in which the sampling grid of the numpy backend is kept for the next files (see \
+      registration.warp.get_sampling_grid())
     :return:
     """
     try:
@@ -117,13 +130,20 @@ def warp_label(path_label, folder_label, file_label, fname_src, fname_transfo, p
         # Warp label
         for i in range(0, len(template_label_file)):
             fname_label = os.path.join(path_label, folder_label, template_label_file[i])
+            fname_out = os.path.join(path_out, folder_label, template_label_file[i])
             # apply transfo
-            sct_apply_transfo.main(['-i', fname_label,
-                                    '-d', fname_src,
-                                    '-w', fname_transfo,
-                                    '-o', os.path.join(path_out, folder_label, template_label_file[i]),
-                                    '-x', get_interp(template_label_file[i], list_labels_nn),
-                                    '-v', '0'])
+            if backend == 'numpy':
+                sct_apply_transfo.Transform(input_filename=fname_label, fname_dest=fname_src, list_warp=[fname_transfo],
+                                            output_filename=fname_out,
+                                            interp=get_interp(template_label_file[i], list_labels_nn),
+                                            backend=backend, grid_cache=grid_cache).apply()
+            else:
+                sct_apply_transfo.main(['-i', fname_label,
+                                        '-d', fname_src,
+                                        '-w', fname_transfo,
+                                        '-o', fname_out,
+                                        '-x', get_interp(template_label_file[i], list_labels_nn),
+                                        '-v', '0'])
         # Copy list.txt
         copy(os.path.join(path_label, folder_label, file_label), os.path.join(path_out, folder_label))
 
@@ -199,6 +219,13 @@ def get_parser():
         default=str(param_default.path_template),
         help="Path to template."
     )
+    optional.add_argument(
+        '-backend',
+        default='ants',
+        choices=('ants', 'numpy'),
+        help="Implementation used to apply the warping field (see sct_apply_transfo -backend). With 'numpy', the "
+             "sampling grid is computed once and reused for all the files of the template."
+    )
     optional.add_argument(
         '-qc',
         metavar=Metavar.folder,
@@ -254,7 +281,8 @@ def main(argv=None):
 
     # call main function
     w = WarpTemplate(fname_src, fname_transfo, warp_atlas, warp_spinal_levels, folder_out, path_template,
-                     folder_template, folder_atlas, folder_spinal_levels, file_info_label, list_labels_nn, verbose)
+                     folder_template, folder_atlas, folder_spinal_levels, file_info_label, list_labels_nn, verbose,
+                     backend=arguments.backend)
 
     path_template = os.path.join(w.folder_out, w.folder_template)
 
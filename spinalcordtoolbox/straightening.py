@@ -6,19 +6,25 @@
 # TODO: only input Image instead of file names
 
 import os
+import gzip
+import shutil
 import time
 import logging
 import inspect
+import json
 import bisect
+import functools
+from multiprocessing.pool import ThreadPool
 
 import numpy as np
-from nibabel import Nifti1Image, save
 
 from spinalcordtoolbox.types import Centerline
 from spinalcordtoolbox.image import Image, spatial_crop, generate_output_file, pad_image
 from spinalcordtoolbox.centerline.core import ParamCenterline, get_centerline
-from spinalcordtoolbox.utils.sys import sct_progress_bar, run_proc
-from spinalcordtoolbox.utils.fs import tmp_create, rmtree, copy, mv, extract_fname
+from spinalcordtoolbox.resampling import resample_file
+from spinalcordtoolbox.utils.sys import sct_progress_bar, run_proc, __version__
+from spinalcordtoolbox.utils.fs import (tmp_create, rmtree, copy, mv, extract_fname, get_cache_dir, cache_key,
+                                      cache_fetch, cache_store)
 
 from spinalcordtoolbox.scripts import sct_apply_transfo
 
@@ -46,6 +52,8 @@ class SpinalCordStraightener(object):
         self.speed_factor = 1.0  # Speed parameter
         self.xy_size = 70  # in mm
         self.param_centerline = param_centerline
+        self.chunk_size = 2 ** 18  # Number of voxels of the warping fields computed at once (bounds memory usage)
+        self.jobs = 1  # Number of threads used to compute the warping fields
 
         # QC metrics
         self.accuracy_results = 0
@@ -120,6 +128,169 @@ class SpinalCordStraightener(object):
         curdir = os.getcwd()
         os.chdir(path_tmp)
 
+        # Reuse the warping fields from the persistent cache (see SCT_CACHE_DIR) if the input centerline and the
+        # straightening parameters did not change since a previous run
+        path_cache = get_cache_dir()
+        path_cache_store = None
+        fnames_cache = {'warp_curve2straight.nii.gz': 'tmp.curve2straight.nii.gz',
+                        'warp_straight2curve.nii.gz': 'tmp.straight2curve.nii.gz',
+                        'straight_space.nii.gz': 'tmp.straight_space.nii.gz',
+                        'straightening.json': 'tmp.straightening.json'}
+        if not self.curved2straight:
+            del fnames_cache['warp_curve2straight.nii.gz']
+        if not self.straight2curved:
+            del fnames_cache['warp_straight2curve.nii.gz']
+        if path_cache is not None:
+            key_cache = self._get_cache_key()
+        if path_cache is not None and cache_fetch(path_cache, key_cache, fnames_cache):
+            fname_warp_curve2straight, fname_warp_straight2curve = 'tmp.curve2straight.nii.gz', 'tmp.straight2curve.nii.gz'
+            fname_ref = 'tmp.straight_space.nii.gz'
+            with open('tmp.straightening.json') as f:
+                number_of_points = json.load(f)['number_of_points']
+        else:
+            fname_warp_curve2straight, fname_warp_straight2curve = 'tmp.curve2straight.nii', 'tmp.straight2curve.nii'
+            fname_ref, number_of_points = self._compute_warping_fields()
+            path_cache_store = path_cache
+
+        if self.curved2straight:
+            logger.info('Apply transformation to input image...')
+            sct_apply_transfo.main(['-i', 'data.nii',
+                                    '-d', fname_ref,
+                                    '-w', fname_warp_curve2straight,
+                                    '-o', 'tmp.anat_rigid_warp.nii.gz',
+                                    '-x', 'spline',
+                                    '-v', '0'])
+
+
+        if self.accuracy_results:
+            time_accuracy_results = time.time()
+            # compute the error between the straightened centerline/segmentation and the central vertical line.
+            # Ideally, the error should be zero.
+            # Apply deformation to input image
+            logger.info('Apply transformation to centerline image...')
+            sct_apply_transfo.main(['-i', 'centerline.nii.gz',
+                                    '-d', fname_ref,
+                                    '-w', fname_warp_curve2straight,
+                                    '-o', 'tmp.centerline_straight.nii.gz',
+                                    '-x', 'nn',
+                                    '-v', '0'])
+            file_centerline_straight = Image('tmp.centerline_straight.nii.gz', verbose=verbose)
+            nx, ny, nz, nt, px, py, pz, pt = file_centerline_straight.dim
+            coordinates_centerline = file_centerline_straight.getNonZeroCoordinates(sorting='z')
+            mean_coord = []
+            for z in range(coordinates_centerline[0].z, coordinates_centerline[-1].z):
+                temp_mean = [coord.value for coord in coordinates_centerline if coord.z == z]
+                if temp_mean:
+                    mean_value = np.mean(temp_mean)
+                    mean_coord.append(
+                        np.mean([[coord.x * coord.value / mean_value, coord.y * coord.value / mean_value]
+                                 for coord in coordinates_centerline if coord.z == z], axis=0))
+
+            # compute error between the straightened centerline and the straight line.
+            x0 = file_centerline_straight.data.shape[0] / 2.0
+            y0 = file_centerline_straight.data.shape[1] / 2.0
+            count_mean = 0
+            if number_of_points >= 10:
+                mean_c = mean_coord[2:-2]  # we don't include the four extrema because there are usually messy.
+            else:
+                mean_c = mean_coord
+            for coord_z in mean_c:
+                if not np.isnan(np.sum(coord_z)):
+                    dist = ((x0 - coord_z[0]) * px) ** 2 + ((y0 - coord_z[1]) * py) ** 2
+                    self.mse_straightening += dist
+                    dist = np.sqrt(dist)
+                    if dist > self.max_distance_straightening:
+                        self.max_distance_straightening = dist
+                    count_mean += 1
+            self.mse_straightening = np.sqrt(self.mse_straightening / float(count_mean))
+
+            self.elapsed_time_accuracy = time.time() - time_accuracy_results
+
+        os.chdir(curdir)
+
+        # Generate output file (in current folder)
+        logger.info('Generate output files...')
+        fnames_warp = []
+        if self.curved2straight:
+            fnames_warp.append((fname_warp_curve2straight, "warp_curve2straight.nii.gz"))
+        if self.straight2curved:
+            fnames_warp.append((fname_warp_straight2curve, "warp_straight2curve.nii.gz"))
+        for fname_warp, fname_out in fnames_warp:
+            if fname_warp.endswith('.nii.gz'):
+                copy(os.path.join(path_tmp, fname_warp), os.path.join(self.path_output, fname_out))
+            else:
+                _compress_nifti(os.path.join(path_tmp, fname_warp), os.path.join(self.path_output, fname_out))
+
+        # Store the warping fields in the persistent cache
+        if path_cache_store is not None:
+            with open(os.path.join(path_tmp, 'tmp.straightening.json'), 'w') as f:
+                json.dump({'number_of_points': number_of_points}, f)
+            fnames_store = {'straight_space.nii.gz': os.path.join(path_tmp, fname_ref),
+                            'straightening.json': os.path.join(path_tmp, 'tmp.straightening.json')}
+            for _, fname_out in fnames_warp:
+                fnames_store[fname_out] = os.path.join(self.path_output, fname_out)
+            cache_store(path_cache_store, key_cache, fnames_store)
+
+        # create ref_straight.nii.gz file that can be used by other SCT functions that need a straight reference space
+        if self.curved2straight:
+            copy(os.path.join(path_tmp, "tmp.anat_rigid_warp.nii.gz"),
+                     os.path.join(self.path_output, "straight_ref.nii.gz"))
+            # move straightened input file
+            if fname_output == '':
+                fname_straight = generate_output_file(os.path.join(path_tmp, "tmp.anat_rigid_warp.nii.gz"),
+                                                          os.path.join(self.path_output,
+                                                                       file_anat + "_straight" + ext_anat), verbose)
+            else:
+                fname_straight = generate_output_file(os.path.join(path_tmp, "tmp.anat_rigid_warp.nii.gz"),
+                                                          os.path.join(self.path_output, fname_output),
+                                                          verbose)  # straightened anatomic
+
+        # Remove temporary files
+        if remove_temp_files:
+            logger.info('Remove temporary files...')
+            rmtree(path_tmp)
+
+        if self.accuracy_results:
+            logger.info('Maximum x-y error: {} mm'.format(self.max_distance_straightening))
+            logger.info('Accuracy of straightening (MSE): {} mm'.format(self.mse_straightening))
+
+        # display elapsed time
+        self.elapsed_time = int(np.round(time.time() - start_time))
+
+        return fname_straight
+
+    def _get_cache_key(self):
+        """
+        Key of the warping fields in the persistent cache: hash of the data and header geometry of the input
+        centerline (and of the reference centerline and discs, if used), and of the straightening parameters.
+        """
+        input_data = []
+        for fname in ['centerline.nii.gz', 'centerline_ref.nii.gz', 'labels_input.nii.gz', 'labels_ref.nii.gz']:
+            if os.path.isfile(fname):
+                img = Image(fname)
+                input_data += [fname, img.data, img.hdr.get_best_affine()]
+        input_params = {
+            'version': __version__,
+            'threshold_distance': self.threshold_distance,
+            'speed_factor': self.speed_factor,
+            'xy_size': self.xy_size,
+            'param_centerline': sorted(vars(self.param_centerline).items()),
+            'use_straight_reference': self.use_straight_reference,
+            'template_orientation': self.template_orientation,
+            'curved2straight': self.curved2straight,
+            'straight2curved': self.straight2curved,
+        }
+        return cache_key(input_data=input_data, input_params=input_params)
+
+    def _compute_warping_fields(self):
+        """
+        Compute the curved->straight (tmp.curve2straight.nii) and straight->curved (tmp.straight2curve.nii) warping
+        fields from the centerline copied in the current (temporary) folder.
+
+        :return: file name of the straight reference space, number of points of the centerline
+        """
+        verbose = self.verbose
+
         # Change orientation of the input centerline into RPI
         image_centerline = Image("centerline.nii.gz").change_orientation("RPI").save("centerline_rpi.nii.gz",
                                                                                      mutable=True)
@@ -135,9 +306,8 @@ class SpinalCordStraightener(object):
         if intermediate_resampling:
             mv('centerline_rpi.nii.gz', 'centerline_rpi_native.nii.gz')
             pz_native = pz
-            # TODO: remove system call
-            run_proc(['sct_resample', '-i', 'centerline_rpi_native.nii.gz', '-mm',
-                      str(px_r) + 'x' + str(py_r) + 'x' + str(pz_r), '-o', 'centerline_rpi.nii.gz'])
+            resample_file('centerline_rpi_native.nii.gz', 'centerline_rpi.nii.gz',
+                          str(px_r) + 'x' + str(py_r) + 'x' + str(pz_r), 'mm', 'linear', 0)
             image_centerline = Image('centerline_rpi.nii.gz')
             nx, ny, nz, nt, px, py, pz, pt = image_centerline.dim
 
@@ -425,70 +595,34 @@ class SpinalCordStraightener(object):
                 break
         lookup_straight2curved = np.array(lookup_straight2curved)
 
-        # Create volumes containing curved and straight warping fields
-        data_warp_curved2straight = np.zeros((nx_s, ny_s, nz_s, 1, 3))
-        data_warp_straight2curved = np.zeros((nx, ny, nz, 1, 3))
-
+        # Create volumes containing curved and straight warping fields. To bound memory usage, warping fields are
+        # memory-mapped uncompressed NIfTI files, which are filled by chunks of slices. Chunks are independent, so they
+        # are computed in parallel when self.jobs > 1.
         # 5. compute transformations
         # Curved and straight images and the same dimensions, so we compute both warping fields at the same time.
         # b. determine which plane of spinal cord centreline it is included
 
         if self.curved2straight:
-            for u in sct_progress_bar(range(nz_s)):
-                x_s, y_s, z_s = np.mgrid[0:nx_s, 0:ny_s, u:u + 1]
-                indexes_straight = np.array(list(zip(x_s.ravel(), y_s.ravel(), z_s.ravel())))
-                physical_coordinates_straight = image_centerline_straight.transfo_pix2phys(indexes_straight)
-                nearest_indexes_straight = centerline_straight.find_nearest_indexes(physical_coordinates_straight)
-                distances_straight = centerline_straight.get_distances_from_planes(physical_coordinates_straight,
-                                                                                   nearest_indexes_straight)
-                lookup = lookup_straight2curved[nearest_indexes_straight]
-                indexes_out_distance_straight = np.logical_or(
-                    np.logical_or(distances_straight > self.threshold_distance,
-                                  distances_straight < -self.threshold_distance), lookup == 0)
-                projected_points_straight = centerline_straight.get_projected_coordinates_on_planes(
-                    physical_coordinates_straight, nearest_indexes_straight)
-                coord_in_planes_straight = centerline_straight.get_in_plans_coordinates(projected_points_straight,
-                                                                                        nearest_indexes_straight)
-
-                coord_straight2curved = centerline.get_inverse_plans_coordinates(coord_in_planes_straight, lookup)
-                displacements_straight = coord_straight2curved - physical_coordinates_straight
-                # Invert Z coordinate as ITK & ANTs physical coordinate system is LPS- (RAI+)
-                # while ours is LPI-
-                # Refs: https://sourceforge.net/p/advants/discussion/840261/thread/2a1e9307/#fb5a
-                #  https://www.slicer.org/wiki/Coordinate_systems
-                displacements_straight[:, 2] = -displacements_straight[:, 2]
-                displacements_straight[indexes_out_distance_straight] = [100000.0, 100000.0, 100000.0]
-
-                data_warp_curved2straight[indexes_straight[:, 0], indexes_straight[:, 1], indexes_straight[:, 2], 0, :]\
-                    = -displacements_straight
+            data_warp_curved2straight = _create_warping_field('tmp.curve2straight.nii', hdr_warp_s, (nx_s, ny_s, nz_s))
+            _fill_warping_field(
+                data_warp_curved2straight,
+                functools.partial(_compute_displacements_curved2straight,
+                                  image_centerline_straight=image_centerline_straight,
+                                  centerline_straight=centerline_straight, centerline=centerline,
+                                  lookup_straight2curved=lookup_straight2curved,
+                                  threshold_distance=self.threshold_distance),
+                self.chunk_size, self.jobs)
 
         if self.straight2curved:
-            for u in sct_progress_bar(range(nz)):
-                x, y, z = np.mgrid[0:nx, 0:ny, u:u + 1]
-                indexes = np.array(list(zip(x.ravel(), y.ravel(), z.ravel())))
-                physical_coordinates = image_centerline_pad.transfo_pix2phys(indexes)
-                nearest_indexes_curved = centerline.find_nearest_indexes(physical_coordinates)
-                distances_curved = centerline.get_distances_from_planes(physical_coordinates,
-                                                                        nearest_indexes_curved)
-                lookup = lookup_curved2straight[nearest_indexes_curved]
-                indexes_out_distance_curved = np.logical_or(
-                    np.logical_or(distances_curved > self.threshold_distance,
-                                  distances_curved < -self.threshold_distance), lookup == 0)
-                projected_points_curved = centerline.get_projected_coordinates_on_planes(physical_coordinates,
-                                                                                         nearest_indexes_curved)
-                coord_in_planes_curved = centerline.get_in_plans_coordinates(projected_points_curved,
-                                                                             nearest_indexes_curved)
-
-                coord_curved2straight = centerline_straight.points[lookup]
-                coord_curved2straight[:, 0:2] += coord_in_planes_curved[:, 0:2]
-                coord_curved2straight[:, 2] += distances_curved
-
-                displacements_curved = coord_curved2straight - physical_coordinates
-
-                displacements_curved[:, 2] = -displacements_curved[:, 2]
-                displacements_curved[indexes_out_distance_curved] = [100000.0, 100000.0, 100000.0]
-
-                data_warp_straight2curved[indexes[:, 0], indexes[:, 1], indexes[:, 2], 0, :] = -displacements_curved
+            data_warp_straight2curved = _create_warping_field('tmp.straight2curve.nii', hdr_warp, (nx, ny, nz))
+            _fill_warping_field(
+                data_warp_straight2curved,
+                functools.partial(_compute_displacements_straight2curved,
+                                  image_centerline_pad=image_centerline_pad, centerline=centerline,
+                                  centerline_straight=centerline_straight,
+                                  lookup_curved2straight=lookup_curved2straight,
+                                  threshold_distance=self.threshold_distance),
+                self.chunk_size, self.jobs)
 
         # Creation of the safe zone based on pre-calculated safe boundaries
         coord_bound_curved_inf, coord_bound_curved_sup = image_centerline_pad.transfo_phys2pix(
@@ -497,120 +631,27 @@ class SpinalCordStraightener(object):
             [[0, 0, bound_straight[0]]]), image_centerline_straight.transfo_phys2pix([[0, 0, bound_straight[1]]])
 
         if radius_safe > 0:
-            data_warp_curved2straight[:, :, 0:coord_bound_straight_inf[0][2], 0, :] = 100000.0
-            data_warp_curved2straight[:, :, coord_bound_straight_sup[0][2]:, 0, :] = 100000.0
-            data_warp_straight2curved[:, :, 0:coord_bound_curved_inf[0][2], 0, :] = 100000.0
-            data_warp_straight2curved[:, :, coord_bound_curved_sup[0][2]:, 0, :] = 100000.0
-
-        # Generate warp files as a warping fields
-        hdr_warp_s.set_intent('vector', (), '')
-        hdr_warp_s.set_data_dtype('float32')
-        hdr_warp.set_intent('vector', (), '')
-        hdr_warp.set_data_dtype('float32')
+            if self.curved2straight:
+                data_warp_curved2straight[:, :, 0:coord_bound_straight_inf[0][2], 0, :] = 100000.0
+                data_warp_curved2straight[:, :, coord_bound_straight_sup[0][2]:, 0, :] = 100000.0
+            if self.straight2curved:
+                data_warp_straight2curved[:, :, 0:coord_bound_curved_inf[0][2], 0, :] = 100000.0
+                data_warp_straight2curved[:, :, coord_bound_curved_sup[0][2]:, 0, :] = 100000.0
+
+        # Write warping fields to disk
         if self.curved2straight:
-            img = Nifti1Image(data_warp_curved2straight, None, hdr_warp_s)
-            save(img, 'tmp.curve2straight.nii.gz')
-            logger.info('Warping field generated: tmp.curve2straight.nii.gz')
+            data_warp_curved2straight.flush()
+            del data_warp_curved2straight
+            logger.info('Warping field generated: tmp.curve2straight.nii')
 
         if self.straight2curved:
-            img = Nifti1Image(data_warp_straight2curved, None, hdr_warp)
-            save(img, 'tmp.straight2curve.nii.gz')
-            logger.info('Warping field generated: tmp.straight2curve.nii.gz')
+            data_warp_straight2curved.flush()
+            del data_warp_straight2curved
+            logger.info('Warping field generated: tmp.straight2curve.nii')
 
         image_centerline_straight.save(fname_ref)
-        if self.curved2straight:
-            logger.info('Apply transformation to input image...')
-            sct_apply_transfo.main(['-i', 'data.nii',
-                                    '-d', fname_ref,
-                                    '-w', 'tmp.curve2straight.nii.gz',
-                                    '-o', 'tmp.anat_rigid_warp.nii.gz',
-                                    '-x', 'spline',
-                                    '-v', '0'])
 
-
-        if self.accuracy_results:
-            time_accuracy_results = time.time()
-            # compute the error between the straightened centerline/segmentation and the central vertical line.
-            # Ideally, the error should be zero.
-            # Apply deformation to input image
-            logger.info('Apply transformation to centerline image...')
-            sct_apply_transfo.main(['-i', 'centerline.nii.gz',
-                                    '-d', fname_ref,
-                                    '-w', 'tmp.curve2straight.nii.gz',
-                                    '-o', 'tmp.centerline_straight.nii.gz',
-                                    '-x', 'nn',
-                                    '-v', '0'])
-            file_centerline_straight = Image('tmp.centerline_straight.nii.gz', verbose=verbose)
-            nx, ny, nz, nt, px, py, pz, pt = file_centerline_straight.dim
-            coordinates_centerline = file_centerline_straight.getNonZeroCoordinates(sorting='z')
-            mean_coord = []
-            for z in range(coordinates_centerline[0].z, coordinates_centerline[-1].z):
-                temp_mean = [coord.value for coord in coordinates_centerline if coord.z == z]
-                if temp_mean:
-                    mean_value = np.mean(temp_mean)
-                    mean_coord.append(
-                        np.mean([[coord.x * coord.value / mean_value, coord.y * coord.value / mean_value]
-                                 for coord in coordinates_centerline if coord.z == z], axis=0))
-
-            # compute error between the straightened centerline and the straight line.
-            x0 = file_centerline_straight.data.shape[0] / 2.0
-            y0 = file_centerline_straight.data.shape[1] / 2.0
-            count_mean = 0
-            if number_of_points >= 10:
-                mean_c = mean_coord[2:-2]  # we don't include the four extrema because there are usually messy.
-            else:
-                mean_c = mean_coord
-            for coord_z in mean_c:
-                if not np.isnan(np.sum(coord_z)):
-                    dist = ((x0 - coord_z[0]) * px) ** 2 + ((y0 - coord_z[1]) * py) ** 2
-                    self.mse_straightening += dist
-                    dist = np.sqrt(dist)
-                    if dist > self.max_distance_straightening:
-                        self.max_distance_straightening = dist
-                    count_mean += 1
-            self.mse_straightening = np.sqrt(self.mse_straightening / float(count_mean))
-
-            self.elapsed_time_accuracy = time.time() - time_accuracy_results
-
-        os.chdir(curdir)
-
-        # Generate output file (in current folder)
-        # TODO: do not uncompress the warping field, it is too time consuming!
-        logger.info('Generate output files...')
-        if self.curved2straight:
-            generate_output_file(os.path.join(path_tmp, "tmp.curve2straight.nii.gz"),
-                                     os.path.join(self.path_output, "warp_curve2straight.nii.gz"), verbose)
-        if self.straight2curved:
-            generate_output_file(os.path.join(path_tmp, "tmp.straight2curve.nii.gz"),
-                                     os.path.join(self.path_output, "warp_straight2curve.nii.gz"), verbose)
-
-        # create ref_straight.nii.gz file that can be used by other SCT functions that need a straight reference space
-        if self.curved2straight:
-            copy(os.path.join(path_tmp, "tmp.anat_rigid_warp.nii.gz"),
-                     os.path.join(self.path_output, "straight_ref.nii.gz"))
-            # move straightened input file
-            if fname_output == '':
-                fname_straight = generate_output_file(os.path.join(path_tmp, "tmp.anat_rigid_warp.nii.gz"),
-                                                          os.path.join(self.path_output,
-                                                                       file_anat + "_straight" + ext_anat), verbose)
-            else:
-                fname_straight = generate_output_file(os.path.join(path_tmp, "tmp.anat_rigid_warp.nii.gz"),
-                                                          os.path.join(self.path_output, fname_output),
-                                                          verbose)  # straightened anatomic
-
-        # Remove temporary files
-        if remove_temp_files:
-            logger.info('Remove temporary files...')
-            rmtree(path_tmp)
-
-        if self.accuracy_results:
-            logger.info('Maximum x-y error: {} mm'.format(self.max_distance_straightening))
-            logger.info('Accuracy of straightening (MSE): {} mm'.format(self.mse_straightening))
-
-        # display elapsed time
-        self.elapsed_time = int(np.round(time.time() - start_time))
-
-        return fname_straight
+        return fname_ref, number_of_points
 
 
 def _get_centerline(img, param_centerline, verbose):
@@ -627,3 +668,155 @@ def _get_centerline(img, param_centerline, verbose):
     # Construct centerline object
     return Centerline(x_centerline.tolist(), y_centerline.tolist(), z_centerline.tolist(),
                       x_centerline_deriv.tolist(), y_centerline_deriv.tolist(), z_centerline_deriv.tolist())
+
+
+def _get_chunks(nx, ny, nz, chunk_size):
+    """
+    Split the slices of a volume into chunks of consecutive slices.
+
+    :param nx, ny, nz: dimensions of the volume
+    :param chunk_size: maximum number of voxels per chunk. Chunks have at least one slice.
+    :return: list of (z_start, z_end) tuples
+    """
+    n_slices = max(1, chunk_size // (nx * ny))
+    return [(z_start, min(z_start + n_slices, nz)) for z_start in range(0, nz, n_slices)]
+
+
+def _get_voxel_indexes(nx, ny, z_start, z_end):
+    """
+    :return: (nx * ny * (z_end - z_start), 3) array with the indexes of all voxels of slices [z_start, z_end[. Indexes
+    are ordered like np.mgrid[0:nx, 0:ny, z_start:z_end].reshape(3, -1).T, so that arrays computed from them can be
+    reshaped to (nx, ny, z_end - z_start).
+    """
+    return np.mgrid[0:nx, 0:ny, z_start:z_end].reshape(3, -1).T
+
+
+def _fill_warping_field(data_warp, compute_displacements, chunk_size, jobs=1):
+    """
+    Fill a warping field chunk by chunk.
+
+    Chunks are independent, so they can be computed by several threads: KD-tree queries and numpy operations on large
+    arrays release the GIL, and threads share the memory-mapped warping field, which they write into directly. Note
+    that peak memory usage grows with the number of chunks computed simultaneously.
+
+    :param data_warp: (nx, ny, nz, 1, 3) array, as returned by _create_warping_field()
+    :param compute_displacements: function which takes a (n, 3) array of voxel indexes and returns the (n, 3) \
+    displacements of these voxels
+    :param chunk_size: maximum number of voxels per chunk
+    :param jobs: number of threads
+    """
+    nx, ny, nz = data_warp.shape[:3]
+    chunks = _get_chunks(nx, ny, nz, chunk_size)
+
+    def fill_chunk(chunk):
+        z_start, z_end = chunk
+        displacements = compute_displacements(_get_voxel_indexes(nx, ny, z_start, z_end))
+        data_warp[:, :, z_start:z_end, 0, :] = -displacements.reshape(nx, ny, z_end - z_start, 3)
+
+    if jobs == 1:
+        for chunk in sct_progress_bar(chunks):
+            fill_chunk(chunk)
+    else:
+        with ThreadPool(jobs) as pool:
+            for _ in sct_progress_bar(pool.imap_unordered(fill_chunk, chunks), total=len(chunks)):
+                pass
+
+
+def _compute_displacements_curved2straight(indexes_straight, image_centerline_straight, centerline_straight,
+                                           centerline, lookup_straight2curved, threshold_distance):
+    """
+    Compute the displacements from voxels of the straight space to the curved space.
+
+    :param indexes_straight: (n, 3) array of voxel indexes in the straight space
+    :return: (n, 3) float32 array of displacements, in the ITK physical coordinate system
+    """
+    physical_coordinates_straight = image_centerline_straight.transfo_pix2phys(indexes_straight)
+    nearest_indexes_straight = centerline_straight.find_nearest_indexes(physical_coordinates_straight)
+    distances_straight = centerline_straight.get_distances_from_planes(physical_coordinates_straight,
+                                                                       nearest_indexes_straight)
+    lookup = lookup_straight2curved[nearest_indexes_straight]
+    indexes_out_distance_straight = np.logical_or(
+        np.logical_or(distances_straight > threshold_distance,
+                      distances_straight < -threshold_distance), lookup == 0)
+    projected_points_straight = centerline_straight.get_projected_coordinates_on_planes(
+        physical_coordinates_straight, nearest_indexes_straight)
+    coord_in_planes_straight = centerline_straight.get_in_plans_coordinates(projected_points_straight,
+                                                                            nearest_indexes_straight)
+
+    coord_straight2curved = centerline.get_inverse_plans_coordinates(coord_in_planes_straight, lookup)
+    displacements_straight = coord_straight2curved - physical_coordinates_straight
+    # Invert Z coordinate as ITK & ANTs physical coordinate system is LPS- (RAI+)
+    # while ours is LPI-
+    # Refs: https://sourceforge.net/p/advants/discussion/840261/thread/2a1e9307/#fb5a
+    #  https://www.slicer.org/wiki/Coordinate_systems
+    displacements_straight[:, 2] = -displacements_straight[:, 2]
+    displacements_straight[indexes_out_distance_straight] = [100000.0, 100000.0, 100000.0]
+    return displacements_straight.astype(np.float32)
+
+
+def _compute_displacements_straight2curved(indexes, image_centerline_pad, centerline, centerline_straight,
+                                           lookup_curved2straight, threshold_distance):
+    """
+    Compute the displacements from voxels of the curved space to the straight space.
+
+    :param indexes: (n, 3) array of voxel indexes in the curved space
+    :return: (n, 3) float32 array of displacements, in the ITK physical coordinate system
+    """
+    physical_coordinates = image_centerline_pad.transfo_pix2phys(indexes)
+    nearest_indexes_curved = centerline.find_nearest_indexes(physical_coordinates)
+    distances_curved = centerline.get_distances_from_planes(physical_coordinates,
+                                                            nearest_indexes_curved)
+    lookup = lookup_curved2straight[nearest_indexes_curved]
+    indexes_out_distance_curved = np.logical_or(
+        np.logical_or(distances_curved > threshold_distance,
+                      distances_curved < -threshold_distance), lookup == 0)
+    projected_points_curved = centerline.get_projected_coordinates_on_planes(physical_coordinates,
+                                                                             nearest_indexes_curved)
+    coord_in_planes_curved = centerline.get_in_plans_coordinates(projected_points_curved,
+                                                                 nearest_indexes_curved)
+
+    coord_curved2straight = centerline_straight.points[lookup]
+    coord_curved2straight[:, 0:2] += coord_in_planes_curved[:, 0:2]
+    coord_curved2straight[:, 2] += distances_curved
+
+    displacements_curved = coord_curved2straight - physical_coordinates
+
+    displacements_curved[:, 2] = -displacements_curved[:, 2]
+    displacements_curved[indexes_out_distance_curved] = [100000.0, 100000.0, 100000.0]
+    return displacements_curved.astype(np.float32)
+
+
+def _create_warping_field(fname, hdr, shape):
+    """
+    Create an uncompressed NIfTI warping field filled with zeros, and return its data as a writable memory-mapped
+    array. This way, the warping field can be filled chunk by chunk without holding the whole volume in memory.
+
+    :param fname: output file name (.nii)
+    :param hdr: header of the image which defines the space of the warping field
+    :param shape: (nx, ny, nz) spatial dimensions of the warping field
+    :return: np.memmap of shape (nx, ny, nz, 1, 3) and dtype float32
+    """
+    hdr = hdr.copy()
+    hdr.set_data_shape(tuple(shape) + (1, 3))
+    hdr.set_data_dtype('float32')
+    hdr.set_intent('vector', (), '')
+    hdr.set_slope_inter(1, 0)
+    hdr['vox_offset'] = 0  # Will be set to the minimum value when writing the header
+    with open(fname, 'wb') as f:
+        hdr.write_to(f)
+        offset = hdr.get_data_offset()
+        f.write(b'\x00' * (offset - f.tell()))
+        # Allocate the data block without writing it (zero-filled)
+        f.truncate(offset + int(np.prod(shape)) * 3 * 4)
+    return np.memmap(fname, dtype=hdr.get_data_dtype(), mode='r+', offset=offset, shape=tuple(shape) + (1, 3),
+                     order='F')
+
+
+def _compress_nifti(fname_in, fname_out):
+    """
+    Compress an uncompressed NIfTI file (.nii) into fname_out (.nii.gz), by streaming it through gzip (i.e. without
+    loading the data into memory).
+    """
+    with open(fname_in, 'rb') as f_in, gzip.open(fname_out, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    logger.info("File created: %s", fname_out)
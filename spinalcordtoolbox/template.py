@@ -8,6 +8,25 @@ import numpy as np
 logger = logging.getLogger(__name__)
 
 
+def get_vertebral_level_per_slice(im_vertlevel):
+    """
+    Find the vertebral level of all the slices at once.
+    Important: This function assumes that the 3rd dimension is Z.
+    :param im_vertlevel: image object of vertebral labeling (e.g., label/template/PAM50_levels.nii.gz)
+    :return: ndarray: vertebral level of each slice, i.e. the average of its non-null and finite values rounded to the \
+    closest integer (nan for the slices without such values).
+    """
+    data_vertlevel = im_vertlevel.data.reshape(-1, im_vertlevel.data.shape[-1])
+    # fetch non-null and finite values
+    valid = (data_vertlevel != 0) & np.isfinite(data_vertlevel)
+    n_valid = valid.sum(axis=0)
+    sum_valid = np.where(valid, data_vertlevel, 0).sum(axis=0, dtype=np.float64)
+    # average non-null values and round to closest (avoid empty slices)
+    levels = np.full(data_vertlevel.shape[-1], np.nan)
+    levels[n_valid > 0] = np.round(sum_valid[n_valid > 0] / n_valid[n_valid > 0])
+    return levels
+
+
 def get_slices_from_vertebral_levels(im_vertlevel, level):
     """
     Find the slices of the corresponding vertebral level.
@@ -16,21 +35,7 @@ def get_slices_from_vertebral_levels(im_vertlevel, level):
     :param level: int: vertebral level
     :return: list of int: slices
     """
-    data_vertlevel = im_vertlevel.data
-    slices = []
-    # loop across z
-    for iz in range(data_vertlevel.shape[-1]):
-        # fetch non-null and finite values
-        data_vertlevel_nonzero = data_vertlevel[..., iz].flatten()[np.nonzero(data_vertlevel[..., iz].flatten())]
-        data_vertlevel_nonzero_finite = [i for i in data_vertlevel_nonzero if np.isfinite(i)]
-        # avoid empty slice
-        if not data_vertlevel_nonzero_finite == []:
-            # average non-null values and round to closest
-            average_value = int(np.round(np.mean(data_vertlevel_nonzero_finite)))
-            # if that matches the desired level, append it to slice list
-            if average_value == level:
-                slices.append(iz)
-    return slices
+    return np.flatnonzero(get_vertebral_level_per_slice(im_vertlevel) == level).tolist()
 
 
 def get_vertebral_level_from_slice(im_vertlevel, idx_slice):
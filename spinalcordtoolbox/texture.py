@@ -0,0 +1,161 @@
+#########################################################################################
+#
+# Grey level co-occurrence matrix (GLCM) texture features, computed in a sliding window.
+#
+# ---------------------------------------------------------------------------------------
+# Copyright (c) 2020 Polytechnique Montreal <www.neuro.polymtl.ca>
+#
+# About the license: see the file LICENSE.TXT
+#########################################################################################
+
+import logging
+import math
+import multiprocessing
+
+import numpy as np
+from scipy import ndimage
+
+from spinalcordtoolbox.utils import sct_progress_bar
+
+logger = logging.getLogger(__name__)
+
+# Properties of skimage.feature.greycoprops
+GLCM_FEATURES = ('contrast', 'dissimilarity', 'homogeneity', 'energy', 'correlation', 'ASM')
+
+
+def glcm_offset(distance, angle):
+    """
+    Offset (row, column) between the two pixels of the pairs of a GLCM, as in skimage.feature.greycomatrix.
+
+    :param distance: int: distance in pixels
+    :param angle: angle in degrees
+    """
+    # Same computation as skimage (with the sin/cos of libm, and rounded as floor(x + 0.5)): e.g. sin(30°) =
+    # 0.49999999999999994 is rounded to 1
+    angle = np.radians(angle)
+    return math.floor(math.sin(angle) * distance + 0.5), math.floor(math.cos(angle) * distance + 0.5)
+
+
+def get_valid_centers(seg, distance):
+    """
+    Pixels of a 2D mask whose window (of size 2 * distance + 1) is entirely inside the slice and the mask.
+    """
+    size = 2 * distance + 1
+    return ndimage.minimum_filter(np.asarray(seg) != 0, size=size, mode='constant', cval=0).astype(bool)
+
+
+def _count_equal_pairs(keys):
+    """Number of pairs (p < q) of equal values along the first axis of a 2D array, for each column."""
+    keys = np.sort(keys, axis=0)
+    n = keys.shape[0]
+    index = np.arange(n)[:, np.newaxis]
+    # Index of the first element of the run of equal values of each element
+    run_start = np.where(np.concatenate([np.ones((1, keys.shape[1]), dtype=bool), keys[1:] != keys[:-1]]), index, 0)
+    run_start = np.maximum.accumulate(run_start, axis=0)
+    return np.sum(index - run_start, axis=0)
+
+
+def glcm_features_slice(data, seg, distance, angles, features=GLCM_FEATURES):
+    """
+    GLCM texture features of the window centered on each pixel of a 2D slice, for the pixels whose window is entirely
+    inside the mask.
+
+    Same output as greycoprops(greycomatrix(window.astype(np.uint8), [distance], [np.radians(angle)], symmetric=True,
+    normed=True), feature) computed for each window of size 2 * distance + 1 (as previously done by
+    sct_analyze_texture), but the co-occurrences of all the windows are counted at once: each feature is an average
+    over the pairs of pixels of the window, except energy and ASM, which are computed from the number of identical
+    pairs.
+
+    :param data: 2D array (cast to uint8, as for greycomatrix)
+    :param seg: 2D mask
+    :param distance: int: distance between the pixels of the pairs, and half-size of the window
+    :param angles: list of angles in degrees
+    :param features: list of features (see GLCM_FEATURES)
+    :return: dict {(feature, angle): 2D array of the feature (zero outside the valid window centers)}
+    """
+    for feature in features:
+        if feature not in GLCM_FEATURES:
+            raise ValueError("{} is an invalid property".format(feature))
+    image = np.asarray(data).astype(np.uint8).astype(np.int64)
+    centers = np.argwhere(get_valid_centers(seg, distance))
+    maps = {(feature, angle): np.zeros(image.shape) for feature in features for angle in angles}
+    if len(centers) == 0:
+        return maps
+    positions = tuple(centers.T)
+
+    window = range(-distance, distance + 1)
+    for angle in angles:
+        offset_row, offset_col = glcm_offset(distance, angle)
+        # Pairs of pixels (first pixel at the offset (u, v) from the center) inside the window
+        starts = [(u, v) for u in window for v in window
+                  if -distance <= u + offset_row <= distance and -distance <= v + offset_col <= distance]
+        a = np.stack([image[centers[:, 0] + u, centers[:, 1] + v] for u, v in starts])
+        b = np.stack([image[centers[:, 0] + u + offset_row, centers[:, 1] + v + offset_col] for u, v in starts])
+        n_pairs = len(starts)
+        diff = a - b
+
+        for feature in features:
+            if feature == 'contrast':
+                values = np.mean(diff ** 2, axis=0)
+            elif feature == 'dissimilarity':
+                values = np.mean(np.abs(diff), axis=0)
+            elif feature == 'homogeneity':
+                values = np.mean(1. / (1. + diff ** 2), axis=0)
+            elif feature in ['energy', 'ASM']:
+                # ASM = sum(P ** 2), where P = (C + C.T) / (2 * n_pairs) and C counts the pairs (i, j). With u the
+                # number of unordered pairs {i, j}: ASM = (sum(u ** 2) + sum(u ** 2 for i == j)) / (2 * n_pairs ** 2)
+                keys = np.minimum(a, b) * 256 + np.maximum(a, b)
+                keys_diag = np.where(a == b, a, -1 - np.arange(n_pairs)[:, np.newaxis])
+                n_diag = np.sum(a == b, axis=0)
+                sum_u2 = n_pairs + 2 * _count_equal_pairs(keys)
+                sum_u2_diag = n_diag + 2 * _count_equal_pairs(keys_diag)
+                values = (sum_u2 + sum_u2_diag) / (2. * n_pairs ** 2)
+                if feature == 'energy':
+                    values = np.sqrt(values)
+            elif feature == 'correlation':
+                mean = np.mean(a + b, axis=0) / 2.
+                var = np.mean(((a - mean) ** 2 + (b - mean) ** 2) / 2., axis=0)
+                cov = np.mean((a - mean) * (b - mean), axis=0)
+                std = np.sqrt(var)
+                # As in greycoprops: the correlation of a constant window is 1
+                values = np.ones(len(centers))
+                values[std >= 1e-15] = cov[std >= 1e-15] / var[std >= 1e-15]
+            maps[feature, angle][positions] = values
+    return maps
+
+
+def _glcm_features_slice(args):
+    return glcm_features_slice(*args)
+
+
+def glcm_features(data, seg, distance, angles, features=GLCM_FEATURES, jobs=1):
+    """
+    GLCM texture features of the windows centered on each pixel of the 2D slices of a volume (see
+    glcm_features_slice()).
+
+    :param data: 3D array, with the slices along the last axis
+    :param seg: 3D mask
+    :param distance: int: distance between the pixels of the pairs, and half-size of the window
+    :param angles: list of angles in degrees
+    :param features: list of features (see GLCM_FEATURES)
+    :param jobs: number of processes used to compute the slices in parallel
+    :return: dict {(feature, angle): 3D array of the feature}
+    """
+    maps = {(feature, angle): np.zeros(data.shape) for feature in features for angle in angles}
+    slices = [z for z in range(data.shape[2]) if np.any(seg[:, :, z])]
+    args = [(data[:, :, z], seg[:, :, z], distance, angles, features) for z in slices]
+
+    with sct_progress_bar(total=len(slices), unit='slice') as pbar:
+        if jobs > 1:
+            with multiprocessing.Pool(jobs) as pool:
+                results = pool.imap(_glcm_features_slice, args)
+                for z, maps_z in zip(slices, results):
+                    for key, map_z in maps_z.items():
+                        maps[key][:, :, z] = map_z
+                    pbar.update(1)
+        else:
+            for z, args_z in zip(slices, args):
+                for key, map_z in glcm_features_slice(*args_z).items():
+                    maps[key][:, :, z] = map_z
+                pbar.update(1)
+    return maps
@@ -13,8 +13,11 @@
 # About the license: see the file LICENSE.TXT
 #########################################################################################
 
+import struct
+import zipfile
+
 from numpy import dot, cross, array, dstack, einsum, tile, multiply, stack, rollaxis, zeros
-from numpy.linalg import norm, inv
+from numpy.linalg import norm
 import numpy as np
 from scipy.spatial import cKDTree
 
@@ -170,6 +173,40 @@ class CoordinateValue(Coordinate):
         return hash(self.value)
 
 
+def _load_npz(fname):
+    """
+    Load the arrays of an .npz file written by np.savez(). The arrays that are stored without compression (as done by
+    np.savez()) are memory-mapped (copy-on-write) instead of being read, the others are loaded with np.load().
+
+    :param fname: str: .npz file
+    :return: dict {name: ndarray}
+    """
+    arrays = {}
+    with zipfile.ZipFile(fname) as archive, open(fname, 'rb') as f:
+        for info in archive.infolist():
+            name = info.filename[:-len('.npy')] if info.filename.endswith('.npy') else info.filename
+            array_mmap = None
+            if info.compress_type == zipfile.ZIP_STORED:
+                # Skip the local header of the member (30 bytes, then the file name and the extra field)
+                f.seek(info.header_offset)
+                name_length, extra_length = struct.unpack('<HH', f.read(30)[26:30])
+                f.seek(info.header_offset + 30 + name_length + extra_length)
+                version = np.lib.format.read_magic(f)
+                if version == (1, 0):
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+                else:
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+                if not dtype.hasobject and np.prod(shape, dtype=int) > 0:
+                    array_mmap = np.memmap(f, dtype=dtype, mode='c', shape=shape,
+                                           order='F' if fortran_order else 'C', offset=f.tell())
+            if array_mmap is not None:
+                arrays[name] = array_mmap.view(np.ndarray)
+            else:
+                with archive.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member, allow_pickle=False)
+    return arrays
+
+
 class Centerline:
     """
     This class represents a centerline in an image. Its coordinates can be in voxel space as well as in physical space.
@@ -223,26 +260,31 @@ class Centerline:
 
     def __init__(self, points_x=None, points_y=None, points_z=None, deriv_x=None, deriv_y=None, deriv_z=None,
                  fname=None):
-        # initialization of variables
-        self.length = 0.0
-        self.progressive_length = [0.0]
-        self.progressive_length_inverse = [0.0]
-        self.incremental_length = [0.0]
-        self.incremental_length_inverse = [0.0]
-
+        """
+        The centerline is stored as arrays, one row per point: points and derivatives (N, 3), coordinate system of the
+        plane of each point (matrices and inverse_matrices (N, 3, 3)), plane parameters (N, 4) and lengths (N,).
+
+        :param points_x, points_y, points_z: coordinates of the points
+        :param deriv_x, deriv_y, deriv_z: derivatives at the points (normalized when the centerline is initialized)
+        :param fname: file saved by save_centerline() (.npz), used instead of the points and derivatives. Its arrays \
+        are memory-mapped (copy-on-write) instead of read, and the coordinate systems are not computed again if they \
+        were saved with the centerline.
+        """
         # variables used for vertebral distribution
         self.first_label, self.last_label = None, None
         self.disks_levels = None
         self.label_reference = None
 
         self.compute_init_distribution = False
+        matrices = None
 
         if fname is not None:
             # Load centerline data from file
-            centerline_file = np.load(fname)
+            centerline_file = _load_npz(fname)
 
             self.points = centerline_file['points']
             self.derivatives = centerline_file['derivatives']
+            matrices = centerline_file.get('matrices')
 
             if 'disks_levels' in centerline_file:
                 self.disks_levels = centerline_file['disks_levels'].tolist()
@@ -255,19 +297,21 @@ class Centerline:
             # Load centerline data from points and derivatives in parameters
             if points_x is None or points_y is None or points_z is None or deriv_x is None or deriv_y is None or deriv_z is None:
                 raise ValueError('Data must be provided to centerline to be initialized')
-            self.points = np.array(list(zip(points_x, points_y, points_z)))
-            self.derivatives = array(list(zip(deriv_x, deriv_y, deriv_z)))
+            self.points = np.stack([np.asarray(points_x), np.asarray(points_y), np.asarray(points_z)], axis=1)
+            self.derivatives = np.stack([np.asarray(deriv_x), np.asarray(deriv_y), np.asarray(deriv_z)], axis=1)
 
         self.number_of_points = len(self.points)
 
         # computation of centerline features, based on points and derivatives
         self.compute_length()
-        self.coordinate_system = [self.compute_coordinate_system(index) for index in range(0, self.number_of_points)]
-        self.plans_parameters = [self.get_plan_parameters(index) for index in range(0, self.number_of_points)]
-
-        self.matrices = stack([item[4] for item in self.coordinate_system])
-        self.inverse_matrices = stack([item[5] for item in self.coordinate_system])
-        self.offset_plans = array([item[3] for item in self.plans_parameters])
+        if matrices is None:
+            self.compute_coordinate_systems()
+        else:
+            self.matrices = matrices
+            # The base is orthonormal: its inverse is its transpose
+            self.inverse_matrices = matrices.transpose(0, 2, 1)
+        self.plans_parameters = self.compute_plans_parameters()
+        self.offset_plans = self.plans_parameters[:, 3]
 
         # initialization of KDTree for enabling computation of nearest points in centerline
         self.tree_points = cKDTree(self.points)
@@ -276,19 +320,18 @@ class Centerline:
             self.compute_vertebral_distribution(disks_levels=self.disks_levels, label_reference=self.label_reference)
 
     def compute_length(self):
-        for i in range(0, self.number_of_points - 1):
-            distance = np.sqrt((self.points[i][0] - self.points[i + 1][0]) ** 2 +
-                            (self.points[i][1] - self.points[i + 1][1]) ** 2 +
-                            (self.points[i][2] - self.points[i + 1][2]) ** 2)
-            self.length += distance
-            self.progressive_length.append(distance)
-            self.incremental_length.append(self.incremental_length[-1] + distance)
-        for i in range(self.number_of_points - 1, 0, -1):
-            distance = np.sqrt((self.points[i][0] - self.points[i - 1][0]) ** 2 +
-                            (self.points[i][1] - self.points[i - 1][1]) ** 2 +
-                            (self.points[i][2] - self.points[i - 1][2]) ** 2)
-            self.progressive_length_inverse.append(distance)
-            self.incremental_length_inverse.append(self.incremental_length_inverse[-1] + distance)
+        """
+        Compute the distance between consecutive points (progressive_length: distance from the previous point, 0 for
+        the first one), the distance along the centerline from the first point (incremental_length), the same from the
+        last point (*_inverse, ordered from the last point) and the total length.
+        """
+        dx, dy, dz = np.diff(self.points, axis=0).T
+        distances = np.sqrt(dx ** 2 + dy ** 2 + dz ** 2)
+        self.progressive_length = np.concatenate([[0.0], distances])
+        self.incremental_length = np.concatenate([[0.0], np.cumsum(distances)])
+        self.progressive_length_inverse = np.concatenate([[0.0], distances[::-1]])
+        self.incremental_length_inverse = np.concatenate([[0.0], np.cumsum(distances[::-1])])
+        self.length = float(self.incremental_length[-1])
 
     def find_nearest_index(self, coord):
         """
@@ -320,6 +363,17 @@ class Centerline:
         """
         return self.points[index]
 
+    def compute_plans_parameters(self):
+        """
+        This function returns the parameters of the parametric equations of the planes at all the points.
+
+        :return: ndarray (N, 4): parameters [a, b, c, d] of each plane, corresponding to plane parametric equation \
+        a*x + b*y + c*z + d = 0
+        """
+        d = - (self.derivatives[:, 0] * self.points[:, 0] + self.derivatives[:, 1] * self.points[:, 1] +
+               self.derivatives[:, 2] * self.points[:, 2])
+        return np.concatenate([self.derivatives, d[:, np.newaxis]], axis=1)
+
     def get_plan_parameters(self, index):
         """
         This function returns the parameters of the parametric equation of the plane at index.
@@ -328,16 +382,11 @@ class Centerline:
         :return: List of parameters [a, b, c, d], corresponding to plane parametric equation a*x + b*y + c*z + d = 0
         """
         if 0 <= index < self.number_of_points:
-            a = self.derivatives[index][0]
-            b = self.derivatives[index][1]
-            c = self.derivatives[index][2]
-            d = - (a * self.points[index][0] + b * self.points[index][1] + c * self.points[index][2])
+            return list(self.plans_parameters[index])
         else:
             raise IndexError('ERROR in types.Centerline.get_plan_parameters: index (' + str(index) + ') should be '
                              'within [' + str(0) + ', ' + str(self.number_of_points) + '[.')
 
-        return [a, b, c, d]
-
     def get_distance_from_plane(self, coord, index, plane_params=None):
         """
         This function returns the distance between a coordinate and the plan at index position.
@@ -373,39 +422,46 @@ class Centerline:
         """
         if index is None:
             index = self.find_nearest_index(coord)
-        plane_params = self.plans_parameters[index]
+        plane_params = self.get_plan_parameters(index)
         distance = self.get_distance_from_plane(coord, index, plane_params=plane_params)
 
         return index, plane_params, distance
 
+    def compute_coordinate_systems(self):
+        """
+        This function computes the coordinate reference system (X, Y, and Z axes) of the plane of each point of the
+        centerline, and normalizes the derivatives (Z axes).
+
+        The Z axis is the derivative, the Y axis is the projection of [0, 1, 0] on the plane and the X axis is their
+        cross product: matrices[i] has the X, Y and Z axes as columns, and inverse_matrices[i] is its transpose since
+        the base is orthonormal.
+        """
+        z_prime_axis = self.derivatives / norm(self.derivatives, axis=1)[:, np.newaxis]
+        # y_axis - dot(y_axis, z_prime_axis) * z_prime_axis, with y_axis = [0, 1, 0]
+        y_prime_axis = array([0, 1, 0]) - z_prime_axis[:, [1]] * z_prime_axis
+        y_prime_axis /= norm(y_prime_axis, axis=1)[:, np.newaxis]
+        x_prime_axis = cross(y_prime_axis, z_prime_axis)
+        x_prime_axis /= norm(x_prime_axis, axis=1)[:, np.newaxis]
+
+        self.derivatives = z_prime_axis
+        self.matrices = stack([x_prime_axis, y_prime_axis, z_prime_axis], axis=2)
+        self.inverse_matrices = self.matrices.transpose(0, 2, 1)
+
     def compute_coordinate_system(self, index):
         """
-        This function computes the cordinate reference system (X, Y, and Z axes) for a given index of centerline.
+        This function returns the cordinate reference system (X, Y, and Z axes) for a given index of centerline.
 
         :param index: int
-        :return:
+        :return: origin, x_prime_axis, y_prime_axis, z_prime_axis, matrix_base, inverse_matrix
         """
         if 0 <= index < self.number_of_points:
-            origin = self.points[index]
-            z_prime_axis = self.derivatives[index]
-            z_prime_axis /= norm(z_prime_axis)
-            y_axis = array([0, 1, 0])
-            y_prime_axis = (y_axis - dot(y_axis, z_prime_axis) * z_prime_axis)
-            y_prime_axis /= norm(y_prime_axis)
-            x_prime_axis = cross(y_prime_axis, z_prime_axis)
-            x_prime_axis /= norm(x_prime_axis)
-
-            matrix_base = array([[x_prime_axis[0], y_prime_axis[0], z_prime_axis[0]],
-                                 [x_prime_axis[1], y_prime_axis[1], z_prime_axis[1]],
-                                 [x_prime_axis[2], y_prime_axis[2], z_prime_axis[2]]])
-
-            inverse_matrix = inv(matrix_base)
+            matrix_base = self.matrices[index]
+            return (self.points[index], matrix_base[:, 0], matrix_base[:, 1], matrix_base[:, 2], matrix_base,
+                    self.inverse_matrices[index])
         else:
             raise IndexError('ERROR in types.Centerline.compute_coordinate_system: index (' + str(index) + ') '
                              'should be within [' + str(0) + ', ' + str(self.number_of_points) + '[.')
 
-        return origin, x_prime_axis, y_prime_axis, z_prime_axis, matrix_base, inverse_matrix
-
     def get_projected_coordinates_on_plane(self, coord, index, plane_params=None):
         """
         This function returns the coordinates of
@@ -436,8 +492,7 @@ class Centerline:
         :return:
         """
         if 0 <= index < self.number_of_points:
-            origin, x_prime_axis, y_prime_axis, z_prime_axis, matrix_base, inverse_matrix = self.coordinate_system[index]
-            return inverse_matrix.dot(coord - origin)
+            return self.inverse_matrices[index].dot(coord - self.points[index])
         else:
             raise IndexError('ERROR in types.Centerline.compute_coordinate_system: index (' + str(index) + ') '
                              'should be within [' + str(0) + ', ' + str(self.number_of_points) + '[.')
@@ -693,22 +748,19 @@ class Centerline:
 
             image_output.save(fname_output, dtype='float32')
         else:
-            # save a .centerline file containing the centerline
+            # save a .centerline file containing the centerline (uncompressed, so that it is memory-mapped when
+            # loaded), with the coordinate systems, which are not computed again
             if self.disks_levels is None:
-                np.savez(fname_output, points=self.points, derivatives=self.derivatives)
+                np.savez(fname_output, points=self.points, derivatives=self.derivatives, matrices=self.matrices)
             else:
-                np.savez(fname_output, points=self.points, derivatives=self.derivatives,
+                np.savez(fname_output, points=self.points, derivatives=self.derivatives, matrices=self.matrices,
                          disks_levels=self.disks_levels, label_reference=self.label_reference)
 
     def average_coordinates_over_slices(self, image):
         # extracting points information for each coordinates
-        P_x = np.array([point[0] for point in self.points])
-        P_y = np.array([point[1] for point in self.points])
-        P_z = np.array([point[2] for point in self.points])
-        P_z_vox = np.array([coord[2] for coord in image.transfo_phys2pix(self.points)])
-        P_x_d = np.array([deriv[0] for deriv in self.derivatives])
-        P_y_d = np.array([deriv[1] for deriv in self.derivatives])
-        P_z_d = np.array([deriv[2] for deriv in self.derivatives])
+        P_x, P_y, P_z = self.points.T
+        P_z_vox = np.asarray(image.transfo_phys2pix(self.points))[:, 2]
+        P_x_d, P_y_d, P_z_d = self.derivatives.T
 
         P_z_vox = np.array([int(np.round(P_z_vox[i])) for i in range(0, len(P_z_vox))])
         # not perfect but works (if "enough" points), in order to deal with missing z slices
@@ -179,6 +179,21 @@ def cache_signature(input_files=[], input_data=[], input_params={}):
       to taking a shortcut.
 
     """
+    return "# Cache file generated by SCT\nDEPENDENCIES_SIG={}\n".format(
+        _cache_hash(input_files, input_data, input_params).hexdigest()).encode()
+
+
+def cache_key(input_files=[], input_data=[], input_params={}):
+    """
+    Create a key identifying an entry of the persistent cache (see cache_fetch() and cache_store()). The key is a hash
+    of the same inputs as cache_signature().
+
+    :return: hexadecimal string
+    """
+    return _cache_hash(input_files, input_data, input_params).hexdigest()
+
+
+def _cache_hash(input_files, input_data, input_params):
     import hashlib
     h = hashlib.md5()
     for path in input_files:
@@ -186,18 +201,22 @@ def cache_signature(input_files=[], input_data=[], input_params={}):
             for chunk in iter(lambda: f.read(4096), b""):
                 h.update(chunk)
     for data in input_data:
-        h.update(str(type(data)))
-        try:
+        h.update(str(type(data)).encode('utf-8'))
+        if hasattr(data, 'tobytes'):
+            # numpy arrays: hash the raw buffer rather than the (truncated) string representation
+            h.update(str(getattr(data, 'dtype', '')).encode('utf-8'))
+            h.update(str(getattr(data, 'shape', '')).encode('utf-8'))
+            h.update(data.tobytes())
+        elif isinstance(data, bytes):
             h.update(data)
-        except:
-            h.update(str(data))
+        else:
+            h.update(str(data).encode('utf-8'))
     for k, v in sorted(input_params.items()):
         h.update(str(type(k)).encode('utf-8'))
         h.update(str(k).encode('utf-8'))
         h.update(str(type(v)).encode('utf-8'))
         h.update(str(v).encode('utf-8'))
-
-    return "# Cache file generated by SCT\nDEPENDENCIES_SIG={}\n".format(h.hexdigest()).encode()
+    return h
 
 
 def cache_valid(cachefile, sig_expected):
@@ -222,6 +241,93 @@ def cache_save(cachefile, sig):
         f.write(sig)
 
 
+def get_cache_dir():
+    """
+    Return the folder of the persistent cache, set by the environment variable SCT_CACHE_DIR. The cache is disabled
+    (None is returned) if this variable is not set.
+    """
+    path_cache = os.environ.get('SCT_CACHE_DIR', '')
+    if not path_cache:
+        return None
+    os.makedirs(path_cache, exist_ok=True)
+    return os.path.abspath(path_cache)
+
+
+def get_cache_size():
+    """
+    Return the maximum size of the persistent cache in bytes, set by the environment variable SCT_CACHE_SIZE (in MB,
+    default: 4096).
+    """
+    return int(float(os.environ.get('SCT_CACHE_SIZE', 4096)) * 1024 ** 2)
+
+
+def cache_fetch(path_cache, key, fnames):
+    """
+    Copy the files of a persistent cache entry to their destination.
+
+    :param path_cache: folder of the cache, see get_cache_dir()
+    :param key: key of the entry, see cache_key()
+    :param fnames: dict {name of the file in the entry: destination path}
+    :return: True if the entry exists and contains all the requested files, False otherwise
+    """
+    path_entry = os.path.join(path_cache, key)
+    if not all(os.path.isfile(os.path.join(path_entry, name)) for name in fnames):
+        return False
+    for name, fname_dest in fnames.items():
+        shutil.copyfile(os.path.join(path_entry, name), fname_dest)
+    # Mark the entry as recently used, for the LRU eviction policy
+    os.utime(path_entry)
+    logger.info("Reusing cached files from: {}".format(path_entry))
+    return True
+
+
+def cache_store(path_cache, key, fnames, max_size=None):
+    """
+    Copy files into a new persistent cache entry, then evict the least recently used entries if the cache is larger
+    than max_size.
+
+    :param path_cache: folder of the cache, see get_cache_dir()
+    :param key: key of the entry, see cache_key()
+    :param fnames: dict {name of the file in the entry: source path}
+    :param max_size: maximum size of the cache in bytes. Default: get_cache_size()
+    """
+    path_entry = os.path.join(path_cache, key)
+    # Write the entry in a temporary folder which is renamed once complete, so that concurrent processes never see
+    # partial entries
+    path_tmp = tempfile.mkdtemp(prefix='.tmp-{}-'.format(key), dir=path_cache)
+    for name, fname_src in fnames.items():
+        shutil.copyfile(fname_src, os.path.join(path_tmp, name))
+    if os.path.isdir(path_entry):
+        shutil.rmtree(path_entry, ignore_errors=True)
+    try:
+        os.rename(path_tmp, path_entry)
+    except OSError:
+        # Another process stored the same entry in the meantime
+        shutil.rmtree(path_tmp, ignore_errors=True)
+    cache_evict(path_cache, get_cache_size() if max_size is None else max_size)
+
+
+def cache_evict(path_cache, max_size):
+    """
+    Remove the least recently used entries of the persistent cache until its size is lower than max_size.
+
+    :param path_cache: folder of the cache, see get_cache_dir()
+    :param max_size: maximum size of the cache in bytes
+    """
+    entries = []
+    for entry in os.scandir(path_cache):
+        if entry.is_dir() and not entry.name.startswith('.'):
+            size = sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file())
+            entries.append((entry.stat().st_mtime, size, entry.path))
+    size_total = sum(size for _, size, _ in entries)
+    for _, size, path_entry in sorted(entries):
+        if size_total <= max_size:
+            break
+        logger.info("Evicting cache entry: {}".format(path_entry))
+        shutil.rmtree(path_entry, ignore_errors=True)
+        size_total -= size
+
+
 def mv(src, dst, verbose=1):
     """Move a file from src to dst, almost like os.rename
     """
@@ -291,7 +291,105 @@ def list2cmdline(lst):
     return " ".join(shlex.quote(x) for x in lst)
 
 
+# SCT scripts that run_proc() calls in-process (see run_proc_in_process()): they do not change global state that
+# would leak to the caller, other than what run_proc_in_process() restores.
+IN_PROCESS_SCRIPTS = [
+    'sct_apply_transfo',
+    'sct_concat_transfo',
+    'sct_crop_image',
+    'sct_image',
+    'sct_label_utils',
+    'sct_maths',
+    'sct_resample',
+    'sct_smooth_spinalcord',
+    'sct_straighten_spinalcord',
+]
+
+
+def run_proc_in_process(cmd):
+    """
+    Run an SCT script by calling its `main(argv)` in the current process, which saves the startup of a new Python
+    interpreter and the import of its modules. The script is run in a fresh copy of its module (so that module-level
+    parameters do not carry over between calls). Its output is captured, and the working directory, environment
+    variables and logging levels are restored afterwards.
+
+    :param cmd: list: command (the script name followed by its arguments)
+    :return: status, output (as returned by a subprocess)
+    """
+    import importlib.util
+    import traceback
+    from contextlib import redirect_stdout, redirect_stderr
+
+    module_name = 'spinalcordtoolbox.scripts.{}'.format(cmd[0])
+    # The module must be imported to be found by set_loglevel()
+    importlib.import_module(module_name)
+    spec = importlib.util.find_spec(module_name)
+
+    cwd = os.getcwd()
+    environ = dict(os.environ)
+    loggers = [logging.root] + [logging.getLogger(name) for name in list(logging.root.manager.loggerDict)]
+    levels = [lg.level for lg in loggers]
+    handlers = [hdlr for hdlr in logging.root.handlers
+                if isinstance(hdlr, logging.StreamHandler) and hdlr.stream in (sys.stdout, sys.stderr)]
+    output = io.StringIO()
+    streams = [hdlr.setStream(output) for hdlr in handlers]
+    try:
+        with redirect_stdout(output), redirect_stderr(output):
+            try:
+                module = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(module)
+                module.main(list(cmd[1:]))
+                status = 0
+            except SystemExit as e:
+                if e.code is None or isinstance(e.code, int):
+                    status = e.code or 0
+                else:
+                    print(e.code, file=sys.stderr)
+                    status = 1
+            except Exception:
+                traceback.print_exc()
+                status = 1
+    finally:
+        for hdlr, stream in zip(handlers, streams):
+            hdlr.setStream(stream)
+        for lg, level in zip(loggers, levels):
+            lg.setLevel(level)
+        os.chdir(cwd)
+        os.environ.clear()
+        os.environ.update(environ)
+
+    return status, output.getvalue()
+
+
+def _get_in_process_cmd(cmd, cwd, env, is_sct_binary):
+    """
+    Return the command as a list if run_proc() can run it in-process, None otherwise.
+
+    Commands run in-process are calls to an SCT script of IN_PROCESS_SCRIPTS, from the main thread, with the current
+    working directory and environment, unless the environment variable SCT_RUN_PROC_SUBPROCESS is set to 1 (in which
+    case all commands run in subprocesses).
+    """
+    import threading
+
+    if is_sct_binary or os.environ.get('SCT_RUN_PROC_SUBPROCESS', '0') == '1':
+        return None
+    if threading.current_thread() is not threading.main_thread():
+        return None
+    if (cwd is not None and os.path.abspath(cwd) != os.getcwd()) or (env is not None and env != os.environ):
+        return None
+    if isinstance(cmd, str):
+        # Commands with shell syntax need a shell
+        if any(c in cmd for c in '|&;<>()$`*?[]{}~\\"\'\n'):
+            return None
+        cmd = cmd.split()
+    if not cmd or cmd[0] not in IN_PROCESS_SCRIPTS:
+        return None
+    return list(cmd)
+
+
 def run_proc(cmd, verbose=1, raise_exception=True, cwd=None, env=None, is_sct_binary=False):
+    in_process_cmd = _get_in_process_cmd(cmd, cwd, env, is_sct_binary)
+
     if cwd is None:
         cwd = os.getcwd()
 
@@ -326,21 +424,29 @@ def run_proc(cmd, verbose=1, raise_exception=True, cwd=None, env=None, is_sct_bi
     if verbose:
         printv("%s # in %s" % (cmdline, cwd), 1, 'code')
 
-    shell = isinstance(cmd, str)
-
-    process = subprocess.Popen(cmd, shell=shell, cwd=cwd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env)
-    output_final = ''
-    while True:
-        # Watch out for deadlock!!!
-        output = process.stdout.readline().decode("utf-8")
-        if output == '' and process.poll() is not None:
-            break
-        if output:
-            if verbose == 2:
+    if in_process_cmd is not None:
+        status, output_final = run_proc_in_process(in_process_cmd)
+        if verbose == 2:
+            for output in output_final.splitlines():
                 logger.debug(f"output => {output.strip()}")
-            output_final += output.strip() + '\n'
+        output_final = ''.join(output.strip() + '\n' for output in output_final.splitlines())
+    else:
+        shell = isinstance(cmd, str)
+
+        process = subprocess.Popen(cmd, shell=shell, cwd=cwd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env)
+        output_final = ''
+        while True:
+            # Watch out for deadlock!!!
+            output = process.stdout.readline().decode("utf-8")
+            if output == '' and process.poll() is not None:
+                break
+            if output:
+                if verbose == 2:
+                    logger.debug(f"output => {output.strip()}")
+                output_final += output.strip() + '\n'
+
+        status = process.returncode
 
-    status = process.returncode
     output = output_final.rstrip()
 
     if status != 0 and raise_exception:
@@ -14,7 +14,7 @@ from scipy.signal import gaussian
 
 from spinalcordtoolbox.image import Image, add_suffix
 from spinalcordtoolbox.metadata import get_file_label
-from spinalcordtoolbox.math import dilate, mutual_information
+from spinalcordtoolbox.math import dilate, mutual_information_batch
 from spinalcordtoolbox.centerline.core import get_centerline
 
 logger = logging.getLogger(__name__)
@@ -339,6 +339,40 @@ def clean_labeled_segmentation(fname_labeled_seg, fname_seg, fname_labeled_seg_n
     img_labeled_seg_corr.save()
 
 
+def _sliding_windows_z(data, starts, size):
+    """
+    Windows of the data along z, the data being padded with zeros beyond its z bounds. The windows are taken from a
+    strided view of the data, so that they are all extracted at once.
+
+    :param data: 3d data
+    :param starts: list of int: first z of each window (can be out of the data)
+    :param size: int: size of the windows along z
+    :return: 4d array: (window, x, y, z)
+    """
+    nz = data.shape[2]
+    zmin, zmax = min(starts), max(starts) + size
+    data_padded = np.zeros(data.shape[:2] + (zmax - zmin,), dtype=data.dtype)
+    zstart, zstop = min(max(zmin, 0), nz), min(max(zmax, 0), nz)
+    if zstart < zstop:
+        data_padded[:, :, zstart - zmin:zstop - zmin] = data[:, :, zstart:zstop]
+    windows = np.lib.stride_tricks.as_strided(
+        data_padded, shape=(zmax - zmin - size + 1,) + data.shape[:2] + (size,),
+        strides=(data_padded.strides[2],) + data_padded.strides, writeable=False)
+    return windows[np.asarray(starts) - zmin]
+
+
+def _get_chunk_bottom(data, z, iz, zsize):
+    """Chunk of the data for a pattern that extends towards the bottom part of the image (see compute_corr_3d())."""
+    nz = data.shape[2]
+    if z + iz + zsize + 1 > nz:
+        padding_size = z + iz + zsize + 1 - nz
+        data_chunk3d = data[:, :, z + iz - zsize: z + iz + zsize + 1 - padding_size]
+        return np.pad(data_chunk3d, ((0, 0), (0, 0), (0, padding_size)), 'constant', constant_values=0)
+    padding_size = abs(iz - zsize)
+    data_chunk3d = data[:, :, z + iz - zsize + padding_size: z + iz + zsize + 1]
+    return np.pad(data_chunk3d, ((0, 0), (0, 0), (padding_size, 0)), 'constant', constant_values=0)
+
+
 def compute_corr_3d(src, target, x, xshift, xsize, y, yshift, ysize, z, zshift, zsize, xtarget, ytarget, ztarget, zrange, verbose, save_suffix, gaussian_std, path_output):
     """
     FIXME doc
@@ -366,49 +400,32 @@ def compute_corr_3d(src, target, x, xshift, xsize, y, yshift, ysize, z, zshift,
     """
     # parameters
     thr_corr = 0.2  # disc correlation threshold. Below this value, use template distance.
-    # get dimensions from src
-    nx, ny, nz = src.shape
     # Get pattern from template
     pattern = target[xtarget - xsize: xtarget + xsize + 1,
                      ytarget + yshift - ysize: ytarget + yshift + ysize + 1,
                      ztarget + zshift - zsize: ztarget + zshift + zsize + 1]
     pattern1d = pattern.ravel()
-    # initializations
+    # Subject chunks for all the shifts along z, taken from a slab of the subject
+    slab = src[x - xsize: x + xsize + 1, y + yshift - ysize: y + yshift + ysize + 1]
+    data_chunks = _sliding_windows_z(slab, [z + iz - zsize for iz in zrange], 2 * zsize + 1)
+    valid = np.full(len(zrange), data_chunks[0].size == pattern1d.size)
+    for ind_I, iz in enumerate(zrange):
+        # if pattern extends towards bottom part of the image, then crop and pad with zeros (as originally done, the
+        # padding only depends on iz)
+        if z + iz - zsize < 0:
+            data_chunk3d = _get_chunk_bottom(slab, z, iz, zsize)
+            if data_chunk3d.shape == data_chunks[ind_I].shape:
+                data_chunks[ind_I] = data_chunk3d
+            else:
+                valid[ind_I] = False
+    # convert subject patterns to 1d
+    data_chunks1d = data_chunks.reshape(len(zrange), -1)
+    # check if each data_chunk1d contains at least one non-zero value
+    valid &= np.any(data_chunks1d, axis=1)
     I_corr = np.zeros(len(zrange))
-    allzeros = 0
-    # current_z = 0
-    ind_I = 0
-    # loop across range of z defined by src
-    for iz in zrange:
-        # if pattern extends towards the top part of the image, then crop and pad with zeros
-        if z + iz + zsize + 1 > nz:
-            padding_size = z + iz + zsize + 1 - nz
-            data_chunk3d = src[x - xsize: x + xsize + 1,
-                               y + yshift - ysize: y + yshift + ysize + 1,
-                               z + iz - zsize: z + iz + zsize + 1 - padding_size]
-            data_chunk3d = np.pad(data_chunk3d, ((0, 0), (0, 0), (0, padding_size)), 'constant',
-                                  constant_values=0)
-        # if pattern extends towards bottom part of the image, then crop and pad with zeros
-        elif z + iz - zsize < 0:
-            padding_size = abs(iz - zsize)
-            data_chunk3d = src[x - xsize: x + xsize + 1,
-                               y + yshift - ysize: y + yshift + ysize + 1,
-                               z + iz - zsize + padding_size: z + iz + zsize + 1]
-            data_chunk3d = np.pad(data_chunk3d, ((0, 0), (0, 0), (padding_size, 0)), 'constant',
-                                  constant_values=0)
-        else:
-            data_chunk3d = src[x - xsize: x + xsize + 1,
-                               y + yshift - ysize: y + yshift + ysize + 1,
-                               z + iz - zsize: z + iz + zsize + 1]
-
-        # convert subject pattern to 1d
-        data_chunk1d = data_chunk3d.ravel()
-        # check if data_chunk1d contains at least one non-zero value
-        if (data_chunk1d.size == pattern1d.size) and np.any(data_chunk1d):
-            I_corr[ind_I] = mutual_information(data_chunk1d, pattern1d, nbins=16, normalized=False)
-        else:
-            allzeros = 1
-        ind_I = ind_I + 1
+    if np.any(valid):
+        I_corr[valid] = mutual_information_batch(data_chunks1d[valid], pattern1d, nbins=16)
+    allzeros = not np.all(valid)
     # ind_y = ind_y + 1
     if allzeros:
         logger.warning('Data contained zero. We probably hit the edge of the image.')
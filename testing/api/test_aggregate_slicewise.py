@@ -15,6 +15,7 @@ from spinalcordtoolbox import __sct_dir__, __version__
 sys.path.append(os.path.join(__sct_dir__, 'scripts'))
 
 from spinalcordtoolbox import aggregate_slicewise
+from spinalcordtoolbox.atlas import SparseAtlas
 from spinalcordtoolbox.process_seg import Metric
 from spinalcordtoolbox.image import Image
 
@@ -222,6 +223,40 @@ def test_extract_metric(dummy_data_and_labels):
     assert agg_metric[list(agg_metric)[0]]['MAP()'] == pytest.approx(20.0, rel=0.01)
 
 
+# noinspection 801,PyShadowingNames
+@pytest.mark.parametrize('method', ['wa', 'bin', 'ml', 'map', 'max', 'median'])
+@pytest.mark.parametrize('id_label', [0, 99])
+def test_extract_metric_sparse_atlas(dummy_data_and_labels, method, id_label):
+    """Test that the estimation methods give the same results with a sparse atlas as with the dense labels"""
+    data, labels, label_struc = dummy_data_and_labels
+    agg_metric = [aggregate_slicewise.extract_metric(data, labels=labels_, label_struc=label_struc, id_label=id_label,
+                                                     indiv_labels_ids=[0, 1, 2], perslice=perslice, method=method)
+                  for labels_ in [labels, SparseAtlas.from_array(labels)] for perslice in [False, True]]
+    for agg_metric_dense, agg_metric_sparse in [agg_metric[0:3:2], agg_metric[1:4:2]]:
+        assert agg_metric_dense.keys() == agg_metric_sparse.keys()
+        for slicegroup in agg_metric_dense:
+            assert agg_metric_sparse[slicegroup] == pytest.approx(agg_metric_dense[slicegroup])
+
+
+# noinspection 801,PyShadowingNames
+@pytest.mark.parametrize('method', ['wa', 'bin', 'ml', 'map', 'max', 'median'])
+@pytest.mark.parametrize('sparse', [False, True])
+def test_extract_metric_several_metrics(dummy_data_and_labels, method, sparse):
+    """Test that several metrics extracted at once give the same results as each metric extracted alone"""
+    data, labels, label_struc = dummy_data_and_labels
+    labels = SparseAtlas.from_array(labels) if sparse else labels
+    data_nan = data.data * 2 + 1
+    data_nan[3] = np.nan
+    metrics = [data, Metric(data=data.data * 2 + 1), Metric(data=data_nan)]
+    for perslice in [False, True]:
+        kwargs = dict(labels=labels, label_struc=label_struc, id_label=0, indiv_labels_ids=[0, 1, 2],
+                      perslice=perslice, method=method)
+        agg_metrics = aggregate_slicewise.extract_metric(metrics, **kwargs)
+        assert len(agg_metrics) == len(metrics)
+        for metric, agg_metric in zip(metrics, agg_metrics):
+            assert agg_metric == aggregate_slicewise.extract_metric(metric, **kwargs)
+
+
 # noinspection 801,PyShadowingNames
 def test_extract_metric_2d(dummy_data_and_labels_2d):
     """Test different estimation methods with 2D input array"""
@@ -357,6 +392,42 @@ def test_save_as_csv_extract_metric(tmp_path, dummy_data_and_labels):
         assert next(spamreader)[1:-1] == [__version__, '', '0:4', '', '', 'label_0', '2.5', '38.0']
 
 
+# noinspection 801,PyShadowingNames
+@pytest.mark.parametrize('kwargs', [dict(perslice=True), dict(slices=[5, 1, 1, 2], perslice=False),
+                                    dict(levels=[2, 4], perlevel=True), dict(levels=[3, 4, 6], perslice=True)])
+def test_aggregate_grouped(kwargs, dummy_vert_level, monkeypatch):
+    """Test that aggregating all the slice groups at once gives the same results as one slice group at a time"""
+    rng = np.random.RandomState(0)
+    data = rng.rand(9, 9, 9).astype(np.float32)
+    data[rng.rand(9, 9, 9) < 0.1] = np.nan
+    mask = rng.rand(9, 9, 9, 2) * (rng.rand(9, 9, 9, 2) > 0.3)
+    mask[:, :, 3, 0] = 0  # first label empty
+    mask[:, :, 4, :] = 0  # all labels empty
+    mask = np.asfortranarray(mask)  # as loaded by nibabel
+    group_funcs = (('WA', aggregate_slicewise.func_wa), ('STD', aggregate_slicewise.func_std),
+                   ('BIN', aggregate_slicewise.func_bin), ('MEDIAN', aggregate_slicewise.func_median),
+                   ('SUM', aggregate_slicewise.func_sum), ('MAX', aggregate_slicewise.func_max))
+    if 'levels' in kwargs:
+        kwargs['vert_level'] = dummy_vert_level
+
+    def aggregate():
+        return aggregate_slicewise.aggregate_per_slice_or_level(Metric(data=data.copy()),
+                                                                mask=Metric(data=mask.copy(order='K'), label='mask'),
+                                                                group_funcs=group_funcs, **kwargs)
+    agg_metric = aggregate()
+    monkeypatch.setattr(aggregate_slicewise, '_GROUPED_FUNCS', {})
+    agg_metric_per_group = aggregate()
+    assert agg_metric.keys() == agg_metric_per_group.keys()
+    for slicegroup in agg_metric:
+        assert agg_metric[slicegroup].keys() == agg_metric_per_group[slicegroup].keys()
+        for key, value in agg_metric_per_group[slicegroup].items():
+            if isinstance(value, (float, np.floating)):
+                assert agg_metric[slicegroup][key] == pytest.approx(value, rel=1e-5)
+                assert type(agg_metric[slicegroup][key]) == type(value)
+            else:
+                assert agg_metric[slicegroup][key] == value
+
+
 def test_dimension_mismatch_between_metric_and_vertfile(dummy_metrics, dummy_vert_level):
     """Test that an exception is raised only for mismatched metric and -vertfile images."""
     for metric in dummy_metrics:
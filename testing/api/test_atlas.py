@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# pytest unit tests for spinalcordtoolbox.atlas
+
+import os
+
+import numpy as np
+import nibabel as nib
+
+from spinalcordtoolbox import atlas
+from spinalcordtoolbox.atlas import SparseAtlas
+
+
+def dummy_labels(seed=0, shape=(6, 7, 5, 4)):
+    """Random sparse labels (x, y, z, label), with an empty slice."""
+    rng = np.random.RandomState(seed)
+    labels = rng.rand(*shape) * (rng.rand(*shape) > 0.7)
+    labels[:, :, 3] = 0
+    return labels.astype(np.float32)
+
+
+def test_sparse_atlas():
+    """Labels, slices and sums of labels of the sparse atlas are the same as with the dense stack."""
+    labels = np.asfortranarray(dummy_labels())
+    sparse_atlas = SparseAtlas.from_array(labels)
+    assert sparse_atlas.shape == labels.shape
+    assert sparse_atlas.dtype == labels.dtype
+    assert sparse_atlas.matrix.nnz == np.count_nonzero(labels)
+    assert np.array_equal(sparse_atlas.toarray(), labels)
+    assert np.array_equal(sparse_atlas.label(2), labels[..., 2])
+    assert np.allclose(sparse_atlas.label([0, 3]), labels[..., 0] + labels[..., 3])
+    assert np.array_equal(sparse_atlas.slices([4, 1, 1]).toarray(), labels[:, :, [4, 1, 1]])
+    selection = sparse_atlas.select([[1, 2], 0])
+    assert selection.shape == labels.shape[:3] + (2,)
+    assert np.allclose(selection.toarray(), np.stack([labels[..., 1] + labels[..., 2], labels[..., 0]], axis=3))
+
+
+def test_normal_equations():
+    """Terms of the normal equations of each slice, ignoring the nonfinite values of the metric."""
+    labels = dummy_labels(1)
+    data = np.random.RandomState(2).rand(*labels.shape[:3])
+    data[1, 2, 0] = np.nan
+    gram, moments, sums = SparseAtlas.from_array(labels).normal_equations(data)
+    for z in range(labels.shape[2]):
+        finite = np.isfinite(data[:, :, z]).ravel()
+        x = labels[:, :, z].reshape(-1, labels.shape[3])[finite].astype(np.float64)
+        y = data[:, :, z].ravel()[finite]
+        assert np.allclose(gram[z], x.T @ x)
+        assert np.allclose(moments[z], x.T @ y)
+        assert np.allclose(sums[z], x.sum(axis=0))
+    assert not gram[3].any()
+    # Metric with the same nonfinite voxels: only the moments are computed
+    gram_shared, moments_shared, sums_shared = SparseAtlas.from_array(labels).normal_equations(data * 2,
+                                                                                               gram=(gram, sums))
+    assert gram_shared is gram and sums_shared is sums
+    assert np.allclose(moments_shared, moments * 2)
+
+
+def test_load_atlas(tmp_path, monkeypatch):
+    """The atlas is loaded from the persistent cache, until the label files are modified."""
+    path_atlas, path_cache = tmp_path / 'atlas', tmp_path / 'cache'
+    path_atlas.mkdir()
+    labels = dummy_labels(3)
+    affine = np.diag([-1, 1, 1, 1])  # RPI
+    fnames = []
+    for i_label in range(labels.shape[3]):
+        fnames.append('label_{}.nii.gz'.format(i_label))
+        nib.save(nib.Nifti1Image(labels[..., i_label], affine), str(path_atlas / fnames[-1]))
+    (path_atlas / 'info_label.txt').write_text('# Keyword=IndivLabels\n')
+
+    from_images = SparseAtlas.from_images
+
+    def from_images_counted(paths):
+        calls.append(paths)
+        return from_images(paths)
+    calls = []
+    monkeypatch.setattr(SparseAtlas, 'from_images', from_images_counted)
+
+    # Cache disabled
+    monkeypatch.delenv('SCT_CACHE_DIR', raising=False)
+    assert np.allclose(atlas.load_atlas(str(path_atlas), fnames).toarray(), labels)
+    assert np.allclose(atlas.load_atlas(str(path_atlas), fnames).toarray(), labels)
+    assert len(calls) == 2
+
+    monkeypatch.setenv('SCT_CACHE_DIR', str(path_cache))
+    sparse_atlas = atlas.load_atlas(str(path_atlas), fnames)
+    assert np.allclose(sparse_atlas.toarray(), labels)
+    assert len(calls) == 3
+    cached_atlas = atlas.load_atlas(str(path_atlas), fnames)
+    assert len(calls) == 3
+    assert cached_atlas.shape == sparse_atlas.shape
+    assert (cached_atlas.matrix != sparse_atlas.matrix).nnz == 0
+    # Nothing is written next to the atlas
+    assert sorted(os.listdir(path_atlas)) == sorted(fnames + ['info_label.txt'])
+    assert len(os.listdir(path_cache)) == 1
+
+    # Modified label file
+    (path_atlas / 'info_label.txt').write_text('# Keyword=IndivLabels\n# Modified\n')
+    atlas.load_atlas(str(path_atlas), fnames)
+    assert len(calls) == 4
+
+    # Modified label
+    labels[..., 1] = 0
+    nib.save(nib.Nifti1Image(labels[..., 1], affine), str(path_atlas / fnames[1]))
+    os.utime(path_atlas / fnames[1], (0, 0))
+    assert np.allclose(atlas.load_atlas(str(path_atlas), fnames).toarray(), labels)
+    assert len(calls) == 5
@@ -149,7 +149,7 @@ def test_get_centerline_linear(img_ctl, expected, params):
 @pytest.mark.parametrize('img_ctl,expected,params', im_centerlines)
 def test_get_centerline_nurbs(img_ctl, expected, params):
     """Test centerline fitting using nurbs"""
-    if 'exclude_nurbs':
+    if 'exclude_nurbs' in params:
         return
     img, img_sub = [img_ctl[0].copy(), img_ctl[1].copy()]
     img_out, arr_out, arr_deriv_out, fit_results = get_centerline(
@@ -177,3 +177,21 @@ def test_get_centerline_optic(params):
 def test_round_and_clip():
     arr = round_and_clip(np.array([-0.2, 3.00001, 2.99999, 49]), clip=[0, 41])
     assert np.all(arr == np.array([0,  3,  3, 40]))  # Check element-wise equality between the two arrays
+
+
+def test_nurbs_basis_functions():
+    """B-spline basis functions of the NURBS fitting, computed at all the parameters at once."""
+    from scipy.interpolate import BSpline
+    from spinalcordtoolbox.centerline.nurbs import _basis_functions
+    order, knots = 4, np.array([0, 0, 0, 0, 0.2, 0.5, 0.7, 1, 1, 1, 1])
+    t = np.array([0.05, 0.3, 0.55, 0.9, 1])
+    basis, basis_deriv = _basis_functions(knots, order, t, derivatives=True)
+    assert basis.shape == basis_deriv.shape == (len(t), len(knots) - order)
+    for i in range(len(knots) - order):
+        spline = BSpline(knots, np.eye(len(knots) - order)[i], order - 1)
+        assert np.allclose(basis[:, i], spline(t))
+        # Derivatives scaled by the order, like the original implementation
+        assert np.allclose(basis_deriv[:, i], order / (order - 1) * spline.derivative()(t))
+    assert np.allclose(basis.sum(axis=1), 1)
+    # Both pieces are counted at an interior knot
+    assert np.isclose(_basis_functions(knots, order, [0.5]).sum(), 2)
@@ -59,3 +59,55 @@ def test_segment_nifti(fname_image, fname_seg_manual, fname_out, task,
     # Compare with ground-truth segmentation
     assert np.all(nibabel.load(fname_out).get_fdata() ==
                   nibabel.load(fname_seg_manual).get_fdata()[..., 0])
+
+
+def test_segment_nifti_list(tmp_path):
+    """
+    Segment several subjects listed with -i-list, with the models loaded once.
+    """
+    fname_seg_manual = sct_test_path('t2s', 't2s_seg-deepseg.nii.gz')
+    fnames_in = []
+    for subject in ['sub-01', 'sub-02']:
+        path_subject = tmp_path / subject
+        path_subject.mkdir()
+        fname_in = str(path_subject / 't2s.nii.gz')
+        nibabel.save(nibabel.load(sct_test_path('t2s', 't2s.nii.gz')), fname_in)
+        fnames_in.append(fname_in)
+    fname_list = str(tmp_path / 'subjects.txt')
+    with open(fname_list, 'w') as f:
+        f.write('# subjects\n{}\n\n{}\n'.format(*fnames_in))
+
+    assert sct_deepseg.read_subject_list(fname_list) == [[fnames_in[0]], [fnames_in[1]]]
+    sct_deepseg.main(['-i-list', fname_list, '-task', 'seg_sc_t2star', '-thr', str(0.9)])
+    for fname_in in fnames_in:
+        # Output named with the suffix of the model, next to the input image
+        path_subject = os.path.dirname(fname_in)
+        fnames_out = [fname for fname in os.listdir(path_subject) if fname != 't2s.nii.gz']
+        assert len(fnames_out) == 1
+        fname_out = os.path.join(path_subject, fnames_out[0])
+        assert np.all(nibabel.load(fname_out).get_fdata() == nibabel.load(fname_seg_manual).get_fdata()[..., 0])
+
+
+def test_cached_models(tmp_path):
+    """
+    Models loaded by ivadomed are reused inside cached_models(), and reloaded outside. torch.load() is left untouched.
+    """
+    import io
+    import torch
+    from ivadomed import inference as imed_inference
+    from spinalcordtoolbox.deepseg.inference import cached_models
+
+    fname_model = str(tmp_path / 'model.pt')
+    torch.save(torch.nn.Linear(2, 1), fname_model)
+    with cached_models([str(tmp_path)]):
+        model = imed_inference.torch.load(fname_model)
+        assert imed_inference.torch.load(fname_model) is model
+        with cached_models([str(tmp_path)]):
+            assert imed_inference.torch.load(fname_model) is model
+        assert imed_inference.torch.load(fname_model) is model
+        assert torch.load(fname_model) is not model
+        # Not a file of a model folder
+        with open(fname_model, 'rb') as f:
+            assert isinstance(imed_inference.torch.load(io.BytesIO(f.read())), torch.nn.Linear)
+    assert imed_inference.torch is torch
+    assert imed_inference.torch.load(fname_model) is not model
@@ -95,6 +95,37 @@ class TestCore(object):
         ret = gm_core.segment_volume(img, 'challenge')
         assert ret.shape == (200, 200, 2)
 
+    def test_segment_volume_batches(self):
+        """Predicting the slices in batches (with TTA) gives the same segmentation."""
+        np_data = np.random.RandomState(0).rand(200, 200, 5).astype(np.float32)
+        img = nib.Nifti1Image(np_data, np.eye(4))
+        np.random.seed(0)
+        ret = gm_core.segment_volume(img, 'challenge', use_tta=True, slices_per_batch=None)
+        np.random.seed(0)
+        ret_batches = gm_core.segment_volume(img, 'challenge', use_tta=True, slices_per_batch=2)
+        assert ret.shape == (200, 200, 5)
+        assert np.array_equal(ret, ret_batches)
+
+    def test_model_cache(self):
+        """Models are reused across calls, until they are evicted."""
+        gm_core.clear_model_cache()
+        deepgmseg_model = gm_core.get_model('challenge', (200, 200))
+        assert gm_core.get_model('challenge', np.array([200, 200])) is deepgmseg_model
+        assert gm_core.get_model('challenge', (103, 102)) is not deepgmseg_model
+        gm_core.clear_model_cache('challenge')
+        assert gm_core.get_model('challenge', (200, 200)) is not deepgmseg_model
+
+    def test_predict_slices_tta(self):
+        """TTA passes predicted in a single call are averaged with the original slices."""
+        class DummyModel(object):
+            def predict(self, batch, batch_size, verbose):
+                return batch * 2
+
+        axial_slices = np.random.randn(3, 10, 10, 1).astype(np.float32)
+        preds = gm_core.predict_slices(DummyModel(), axial_slices, tta_offsets=[0.5, 1.0])
+        assert preds.shape == axial_slices.shape
+        assert np.allclose(preds, axial_slices * 2 + 1.0)
+
     def test_standardization_transform(self):
         """Test the standardization transform with specified parameters."""
         np_data = np.ones((200, 200, 2), dtype=np.float32)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# pytest unit tests for spinalcordtoolbox.deepseg.inference, with a fake ivadomed.inference module
+
+import io
+import threading
+import types
+
+import pytest
+
+from spinalcordtoolbox.deepseg import inference
+
+
+class FakeTorch(object):
+    """torch module whose load() returns a new object on each call"""
+
+    def __init__(self):
+        self.calls = []
+
+    def load(self, f, map_location=None):
+        self.calls.append(f)
+        return object()
+
+
+class FakeOnnxruntime(object):
+    """onnxruntime module with a counter of the created sessions"""
+
+    def __init__(self):
+        self.calls = []
+
+    def InferenceSession(self, path, providers=None):
+        self.calls.append(path)
+        return object()
+
+    def get_device(self):
+        return 'CPU'
+
+
+@pytest.fixture
+def fake_module():
+    module = types.ModuleType('fake_ivadomed_inference')
+    module.torch = FakeTorch()
+    module.onnxruntime = FakeOnnxruntime()
+    return module
+
+
+@pytest.fixture
+def model_files(tmp_path):
+    path_model = tmp_path / 'model'
+    path_model.mkdir()
+    fnames = {}
+    for name in ['model.pt', 'model.onnx']:
+        (path_model / name).write_bytes(b'model')
+        fnames[name] = str(path_model / name)
+    (tmp_path / 'other.pt').write_bytes(b'other')
+    fnames['other'] = str(tmp_path / 'other.pt')
+    return str(path_model), fnames
+
+
+def test_cached_models(fake_module, model_files):
+    """Models of the model folder are loaded once, and released when leaving the context"""
+    torch, onnxruntime = fake_module.torch, fake_module.onnxruntime
+    path_model, fnames = model_files
+    with inference.cached_models([path_model], module=fake_module):
+        model = fake_module.torch.load(fnames['model.pt'], map_location='cpu')
+        assert fake_module.torch.load(fnames['model.pt'], map_location='cpu') is model
+        session = fake_module.onnxruntime.InferenceSession(fnames['model.onnx'])
+        assert fake_module.onnxruntime.InferenceSession(fnames['model.onnx']) is session
+        # Other arguments: another model
+        assert fake_module.torch.load(fnames['model.pt'], map_location='cuda') is not model
+        # The other attributes are the ones of the module
+        assert fake_module.onnxruntime.get_device() == 'CPU'
+        # The modules themselves are not patched
+        assert torch.load(fnames['model.pt']) is not model
+        assert len(torch.calls) == 3
+        assert len(onnxruntime.calls) == 1
+    assert fake_module.torch is torch
+    assert fake_module.onnxruntime is onnxruntime
+    assert not inference._cache
+    assert fake_module.torch.load(fnames['model.pt'], map_location='cpu') is not model
+
+
+def test_cached_models_not_model_files(fake_module, model_files):
+    """File objects and files outside of the model folders are passed to the original loaders"""
+    torch = fake_module.torch
+    path_model, fnames = model_files
+    with inference.cached_models([path_model], module=fake_module):
+        buffer = io.BytesIO(b'model')
+        fake_module.torch.load(buffer)
+        fake_module.torch.load(buffer)
+        fake_module.torch.load(fnames['other'])
+        fake_module.torch.load(fnames['other'])
+        fake_module.torch.load(fnames['model.pt'] + '.missing')
+    assert torch.calls == [buffer, buffer, fnames['other'], fnames['other'], fnames['model.pt'] + '.missing']
+
+
+def test_cached_models_nested(fake_module, model_files, tmp_path):
+    """Nested contexts share the cache, which is released when leaving the outermost one"""
+    torch = fake_module.torch
+    path_model, fnames = model_files
+    with inference.cached_models([path_model], module=fake_module):
+        model = fake_module.torch.load(fnames['model.pt'])
+        with inference.cached_models([str(tmp_path)], module=fake_module):
+            assert fake_module.torch.load(fnames['model.pt']) is model
+            other = fake_module.torch.load(fnames['other'])
+            assert fake_module.torch.load(fnames['other']) is other
+        assert fake_module.torch is not torch
+        assert fake_module.torch.load(fnames['model.pt']) is model
+        # The folder of the inner context is no longer cached
+        assert fake_module.torch.load(fnames['other']) is not other
+    assert fake_module.torch is torch
+    assert inference._state == {'depth': 0, 'folders': [], 'restore': None}
+
+
+def test_cached_models_threads(fake_module, model_files):
+    """A model loaded from several threads at the same time is loaded once"""
+    path_model, fnames = model_files
+    barrier = threading.Barrier(4)
+    models = []
+
+    def load():
+        barrier.wait()
+        models.append(fake_module.torch.load(fnames['model.pt']))
+
+    with inference.cached_models([path_model], module=fake_module):
+        threads = [threading.Thread(target=load) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert len(models) == 4
+    assert all(model is models[0] for model in models)
+    assert len(fake_module.torch.calls) == 1
@@ -98,3 +98,38 @@ def test_uncrop_image():
                                        y_crop_lst[z_rand]:y_crop_lst[z_rand] + crop_size,
                                        z_rand],
                        data_crop[:, :, z_rand])
+
+
+class DummyCenterlineModel:
+    """Fake CNN predicting high values on the bright voxels of the (normalized) input blocks."""
+    def __init__(self):
+        self.n_calls = 0
+
+    def predict(self, x, batch_size=None):
+        self.n_calls += 1
+        return 1 / (1 + np.exp(-4 * (x - 1.0)))
+
+
+def test_heatmap_batch(monkeypatch):
+    """Batched predictions of heatmap() should give the same heatmap as predictions one slice at a time"""
+    nx, ny, nz = 100, 90, 60
+    data = np.random.RandomState(0).rand(nx, ny, nz) * 30
+    xx, yy = np.mgrid[0:nx, 0:ny]
+    for z in range(nz):
+        if 20 <= z < 25:
+            continue  # cord not visible
+        x_ctr, y_ctr = 50 + 15 * np.sin(z / 20.), 45 + 8 * np.cos(z / 15.)
+        data[..., z] += 200 * (((xx - x_ctr) / 6) ** 2 + ((yy - y_ctr) / 4) ** 2 < 1)
+    img = Image(data.astype(np.float32), hdr=nib.Nifti1Header())
+
+    results = {}
+    for batch_slices in [1, sct.deepseg_sc.core.BATCH_SLICES]:
+        monkeypatch.setattr(sct.deepseg_sc.core, 'BATCH_SLICES', batch_slices)
+        model = DummyCenterlineModel()
+        im_heatmap, _ = sct.deepseg_sc.core.heatmap(img.copy(), model, (48, 48), 100.0, 60.0, brain_bool=False)
+        results[batch_slices] = im_heatmap.data, model.n_calls
+
+    (data_ref, n_calls_ref), (data_batch, n_calls_batch) = results.values()
+    assert np.count_nonzero(data_ref)
+    assert np.array_equal(data_ref, data_batch)
+    assert n_calls_batch < n_calls_ref
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# pytest unit tests for spinalcordtoolbox.hausdorff
+
+import numpy as np
+import nibabel as nib
+from scipy import ndimage
+
+from spinalcordtoolbox import hausdorff
+from spinalcordtoolbox.image import Image
+
+
+def dummy_blobs(seed, shape=(4, 40, 40), percentile=60):
+    """Binary 3D stack of random smooth blobs, with empty borders."""
+    data = ndimage.gaussian_filter(np.random.RandomState(seed).rand(*shape), 3)
+    data = (data > np.percentile(data, percentile)).astype(int)
+    data[:, [0, 1, -2, -1], :] = 0
+    data[:, :, [0, 1, -2, -1]] = 0
+    return data
+
+
+def test_zhang_suen():
+    """The skeleton of a horizontal bar is a line, and thinning all the slices at once is the same as one by one."""
+    bar = np.zeros((30, 30), dtype=int)
+    bar[12:17, 3:27] = 1
+    skeleton = hausdorff.zhang_suen(bar)
+    assert skeleton.dtype == bar.dtype
+    # Away from the ends of the bar (where the skeleton forks), one pixel per column, in the middle row
+    assert (skeleton[:, 8:22].sum(axis=0) == 1).all()
+    assert skeleton[14, 8:22].all()
+
+    data = dummy_blobs(0)
+    thinned = hausdorff.zhang_suen(data)
+    assert np.array_equal(thinned, [hausdorff.zhang_suen(data_slice) for data_slice in data])
+    assert (thinned <= data).all() and 0 < thinned.sum() < data.sum()
+
+
+def test_relative_distances():
+    """Slice-wise distances match a brute-force computation, and are zero on the slices where an image is empty."""
+    data1, data2 = dummy_blobs(1), dummy_blobs(2, percentile=80)
+    data2[2] = 0
+    distances = hausdorff.relative_distances(data1, data2)
+
+    for i in [0, 1, 3]:
+        coords1, coords2 = np.argwhere(data1[i]), np.argwhere(data2[i])
+        expected = np.linalg.norm(coords1[:, np.newaxis] - coords2[np.newaxis], axis=2).min(axis=1)
+        assert np.allclose(distances[i][tuple(coords1.T)], expected)
+    assert not distances[2].any()
+    assert not distances[data1 == 0].any()
+
+
+def test_surface_distances():
+    """Two balls shifted by 2 voxels along an axis with a pixdim of 0.5 mm."""
+    x, y, z = np.mgrid[:30, :30, :12]
+    affine = np.diag([0.5, 0.5, 2, 1])
+    im1 = Image(((x - 15) ** 2 + (y - 15) ** 2 + ((z - 6) * 4) ** 2 < 64).astype(np.uint8),
+                hdr=nib.Nifti1Image(np.zeros((30, 30, 12)), affine).header)
+    im2 = Image(((x - 17) ** 2 + (y - 15) ** 2 + ((z - 6) * 4) ** 2 < 64).astype(np.uint8), hdr=im1.hdr.copy())
+
+    distances = hausdorff.surface_distances(im1, im2)
+    assert np.isclose(distances['hausdorff'], 1.0)
+    assert 0 < distances['assd'] <= distances['hd95'] <= distances['hausdorff']
+
+    same = hausdorff.surface_distances(im1, im1)
+    assert same == {'hausdorff': 0, 'hd95': 0, 'assd': 0}
+
+    empty = Image(np.zeros((30, 30, 12), dtype=np.uint8), hdr=im1.hdr.copy())
+    assert np.isnan(hausdorff.surface_distances(im1, empty)['hd95'])
+
+
+def test_hausdorff_distance_2d(tmp_path, monkeypatch):
+    """2D images are resampled as 2D images, and their distances are computed in 2D, without surface distances."""
+    from spinalcordtoolbox.scripts import sct_compute_hausdorff_distance
+    x, y = np.mgrid[:40, :40]
+    affine = np.diag([0.5, 0.5, 1, 1])
+    for fname, x0 in [('seg1.nii.gz', 20), ('seg2.nii.gz', 22)]:
+        nib.save(nib.Nifti1Image(((x - x0) ** 2 + (y - 20) ** 2 < 64).astype(np.uint8), affine),
+                 str(tmp_path / fname))
+    monkeypatch.chdir(tmp_path)
+
+    fname_resampled = sct_compute_hausdorff_distance.resample_image('seg1.nii.gz', binary=True, thr=0.5, npx=0.25,
+                                                                    npy=0.25)
+    assert Image(fname_resampled).data.shape == (80, 80)
+
+    sct_compute_hausdorff_distance.main(argv=['-i', 'seg1.nii.gz', '-d', 'seg2.nii.gz', '-resampling', '0.25',
+                                              '-o', 'hausdorff_distance.txt', '-v', '0'])
+    with open('hausdorff_distance.txt') as f:
+        result = f.read()
+    assert result.startswith("Hausdorff's distance : ")
+    assert 'Slice' not in result and '3D distances' not in result
+    assert float(result.split(': ')[1].split(' mm')[0]) > 0
@@ -320,6 +320,39 @@ def test_slicer(fake_3dimage_sct, fake_3dimage_sct2):
         assert (slice2d_new == slice2d_old).all()
 
 
+@pytest.mark.parametrize('ext', ['.nii', '.nii.gz'])
+def test_lazy_image(tmp_path, fake_3dimage_sct, ext):
+    fname = str(tmp_path / "src{}".format(ext))
+    fake_3dimage_sct.save(fname)
+    im_ref = msct_image.Image(fname)
+    im_lazy = msct_image.Image(fname, lazy=True)
+
+    # header without reading the data
+    assert im_lazy.dim == im_ref.dim
+    assert im_lazy.orientation == im_ref.orientation
+    assert im_lazy._data is None
+
+    # slicers only read the requested slices
+    for orientation in ["LPI", "ASR", "SRA", "RPS"]:
+        for slice_lazy, slice_ref in msct_image.SlicerMany((im_lazy, im_ref), msct_image.Slicer,
+                                                          orientation=orientation):
+            assert (slice_lazy == slice_ref).all()
+    for axis in ["IS", "SI", "AP"]:
+        for idx_slice in range(len(msct_image.SlicerOneAxis(im_ref, axis))):
+            assert (msct_image.SlicerOneAxis(im_lazy, axis)[idx_slice]
+                    == msct_image.SlicerOneAxis(im_ref, axis)[idx_slice]).all()
+    assert im_lazy._data is None
+
+    # data is read when accessed, and writing to it does not modify the file
+    assert (im_lazy.data == im_ref.data).all()
+    im_lazy.data[0, 0, 0] = -1
+    assert msct_image.Image(fname).data[0, 0, 0] == im_ref.data[0, 0, 0]
+
+    # overwrite the file the data is read from
+    im_lazy.save(fname)
+    assert (msct_image.Image(fname).data == im_lazy.data).all()
+
+
 def test_nibabel(fake_3dimage):
     img = fake_3dimage
     print(img.header)
@@ -674,6 +707,24 @@ def test_add_suffix():
     assert msct_image.add_suffix('var/lib.version.3/usr/t2.nii.gz', 'sfx') == 'var/lib.version.3/usr/t2sfx.nii.gz'
 
 
+@pytest.mark.parametrize('dim,squeeze_data', [(2, False), (3, True), (3, False)])
+def test_split_img_data_no_copy(tmp_path, dim, squeeze_data):
+    """Without copy, the split images are the same, with views of the input data"""
+    fname = str(tmp_path / 'data.nii')
+    nibabel.save(nibabel.Nifti1Image(np.random.rand(4, 5, 3, 6).astype(np.float32), np.eye(4)), fname)
+    im = msct_image.Image(fname)
+    list_im = msct_image.split_img_data(im, dim, squeeze_data=squeeze_data, copy=False)
+    list_im_ref = msct_image.split_img_data(im, dim, squeeze_data=squeeze_data)
+    assert len(list_im) == len(list_im_ref) == im.data.shape[dim]
+    for im_split, im_split_ref in zip(list_im, list_im_ref):
+        assert im_split.absolutepath == im_split_ref.absolutepath
+        assert im_split.data.shape == im_split_ref.data.shape
+        np.testing.assert_array_equal(im_split.data, im_split_ref.data)
+        assert np.shares_memory(im_split.data, im.data)
+        assert not np.shares_memory(im_split_ref.data, im.data)
+        assert im_split.hdr is not im.hdr
+
+
 def test_splitext():
     assert msct_image.splitext('image.nii') == ('image', '.nii')
     assert msct_image.splitext('image.nii.gz') == ('image', '.nii.gz')
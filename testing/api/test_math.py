@@ -80,3 +80,16 @@ def test_threshold():
 
     e = sct_math.threshold(a.copy())
     assert (e == a).all()
+
+
+def test_mutual_information_batch():
+    """Mutual information of several images with the same pattern, computed at once."""
+    rng = np.random.RandomState(0)
+    pattern = rng.rand(500).astype(np.float32)
+    data = (rng.rand(6, 500) + pattern).astype(np.float32)
+    data[1] = 3  # constant image
+    data[2] = np.round(data[2] * 4)  # values on the bin edges
+    mi = sct_math.mutual_information_batch(data, pattern, nbins=16)
+    assert mi.shape == (6,)
+    assert np.allclose(mi, [sct_math.mutual_information(x, pattern, nbins=16) for x in data], rtol=0, atol=1e-12)
+    assert mi[1] == 0
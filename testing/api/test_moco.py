@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# pytest unit tests for spinalcordtoolbox.moco
+
+import os
+import multiprocessing
+
+import pytest
+import numpy as np
+import nibabel
+
+from spinalcordtoolbox import moco
+from spinalcordtoolbox.image import Image
+
+
+def fake_register(param, file_src, file_dest, file_mat, file_out, im_mask=None):
+    """register() without ANTs: the registered volume is the source volume, plus the current value of the target, so
+    that the order of the registrations and of the updates of the target can be checked."""
+    im_out = Image(file_src)
+    im_out.data = im_out.data + Image(file_dest).data
+    im_out.save(file_out, verbose=0)
+    with open(file_mat + 'Warp.nii.gz', 'w'):
+        pass
+    with open('registrations.txt', 'a') as f:
+        f.write('{}\n'.format(os.path.basename(file_mat)))
+    return 0
+
+
+@pytest.mark.parametrize('iterAvg', [0, 1])
+def test_moco_jobs(tmp_path, monkeypatch, iterAvg):
+    """Sagittal moco gives the same output with parallel jobs, which share one pool of processes for all the slices"""
+    monkeypatch.setattr(moco, 'register', fake_register)
+    pools = []
+    pool_class = multiprocessing.Pool
+
+    def pool_counted(*args, **kwargs):
+        pools.append(args)
+        return pool_class(*args, **kwargs)
+    monkeypatch.setattr(multiprocessing, 'Pool', pool_counted)
+
+    nz, nt = 3, 12
+    data = np.random.RandomState(0).rand(4, 5, nz, nt).astype(np.float32)
+    outputs = {}
+    for jobs in [1, 2]:
+        path = tmp_path / 'jobs{}'.format(jobs)
+        path.mkdir()
+        monkeypatch.chdir(path)
+        nibabel.save(nibabel.Nifti1Image(data, np.eye(4)), 'data.nii')
+        nibabel.save(nibabel.Nifti1Image(np.ones((4, 5, nz), dtype=np.float32), np.eye(4)), 'target.nii')
+        param = moco.ParamMoco()
+        param.file_data, param.file_target, param.mat_moco = 'data.nii', 'target.nii', 'mat'
+        param.todo, param.is_sagittal, param.iterAvg, param.jobs, param.verbose = 'estimate_and_apply', True, \
+            iterAvg, jobs, 0
+        file_mat, im_moco = moco.moco(param)
+        assert file_mat.shape == (nz, nt)
+        with open('registrations.txt') as f:
+            assert sorted(f.read().split()) == sorted(os.path.basename(fname) for fname in file_mat.ravel())
+        outputs[jobs] = im_moco.data
+    assert pools == [(2,)]
+    assert outputs[2].shape == (4, 5, nz, nt)
+    np.testing.assert_allclose(outputs[2], outputs[1])
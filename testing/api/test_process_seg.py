@@ -135,3 +135,36 @@ def test_compute_shape(im_seg, expected, params):
         else:
             expected_value = pytest.approx(expected[key], rel=0.05)
         assert obtained_value == expected_value
+
+
+# noinspection 801,PyShadowingNames
+@pytest.mark.parametrize('im_seg,expected,params', im_segs)
+def test_compute_shape_batch_vs_loop(im_seg, expected, params):
+    """The 'batch' engine should give the same results as the reference 'loop' engine, within tolerance."""
+    metrics_loop, _ = process_seg.compute_shape(im_seg, angle_correction=params['angle_corr'],
+                                                param_centerline=ParamCenterline(), verbose=VERBOSE, engine='loop')
+    metrics_batch, _ = process_seg.compute_shape(im_seg, angle_correction=params['angle_corr'],
+                                                 param_centerline=ParamCenterline(), verbose=VERBOSE, engine='batch')
+    for key in process_seg.PROPERTY_LIST:
+        if key == 'orientation':
+            tolerance = {'abs': process_seg.BATCH_ENGINE_ORIENTATION_ATOL}
+        else:
+            tolerance = {'rel': process_seg.BATCH_ENGINE_RTOL}
+        assert metrics_batch[key].data == pytest.approx(metrics_loop[key].data, nan_ok=True, **tolerance)
+
+
+def test_compute_shape_jobs():
+    """Processing chunks of slices in parallel should give the same results as processing them serially, for any
+    grouping of the slices into chunks."""
+    # Cord whose size changes along z, so that the slices of a chunk have bounding boxes of different sizes
+    im_seg = dummy_segmentation(size_arr=(64, 64, 130), shape='ellipse', radius_RL=13.0, radius_AP=5.0,
+                                angle_RL=-10.0, angle_AP=15.0, debug=DEBUG)
+    im_seg_small = dummy_segmentation(size_arr=(64, 64, 130), shape='ellipse', radius_RL=6.0, radius_AP=3.0,
+                                      angle_RL=-10.0, angle_AP=15.0, debug=DEBUG)
+    im_seg.data[:, :, 70:] = im_seg_small.data[:, :, 70:]
+    metrics_serial, _ = process_seg.compute_shape(im_seg, param_centerline=ParamCenterline(), verbose=VERBOSE, jobs=1)
+    for jobs in [2, 3]:
+        metrics_parallel, _ = process_seg.compute_shape(im_seg, param_centerline=ParamCenterline(), verbose=VERBOSE,
+                                                        jobs=jobs)
+        for key in process_seg.PROPERTY_LIST:
+            np.testing.assert_array_equal(metrics_parallel[key].data, metrics_serial[key].data)
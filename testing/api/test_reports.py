@@ -3,6 +3,7 @@
 # pytest unit tests for spinalcordtoolbox.reports
 
 import os
+import json
 import logging
 
 import pytest
@@ -13,6 +14,7 @@ from spinalcordtoolbox.reports.slice import Sagittal
 from spinalcordtoolbox.utils import sct_test_path
 import spinalcordtoolbox.reports.qc as qc
 import spinalcordtoolbox.reports.slice as qcslice
+from spinalcordtoolbox.reports import raster
 
 
 logger = logging.getLogger()
@@ -115,6 +117,75 @@ def test_propseg(t2_image, t2_seg_image):
     assert os.path.isfile(param.qc_results)
 
 
+def test_qc_index(tmp_path, monkeypatch):
+    """Entries are appended to the QC index, and index.html is rendered on demand from all the entries."""
+    path_qc = str(tmp_path / 'qc')
+    monkeypatch.setenv('SCT_QC_DEFER_INDEX', '1')
+    for subject in ['sub-01', 'sub-02']:
+        param = qc.Params(os.path.join('/data', subject, 'anat', 't2.nii.gz'), 'sct_propseg', ['-c', 't2'], 'Axial',
+                          path_qc)
+        qc.QcReport(param, '').update_description_file((10, 20))
+    assert os.path.isfile(param.qc_results)
+    assert not os.path.exists(os.path.join(path_qc, 'index.html'))
+    # Entry written by a previous version of SCT, one json file per entry
+    with open(os.path.join(path_qc, '_json', 'qc_2021_01_01_000000.000000.json'), 'w') as fjson:
+        json.dump({'subject': 'sub-00', 'command': 'sct_deepseg_sc'}, fjson)
+
+    json_data = qc.get_json_data_from_path(os.path.join(path_qc, '_json'))
+    assert [entry['subject'] for entry in json_data] == ['sub-00', 'sub-01', 'sub-02']
+    assert json_data[1]['dimension'] == '10x20'
+    assert json_data[2]['cmdline'] == 'sct_propseg -c t2'
+
+    qc.update_index_html(path_qc)
+    with open(os.path.join(path_qc, 'index.html')) as index:
+        assert json.dumps(json_data) in index.read()
+    assert os.listdir(os.path.join(path_qc, '_assets', 'css'))
+
+    # Without deferral, index.html is rendered with each new entry
+    monkeypatch.setenv('SCT_QC_DEFER_INDEX', '0')
+    qc.QcReport(qc.Params('/data/sub-03/anat/t2.nii.gz', 'sct_propseg', [], 'Axial', path_qc),
+                '').update_description_file((10, 20))
+    with open(os.path.join(path_qc, 'index.html')) as index:
+        assert '"sub-03"' in index.read()
+
+
+def test_raster_colormap():
+    """Colors and alpha blending of the rasterized QC images are the ones of matplotlib."""
+    import matplotlib.colors as color
+    data = np.ma.masked_equal(np.random.RandomState(0).rand(20, 30) * 2 - 0.5, 0)
+    data[3, 4] = np.ma.masked
+    data[5, 6] = np.nan
+    cmap = color.LinearSegmentedColormap.from_list("", qc.QcImage._seg_colormap)
+    rgba = raster.apply_colormap(data, raster.colormap_lut(cmap), vmin=0.5, vmax=1)
+    expected = cmap(color.Normalize(vmin=0.5, vmax=1)(np.ma.masked_invalid(data)), bytes=True)
+    expected[np.ma.getmaskarray(np.ma.masked_invalid(data))] = 0
+    assert np.array_equal(rgba, expected)
+    assert not rgba[3, 4].any() and not rgba[5, 6].any()
+
+    transparent = np.zeros_like(rgba)
+    assert np.array_equal(raster.alpha_blend(transparent, rgba), rgba)
+    assert np.array_equal(raster.alpha_blend(rgba, transparent), rgba)
+    half = np.full_like(rgba, 255)
+    half[..., 3] = 128
+    blend = raster.alpha_blend(np.full_like(rgba, 255) * [0, 0, 0, 1], half)
+    assert np.all(blend == [128, 128, 128, 255])
+
+
+def test_raster_canvas():
+    """Images are scaled to fit in the canvas with their aspect ratio, and centered."""
+    canvas = raster.Canvas((214, 500), (7, 3), aspect=1.7)
+    assert canvas.shape == (500, 126)
+    assert canvas.offset == (44, 0)
+    image = np.arange(21, dtype=np.uint8).reshape(7, 3)
+    drawn = canvas.draw(image, background=255)
+    assert drawn.shape == (500, 214)
+    assert np.all(drawn[:, :44] == 255) and np.all(drawn[:, 44 + 126:] == 255)
+    assert np.array_equal(np.unique(drawn[:, 44:44 + 126]), np.arange(21))
+    assert drawn[0, 44] == image[0, 0] and drawn[-1, 44 + 125] == image[-1, -1]
+    scale = 500 / (7 * 1.7)
+    assert np.allclose(canvas.to_canvas(2, 6), (44 + 2.5 * scale, 6.5 * scale * 1.7))
+
+
 # FIXME: The following tests are broken, as they use outdated syntax for classes, attributes, etc.
 #        For example, the Coronal slice type no longer exists, having been removed in 2018 (PR #1667)
 #        These tests could could be deleted, but saving them lets them be used to model new tests after.
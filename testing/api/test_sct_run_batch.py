@@ -1,4 +1,5 @@
 import glob
+import multiprocessing
 import os
 import sys
 import pytest
@@ -128,3 +129,92 @@ def test_separate_sessions():
         for sub, ses in sub_ses_pairs:
             file_log = glob.glob(os.path.join(out, 'log', f'*sub-{sub}_ses-{ses}.log'))[0]
             assert f'sub-{sub}/ses-{ses}' in open(file_log, "r").read()
+
+
+def test_estimate_costs_from_previous_run():
+    with TemporaryDirectory() as data,\
+            TemporaryDirectory() as out,\
+            NamedTemporaryFile('w', suffix='.sh') as script:
+        # Subjects with images of different sizes
+        for sub, size in [('01', 10), ('02', 1000), ('03', 100)]:
+            os.makedirs(os.path.join(data, f'sub-{sub}', 'anat'))
+            with open(os.path.join(data, f'sub-{sub}', 'anat', f'sub-{sub}_T2w.nii.gz'), 'wb') as f:
+                f.write(b'0' * size)
+        subject_dirs = ['sub-01', 'sub-02', 'sub-03']
+        costs = sct_run_batch.estimate_costs(subject_dirs, data, {})
+        assert sorted(subject_dirs, key=costs.get) == ['sub-01', 'sub-03', 'sub-02']
+
+        # The durations of the previous run are read from the batch log
+        write_dummy_script(script)
+        sct_run_batch.main(['-path-data', data, '-path-out', out, '-script', script.name, '-jobs', '2'])
+        previous_runs = sct_run_batch.read_batch_log(os.path.join(out, 'log', 'sct_run_batch_log.txt'))
+        assert sorted(previous_runs) == subject_dirs
+        previous_runs['sub-01'] = (100., 10.)
+        costs = sct_run_batch.estimate_costs(subject_dirs, data, previous_runs)
+        assert costs['sub-01'] == 100.
+        assert sorted(subject_dirs, key=costs.get)[-1] == 'sub-01'
+
+
+def test_run_batch_order_and_threads():
+    with TemporaryDirectory() as data,\
+            TemporaryDirectory() as out:
+        script = os.path.join(out, 'script.sh')
+        with open(script, 'w') as f:
+            f.write(dedent("""
+            #!/bin/bash
+            echo $1 $ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS >> {}
+            """.format(os.path.join(out, 'order.txt')))[1:])
+        os.chmod(script, 0o755)
+        subject_dirs = ['sub-01', 'sub-02', 'sub-03']
+        for subj_dir in subject_dirs:
+            os.makedirs(os.path.join(data, subj_dir))
+        results, runs = sct_run_batch.run_batch(
+            subject_dirs, {'sub-01': 1, 'sub-02': 3, 'sub-03': 2}, jobs=1, itk_threads=0, script=script,
+            script_args='', path_segmanual=data, path_data=data, path_data_processed=out, path_results=out,
+            path_log=out, path_qc=out)
+        assert [res.returncode for res in results] == [0, 0, 0]
+        assert sorted(runs) == subject_dirs
+        # Most costly subjects first, each one using all the cores
+        n_cores = str(multiprocessing.cpu_count())
+        with open(os.path.join(out, 'order.txt')) as f:
+            assert [line.split() for line in f] == [['sub-02', n_cores], ['sub-03', n_cores], ['sub-01', n_cores]]
+
+
+def test_read_batch_log_spaces():
+    with TemporaryDirectory() as out:
+        fname = os.path.join(out, 'sct_run_batch_log.txt')
+        with open(fname, 'w') as f:
+            f.write('Finished at 10h00m00s: sub-01 (duration: 12.5 s, peak memory: 100 MB, ITK threads: 1)\n'
+                    'Finished at 10h00m01s: sub 02/ses 01 (duration: 3.0 s, peak memory: 20 MB, ITK threads: 1)\n')
+        assert sct_run_batch.read_batch_log(fname) == {'sub-01': (12.5, 100.0), 'sub 02/ses 01': (3.0, 20.0)}
+
+
+@pytest.mark.skipif(sys.platform.startswith("win"), reason="Process groups are POSIX only")
+def test_terminate_single_children():
+    import psutil
+    import time
+    with TemporaryDirectory() as data,\
+            TemporaryDirectory() as out:
+        # Script starting a program in the background, as the processing scripts do with e.g. sct_deepseg
+        script = os.path.join(out, 'script.sh')
+        fname_pid = os.path.join(out, 'pid.txt')
+        with open(script, 'w') as f:
+            f.write(dedent("""
+            #!/bin/bash
+            sleep 60 &
+            echo $! > {}
+            wait
+            """.format(fname_pid))[1:])
+        os.chmod(script, 0o755)
+        os.makedirs(os.path.join(data, 'sub-01'))
+        job = sct_run_batch.start_single('sub-01', script, '', data, data, out, out, out, out, 1)
+        for _ in range(100):
+            if os.path.isfile(fname_pid) and os.path.getsize(fname_pid):
+                break
+            time.sleep(0.05)
+        with open(fname_pid) as f:
+            child = psutil.Process(int(f.read()))
+        sct_run_batch.terminate_single(job)
+        assert job.process.wait(timeout=5) != 0
+        child.wait(timeout=5)
+        assert not child.is_running()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# pytest unit tests for spinalcordtoolbox.compat.server
+
+import os
+import sys
+import time
+import socket
+import subprocess
+
+import pytest
+
+from spinalcordtoolbox.compat import launcher
+from spinalcordtoolbox.compat import server as command_server
+from spinalcordtoolbox.utils.sys import sct_dir_local_path
+
+
+@pytest.fixture()
+def server(tmp_path):
+    """Start a command server, without preloading modules."""
+    path_socket = str(tmp_path / 'sct.sock')
+    process = subprocess.Popen([sys.executable, '-c', 'from spinalcordtoolbox.compat.server import serve; '
+                                                      'serve({!r}, preload=[])'.format(path_socket)])
+    for _ in range(100):
+        if os.path.exists(path_socket):
+            break
+        time.sleep(0.1)
+    yield path_socket
+    process.terminate()
+    process.wait()
+    assert not os.path.exists(path_socket)
+
+
+def forward(path_socket, script, args, cwd):
+    """Forward a command to the server from a new client process."""
+    return subprocess.run([sys.executable, '-c', 'import os, sys; from spinalcordtoolbox.compat.server import forward; '
+                                                 'sys.exit(forward({!r}, {!r}, {!r}, os.environ))'
+                           .format(path_socket, script, args)],
+                          cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def test_forward(server, tmp_path):
+    script = str(tmp_path / 'script.py')
+    with open(script, 'w') as f:
+        f.write("import os, sys\n"
+                "print(os.getcwd(), sys.argv[1:])\n"
+                "print('error', file=sys.stderr)\n"
+                "sys.exit(int(sys.argv[1]))\n")
+    # The command runs in the working directory of the client, with its streams, and returns its exit status
+    for status in [0, 3]:
+        res = forward(server, script, [str(status), 'arg'], cwd=str(tmp_path))
+        assert res.returncode == status
+        assert res.stdout.decode().strip() == "{} ['{}', 'arg']".format(tmp_path, status)
+        assert res.stderr.decode().strip() == 'error'
+
+    # SCT scripts
+    res = forward(server, sct_dir_local_path('spinalcordtoolbox', 'scripts', 'sct_version.py'), [], cwd=str(tmp_path))
+    assert res.returncode == 0
+    assert res.stdout.decode().strip()
+
+
+def dead_socket(path_socket):
+    """Socket file left by a server that is not running anymore."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path_socket)
+    sock.close()
+    return path_socket
+
+
+def test_forward_no_server(tmp_path):
+    # Without server (no socket, or a socket that nobody listens to), the command is not run
+    assert command_server.forward(str(tmp_path / 'sct.sock'), 'script.py', [], os.environ) is None
+    assert command_server.forward(dead_socket(str(tmp_path / 'dead.sock')), 'script.py', [], os.environ) is None
+
+
+def test_launcher_no_server(tmp_path, monkeypatch):
+    """The launcher starts a new interpreter when the server set by SCT_SERVER is not running."""
+    class Exec(Exception):
+        pass
+
+    def execvpe(file, args, env):
+        raise Exec(file, args, env)
+    monkeypatch.setattr(os, 'execvpe', execvpe)
+    monkeypatch.setattr(sys, 'argv', [os.path.join('bin', 'sct_version'), '-h'])
+    monkeypatch.delenv('SCT_MPI_MODE', raising=False)
+    monkeypatch.setenv('SCT_SERVER', dead_socket(str(tmp_path / 'dead.sock')))
+    with pytest.raises(Exec) as e:
+        launcher.main()
+    file, args, env = e.value.args
+    assert file == sys.executable
+    assert args == [sys.executable, sct_dir_local_path('spinalcordtoolbox', 'scripts', 'sct_version.py'), '-h']
+    assert env['SCT_SERVER'] == str(tmp_path / 'dead.sock')
@@ -2,7 +2,12 @@
 # -*- coding: utf-8
 # pytest unit tests for spinalcordtoolbox.straightening
 
-from spinalcordtoolbox.straightening import SpinalCordStraightener
+import numpy as np
+import nibabel
+from nibabel import Nifti1Header
+
+from spinalcordtoolbox.straightening import (SpinalCordStraightener, _create_warping_field, _get_chunks,
+                                               _fill_warping_field)
 from spinalcordtoolbox.utils import sct_test_path
 
 VERBOSE = 0  # Set to 2 to save images, 0 otherwise
@@ -18,3 +23,39 @@ def test_straighten(tmp_path):
     sc_straight.straighten()
     assert sc_straight.mse_straightening < 0.8
     assert sc_straight.max_distance_straightening < 1.2
+
+
+def test_create_warping_field(tmp_path):
+    """Warping fields filled by chunks through a memory-mapped file should be readable as regular NIfTI files"""
+    fname_warp = str(tmp_path / 'warp.nii')
+    nx, ny, nz = 8, 6, 10
+    hdr = Nifti1Header()
+    hdr.set_data_shape((nx, ny, nz))
+    hdr.set_zooms((0.5, 0.5, 1.0))
+    data_warp = _create_warping_field(fname_warp, hdr, (nx, ny, nz))
+    displacements = np.random.rand(nx, ny, nz, 1, 3).astype(np.float32)
+    chunks = _get_chunks(nx, ny, nz, chunk_size=3 * nx * ny)
+    assert chunks == [(0, 3), (3, 6), (6, 9), (9, 10)]
+    for z_start, z_end in chunks:
+        data_warp[:, :, z_start:z_end, 0, :] = displacements[:, :, z_start:z_end, 0, :]
+    data_warp.flush()
+    del data_warp
+    img = nibabel.load(fname_warp)
+    assert img.header.get_intent()[0] == 'vector'
+    assert img.get_data_dtype() == np.float32
+    np.testing.assert_array_equal(np.asanyarray(img.dataobj), displacements)
+
+
+def test_fill_warping_field_jobs(tmp_path):
+    """Warping fields computed by chunks in parallel threads should be identical to the sequential ones"""
+    nx, ny, nz = 8, 6, 10
+    hdr = Nifti1Header()
+    hdr.set_data_shape((nx, ny, nz))
+    data_warps = []
+    for jobs in [1, 3]:
+        data_warp = _create_warping_field(str(tmp_path / 'warp_{}.nii'.format(jobs)), hdr, (nx, ny, nz))
+        _fill_warping_field(data_warp, lambda indexes: (indexes * [1., 2., 3.]).astype(np.float32),
+                            chunk_size=2 * nx * ny, jobs=jobs)
+        data_warps.append(data_warp)
+    np.testing.assert_array_equal(data_warps[0][:, :, :, 0, 2], -3 * np.mgrid[0:nx, 0:ny, 0:nz][2])
+    np.testing.assert_array_equal(data_warps[0], data_warps[1])
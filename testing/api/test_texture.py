@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# pytest unit tests for spinalcordtoolbox.texture
+
+import numpy as np
+import pytest
+from scipy import ndimage
+
+from spinalcordtoolbox import texture
+
+try:
+    from skimage.feature import graycomatrix as greycomatrix, graycoprops as greycoprops
+except ImportError:
+    from skimage.feature import greycomatrix, greycoprops
+
+
+def dummy_texture(seed, shape=(30, 30, 3)):
+    """Smooth random image (values in [0, 255]) and a disk-shaped mask in each slice."""
+    data = ndimage.gaussian_filter(np.random.RandomState(seed).rand(*shape), 1)
+    data = (data - data.min()) / (data.max() - data.min()) * 255
+    x, y = np.mgrid[:shape[0], :shape[1]]
+    seg = np.repeat((((x - 15) ** 2 + (y - 15) ** 2) < 100)[..., np.newaxis], shape[2], axis=2)
+    return data, seg.astype(np.uint8)
+
+
+@pytest.mark.parametrize('distance', [1, 2])
+def test_glcm_features_slice(distance):
+    """Same features as greycomatrix/greycoprops computed on the window of each valid pixel."""
+    data, seg = dummy_texture(0)
+    data, seg = data[:, :, 0], seg[:, :, 0]
+    angles = [0, 30, 45, 90, 135]
+    maps = texture.glcm_features_slice(data, seg, distance, angles)
+
+    centers = texture.get_valid_centers(seg, distance)
+    assert 0 < centers.sum() < seg.sum()
+    for x, y in np.argwhere(centers)[::7]:
+        window = data[x - distance:x + distance + 1, y - distance:y + distance + 1].astype(np.uint8)
+        glcm = greycomatrix(window, [distance], np.radians(angles), symmetric=True, normed=True)
+        for feature in texture.GLCM_FEATURES:
+            expected = greycoprops(glcm, feature)[0]
+            assert np.allclose([maps[feature, angle][x, y] for angle in angles], expected)
+    for map_feature in maps.values():
+        assert not map_feature[~centers].any()
+
+    with pytest.raises(ValueError):
+        texture.glcm_features_slice(data, seg, distance, angles, features=['entropy'])
+
+
+def test_glcm_features_jobs():
+    """Computing the slices in parallel gives the same maps."""
+    data, seg = dummy_texture(1)
+    seg[:, :, 1] = 0
+    maps = texture.glcm_features(data, seg, 1, [0, 90], features=['contrast', 'ASM'])
+    maps_parallel = texture.glcm_features(data, seg, 1, [0, 90], features=['contrast', 'ASM'], jobs=2)
+    assert maps.keys() == maps_parallel.keys() == {(f, a) for f in ['contrast', 'ASM'] for a in [0, 90]}
+    for key in maps:
+        assert np.array_equal(maps[key], maps_parallel[key])
+        assert not maps[key][:, :, 1].any() and maps[key][:, :, 0].any()
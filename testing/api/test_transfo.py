@@ -2,13 +2,19 @@
 # -*- coding: utf-8
 # pytest unit tests for transform stuff
 
+import os
 import sys
+import shutil
 
+import pytest
 import numpy as np
 import nibabel
 import nibabel.orientations
+from scipy import ndimage
 
 import spinalcordtoolbox.image as msct_image
+from spinalcordtoolbox.registration import warp
+from spinalcordtoolbox.utils import sct_dir_local_path
 
 from spinalcordtoolbox.scripts import sct_apply_transfo
 
@@ -430,3 +436,182 @@ def test_transfo_skip_pix2phys(tmp_path):
     assert np.allclose(dat_dst[:, 0, :], 0)
     assert np.allclose(dat_dst[:, :, 0], 0)
     assert np.allclose(dat_src[:-1, :-1, :-1], dat_dst[1:, 1:, 1:])
+
+
+def ants_available():
+    return os.path.isfile(sct_dir_local_path('bin', 'isct_antsApplyTransforms')) \
+        or shutil.which('isct_antsApplyTransforms') is not None
+
+
+def fake_warp_sct(data, orientation="LPI"):
+    """
+    :return: an Image (5D displacement field) in RAS+ space, reoriented to `orientation`
+    """
+    img_warp = fake_image_sct_custom(data)
+    img_warp.header.set_intent('vector', (), '')
+    return img_warp.change_orientation(orientation)
+
+
+@pytest.mark.parametrize("orientation", msct_image.all_refspace_strings())
+def test_transfo_numpy_shift_wrt_orientations(tmp_path, orientation):
+    """Shift by a displacement field (in the LPS frame of ANTs) with the numpy backend, in all the orientations."""
+    shift_wanted = np.array([1, 2, 3])
+    shift = shift_wanted * [1, 1, -1]  # ANTs / ITK reference frame is LPS, ours is LPI
+
+    path_src = str(tmp_path / "warp-src.nii")
+    img_src = fake_3dimage_sct().change_orientation(orientation).save(path_src)
+    path_warp = str(tmp_path / "warp-field.nii")
+    data = np.zeros((10, 20, 30, 1, 3), order="F")
+    data[:, :, :, 0] = shift
+    fake_warp_sct(data, orientation).save(path_warp)
+
+    path_dst = str(tmp_path / "warp-dst.nii")
+    sct_apply_transfo.Transform(input_filename=path_src, fname_dest=path_src, list_warp=[path_warp],
+                                output_filename=path_dst, interp='linear', backend='numpy').apply()
+    img_dst = msct_image.Image(path_dst)
+
+    assert img_dst.orientation == img_src.orientation
+    assert img_dst.data.shape == img_src.data.shape
+    # The value at the center of the source is found `shift_wanted` away (in physical coordinates) in the destination
+    value = 50505
+    pt_src = np.argwhere(img_src.data == value)[0]
+    pt_dst = np.argwhere(np.isclose(img_dst.data, value))[0]
+    aff = img_src.header.get_best_affine()
+    displacement = (aff @ np.hstack((pt_dst, [1])) - aff @ np.hstack((pt_src, [1])))[:3]
+    assert np.allclose(displacement, shift_wanted)
+
+
+def test_transfo_numpy_skip_pix2phys(tmp_path):
+    """Same as test_transfo_skip_pix2phys(), with the numpy backend."""
+    path_src = str(tmp_path / "warp-src.nii")
+    img_src = fake_3dimage_sct().save(path_src)
+    data = np.ones((10, 20, 30, 1, 3), order="F")
+    data[..., 2] *= -1
+    path_warp = str(tmp_path / "warp-field111.nii")
+    fake_warp_sct(data).save(path_warp)
+
+    path_dst = str(tmp_path / "warp-dst111.nii")
+    sct_apply_transfo.Transform(input_filename=path_src, fname_dest=path_src, list_warp=[path_warp],
+                                output_filename=path_dst, backend='numpy').apply()
+    dat_src = img_src.data
+    dat_dst = msct_image.Image(path_dst).data
+
+    assert np.allclose(dat_dst[0, :, :], 0)
+    assert np.allclose(dat_dst[:, 0, :], 0)
+    assert np.allclose(dat_dst[:, :, 0], 0)
+    assert np.allclose(dat_src[:-1, :-1, :-1], dat_dst[1:, 1:, 1:])
+
+
+def test_transfo_numpy_affine_and_4d(tmp_path):
+    """Chain of an (inverted) ITK affine transformation and a displacement field, on a 4D image."""
+    path_affine = str(tmp_path / "affine.txt")
+    with open(path_affine, 'w') as f:
+        # Translation of (-1, -2, 0) in LPS, i.e. (1, 2, 0) in RAS, around an arbitrary center
+        f.write("#Insight Transform File V1.0\n#Transform 0\nTransform: AffineTransform_double_3_3\n"
+                "Parameters: 1 0 0 0 1 0 0 0 1 -1 -2 0\nFixedParameters: 4 5 6\n")
+    affine = warp.read_affine(path_affine)
+    assert np.allclose(affine, [[1, 0, 0, -1], [0, 1, 0, -2], [0, 0, 1, 0], [0, 0, 0, 1]])
+    assert np.allclose(warp.read_affine(path_affine, inverse=True) @ affine, np.eye(4))
+
+    path_warp = str(tmp_path / "warp-field.nii")
+    data = np.zeros((10, 20, 30, 1, 3), order="F")
+    data[..., 2] = -3  # (0, 0, 3) in RAS
+    fake_warp_sct(data).save(path_warp)
+
+    data = np.stack([fake_3dimage_sct().data * (t + 1) for t in range(4)], axis=3)
+    path_src = str(tmp_path / "src-4d.nii")
+    fake_image_sct_custom(data).save(path_src)
+    path_dest = str(tmp_path / "dest.nii")
+    fake_3dimage_sct().save(path_dest)
+
+    # The destination points are displaced by (0, 0, -3) (in RAS) by the field, then by (-1, -2, 0) by the inverted
+    # affine transformation, so the image is shifted by (1, 2, 3) voxels
+    path_dst = str(tmp_path / "dst-4d.nii")
+    sct_apply_transfo.Transform(input_filename=path_src, fname_dest=path_dest, list_warp=[path_affine, path_warp],
+                                list_warpinv=[path_affine], output_filename=path_dst, interp='nn',
+                                backend='numpy').apply()
+    img_dst = msct_image.Image(path_dst)
+
+    assert img_dst.data.shape == (10, 20, 30, 4)
+    assert np.allclose(img_dst.data[1:, 2:, 3:], data[:-1, :-2, :-3])
+    assert np.allclose(img_dst.data[0], 0)
+
+
+def test_transfo_numpy_grid_cache(tmp_path, monkeypatch):
+    """The sampling grid is only reused by the Transforms sharing a cache, until the warping field is modified."""
+    path_src = str(tmp_path / "warp-src.nii")
+    fake_3dimage_sct().save(path_src)
+    path_warp = str(tmp_path / "warp-field.nii")
+    fake_warp_sct(np.ones((10, 20, 30, 1, 3), order="F")).save(path_warp)
+
+    read_transforms = warp.read_transforms
+    calls = []
+
+    def read_transforms_counted(*args):
+        calls.append(args)
+        return read_transforms(*args)
+    monkeypatch.setattr(warp, 'read_transforms', read_transforms_counted)
+
+    def apply(grid_cache=None):
+        path_dst = str(tmp_path / "warp-dst.nii")
+        sct_apply_transfo.Transform(input_filename=path_src, fname_dest=path_src, list_warp=[path_warp],
+                                    output_filename=path_dst, interp='linear', backend='numpy',
+                                    grid_cache=grid_cache).apply()
+        return msct_image.Image(path_dst).data
+
+    data = apply()
+    apply()
+    assert len(calls) == 2
+    grid_cache = {}
+    assert np.allclose(apply(grid_cache), data)
+    assert np.allclose(apply(grid_cache), data)
+    assert len(calls) == 3
+    assert len(grid_cache) == 1
+    # Modified warping field
+    os.utime(path_warp, (0, 0))
+    apply(grid_cache)
+    assert len(calls) == 4
+    assert len(grid_cache) == 1
+
+
+@pytest.mark.skipif(not ants_available(), reason="isct_antsApplyTransforms is not installed")
+@pytest.mark.parametrize("interp", ['nn', 'linear', 'spline'])
+def test_transfo_numpy_parity_with_ants(tmp_path, interp):
+    """The numpy backend gives the same output as isct_antsApplyTransforms, for a chain of an affine transformation
+    and a smooth displacement field, between images of different orientations and resolutions."""
+    rng = np.random.RandomState(0)
+    path_src = str(tmp_path / "src.nii")
+    fake_3dimage_sct().change_orientation("RPI").save(path_src)
+    im_dest = msct_image.Image(np.zeros((12, 18, 25), dtype=np.float32),
+                               hdr=fake_image_custom(np.zeros((1, 1, 1))).header)
+    im_dest.hdr.set_zooms((0.8, 1.1, 1.2))
+    im_dest.hdr.set_qform(np.diag([0.8, 1.1, 1.2, 1]) + np.array([[0, 0, 0, 0.3], [0, 0, 0, -0.7], [0, 0, 0, 1.5],
+                                                                     [0, 0, 0, 0]]))
+    im_dest.hdr.set_sform(im_dest.hdr.get_qform())
+    path_dest = str(tmp_path / "dest.nii")
+    im_dest.change_orientation("PIL").save(path_dest)
+
+    path_affine = str(tmp_path / "affine.txt")
+    with open(path_affine, 'w') as f:
+        f.write("#Insight Transform File V1.0\n#Transform 0\nTransform: AffineTransform_double_3_3\n"
+                "Parameters: 0.98 0.1 0 -0.1 0.98 0.05 0 -0.05 1.02 0.7 -1.3 2.1\nFixedParameters: 5 9 14\n")
+    data = ndimage.gaussian_filter(rng.uniform(-3, 3, (10, 20, 30, 1, 3)), (3, 3, 3, 0, 0))
+    path_warp = str(tmp_path / "warp-field.nii")
+    fake_warp_sct(data, "LPI").save(path_warp)
+
+    outputs = {}
+    for backend in ['ants', 'numpy']:
+        outputs[backend] = str(tmp_path / "dst-{}.nii".format(backend))
+        sct_apply_transfo.Transform(input_filename=path_src, fname_dest=path_dest, list_warp=[path_warp, path_affine],
+                                    output_filename=outputs[backend], interp=interp, backend=backend).apply()
+    dat_ants = msct_image.Image(outputs['ants']).data
+    dat_numpy = msct_image.Image(outputs['numpy']).data
+
+    assert dat_ants.shape == dat_numpy.shape
+    # Only voxels sampled far from the edges of the source image are compared, as ITK and SciPy do not handle the
+    # boundaries in the exact same way
+    mask = ndimage.binary_erosion(dat_ants != 0, iterations=2)
+    if interp == 'nn':
+        assert np.mean(dat_ants[mask] == dat_numpy[mask]) > 0.99
+    else:
+        assert np.allclose(dat_ants[mask], dat_numpy[mask], rtol=1e-3, atol=1)
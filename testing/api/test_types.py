@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# pytest unit tests for spinalcordtoolbox.types
+
+import numpy as np
+
+from spinalcordtoolbox.types import Centerline
+
+
+def dummy_centerline(n=100):
+    """Helix-like centerline along z."""
+    t = np.linspace(0, 1, n)
+    points = [5 * np.sin(3 * t), 3 * np.cos(2 * t), 100 * t]
+    return Centerline(*points, *[np.gradient(p) for p in points])
+
+
+def test_centerline_coordinate_systems():
+    """The frame of each point is orthonormal, with the derivative as Z axis and the X axis in the axial plane."""
+    centerline = dummy_centerline()
+    assert centerline.matrices.shape == (100, 3, 3)
+    assert np.allclose(centerline.inverse_matrices, np.linalg.inv(centerline.matrices))
+    assert np.allclose(centerline.matrices[:, :, 2], centerline.derivatives)
+    assert np.allclose(np.linalg.norm(centerline.derivatives, axis=1), 1)
+    assert np.allclose(centerline.matrices[:, 1, 0], 0)
+    for index in [0, 50, 99]:
+        origin, x_axis, y_axis, z_axis, matrix, inverse_matrix = centerline.compute_coordinate_system(index)
+        assert np.allclose(inverse_matrix @ matrix, np.eye(3))
+        assert np.allclose(np.cross(y_axis, z_axis), x_axis)
+        # A point of the plane has a null Z coordinate, and goes back to the same point
+        point = origin + 2 * x_axis - y_axis
+        assert np.allclose(centerline.get_in_plane_coordinates(point, index), [2, -1, 0])
+        assert np.allclose(centerline.get_inverse_plans_coordinates(np.array([[2, -1, 0]]), np.array([index])), point)
+        assert np.isclose(centerline.get_distance_from_plane(point + z_axis, index), 1)
+
+
+def test_centerline_length():
+    """Lengths between consecutive points, cumulated from the first and the last point."""
+    centerline = dummy_centerline()
+    distances = np.linalg.norm(np.diff(centerline.points, axis=0), axis=1)
+    assert np.isclose(centerline.length, distances.sum())
+    assert np.allclose(centerline.progressive_length, [0] + distances.tolist())
+    assert np.allclose(centerline.incremental_length, [0] + np.cumsum(distances).tolist())
+    assert np.allclose(centerline.incremental_length_inverse, [0] + np.cumsum(distances[::-1]).tolist())
+
+
+def test_centerline_save_load(tmp_path):
+    """A saved centerline is loaded memory-mapped, with the same coordinate systems and vertebral distribution."""
+    centerline = dummy_centerline()
+    disks_levels = [[*centerline.points[index], level] for index, level in [(90, 1), (60, 3), (30, 4), (5, 5)]]
+    centerline.compute_vertebral_distribution(disks_levels)
+    fname = str(tmp_path / 'centerline')
+    centerline.save_centerline(fname_output=fname)
+    centerline_loaded = Centerline(fname=fname + '.npz')
+    assert isinstance(centerline_loaded.points.base, np.memmap)
+    for attr in ['points', 'derivatives', 'matrices', 'inverse_matrices', 'plans_parameters', 'incremental_length']:
+        assert np.array_equal(getattr(centerline_loaded, attr), getattr(centerline, attr))
+    assert centerline_loaded.dist_points_rel == centerline.dist_points_rel
+    assert centerline_loaded.label_reference == 'C1'
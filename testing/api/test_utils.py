@@ -42,3 +42,72 @@ def test_sct_argument_parser(capsys):
     with pytest.raises(SystemExit) as e:
         parser3.parse_args(['-h'])
     assert e.value.code == 0
+
+
+def test_cache_key():
+    """Cache keys should depend on the content of numpy arrays, not on their (truncated) string representation"""
+    import numpy as np
+    data = np.zeros((100, 100))
+    key = utils.cache_key(input_data=[data], input_params={'a': 1})
+    assert key == utils.cache_key(input_data=[data.copy()], input_params={'a': 1})
+    assert key != utils.cache_key(input_data=[data], input_params={'a': 2})
+    data[50, 50] = 1
+    assert key != utils.cache_key(input_data=[data], input_params={'a': 1})
+
+
+def test_cache_store_fetch_evict(tmp_path):
+    """Test the persistent cache, including the eviction of the least recently used entries"""
+    import os
+    path_cache = str(tmp_path / 'cache')
+    os.makedirs(path_cache)
+    fname_src = str(tmp_path / 'src.txt')
+    with open(fname_src, 'w') as f:
+        f.write('x' * 100)
+    fname_dest = str(tmp_path / 'dest.txt')
+    assert not utils.cache_fetch(path_cache, 'key1', {'file.txt': fname_dest})
+    utils.cache_store(path_cache, 'key1', {'file.txt': fname_src}, max_size=250)
+    assert utils.cache_fetch(path_cache, 'key1', {'file.txt': fname_dest})
+    with open(fname_dest) as f:
+        assert f.read() == 'x' * 100
+    # Entries which do not contain all the requested files are not valid
+    assert not utils.cache_fetch(path_cache, 'key1', {'file.txt': fname_dest, 'other.txt': fname_dest})
+    # Make key1 the least recently used entry, then exceed the maximum size
+    utils.cache_store(path_cache, 'key2', {'file.txt': fname_src}, max_size=250)
+    os.utime(os.path.join(path_cache, 'key1'), (0, 0))
+    utils.cache_store(path_cache, 'key3', {'file.txt': fname_src}, max_size=250)
+    assert sorted(os.listdir(path_cache)) == ['key2', 'key3']
+
+
+def test_run_proc_in_process(tmp_path, monkeypatch):
+    import numpy as np
+    import nibabel as nib
+    from spinalcordtoolbox.utils.sys import _get_in_process_cmd
+
+    monkeypatch.chdir(tmp_path)
+    nib.save(nib.Nifti1Image(np.random.rand(8, 8, 4).astype(np.float32), np.diag([1, 1, 2, 1])), 'a.nii.gz')
+
+    # Python SCT scripts are called in-process, unless a subprocess is needed or requested
+    assert _get_in_process_cmd(['sct_resample', '-i', 'a.nii.gz'], None, None, False) == ['sct_resample', '-i', 'a.nii.gz']
+    assert _get_in_process_cmd('sct_image -i a.nii.gz -getorient', None, None, False) is not None
+    assert _get_in_process_cmd('sct_image -i a.nii.gz -getorient > orient.txt', None, None, False) is None
+    assert _get_in_process_cmd(['sct_image', '-i', 'a.nii.gz'], str(tmp_path.parent), None, False) is None
+    assert _get_in_process_cmd(['sct_image', '-i', 'a.nii.gz'], None, {'PATH': ''}, False) is None
+    assert _get_in_process_cmd(['isct_antsRegistration'], None, None, True) is None
+    monkeypatch.setenv('SCT_RUN_PROC_SUBPROCESS', '1')
+    assert _get_in_process_cmd(['sct_resample', '-i', 'a.nii.gz'], None, None, False) is None
+    monkeypatch.delenv('SCT_RUN_PROC_SUBPROCESS')
+
+    # Module-level parameters of the scripts do not carry over between calls (e.g. -ref of sct_resample)
+    status, _ = utils.run_proc(['sct_resample', '-i', 'a.nii.gz', '-mm', '0.5x0.5x1', '-o', 'b.nii.gz'], verbose=0)
+    assert status == 0
+    utils.run_proc(['sct_resample', '-i', 'a.nii.gz', '-ref', 'b.nii.gz', '-o', 'c.nii.gz'], verbose=0)
+    utils.run_proc(['sct_resample', '-i', 'a.nii.gz', '-f', '3x3x3', '-o', 'd.nii.gz'], verbose=0)
+    assert nib.load('b.nii.gz').shape == nib.load('c.nii.gz').shape == (16, 16, 8)
+    assert nib.load('d.nii.gz').shape == (24, 24, 12)
+
+    # Errors are reported as for subprocesses
+    status, output = utils.run_proc(['sct_resample', '-i', 'a.nii.gz'], raise_exception=False, verbose=0)
+    assert status == 2
+    assert 'you need to specify one of those three arguments' in output
+    with pytest.raises(RuntimeError, match='nonexistent.nii.gz'):
+        utils.run_proc(['sct_resample', '-i', 'nonexistent.nii.gz', '-mm', '1', '-o', 'e.nii.gz'], verbose=0)
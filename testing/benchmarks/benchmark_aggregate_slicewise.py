@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Benchmark of the metric extraction of sct_extract_metric (extract_metric() for each label of the PAM50 atlas), with
+# the slice groups aggregated at once (grouped reductions) against one slice group at a time.
+#
+# Usage:
+#   python testing/benchmarks/benchmark_aggregate_slicewise.py [-f data/PAM50/atlas] \
+#       [-vertfile data/PAM50/template/PAM50_levels.nii.gz] [-method wa median] [-repeat 3]
+
+import argparse
+import logging
+import os
+import time
+
+import numpy as np
+from scipy import ndimage
+
+from spinalcordtoolbox import aggregate_slicewise
+from spinalcordtoolbox.aggregate_slicewise import Metric, LabelStruc, extract_metric
+from spinalcordtoolbox.image import Image
+from spinalcordtoolbox.metadata import read_label_file
+from spinalcordtoolbox.utils import sct_dir_local_path
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Benchmark extract_metric() across the labels of an atlas.")
+    parser.add_argument('-f', default=sct_dir_local_path('data', 'PAM50', 'atlas'),
+                        help="Atlas folder (with info_label.txt).")
+    parser.add_argument('-vertfile', default=sct_dir_local_path('data', 'PAM50', 'template', 'PAM50_levels.nii.gz'),
+                        help="Vertebral labeling, for the per-level aggregation.")
+    parser.add_argument('-method', nargs='+', default=['wa', 'bin', 'median', 'max'],
+                        choices=['wa', 'bin', 'median', 'max'], help="Estimation methods.")
+    parser.add_argument('-repeat', type=int, default=3, help="Number of runs per mode (the fastest is kept).")
+    return parser
+
+
+def extract_all_labels(data, labels, label_struc, method, **kwargs):
+    """Extract the metric in all the labels, as sct_extract_metric does."""
+    return [extract_metric(data, labels=labels, method=method, label_struc=label_struc, id_label=id_label,
+                           indiv_labels_ids=list(label_struc), **kwargs)
+            for id_label in label_struc]
+
+
+def main():
+    args = get_parser().parse_args()
+    logging.disable(logging.WARNING)
+
+    indiv_labels_ids, _, indiv_labels_files, _, _, _, _ = read_label_file(args.f, 'info_label.txt')
+    labels = np.stack([Image(os.path.join(args.f, fname)).change_orientation('RPI').data
+                       for fname in indiv_labels_files], axis=3)
+    label_struc = {id_label: LabelStruc(id=id_label, name=str(id_label)) for id_label in indiv_labels_ids}
+    # Smooth random metric (e.g. FA), with a few non-finite voxels
+    metric = ndimage.gaussian_filter(np.random.RandomState(0).rand(*labels.shape[:3]), 2).astype(np.float32)
+    metric[np.random.RandomState(1).rand(*metric.shape) < 1e-4] = np.nan
+    data = Metric(data=metric, label='')
+    nz = labels.shape[2]
+    print(f"{args.f}: {labels.shape[3]} labels, {nz} slices")
+
+    grouped_funcs = aggregate_slicewise._GROUPED_FUNCS.copy()
+    for name, kwargs in [('perslice', dict(perslice=True)),
+                         ('perlevel', dict(levels=list(range(1, 21)), perlevel=True, vert_level=args.vertfile))]:
+        if 'vert_level' in kwargs and not os.path.isfile(args.vertfile):
+            continue
+        for method in args.method:
+            results = {}
+            for mode, funcs in [('per-group', {}), ('grouped', grouped_funcs)]:
+                aggregate_slicewise._GROUPED_FUNCS = funcs
+                durations = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    agg_metrics = extract_all_labels(data, labels, label_struc, method, **kwargs)
+                    durations.append(time.perf_counter() - start)
+                results[mode] = agg_metrics, min(durations)
+            aggregate_slicewise._GROUPED_FUNCS = grouped_funcs
+
+            max_difference = 0
+            for agg_per_group, agg_grouped in zip(results['per-group'][0], results['grouped'][0]):
+                for slicegroup in agg_per_group:
+                    for key, value in agg_per_group[slicegroup].items():
+                        if isinstance(value, (float, np.floating)):
+                            max_difference = max(max_difference, abs(value - agg_grouped[slicegroup][key]))
+            print(f"  {name} {method:>6}: per-group {results['per-group'][1]:.3f} s, "
+                  f"grouped {results['grouped'][1]:.3f} s, speedup {results['per-group'][1] / results['grouped'][1]:.1f}x "
+                  f"(max absolute difference: {max_difference:.2g})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Benchmark of the 'batch' engine of process_seg.compute_shape() against the reference 'loop' engine.
+#
+# Usage:
+#   python testing/benchmarks/benchmark_compute_shape.py [-nz 600] [-repeat 3]
+
+import argparse
+import logging
+import os
+import time
+
+import numpy as np
+
+from spinalcordtoolbox import process_seg
+from spinalcordtoolbox.centerline.core import ParamCenterline
+from spinalcordtoolbox.testing.create_test_data import dummy_segmentation
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Benchmark process_seg.compute_shape() engines.")
+    parser.add_argument('-nz', type=int, default=600, help="Number of axial slices of the dummy segmentation.")
+    parser.add_argument('-repeat', type=int, default=3, help="Number of runs per engine (the fastest is kept).")
+    return parser
+
+
+def main():
+    args = get_parser().parse_args()
+    os.environ['SCT_PROGRESS_BAR'] = 'off'
+    logging.disable(logging.WARNING)
+
+    # 0.5 mm isotropic, angled elliptical cord
+    im_seg = dummy_segmentation(size_arr=(64, 64, args.nz), pixdim=(0.5, 0.5, 0.5), shape='ellipse',
+                                radius_RL=13.0, radius_AP=5.0, angle_RL=-10.0, angle_AP=15.0)
+    for angle_correction in [False, True]:
+        results = {}
+        for engine in ['loop', 'batch']:
+            durations = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                metrics, _ = process_seg.compute_shape(im_seg, angle_correction=angle_correction,
+                                                       param_centerline=ParamCenterline(), verbose=0, engine=engine)
+                durations.append(time.perf_counter() - start)
+            results[engine] = metrics, min(durations)
+        print(f"angle_correction={angle_correction}, {args.nz} slices")
+        for engine, (_, duration) in results.items():
+            print(f"  {engine:>5}: {duration:.3f} s ({args.nz / duration:.0f} slices/s)")
+        print(f"  speedup: {results['loop'][1] / results['batch'][1]:.1f}x")
+        for key in process_seg.PROPERTY_LIST:
+            loop, batch = results['loop'][0][key].data, results['batch'][0][key].data
+            difference = np.abs(loop - batch)
+            if key == 'orientation':
+                print(f"  max absolute difference for {key}: {np.nanmax(difference):.2e} deg")
+            else:
+                print(f"  max relative difference for {key}: {np.nanmax(difference / np.maximum(np.abs(loop), 1e-12)):.2e}")
+
+
+if __name__ == "__main__":
+    main()
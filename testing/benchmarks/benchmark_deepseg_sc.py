@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# CPU benchmark of the CNN centerline heatmap of deepseg_sc (as used by `sct_deepseg_sc -centerline cnn`): batched
+# predictions against one prediction per block.
+#
+# Usage:
+#   python testing/benchmarks/benchmark_deepseg_sc.py [-i t2.nii.gz] [-c t2] [-repeat 3]
+
+import argparse
+import logging
+import os
+import time
+
+import numpy as np
+
+os.environ['CUDA_VISIBLE_DEVICES'] = ''  # CPU only
+
+from spinalcordtoolbox.image import Image
+from spinalcordtoolbox.utils import sct_test_path, sct_dir_local_path
+from spinalcordtoolbox.deepseg_sc import core as deepseg_sc
+from spinalcordtoolbox.deepseg_sc.cnn_models import nn_architecture_ctr
+
+# Same parameters as deepseg_sc.find_centerline()
+DCT_PATCH_CTR = {'t2': {'size': (80, 80), 'mean': 51.1417, 'std': 57.4408},
+                 't2s': {'size': (80, 80), 'mean': 68.8591, 'std': 71.4659},
+                 't1': {'size': (80, 80), 'mean': 55.7359, 'std': 64.3149},
+                 'dwi': {'size': (80, 80), 'mean': 55.744, 'std': 45.003}}
+DCT_PARAMS_CTR = {'t2': {'features': 16, 'dilation_layers': 2},
+                  't2s': {'features': 8, 'dilation_layers': 3},
+                  't1': {'features': 24, 'dilation_layers': 3},
+                  'dwi': {'features': 8, 'dilation_layers': 2}}
+
+
+class PerBlockModel:
+    """Wrap a model to predict its input one block at a time, as heatmap() did before batching."""
+    def __init__(self, model):
+        self.model = model
+        self.calls = 0
+
+    def predict(self, x, batch_size=None):
+        self.calls += len(x)
+        return np.concatenate([self.model.predict(x[i:i + 1], batch_size=deepseg_sc.BATCH_SIZE)
+                               for i in range(len(x))])
+
+
+class CountingModel(PerBlockModel):
+    """Wrap a model to count its calls."""
+    def predict(self, x, batch_size=None):
+        self.calls += 1
+        return self.model.predict(x, batch_size=batch_size)
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the CNN centerline heatmap of deepseg_sc on CPU.")
+    parser.add_argument('-i', default=sct_test_path('t2', 't2.nii.gz'), help="Input image.")
+    parser.add_argument('-c', default='t2', choices=sorted(DCT_PATCH_CTR), help="Contrast of the input image.")
+    parser.add_argument('-repeat', type=int, default=3, help="Number of runs per mode (the fastest is kept).")
+    return parser
+
+
+def main():
+    args = get_parser().parse_args()
+    os.environ['SCT_PROGRESS_BAR'] = 'off'
+    logging.disable(logging.WARNING)
+
+    patch = DCT_PATCH_CTR[args.c]
+    model = nn_architecture_ctr(height=patch['size'][0], width=patch['size'][1], channels=1, classes=1,
+                                features=DCT_PARAMS_CTR[args.c]['features'], depth=2, temperature=1.0,
+                                padding='same', batchnorm=True, dropout=0.0,
+                                dilation_layers=DCT_PARAMS_CTR[args.c]['dilation_layers'])
+    model.load_weights(sct_dir_local_path('data', 'deepseg_sc_models', '{}_ctr.h5'.format(args.c)))
+    im = Image(args.i).change_orientation('RPI')
+    nz = im.dim[2]
+
+    results = {}
+    for mode, wrapper in [('per-block', PerBlockModel), ('batched', CountingModel)]:
+        durations = []
+        for _ in range(args.repeat):
+            wrapped = wrapper(model)
+            start = time.perf_counter()
+            im_heatmap, _ = deepseg_sc.heatmap(Image(im), wrapped, patch['size'], patch['mean'], patch['std'],
+                                               brain_bool=False)
+            durations.append(time.perf_counter() - start)
+        results[mode] = im_heatmap.data, min(durations), wrapped.calls
+    print(f"{args.i}, {nz} slices")
+    for mode, (_, duration, calls) in results.items():
+        print(f"  {mode:>9}: {duration:.3f} s ({nz / duration:.1f} slices/s, {calls} calls to predict)")
+    print(f"  speedup: {results['per-block'][1] / results['batched'][1]:.1f}x")
+    difference = np.abs(results['per-block'][0].astype(int) - results['batched'][0].astype(int))
+    print(f"  max absolute difference of the heatmaps: {difference.max()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Benchmark of the centerline fitting of get_centerline() with NURBS (basis matrices of the Cox-de Boor recursion),
+# against the bspline and polyfit fittings, on a dummy segmentation.
+#
+# Usage:
+#   python testing/benchmarks/benchmark_nurbs.py [-nz 200 600] [-repeat 3]
+
+import argparse
+import logging
+import os
+import time
+
+import numpy as np
+
+from spinalcordtoolbox.centerline.core import ParamCenterline, get_centerline
+from spinalcordtoolbox.testing.create_test_data import dummy_segmentation
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the nurbs, bspline and polyfit centerline fittings.")
+    parser.add_argument('-nz', type=int, nargs='+', default=[200, 600],
+                        help="Number of axial slices of the dummy segmentation.")
+    parser.add_argument('-repeat', type=int, default=3, help="Number of runs per fitting (the fastest is kept).")
+    return parser
+
+
+def main():
+    args = get_parser().parse_args()
+    os.environ['SCT_PROGRESS_BAR'] = 'off'
+    logging.disable(logging.WARNING)
+
+    for nz in args.nz:
+        # Curved cord (degree 2), 1 mm isotropic
+        im_seg = dummy_segmentation(size_arr=(64, 64, nz), shape='ellipse', angle_RL=-10.0, angle_AP=15.0)
+        results = {}
+        for algo_fitting in ['nurbs', 'bspline', 'polyfit']:
+            durations = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                _, arr_ctl, _, _ = get_centerline(im_seg, ParamCenterline(algo_fitting=algo_fitting, minmax=True),
+                                                  verbose=0)
+                durations.append(time.perf_counter() - start)
+            results[algo_fitting] = arr_ctl, min(durations)
+        print(f"{nz} slices")
+        for algo_fitting, (arr_ctl, duration) in results.items():
+            distance = np.max(np.linalg.norm(arr_ctl - results['bspline'][0], axis=0))
+            print(f"  {algo_fitting:>7}: {duration:.3f} s ({duration / results['bspline'][1]:.1f}x bspline), "
+                  f"max distance to the bspline centerline: {distance:.2f} vox")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Benchmark of reports.qc.generate_qc() for each type of QC report, on dummy images: an anatomical image simulated
+# from a dummy segmentation, its centerline, vertebral levels and labels, and 4D volumes for the motion correction.
+#
+# Usage:
+#   python testing/benchmarks/benchmark_qc.py [-nz 60] [-nt 20] [-repeat 3] [-p sct_deepseg_sc sct_fmri_moco]
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from spinalcordtoolbox.reports.qc import generate_qc
+from spinalcordtoolbox.testing.create_test_data import dummy_segmentation, dummy_segmentation_4d
+
+PROCESSES = ['sct_deepseg_sc', 'sct_register_to_template', 'sct_warp_template', 'sct_get_centerline',
+             'sct_label_vertebrae', 'sct_label_utils', 'sct_detect_pmj', 'sct_fmri_moco']
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the generation of the QC reports.")
+    parser.add_argument('-nz', type=int, default=60, help="Number of axial slices of the dummy images.")
+    parser.add_argument('-nt', type=int, default=20, help="Number of volumes of the dummy 4D images.")
+    parser.add_argument('-repeat', type=int, default=3, help="Number of runs per process (the fastest is kept).")
+    parser.add_argument('-p', nargs='+', choices=PROCESSES, default=PROCESSES, help="Types of QC reports.")
+    return parser
+
+
+def save_like(im_ref, data, fname):
+    """Save data with the header of im_ref"""
+    im = im_ref.copy()
+    im.data = data
+    im.save(fname, verbose=0)
+    return fname
+
+
+def dummy_images(path, nz, nt):
+    """Dummy input images of generate_qc(), in the folder path"""
+    rng = np.random.RandomState(0)
+    kwargs = dict(size_arr=(64, 64, nz), pixdim=(0.5, 0.5, 1), shape='ellipse', radius_RL=7.0, radius_AP=4.0,
+                  angle_RL=-10.0, angle_AP=15.0)
+    im_seg = dummy_segmentation(**kwargs)
+    seg = im_seg.data
+    anat = 100 * seg + 20 + 10 * rng.rand(*seg.shape)
+    # Vertebral levels of ~20 mm, and labels at the middle of some of them (the last one at the PMJ)
+    levels = np.where(seg > 0, 1 + np.arange(nz)[::-1] // 20, 0)
+    centerline = np.zeros_like(seg)
+    for z in range(nz):
+        x, y = np.argwhere(seg[:, :, z]).mean(axis=0).astype(int)
+        centerline[x, y, z] = 1
+    labels = np.zeros_like(seg)
+    for z in range(10, nz, 20):
+        x, y = np.argwhere(seg[:, :, z]).mean(axis=0).astype(int)
+        labels[x, y, z] = 1 + (nz - z) // 20
+    labels[32, 32, nz - 1] = 50
+    im_seg_4d = dummy_segmentation_4d(vol_num=nt, **kwargs)
+    anat_4d = 100 * im_seg_4d.data + 20 + 10 * rng.rand(*im_seg_4d.data.shape)
+    return {
+        'anat': save_like(im_seg, anat, os.path.join(path, 'anat.nii.gz')),
+        'template': save_like(im_seg, anat[::-1], os.path.join(path, 'template.nii.gz')),
+        'seg': save_like(im_seg, seg, os.path.join(path, 'seg.nii.gz')),
+        'centerline': save_like(im_seg, centerline, os.path.join(path, 'centerline.nii.gz')),
+        'levels': save_like(im_seg, levels.astype(float), os.path.join(path, 'levels.nii.gz')),
+        'labels': save_like(im_seg, labels, os.path.join(path, 'labels.nii.gz')),
+        'anat_4d': save_like(im_seg_4d, anat_4d, os.path.join(path, 'anat_4d.nii.gz')),
+    }
+
+
+def main():
+    args = get_parser().parse_args()
+    os.environ['SCT_PROGRESS_BAR'] = 'off'
+    # Only the rendering of the images is timed, not the rendering of index.html
+    os.environ['SCT_QC_DEFER_INDEX'] = '1'
+    logging.disable(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as path:
+        fnames = dummy_images(path, args.nz, args.nt)
+        inputs = {
+            'sct_deepseg_sc': dict(fname_in1=fnames['anat'], fname_seg=fnames['seg']),
+            'sct_register_to_template': dict(fname_in1=fnames['anat'], fname_in2=fnames['template'],
+                                             fname_seg=fnames['seg']),
+            'sct_warp_template': dict(fname_in1=fnames['anat'], fname_seg=fnames['seg']),
+            'sct_get_centerline': dict(fname_in1=fnames['anat'], fname_seg=fnames['centerline']),
+            'sct_label_vertebrae': dict(fname_in1=fnames['anat'], fname_seg=fnames['levels']),
+            'sct_label_utils': dict(fname_in1=fnames['anat'], fname_seg=fnames['labels']),
+            'sct_detect_pmj': dict(fname_in1=fnames['anat'], fname_seg=fnames['labels']),
+            'sct_fmri_moco': dict(fname_in1=fnames['anat_4d'], fname_in2=fnames['anat_4d'], fname_seg=fnames['seg']),
+        }
+        print(f"{args.nz} slices, {args.nt} volumes")
+        for process in args.p:
+            path_qc = os.path.join(path, 'qc_' + process)
+            durations = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                generate_qc(args='', path_qc=path_qc, process=process, **inputs[process])
+                durations.append(time.perf_counter() - start)
+            print(f"  {process:>24}: {min(durations):.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Wall-clock benchmark of sct_register_to_template, with the internal calls to other SCT scripts (run_proc) run as
+# subprocesses (as before the in-process dispatch) and in-process.
+#
+# Usage (from the sct_testing_data folder):
+#   python testing/benchmarks/benchmark_register_to_template.py [-i t2/t2.nii.gz] [-s t2/t2_seg-manual.nii.gz] \
+#       [-l t2/labels.nii.gz] [-t template] [-repeat 3]
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Benchmark sct_register_to_template with and without the in-process "
+                                                 "dispatch of run_proc().")
+    parser.add_argument('-i', default=os.path.join('t2', 't2.nii.gz'), help="Anatomical image.")
+    parser.add_argument('-s', default=os.path.join('t2', 't2_seg-manual.nii.gz'), help="Spinal cord segmentation.")
+    parser.add_argument('-l', default=os.path.join('t2', 'labels.nii.gz'), help="Vertebral labels.")
+    parser.add_argument('-t', default='template', help="Template folder.")
+    parser.add_argument('-param', default='step=1,type=seg,algo=centermassrot,metric=MeanSquares:'
+                                          'step=2,type=seg,algo=bsplinesyn,iter=5,metric=MeanSquares',
+                        help="Registration parameters.")
+    parser.add_argument('-repeat', type=int, default=3, help="Number of runs per mode (the fastest is kept).")
+    return parser
+
+
+def main():
+    args = get_parser().parse_args()
+    fnames = [os.path.abspath(fname) for fname in (args.i, args.s, args.l, args.t)]
+
+    results = {}
+    for mode, subprocess_only in [('subprocess', '1'), ('in-process', '0')]:
+        env = dict(os.environ, SCT_PROGRESS_BAR='off', SCT_RUN_PROC_SUBPROCESS=subprocess_only)
+        durations = []
+        for _ in range(args.repeat):
+            with tempfile.TemporaryDirectory() as path_out:
+                cmd = ['sct_register_to_template', '-i', fnames[0], '-s', fnames[1], '-l', fnames[2], '-t', fnames[3],
+                       '-param', args.param, '-ofolder', path_out, '-r', '1', '-v', '0']
+                start = time.perf_counter()
+                res = subprocess.run(cmd, env=env, cwd=path_out, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+                durations.append(time.perf_counter() - start)
+            if res.returncode != 0:
+                sys.exit(res.stderr.decode())
+        results[mode] = min(durations)
+
+    print("sct_register_to_template -i {}".format(args.i))
+    for mode, duration in results.items():
+        print(f"  {mode:>10}: {duration:.2f} s")
+    print(f"  speedup: {results['subprocess'] / results['in-process']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Benchmark of the ML/MAP metric extraction of sct_extract_metric (extract_metric() for each label of the PAM50 atlas),
+# with the atlas loaded as a dense (x, y, z, label) stack (estimation one slice group at a time) against a sparse atlas
+# (normal equations of all the slices at once).
+#
+# Usage:
+#   python testing/benchmarks/benchmark_sparse_atlas.py [-f data/PAM50/atlas] \
+#       [-vertfile data/PAM50/template/PAM50_levels.nii.gz] [-method ml map] [-repeat 3]
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+import numpy as np
+from scipy import ndimage
+
+from spinalcordtoolbox import aggregate_slicewise
+from spinalcordtoolbox.aggregate_slicewise import Metric, LabelStruc, extract_metric
+from spinalcordtoolbox.atlas import load_atlas
+from spinalcordtoolbox.image import Image
+from spinalcordtoolbox.metadata import read_label_file
+from spinalcordtoolbox.utils import sct_dir_local_path
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Benchmark ML/MAP extraction with a dense and a sparse atlas.")
+    parser.add_argument('-f', default=sct_dir_local_path('data', 'PAM50', 'atlas'),
+                        help="Atlas folder (with info_label.txt).")
+    parser.add_argument('-vertfile', default=sct_dir_local_path('data', 'PAM50', 'template', 'PAM50_levels.nii.gz'),
+                        help="Vertebral labeling, for the per-level aggregation.")
+    parser.add_argument('-method', nargs='+', default=['ml', 'map'], choices=['ml', 'map'],
+                        help="Estimation methods.")
+    parser.add_argument('-repeat', type=int, default=3, help="Number of runs per mode (the fastest is kept).")
+    return parser
+
+
+def main():
+    args = get_parser().parse_args()
+    logging.disable(logging.WARNING)
+
+    indiv_labels_ids, _, indiv_labels_files, _, _, _, map_clusters = read_label_file(args.f, 'info_label.txt')
+    label_struc = {id_label: LabelStruc(id=id_label, name=str(id_label),
+                                        map_cluster=[id_label in map_cluster for map_cluster in map_clusters].index(True)
+                                        if map_clusters else 0)
+                   for id_label in indiv_labels_ids}
+
+    start = time.perf_counter()
+    labels = np.stack([Image(os.path.join(args.f, fname)).change_orientation('RPI').data
+                       for fname in indiv_labels_files], axis=3)
+    print(f"Dense atlas: {labels.nbytes / 1e6:.1f} MB, loaded in {time.perf_counter() - start:.3f} s")
+    with tempfile.TemporaryDirectory() as path_cache:
+        # The sparse atlas is stored in the persistent cache by the first load with the cache
+        os.environ['SCT_CACHE_DIR'] = path_cache
+        for cache in [False, True, True]:
+            start = time.perf_counter()
+            atlas = load_atlas(args.f, indiv_labels_files, cache=cache)
+            print(f"Sparse atlas: {atlas.nbytes / 1e6:.1f} MB, loaded in {time.perf_counter() - start:.3f} s "
+                  f"({'cache' if cache else 'no cache'})")
+
+    # Smooth random metric (e.g. FA), with a few non-finite voxels
+    metric = ndimage.gaussian_filter(np.random.RandomState(0).rand(*labels.shape[:3]), 2).astype(np.float32)
+    metric[np.random.RandomState(1).rand(*metric.shape) < 1e-4] = np.nan
+    data = Metric(data=metric, label='')
+
+    grouped_funcs = aggregate_slicewise._GROUPED_FUNCS.copy()
+    for name, kwargs in [('perslice', dict(perslice=True)),
+                         ('perlevel', dict(levels=list(range(1, 21)), perlevel=True, vert_level=args.vertfile))]:
+        if 'vert_level' in kwargs and not os.path.isfile(args.vertfile):
+            continue
+        for method in args.method:
+            results = {}
+            for mode, labels_mode, funcs in [('dense', labels, {}), ('sparse', atlas, grouped_funcs)]:
+                aggregate_slicewise._GROUPED_FUNCS = funcs
+                durations = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    agg_metrics = [extract_metric(data, labels=labels_mode, method=method, label_struc=label_struc,
+                                                  id_label=id_label, indiv_labels_ids=list(label_struc), **kwargs)
+                                   for id_label in label_struc]
+                    durations.append(time.perf_counter() - start)
+                results[mode] = agg_metrics, min(durations)
+            aggregate_slicewise._GROUPED_FUNCS = grouped_funcs
+
+            max_difference = 0
+            for agg_dense, agg_sparse in zip(results['dense'][0], results['sparse'][0]):
+                for slicegroup in agg_dense:
+                    for key, value in agg_dense[slicegroup].items():
+                        if isinstance(value, (float, np.floating)):
+                            max_difference = max(max_difference, abs(value - agg_sparse[slicegroup][key]))
+            print(f"  {name} {method:>3}: dense {results['dense'][1]:.3f} s, sparse {results['sparse'][1]:.3f} s, "
+                  f"speedup {results['dense'][1] / results['sparse'][1]:.1f}x "
+                  f"(max absolute difference: {max_difference:.2g})")
+
+
+if __name__ == "__main__":
+    main()
@@ -61,3 +61,16 @@ def test_sct_dmri_moco_sagittal_no_checks(tmp_path, dmri_ail_cropped):
     sct_dmri_moco.main(argv=['-i', dmri_ail_cropped, '-bvec', 'dmri/bvecs.txt', '-x', 'nn', '-r', '0',
                              '-ofolder', str(tmp_path)])
     # NB: We skip checking params because there are no output moco params for sagittal images (*_AIL)
+
+
+@pytest.mark.sct_testing
+@pytest.mark.usefixtures("run_in_sct_testing_data_dir")
+def test_sct_dmri_moco_jobs_check_params(tmp_path):
+    """Run the CLI script with parallel registrations and validate that output moco params are unchanged."""
+    sct_dmri_moco.main(argv=['-i', 'dmri/dmri.nii.gz', '-bvec', 'dmri/bvecs.txt', '-g', '3', '-x', 'nn', '-r', '0',
+                             '-jobs', '2', '-ofolder', str(tmp_path)])
+
+    lresults = genfromtxt(tmp_path / "moco_params.tsv", skip_header=1, delimiter='\t')[:, 0]
+    lgroundtruth = [0.00047529041677414337, -1.1970542445283172e-05, -1.1970542445283172e-05, -1.1970542445283172e-05,
+                    -0.1296642741802682, -0.1296642741802682, -0.1296642741802682]
+    assert allclose(lresults, lgroundtruth)
@@ -44,6 +44,19 @@ def test_sct_process_segmentation_check_pmj(dummy_3d_mask_nib, dummy_3d_pmj_labe
         assert row['SUM(length)'] == '4.0'
 
 
+def test_sct_process_segmentation_jobs(dummy_3d_mask_nib, tmp_path):
+    """ Run sct_process_segmentation with -jobs and check that the results are the same as with a single job"""
+    rows = []
+    for jobs in ['1', '2']:
+        filename = str(tmp_path / f'tmp_file_out_jobs{jobs}.csv')
+        sct_process_segmentation.main(argv=['-i', dummy_3d_mask_nib, '-jobs', jobs, '-o', filename])
+        with open(filename, "r") as csvfile:
+            reader = csv.DictReader(csvfile, delimiter=',')
+            rows.append(next(reader))
+    assert float(rows[1]['MEAN(area)']) == pytest.approx(float(rows[0]['MEAN(area)']))
+    assert float(rows[1]['SUM(length)']) == pytest.approx(float(rows[0]['SUM(length)']))
+
+
 def test_sct_process_segmentation_missing_pmj_args(dummy_3d_mask_nib, dummy_3d_pmj_label):
     """ Run sct_process_segmentation with PMJ method when missing -pmj or -pmj-distance """
     for args in [['-i', dummy_3d_mask_nib, '-pmj', dummy_3d_pmj_label], ['-i', dummy_3d_mask_nib, '-pmj-distance', '4']]: